@@ -1,6 +1,8 @@
 from flask import Blueprint, Flask, jsonify, make_response
 from .users import user_management
 from .consignment_management import consignment_management
+from .system import system_management
+from .jobs import job_management
 # from .scores import scores_management
 # from .quizes import quiz_management
 # from .chapters import chapter_management
@@ -9,18 +11,30 @@ from .consignment_management import consignment_management
 # from .attempts_manager import attempts_management
 
 from flask_cors import CORS
+import config
+import metrics
+from schema import init_db
+from cli import register_commands
+import restrictions
 from itsdangerous import URLSafeTimedSerializer
 
 
+# Request headers browsers may send cross-origin: the conditional GET, change
+# stream resume and idempotent retry headers besides the usual two
+ALLOW_HEADERS = ["Content-Type", "Authorization", "If-None-Match", "Last-Event-ID", "Idempotency-Key"]
+
+
 def create_app():
     app = Flask(__name__)
 
-    SECRET_KEY = 'SUPER_SECRET_KEY'
+    SECRET_KEY = config.SECRET_KEY
     app.secret_key = SECRET_KEY  # Required for flashing messages
     app.config['SECRET_KEY'] = SECRET_KEY
+    # Request bodies over this size are refused with 413 before reaching a view
+    app.config['MAX_CONTENT_LENGTH'] = config.MAX_CONTENT_LENGTH
 
     # Apply CORS to the app with the specific origin
-    CORS(app, resources={r"/*": {"origins": ["*"], "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"], "allow_headers": ["Content-Type", "Authorization"]}})
+    CORS(app, resources={r"/*": {"origins": ["*"], "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"], "allow_headers": ALLOW_HEADERS, "expose_headers": ["X-Next-Cursor", "ETag", "Idempotent-Replayed", "X-Report-Key", "X-Report-Cache"]}})
 
 
     # Serializer setup
@@ -29,14 +43,20 @@ def create_app():
     # Handle preflight requests globally (this can be customized per route)
     @app.after_request
     def after_request(response):
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Headers', ','.join(ALLOW_HEADERS))
         response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
         response.headers.add('Access-Control-Allow-Credentials', 'true')
         return response
 
+    # Bring the database schema up to date before serving
+    init_db()
+    restrictions.get_index()
+
     # Register the blueprints
     app.register_blueprint(user_management, url_prefix='/users')
     app.register_blueprint(consignment_management, url_prefix='/consignment')
+    app.register_blueprint(system_management, url_prefix='/system')
+    app.register_blueprint(job_management, url_prefix='/jobs')
     # app.register_blueprint(quiz_management, url_prefix='/quiz')
     # app.register_blueprint(scores_management, url_prefix='/scores')
     # app.register_blueprint(chapter_management, url_prefix='/chapters')
@@ -44,6 +64,11 @@ def create_app():
     # app.register_blueprint(question_management, url_prefix='/questions')
     # app.register_blueprint(attempts_management, url_prefix='/attempts')
 
+    register_commands(app)
+
+    # Request/SQL timings and the /metrics endpoint
+    metrics.init_app(app)
+
 
 
     return app
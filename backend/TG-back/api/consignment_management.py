@@ -1,71 +1,57 @@
-from flask import Blueprint, current_app, make_response, abort, send_file, request, jsonify, Response
+from flask import Blueprint, current_app, send_file, request, jsonify, Response
+import base64
+import binascii
 import datetime
+import json
+import os
+import shutil
+import time
 import uuid
-from utils import get_db_connection, token_required
-from io import BytesIO
+from utils import authenticate, closing_once, db_connection, get_db_connection, token_required
+import config
+import invoice_store
+import restrictions
+import search
+import consignment_store
+import consignment_cache
+import archive
+import audit
+import consignment_stats
+import changefeed
+import json_stream
+import bulk_ingest
+import hs_classifier
+import hs_suggest
+import idempotency
+import jobs
+import reports
+import tasks  # noqa: F401  (registers the job handlers)
+from validation import validate_consignment
+from io import BytesIO, TextIOWrapper
 import re
 
 # Define the blueprint for consignments
 consignment_management = Blueprint('consignment_management', __name__)
 
-def validate_field_type(value, field_name, expected_type, required=True):
-    """Validate field type and return tuple of (is_valid, error_message)"""
-    if value is None or value == "":
-        if required:
-            return False, f"Field '{field_name}' is required"
-        return True, None
-    
-    try:
-        if expected_type == int:
-            int(value)
-        elif expected_type == float:
-            float(value)
-        elif expected_type == "date":
-            datetime.datetime.strptime(value, "%Y-%m-%d")
-        return True, None
-    except (ValueError, TypeError):
-        return False, f"Invalid data type for field '{field_name}'. Expected {expected_type.__name__}"
-
-# Add new consignment
+# Add new consignment. A retry sent with the same Idempotency-Key header gets
+# the first attempt's response back instead of inserting again; keys are per
+# user, so a request carrying one must be signed in
 @consignment_management.route('/add-consignment', methods=['POST'])
 def add_consignment():
     try:
-        # Extract data from form
-        form_data = {
-            "sender_name": (request.form.get("sender_name"), str),
-            "sender_address": (request.form.get("sender_address"), str),
-            "sender_country": (request.form.get("sender_country"), str),
-            "sender_mail": (request.form.get("sender_mail"), str),
-            "sender_phone": (request.form.get("sender_phone"), str),
-            "receiver_name": (request.form.get("receiver_name"), str),
-            "receiver_address": (request.form.get("receiver_address"), str),
-            "receiver_country": (request.form.get("receiver_country"), str),
-            "shipment_id": (request.form.get("shipment_id"), str),
-            "shipment_date": (request.form.get("shipment_date", datetime.datetime.utcnow().strftime("%Y-%m-%d")), "date"),
-            "PackageQuantity": (request.form.get("PackageQuantity"), int),
-            "HS_code": (request.form.get("HS_code"), str),
-            "totalWeight": (request.form.get("totalWeight"), float),
-            "Item_desc": (request.form.get("Item_desc"), str),
-            "handling_inst": (request.form.get("handling_inst", ""), str, False)  # Not required
-        }
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key is not None and not idempotency.valid_key(idempotency_key):
+            return jsonify({
+                "success": False,
+                "message": f"Idempotency-Key must be 1 to {idempotency.MAX_KEY_LENGTH} printable characters"
+            }), 400
+        if idempotency_key is not None:
+            token_data, error = authenticate(request.headers.get('Authorization'))
+            if error:
+                return error
 
         # Validate all fields
-        validation_errors = []
-        validated_data = {}
-        
-        for field_name, (value, expected_type, *args) in form_data.items():
-            required = True if not args else args[0]
-            is_valid, error_message = validate_field_type(value, field_name, expected_type, required)
-            if not is_valid:
-                validation_errors.append(error_message)
-            else:
-                if value is not None and value != "":
-                    if expected_type == int:
-                        validated_data[field_name] = int(value)
-                    elif expected_type == float:
-                        validated_data[field_name] = float(value)
-                    else:
-                        validated_data[field_name] = value
+        validated_data, validation_errors = validate_consignment(request.form)
 
         if validation_errors:
             return jsonify({
@@ -74,62 +60,81 @@ def add_consignment():
                 "details": validation_errors
             }), 400
             
-        # Handle PDF upload
+        # Handle PDF upload: streamed to a temporary file in the invoice store,
+        # only the digest goes in the row. The file is published under its
+        # digest only once the consignment is committed
         commercial_invoice_file = request.files.get('commercial_invoice')
-        commercial_invoice = commercial_invoice_file.read() if commercial_invoice_file else None
+        invoice_sha256 = invoice_size = spooled_invoice = None
+        if commercial_invoice_file:
+            invoice_sha256, invoice_size, spooled_invoice = invoice_store.spool_stream(commercial_invoice_file.stream)
         
-        # Default compliance status is pending
-        compliant = "pending"
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if shipment_id already exists
-        cursor.execute('SELECT COUNT(*) FROM Consignments WHERE shipment_id = ?', (validated_data['shipment_id'],))
-        if cursor.fetchone()[0] > 0:
-            conn.close()
-            return jsonify({"success": False, "message": "Shipment ID already exists"}), 409
-        
-        # Insert new consignment - removed uuid from INSERT as it's AUTOINCREMENT
-        cursor.execute('''
-            INSERT INTO Consignments (
-                sender_name, sender_address, sender_country, sender_mail, sender_phone,
-                receiver_name, receiver_address, receiver_country, shipment_id, shipment_date,
-                PackageQuantity, HS_code, totalWeight, Item_desc, handling_inst,
-                commercial_invoice, compliant
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            validated_data['sender_name'],
-            validated_data['sender_address'],
-            validated_data['sender_country'],
-            validated_data['sender_mail'],
-            validated_data['sender_phone'],
-            validated_data['receiver_name'],
-            validated_data['receiver_address'],
-            validated_data['receiver_country'],
-            validated_data['shipment_id'],
-            validated_data['shipment_date'],
-            validated_data['PackageQuantity'],
-            validated_data['HS_code'],
-            validated_data['totalWeight'],
-            validated_data['Item_desc'],
-            validated_data.get('handling_inst', ''),
-            commercial_invoice,
-            compliant
-        ))
-        
-        # Get the last inserted id
-        cursor.execute('SELECT last_insert_rowid()')
-        consignment_id = cursor.fetchone()[0]
-        
-        conn.commit()
-        conn.close()
+        try:
+            # Evaluate the compliance rules inline; violations are stored with the row
+            decision = consignment_store.evaluate(validated_data, invoice_sha256 is not None)
+            compliant = decision.status
+            fingerprint = idempotency_key and idempotency.fingerprint(request.form, invoice_sha256)
+            
+            with db_connection() as conn:
+                # The write lock up front serializes requests sharing a key, so a
+                # concurrent retry waits here and then finds the stored response
+                conn.execute('BEGIN IMMEDIATE')
+                if idempotency_key:
+                    try:
+                        stored = idempotency.lookup(conn, token_data['user_id'], idempotency_key, fingerprint)
+                    except idempotency.KeyReused as e:
+                        return jsonify({"success": False, "message": str(e)}), 422
+                    if stored:
+                        status, body = stored
+                        response = Response(body, status=status, mimetype='application/json')
+                        response.headers['Idempotent-Replayed'] = 'true'
+                        return response
+            
+                parse_invoice = invoice_sha256 and invoice_store.register(conn, invoice_sha256, invoice_size)
+
+                # One statement: the UNIQUE shipment_id index decides duplicates
+                # and RETURNING hands back the new uuid
+                inserted = conn.execute(
+                    consignment_store.INSERT_NEW_CONSIGNMENT_SQL,
+                    consignment_store.insert_params(validated_data, invoice_sha256, decision)).fetchone()
+            
+                if inserted is None:
+                    if parse_invoice:
+                        # Registered by this request for a row that was not inserted
+                        invoice_store.unregister(conn, invoice_sha256)
+                        parse_invoice = False
+                    response = jsonify({"success": False, "message": "Shipment ID already exists"})
+                    response.status_code = 409
+                else:
+                    response = jsonify({
+                        "success": True, 
+                        "message": "Consignment added successfully",
+                        "uuid": inserted[0],
+                        "compliant": compliant,
+                        "violations": decision.violations
+                    })
+                    response.status_code = 201
+                if idempotency_key:
+                    idempotency.remember(conn, token_data['user_id'], idempotency_key, fingerprint,
+                                         response.status_code, response.get_data(as_text=True))
+            
+                conn.commit()
+
+            # Published only once the row that references it is committed, so
+            # a failed commit leaves no blob behind. Until then a download of
+            # the new row gets a 404, as for any invoice missing from the store
+            if inserted is not None and spooled_invoice:
+                invoice_store.publish(invoice_sha256, spooled_invoice)
+                spooled_invoice = None
+        finally:
+            if spooled_invoice:
+                invoice_store.discard(spooled_invoice)
+
+        if inserted is not None:
+            changefeed.notify()
+        if parse_invoice:
+            jobs.submit('parse_invoice', {"sha256": invoice_sha256})
         
-        return jsonify({
-            "success": True, 
-            "message": "Consignment added successfully",
-            "uuid": consignment_id
-        }), 201
+        return response
         
     except Exception as e:
         return jsonify({
@@ -138,55 +143,526 @@ def add_consignment():
             "error_type": type(e).__name__
         }), 500
 
-# Fetch all consignments
+# Bulk upload shipments from a CSV or NDJSON file, streamed row by row
+@consignment_management.route('/bulk-upload', methods=['POST'])
+@token_required
+def bulk_upload():
+    try:
+        upload = request.files.get('file')
+        if upload:
+            binary, filename, mimetype = upload.stream, upload.filename or '', upload.mimetype
+        else:
+            binary, filename, mimetype = request.stream, '', request.mimetype
+
+        fmt = request.args.get('format')
+        if not fmt:
+            is_ndjson = mimetype in ('application/x-ndjson', 'application/jsonl') or filename.endswith(('.ndjson', '.jsonl'))
+            fmt = 'ndjson' if is_ndjson else 'csv'
+        if fmt not in bulk_ingest.FORMATS:
+            return jsonify({"success": False, "message": f"Unsupported format '{fmt}'"}), 400
+
+        evaluate = request.args.get('evaluate', '1') not in ('0', 'false')
+
+        if request.args.get('async') in ('1', 'true'):
+            # Spool the upload to disk and let a worker ingest it
+            os.makedirs(config.JOB_SPOOL_DIR, exist_ok=True)
+            path = os.path.join(config.JOB_SPOOL_DIR, f'{uuid.uuid4().hex}.{fmt}')
+            with open(path, 'wb') as spool:
+                shutil.copyfileobj(binary, spool, config.INVOICE_CHUNK_SIZE)
+            job_id = jobs.submit('bulk_upload', {"path": path, "format": fmt, "evaluate": evaluate},
+                                 created_by=request.token_data['user_id'])
+            return jsonify({"success": True, "job_id": job_id, "status": jobs.QUEUED}), 202
+
+        text_stream = TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+        report = bulk_ingest.ingest(text_stream, fmt, evaluate=evaluate)
+
+        return jsonify({"success": report["failed"] == 0, **report}), 200
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# Output key -> Consignments column, in response order
+CONSIGNMENT_FIELDS = {
+    "uuid": "uuid",
+    "sender_name": "sender_name",
+    "sender_address": "sender_address",
+    "sender_country": "sender_country",
+    "sender_mail": "sender_mail",
+    "sender_phone": "sender_phone",
+    "receiver_name": "receiver_name",
+    "receiver_address": "receiver_address",
+    "receiver_country": "receiver_country",
+    "shipment_id": "shipment_id",
+    "shipment_date": "shipment_date",
+    "package_quantity": "PackageQuantity",
+    "hs_code": "HS_code",
+    "total_weight": "totalWeight",
+    "item_desc": "Item_desc",
+    "handling_inst": "handling_inst",
+    "compliant": "compliant",
+    "created_at": "created_at",
+    "declared_value": "declared_value",
+    "compliance_reasons": "compliance_reasons",
+}
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(created_at, consignment_uuid):
+    return base64.urlsafe_b64encode(f"{created_at}|{consignment_uuid}".encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Return (created_at, uuid) from an opaque page cursor, or raise ValueError."""
+    try:
+        created_at, consignment_uuid = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        return created_at, int(consignment_uuid)
+    except (ValueError, UnicodeError, binascii.Error):
+        raise ValueError("Invalid cursor")
+
+
+def parse_listing_args(args):
+    """Turn fetch-consignments query parameters into (fields, where, params,
+    limit, created), created being the (from, to) created_at bounds, either
+    of them None.
+
+    Raises ValueError with a client-facing message on bad input.
+    """
+    fields = list(CONSIGNMENT_FIELDS)
+    if args.get('fields'):
+        fields = [f.strip() for f in args['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in CONSIGNMENT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    where = []
+    params = []
+    created = {}
+
+    compliant = args.get('compliant')
+    if compliant:
+        if compliant not in ('pending', 'compliant', 'flagged'):
+            raise ValueError("Invalid compliance status")
+        where.append("compliant = ?")
+        params.append(compliant)
+
+    for arg, column in (('sender_country', 'sender_country'), ('receiver_country', 'receiver_country')):
+        if args.get(arg):
+            where.append(f"{column} = ?")
+            params.append(args[arg])
+
+    hs_code = args.get('hs_code')
+    if hs_code:
+        # Prefix match written as a range so it can use the HS_code index
+        where.append("HS_code >= ? AND HS_code < ?")
+        params.extend([hs_code, hs_code[:-1] + chr(ord(hs_code[-1]) + 1)])
+
+    for arg, op in (('created_from', '>='), ('created_to', '<')):
+        value = args.get(arg)
+        if value:
+            try:
+                day = datetime.datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise ValueError(f"{arg} must be a YYYY-MM-DD date")
+            if arg == 'created_to':
+                # Inclusive of the whole end day
+                day += datetime.timedelta(days=1)
+            created[arg] = day.strftime("%Y-%m-%d %H:%M:%S")
+            where.append(f"created_at {op} ?")
+            params.append(created[arg])
+
+    if args.get('cursor'):
+        created_at, last_uuid = decode_cursor(args['cursor'])
+        where.append("(created_at, uuid) < (?, ?)")
+        params.extend([created_at, last_uuid])
+
+    return fields, where, params, limit, (created.get('created_from'), created.get('created_to'))
+
+
+def _versioned(response, etag):
+    """Attach a strong ETag; clients must revalidate (If-None-Match) before reuse."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# Fetch consignments, newest first, one keyset page at a time. The page is
+# streamed from the cursor as a JSON array, or as NDJSON when the client
+# sends Accept: application/x-ndjson
 @consignment_management.route('/fetch-consignments', methods=['GET'])
 @token_required
 def fetch_consignments():
     try:
+        try:
+            fields, where, params, limit, created = parse_listing_args(request.args)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        columns = ", ".join(CONSIGNMENT_FIELDS[f] for f in fields)
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+        ndjson = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+        mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+        query = (tuple(sorted(request.args.items(multi=True))), ndjson)
+        cache_key = (request.token_data['user_id'], *query)
+
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                uuid, sender_name, sender_address, sender_country, sender_mail, sender_phone,
-                receiver_name, receiver_address, receiver_country, shipment_id, shipment_date,
-                PackageQuantity, HS_code, totalWeight, Item_desc, handling_inst,
-                compliant, created_at
-            FROM Consignments
-            ORDER BY created_at DESC
-        ''')
-        
-        consignments = cursor.fetchall()
-        conn.close()
-        
-        if not consignments:
-            return jsonify({"success": False, "message": "No consignments found"}), 404
-        
-        result = []
-        for row in consignments:
-            result.append({
-                "uuid": row[0],
-                "sender_name": row[1],
-                "sender_address": row[2],
-                "sender_country": row[3],
-                "sender_mail": row[4],
-                "sender_phone": row[5],
-                "receiver_name": row[6],
-                "receiver_address": row[7],
-                "receiver_country": row[8],
-                "shipment_id": row[9],
-                "shipment_date": row[10],
-                "package_quantity": row[11],
-                "hs_code": row[12],
-                "total_weight": row[13],
-                "item_desc": row[14],
-                "handling_inst": row[15],
-                "compliant": row[16],
-                "created_at": row[17]
-            })
-        
-        return jsonify(result), 200
-        
+        try:
+            # One read snapshot for the version and the page it labels
+            conn.execute('BEGIN')
+            version = consignment_cache.table_version(conn)
+            etag = consignment_cache.listing_etag(version, query)
+            if request.if_none_match.contains_weak(etag):
+                conn.close()
+                return _versioned(Response(status=304), etag)
+
+            cached = consignment_cache.pages.get(cache_key)
+            if cached is not None and cached.version == version:
+                conn.close()
+                response = _versioned(Response(cached.body, mimetype=cached.mimetype), etag)
+                if cached.next_cursor:
+                    response.headers['X-Next-Cursor'] = cached.next_cursor
+                return response, 200
+
+            # A date range reaching back into the archive also reads the
+            # partitions it covers; every other listing is the hot table alone
+            ranges = archive.partitions(conn, *created) if any(created) else []
+            if ranges:
+                rows, last = archive.listing(conn, ranges, columns, where_sql, params, limit)
+                next_cursor = encode_cursor(*last) if last else None
+                cursor = json_stream.RowList(rows)
+            else:
+                cursor = conn.cursor()
+
+                # The next cursor goes in a header, so it is found before the body
+                # with a key-only lookahead: rows limit and limit + 1 of the page.
+                # uuid is the rowid, so every created_at index already ends in it
+                cursor.execute(f'''
+                    SELECT created_at, uuid FROM Consignments
+                    {where_sql}
+                    ORDER BY created_at DESC, uuid DESC
+                    LIMIT 2 OFFSET ?
+                ''', (*params, limit - 1))
+                lookahead = cursor.fetchall()
+                next_cursor = encode_cursor(*lookahead[0]) if len(lookahead) == 2 else None
+
+                cursor.execute(f'''
+                    SELECT {columns}
+                    FROM Consignments
+                    {where_sql}
+                    ORDER BY created_at DESC, uuid DESC
+                    LIMIT ?
+                ''', (*params, limit))
+            first = cursor.fetchone()
+
+            if first is None and not request.args.get('cursor'):
+                conn.close()
+                return jsonify({"success": False, "message": "No consignments found"}), 404
+
+            encoder = json_stream.RowEncoder(fields, raw=('compliance_reasons',),
+                                             sort_keys=current_app.json.sort_keys)
+        except BaseException:
+            conn.close()
+            raise
+
+        # The connection stays checked out until the body is sent, or until
+        # the server closes the response if the client goes away first;
+        # pages are at most MAX_PAGE_SIZE rows
+        release = closing_once(conn)
+
+        def body():
+            try:
+                yield from consignment_cache.tee(
+                    cache_key, version, etag, mimetype, next_cursor,
+                    json_stream.stream(encoder, first, cursor, ndjson=ndjson))
+            finally:
+                release()
+
+        response = _versioned(Response(body(), mimetype=mimetype), etag)
+        response.call_on_close(release)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# Fields returned by /search unless ?fields= asks for others
+SEARCH_FIELDS = ("uuid", "shipment_id", "sender_name", "receiver_name", "receiver_country",
+                 "item_desc", "compliant", "created_at")
+MAX_SEARCH_PAGE_SIZE = 100
+
+# Full-text search across descriptions, names, addresses and handling notes,
+# one keyset page at a time; best match first, or newest first with order=recent
+@consignment_management.route('/search', methods=['GET'])
+@token_required
+def search_consignments():
+    try:
+        fields = list(SEARCH_FIELDS)
+        if request.args.get('fields'):
+            fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+            unknown = [f for f in fields if f not in CONSIGNMENT_FIELDS]
+            if unknown:
+                return jsonify({"success": False, "message": f"Unknown fields: {', '.join(unknown)}"}), 400
+        try:
+            limit = max(1, min(int(request.args.get('limit', 20)), MAX_SEARCH_PAGE_SIZE))
+        except ValueError:
+            return jsonify({"success": False, "message": "limit must be an integer"}), 400
+
+        with db_connection() as conn:
+            try:
+                rows, next_cursor = search.search(
+                    conn, request.args.get('q'), [CONSIGNMENT_FIELDS[f] for f in fields], limit,
+                    cursor=request.args.get('cursor'), order=request.args.get('order', 'relevance'))
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+
+        results = []
+        for row in rows:
+            item = dict(zip(fields, row[3:]))
+            if item.get("compliance_reasons"):
+                item["compliance_reasons"] = json.loads(item["compliance_reasons"])
+            item["snippet"] = search.highlight(row[2])
+            item["score"] = -row[0]  # bm25 rank is lower-is-better
+            results.append(item)
+
+        response = jsonify(results)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+MAX_CLASSIFY_DESCRIPTIONS = 1000
+
+# Suggest HS codes for item descriptions, e.g. before filling in HS_code.
+# Body: {"descriptions": ["..."]} or {"description": "..."}
+@consignment_management.route('/classify-hs', methods=['POST'])
+@token_required
+def classify_hs():
+    try:
+        data = request.get_json(silent=True) or {}
+        descriptions = data.get('descriptions')
+        if descriptions is None and 'description' in data:
+            descriptions = [data['description']]
+        if not isinstance(descriptions, list) or not all(isinstance(d, str) for d in descriptions):
+            return jsonify({"success": False, "message": "descriptions must be a list of strings"}), 400
+        if len(descriptions) > MAX_CLASSIFY_DESCRIPTIONS:
+            return jsonify({"success": False, "message": f"At most {MAX_CLASSIFY_DESCRIPTIONS} descriptions per request"}), 400
+
+        try:
+            classifications = hs_classifier.classify(descriptions)
+        except (hs_classifier.ClassifierBusy, hs_classifier.ClassifierUnavailable) as e:
+            return jsonify({"success": False, "message": str(e)}), 503
+
+        return jsonify({
+            "success": True,
+            "classifications": [
+                {"description": description, "hs_code": None, "confidence": 0.0, "source": None}
+                if c is None else
+                {"description": description, "hs_code": c.hs_code, "confidence": c.confidence, "source": c.source}
+                for description, c in zip(descriptions, classifications)
+            ],
+        }), 200
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def _suggestion_json(suggestion, jurisdiction):
+    result = {
+        "hs_code": suggestion.hs_code,
+        "score": suggestion.score,
+        "source": suggestion.source,
+        "matched": suggestion.matched,
+    }
+    if jurisdiction is not None:
+        result["restricted"] = bool(jurisdiction.trie.covering(suggestion.hs_code))
+    return result
+
+# Offline HS code suggestions from the local index (hs_suggest.py).
+# Body: {"descriptions": ["..."]} or {"description": "..."}, or a CSV upload
+# (multipart "file" or a text/csv body) with an Item_desc column, scored row
+# by row. Optional k and destination_country (marks restricted suggestions)
+# come from the JSON body or the query string.
+@consignment_management.route('/suggest-hs', methods=['POST'])
+@token_required
+def suggest_hs():
+    try:
+        upload = request.files.get('file')
+        is_csv = upload is not None or request.mimetype == 'text/csv'
+        data = {} if is_csv else (request.get_json(silent=True) or {})
+        destination = data.get('destination_country', request.args.get('destination_country'))
+
+        try:
+            k = int(data.get('k', request.args.get('k', 5)))
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "message": "k must be an integer"}), 400
+        if not 1 <= k <= hs_suggest.MAX_K:
+            return jsonify({"success": False, "message": f"k must be between 1 and {hs_suggest.MAX_K}"}), 400
+
+        jurisdiction = None
+        if destination:
+            jurisdiction = restrictions.get_index().for_country(destination)
+            if jurisdiction is None:
+                return jsonify({"success": False, "message": f"Unsupported destination '{destination}'"}), 400
+
+        if is_csv:
+            text_stream = TextIOWrapper(upload.stream if upload else request.stream, encoding='utf-8-sig', newline='')
+            rows = []
+            for row_number, values, error in bulk_ingest.iter_rows(text_stream, 'csv'):
+                if len(rows) == config.HS_SUGGEST_MAX_ROWS:
+                    return jsonify({"success": False, "message": f"At most {config.HS_SUGGEST_MAX_ROWS} rows per upload"}), 400
+                if error:
+                    return jsonify({"success": False, "message": f"Row {row_number}: {error}"}), 400
+                if 'Item_desc' not in values:
+                    return jsonify({"success": False, "message": "CSV must have an Item_desc column"}), 400
+                rows.append((row_number, values))
+            suggestions = hs_suggest.suggest_many([values['Item_desc'] or '' for _, values in rows], k)
+            return jsonify({
+                "success": True,
+                "rows": [{
+                    "row": row_number,
+                    "shipment_id": values.get('shipment_id'),
+                    "description": values['Item_desc'],
+                    "declared_hs_code": values.get('HS_code'),
+                    "suggestions": [_suggestion_json(s, jurisdiction) for s in found],
+                } for (row_number, values), found in zip(rows, suggestions)],
+            }), 200
+
+        descriptions = data.get('descriptions')
+        if descriptions is None and 'description' in data:
+            descriptions = [data['description']]
+        if not isinstance(descriptions, list) or not all(isinstance(d, str) for d in descriptions):
+            return jsonify({"success": False, "message": "descriptions must be a list of strings"}), 400
+        if len(descriptions) > config.HS_SUGGEST_MAX_ROWS:
+            return jsonify({"success": False, "message": f"At most {config.HS_SUGGEST_MAX_ROWS} descriptions per request"}), 400
+
+        suggestions = hs_suggest.suggest_many(descriptions, k)
+        return jsonify({
+            "success": True,
+            "results": [{
+                "description": description,
+                "suggestions": [_suggestion_json(s, jurisdiction) for s in found],
+            } for description, found in zip(descriptions, suggestions)],
+        }), 200
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+MAX_CHANGES_PAGE = 1000
+
+def _change_args():
+    """(since, limit) for the change feed, or an error response. since comes
+    from ?since= or Last-Event-ID (set by EventSource on reconnect); without
+    either the client starts from now."""
+    since = request.args.get('since', request.headers.get('Last-Event-ID'))
+    try:
+        since = changefeed.get_feed().last_seq if since in (None, '') else int(since)
+        limit = min(int(request.args.get('limit', 500)), MAX_CHANGES_PAGE)
+    except ValueError:
+        return None, None, (jsonify({"success": False, "message": "since and limit must be integers"}), 400)
+    if since < 0 or limit < 1:
+        return None, None, (jsonify({"success": False, "message": "since and limit must be positive"}), 400)
+    return since, limit, None
+
+# Long-poll change feed: returns as soon as there are changes after since,
+# or empty after ?wait= seconds. reset means since can no longer be resumed
+# from: reload the listing, then continue from last_seq
+@consignment_management.route('/changes', methods=['GET'])
+@token_required
+def consignment_changes():
+    try:
+        since, limit, error = _change_args()
+        if error:
+            return error
+        try:
+            wait = min(float(request.args.get('wait', 0)), config.CHANGE_FEED_MAX_WAIT)
+        except ValueError:
+            return jsonify({"success": False, "message": "wait must be a number"}), 400
+
+        feed = changefeed.get_feed()
+        events, reset_to = feed.read(since, limit)
+        if not events and reset_to is None and wait > 0:
+            with feed.subscribed():
+                if feed.wait(since, wait):
+                    events, reset_to = feed.read(since, limit)
+
+        last = reset_to if reset_to is not None else (events[-1][0] if events else since)
+        body = (f'{{"success":true,"reset":{"true" if reset_to is not None else "false"},'
+                f'"last_seq":{last},"changes":[{",".join(event[1] for event in events)}]}}')
+        return Response(body, mimetype='application/json', headers={'Cache-Control': 'no-store'})
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# Server-sent events version of /changes. Events carry their seq as the
+# event id, so a reconnecting EventSource resumes where it stopped
+@consignment_management.route('/changes/stream', methods=['GET'])
+@token_required
+def consignment_changes_stream():
+    since, limit, error = _change_args()
+    if error:
+        return error
+    feed = changefeed.get_feed()
+
+    def events():
+        position = since
+        with feed.subscribed():
+            yield f'retry: {int(config.CHANGE_FEED_POLL_SECONDS * 1000) + 1000}\n\n'
+            deadline = time.monotonic() + config.CHANGE_FEED_STREAM_SECONDS
+            while True:
+                batch, reset_to = feed.read(position, limit)
+                if reset_to is not None:
+                    position = reset_to
+                    yield f'id: {reset_to}\nevent: reset\ndata: {{"last_seq":{reset_to}}}\n\n'
+                    continue
+                if batch:
+                    position = batch[-1][0]
+                    yield ''.join(event[2] for event in batch)
+                    continue
+                if time.monotonic() >= deadline:
+                    return
+                if not feed.wait(position, config.CHANGE_FEED_HEARTBEAT_SECONDS):
+                    yield ': keep-alive\n\n'
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+# Dashboard aggregates, read from the consignment_stats rollups
+@consignment_management.route('/stats', methods=['GET'])
+@token_required
+def consignment_stats_summary():
+    try:
+        days = {}
+        for arg in ('from', 'to'):
+            value = request.args.get(arg)
+            if value:
+                try:
+                    datetime.datetime.strptime(value, "%Y-%m-%d")
+                except ValueError:
+                    return jsonify({"success": False, "message": f"{arg} must be a YYYY-MM-DD date"}), 400
+            days[arg] = value
+        period = request.args.get('period', 'day')
+        if period not in ('day', 'month'):
+            return jsonify({"success": False, "message": "period must be 'day' or 'month'"}), 400
+
+        with db_connection() as conn:
+            try:
+                result = consignment_stats.summary(
+                    conn, days['from'], days['to'],
+                    sender_country=request.args.get('sender_country'),
+                    receiver_country=request.args.get('receiver_country'),
+                    period=period)
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+        return jsonify({"success": True, **result}), 200
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -195,47 +671,34 @@ def fetch_consignments():
 @token_required
 def fetch_consignment(consignment_uuid):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+
+            # Revalidation only needs the row's version
+            if request.if_none_match:
+                cursor.execute('SELECT uuid, row_version FROM Consignments WHERE uuid = ?', (consignment_uuid,))
+                current = cursor.fetchone() or archive.fetch(conn, consignment_uuid, 'uuid, row_version')
+                if current and request.if_none_match.contains_weak(consignment_cache.row_etag(*current)):
+                    return _versioned(Response(status=304), consignment_cache.row_etag(*current))
         
-        cursor.execute('''
-            SELECT 
-                uuid, sender_name, sender_address, sender_country, sender_mail, sender_phone,
-                receiver_name, receiver_address, receiver_country, shipment_id, shipment_date,
-                PackageQuantity, HS_code, totalWeight, Item_desc, handling_inst,
-                compliant, created_at
-            FROM Consignments
-            WHERE uuid = ?
-        ''', (consignment_uuid,))
+            cursor.execute(f'''
+                SELECT uuid, row_version, {", ".join(CONSIGNMENT_FIELDS.values())}
+                FROM Consignments
+                WHERE uuid = ?
+            ''', (consignment_uuid,))
         
-        row = cursor.fetchone()
-        conn.close()
+            row = cursor.fetchone()
+            if row is None:
+                row = archive.fetch(conn, consignment_uuid,
+                                    f'uuid, row_version, {", ".join(CONSIGNMENT_FIELDS.values())}')
         
         if not row:
             return jsonify({"success": False, "message": "Consignment not found"}), 404
-        
-        consignment = {
-            "uuid": row[0],
-            "sender_name": row[1],
-            "sender_address": row[2],
-            "sender_country": row[3],
-            "sender_mail": row[4],
-            "sender_phone": row[5],
-            "receiver_name": row[6],
-            "receiver_address": row[7],
-            "receiver_country": row[8],
-            "shipment_id": row[9],
-            "shipment_date": row[10],
-            "package_quantity": row[11],
-            "hs_code": row[12],
-            "total_weight": row[13],
-            "item_desc": row[14],
-            "handling_inst": row[15],
-            "compliant": row[16],
-            "created_at": row[17]
-        }
-        
-        return jsonify(consignment), 200
+
+        encoder = json_stream.RowEncoder(list(CONSIGNMENT_FIELDS), raw=('compliance_reasons',), offset=2,
+                                         sort_keys=current_app.json.sort_keys)
+        response = Response(encoder.encode(row) + '\n', mimetype='application/json')
+        return _versioned(response, consignment_cache.row_etag(row[0], row[1])), 200
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -245,22 +708,48 @@ def fetch_consignment(consignment_uuid):
 @token_required
 def download_invoice(consignment_uuid):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute("SELECT commercial_invoice, shipment_id FROM Consignments WHERE uuid = ?", (consignment_uuid,))
-        result = cursor.fetchone()
-        conn.close()
+            cursor.execute(
+                "SELECT invoice_sha256, shipment_id, commercial_invoice IS NOT NULL FROM Consignments WHERE uuid = ?",
+                (consignment_uuid,))
+            result = cursor.fetchone()
+
+            legacy_invoice = None
+            if result and result[0] is None and result[2]:
+                # Not moved to the invoice store yet (see `flask migrate-invoices`)
+                cursor.execute("SELECT commercial_invoice FROM Consignments WHERE uuid = ?", (consignment_uuid,))
+                legacy_invoice = cursor.fetchone()[0]
+            elif result is None:
+                result = archive.fetch_invoice(conn, consignment_uuid)
+                legacy_invoice = result and result[2]
         
-        if not result or result[0] is None:
+        if not result or (result[0] is None and legacy_invoice is None):
             return jsonify({"success": False, "message": "Invoice not found"}), 404
-        
-        pdf_file = BytesIO(result[0])
+
+        if legacy_invoice is not None:
+            return send_file(
+                BytesIO(legacy_invoice),
+                mimetype='application/pdf',
+                as_attachment=True,
+                download_name=f'invoice_{result[1]}.pdf',
+                conditional=True
+            )
+
+        path = invoice_store.path_for(result[0])
+        if not os.path.exists(path):
+            return jsonify({"success": False, "message": "Invoice not found"}), 404
+
+        # Served from disk via the WSGI file wrapper. conditional=True handles
+        # Range and If-None-Match/If-Modified-Since; the digest is a strong ETag
         return send_file(
-            pdf_file, 
+            os.path.abspath(path),
             mimetype='application/pdf', 
             as_attachment=True, 
-            download_name=f'invoice_{result[1]}.pdf'
+            download_name=f'invoice_{result[1]}.pdf',
+            conditional=True,
+            etag=result[0]
         )
         
     except Exception as e:
@@ -277,19 +766,344 @@ def update_compliance(consignment_uuid):
         if new_status not in ['pending', 'compliant', 'flagged']:
             return jsonify({"success": False, "message": "Invalid compliance status"}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("UPDATE Consignments SET compliant = ? WHERE uuid = ?", (new_status, consignment_uuid))
-        
-        if cursor.rowcount == 0:
-            conn.close()
-            return jsonify({"success": False, "message": "Consignment not found"}), 404
+        # The audit entry's room is taken before the write lock: waiting for
+        # it while holding the lock would stall the audit writer too
+        try:
+            entry = audit.reserve()
+        except audit.AuditUnavailable as e:
+            return jsonify({"success": False, "message": f"Compliance status not changed, the audit trail is unavailable: {e}"}), 503
+
+        with entry, db_connection() as conn:
+            cursor = conn.cursor()
+
+            # Taking the write lock first makes the status read here the one being replaced
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute("SELECT uuid, shipment_id, compliant FROM Consignments WHERE uuid = ?", (consignment_uuid,))
+            current = cursor.fetchone()
+            if current is None:
+                if archive.locate(conn, consignment_uuid) is not None:
+                    return jsonify({"success": False, "message": "Archived consignments are read-only"}), 409
+                return jsonify({"success": False, "message": "Consignment not found"}), 404
         
-        conn.commit()
-        conn.close()
+            cursor.execute(
+                "UPDATE Consignments SET compliant = ?, compliance_override = 1 WHERE uuid = ?",
+                (new_status, consignment_uuid))
+            entry.record(conn, current['uuid'], current['shipment_id'], request.token_data['user_id'],
+                         current['compliant'], new_status)
+            conn.commit()
+            # Only a committed change is buffered (async mode)
+            entry.committed()
+
+        changefeed.notify()
+        if new_status == 'compliant':
+            # The confirmation trigger recorded the shipment's HS code; make
+            # it suggestible here at once, other processes pick it up shortly
+            hs_suggest.refresh()
         
         return jsonify({"success": True, "message": "Compliance status updated successfully"}), 200
         
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500 
\ No newline at end of file
+        return jsonify({"success": False, "error": str(e)}), 500 
+
+
+MAX_AUDIT_PAGE_SIZE = 500
+
+def _audit_time(value, name):
+    """from/to argument (a date or an ISO date-time, UTC) in changed_at form."""
+    try:
+        moment = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO date or date-time")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc)
+    return audit.timestamp(moment)
+
+# Audit trail of manual status changes, newest first. Filters: user_id,
+# uuid, from/to (changed_at range, to exclusive); pages follow X-Next-Cursor
+@consignment_management.route('/audit', methods=['GET'])
+@token_required
+def compliance_audit():
+    if request.token_data.get('userRole') not in ('admin', 'compliance'):
+        return jsonify({"success": False, "message": "Only compliance officers and admins can view the audit trail"}), 403
+    try:
+        args = request.args
+        try:
+            user_id = int(args['user_id']) if args.get('user_id') else None
+            consignment_uuid = int(args['uuid']) if args.get('uuid') else None
+            limit = int(args.get('limit', 100))
+        except ValueError:
+            return jsonify({"success": False, "message": "user_id, uuid and limit must be integers"}), 400
+        if not 1 <= limit <= MAX_AUDIT_PAGE_SIZE:
+            return jsonify({"success": False, "message": f"limit must be between 1 and {MAX_AUDIT_PAGE_SIZE}"}), 400
+        try:
+            since = _audit_time(args['from'], 'from') if args.get('from') else None
+            until = _audit_time(args['to'], 'to') if args.get('to') else None
+            after = decode_cursor(args['cursor']) if args.get('cursor') else None
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        with db_connection() as conn:
+            entries = audit.query(conn, user_id, consignment_uuid, since, until, limit + 1, after)
+
+        response = jsonify({"success": True, "entries": entries[:limit]})
+        if len(entries) > limit:
+            response.headers['X-Next-Cursor'] = encode_cursor(entries[limit - 1]['changed_at'], entries[limit - 1]['id'])
+        return response, 200
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+# Look up restricted HS codes for a destination by category or HS prefix
+@consignment_management.route('/search-hs-code', methods=['POST'])
+@token_required
+def search_hs_code():
+    try:
+        data = request.json or {}
+        destination = data.get('destination_country')
+        main_category = data.get('main_category')
+        sub_category = data.get('sub_category')
+        hs_code = data.get('hs_code')
+
+        if not destination:
+            return jsonify({"success": False, "message": "destination_country is required"}), 400
+        if not (main_category or sub_category or hs_code):
+            return jsonify({"success": False, "message": "Provide main_category, sub_category or hs_code"}), 400
+
+        jurisdiction = restrictions.get_index().for_country(destination)
+        if jurisdiction is None:
+            return jsonify({"success": False, "message": f"Unsupported destination '{destination}'"}), 400
+
+        matches = jurisdiction.search(main_category, sub_category, hs_code)
+        if not matches:
+            return jsonify({"success": False, "message": "No matching HS code found"}), 404
+
+        results = [{
+            "hs_code": match.hs_code,
+            "main_category": match.main_category,
+            "sub_category": match.sub_category,
+        } for match in matches]
+
+        return jsonify({
+            "success": True,
+            "destination": jurisdiction.name,
+            "hs_code": results[0]["hs_code"],
+            "restricted": True,
+            "results": results,
+        }), 200
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+# Re-evaluate every stored consignment against the current restriction lists
+@consignment_management.route('/rescore', methods=['POST'])
+@token_required
+def rescore_consignments():
+    if request.token_data.get('userRole') not in ('admin', 'compliance'):
+        return jsonify({"success": False, "message": "Only compliance officers and admins can re-score"}), 403
+    try:
+        job_id = jobs.submit('rescore', {"chunk_size": request.args.get('chunk_size', type=int)},
+                             created_by=request.token_data['user_id'])
+        return jsonify({"success": True, "job_id": job_id, "status": jobs.QUEUED}), 202
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+# Move shipments older than ?older_than_days= (default TG_ARCHIVE_AFTER_DAYS)
+# to the monthly archive partitions, in the background
+@consignment_management.route('/archive', methods=['POST'])
+@token_required
+def archive_consignments():
+    if request.token_data.get('userRole') != 'admin':
+        return jsonify({"success": False, "message": "Only admins can archive consignments"}), 403
+    try:
+        older_than_days = request.args.get('older_than_days', type=int)
+        if older_than_days is not None and older_than_days < 0:
+            return jsonify({"success": False, "message": "older_than_days must not be negative"}), 400
+        job_id = jobs.submit('archive', {"older_than_days": older_than_days,
+                                         "batch_size": request.args.get('batch_size', type=int)},
+                             created_by=request.token_data['user_id'])
+        return jsonify({"success": True, "job_id": job_id, "status": jobs.QUEUED}), 202
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+# Re-run the compliance rules for selected consignments in the background
+@consignment_management.route('/evaluate', methods=['POST'])
+@token_required
+def evaluate_consignments():
+    if request.token_data.get('userRole') not in ('admin', 'compliance'):
+        return jsonify({"success": False, "message": "Only compliance officers and admins can re-evaluate consignments"}), 403
+    try:
+        uuids = (request.json or {}).get('uuids')
+        if not isinstance(uuids, list) or not uuids or not all(isinstance(u, int) for u in uuids):
+            return jsonify({"success": False, "message": "uuids must be a non-empty list of integers"}), 400
+        if len(uuids) > config.EVALUATE_MAX_UUIDS:
+            return jsonify({"success": False, "message": f"At most {config.EVALUATE_MAX_UUIDS} uuids per request"}), 400
+        job_id = jobs.submit('evaluate_compliance', {"uuids": uuids}, created_by=request.token_data['user_id'])
+        return jsonify({"success": True, "job_id": job_id, "status": jobs.QUEUED}), 202
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+def _report_file(key, fmt):
+    response = send_file(
+        os.path.abspath(reports.path_for(key, fmt)),
+        mimetype=reports.FORMATS[fmt],
+        download_name=f'report-{key[:12]}.{fmt}',
+        conditional=True,
+        etag=key
+    )
+    response.headers['X-Report-Key'] = key
+    return response
+
+
+# Compliance report or shipping forms for chosen shipments ("uuids") or a
+# listing ("filters"), as HTML or PDF. An unchanged report is sent from the
+# report cache; a new one is streamed while it renders, or rendered by a
+# background job when it is large or "async" is asked for
+@consignment_management.route('/reports', methods=['POST'])
+@token_required
+def create_report():
+    try:
+        data = request.json or {}
+        try:
+            spec = reports.parse_spec(data)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        conn = get_db_connection()
+        try:
+            # One read snapshot for the key and the report it names
+            conn.execute('BEGIN')
+            key, count = reports.report_key(conn, spec)
+            if count == 0:
+                conn.close()
+                return jsonify({"success": False, "message": "No consignments found"}), 404
+
+            if reports.cached(key, spec["format"]) is not None:
+                conn.close()
+                response = _report_file(key, spec["format"])
+                response.headers['X-Report-Cache'] = 'hit'
+                return response
+
+            if data.get('async') or count > config.REPORT_SYNC_MAX_ROWS:
+                conn.close()
+                job_id = jobs.submit('report', spec, created_by=request.token_data['user_id'])
+                return jsonify({"success": True, "job_id": job_id, "status": jobs.QUEUED}), 202
+        except BaseException:
+            conn.close()
+            raise
+
+        # As with fetch-consignments, the connection stays checked out until
+        # the body is sent or the server closes the response
+        release = closing_once(conn)
+
+        def body():
+            try:
+                yield from reports.generate(conn, spec, key)
+            finally:
+                release()
+
+        response = Response(body(), mimetype=reports.FORMATS[spec["format"]])
+        response.call_on_close(release)
+        response.headers['X-Report-Key'] = key
+        response.headers['X-Report-Cache'] = 'miss'
+        return response, 200
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+# A finished report by the key from X-Report-Key or a report job's result
+@consignment_management.route('/reports/<string:key>.<string:fmt>', methods=['GET'])
+@token_required
+def download_report(key, fmt):
+    if fmt not in reports.FORMATS or not re.fullmatch(r'[0-9a-f]{64}', key):
+        return jsonify({"success": False, "message": "Report not found"}), 404
+    if reports.cached(key, fmt) is None:
+        return jsonify({"success": False, "message": "Report not found"}), 404
+    return _report_file(key, fmt)
+
+
+def _restriction_args(data):
+    """(jurisdiction table, HS code as stored) from a restriction request, or an error response."""
+    destination = data.get('destination_country')
+    jurisdiction = restrictions.jurisdiction_for(destination)
+    if jurisdiction is None:
+        return None, (jsonify({"success": False, "message": f"Unsupported destination '{destination}'"}), 400)
+    hs_code = restrictions.normalize_hs(data.get('hs_code'))
+    if not hs_code:
+        return None, (jsonify({"success": False, "message": "hs_code is required"}), 400)
+    # The restriction tables keep HS_code as INTEGER; normalize_hs restores the leading zero
+    return (jurisdiction, int(hs_code)), None
+
+
+# Add or remove a restricted HS code; only the consignments it covers are re-evaluated
+@consignment_management.route('/restrictions', methods=['POST', 'DELETE'])
+@token_required
+def edit_restrictions():
+    if request.token_data.get('userRole') not in ('admin', 'compliance'):
+        return jsonify({"success": False, "message": "Only compliance officers and admins can edit restrictions"}), 403
+    try:
+        data = request.json or {}
+        args, error = _restriction_args(data)
+        if error:
+            return error
+        jurisdiction, hs_code = args
+
+        with db_connection() as conn:
+            if request.method == 'POST':
+                if not data.get('main_category'):
+                    return jsonify({"success": False, "message": "main_category is required"}), 400
+                conn.execute(
+                    f'INSERT INTO {jurisdiction} (HS_code, main_category, sub_category) VALUES (?, ?, ?)',
+                    (hs_code, data['main_category'], data.get('sub_category')))
+            else:
+                cursor = conn.execute(f'DELETE FROM {jurisdiction} WHERE HS_code = ?', (hs_code,))
+                if cursor.rowcount == 0:
+                    return jsonify({"success": False, "message": "Restriction not found"}), 404
+            conn.commit()
+
+        job_id = jobs.submit('apply_restriction_changes', created_by=request.token_data['user_id'])
+        return jsonify({"success": True, "destination": jurisdiction, "job_id": job_id, "status": jobs.QUEUED}), 202
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+# Recent restriction edits and how many consignments each one touched
+@consignment_management.route('/restriction-changes', methods=['GET'])
+@token_required
+def restriction_changes():
+    try:
+        limit = max(1, min(request.args.get('limit', 50, type=int), MAX_PAGE_SIZE))
+        with db_connection() as conn:
+            rows = conn.execute(
+                '''SELECT id, jurisdiction, hs_code, op, changed_at, applied_at, affected, changed
+                   FROM restriction_changes ORDER BY id DESC LIMIT ?''', (limit,)).fetchall()
+        return jsonify({"success": True, "changes": [dict(row) for row in rows]}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+# Consignments re-evaluated because of one restriction edit
+@consignment_management.route('/restriction-changes/<int:change_id>', methods=['GET'])
+@token_required
+def restriction_change_effects(change_id):
+    try:
+        with db_connection() as conn:
+            change = conn.execute(
+                '''SELECT id, jurisdiction, hs_code, op, changed_at, applied_at, affected, changed
+                   FROM restriction_changes WHERE id = ?''', (change_id,)).fetchone()
+            if change is None:
+                return jsonify({"success": False, "message": "Restriction change not found"}), 404
+            # Paged by uuid: ?after=<last uuid seen>
+            limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+            effects = conn.execute(
+                '''SELECT uuid, previous_status, new_status FROM restriction_change_effects
+                   WHERE change_id = ? AND uuid > ? ORDER BY uuid LIMIT ?''',
+                (change_id, request.args.get('after', 0, type=int), limit)).fetchall()
+        return jsonify({"success": True, "change": dict(change), "consignments": [dict(row) for row in effects]}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
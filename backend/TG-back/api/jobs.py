@@ -0,0 +1,25 @@
+from flask import Blueprint, jsonify, request
+import jobs
+from utils import token_required
+
+# Define the blueprint for background job status
+job_management = Blueprint('job_management', __name__)
+
+
+# Fetch the status, progress and result of a background job
+@job_management.route('/<string:job_id>', methods=['GET'])
+@token_required
+def fetch_job(job_id):
+    try:
+        job_info = jobs.get_job(job_id)
+        if job_info is None:
+            return jsonify({"success": False, "message": "Job not found"}), 404
+
+        token_data = request.token_data
+        if job_info['created_by'] != token_data['user_id'] and token_data.get('userRole') not in ('admin', 'compliance'):
+            return jsonify({"success": False, "message": "You can only view your own jobs"}), 403
+
+        return jsonify({"success": True, **job_info}), 200
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
@@ -0,0 +1,116 @@
+from functools import wraps
+
+from flask import Blueprint, jsonify, request
+import archive
+import audit
+import auth_cache
+import changefeed
+import compliance
+import consignment_cache
+import hs_classifier
+import hs_suggest
+import passwords
+import reports
+from db import pool_stats
+from utils import token_required
+
+# Define the blueprint for operational endpoints
+system_management = Blueprint('system_management', __name__)
+
+
+def admin_required(f):
+    """Restrict an endpoint to admins; goes below token_required."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if request.token_data.get('userRole') != 'admin':
+            return jsonify({"success": False, "message": "Only admins can view system statistics"}), 403
+        return f(*args, **kwargs)
+    return decorated
+
+
+# Connection pool usage, for sizing TG_DB_POOL_SIZE
+@system_management.route('/db-pool', methods=['GET'])
+@token_required
+@admin_required
+def db_pool():
+    return jsonify({"success": True, "pools": pool_stats()}), 200
+
+
+# Principal/token cache hit rates for token_required
+@system_management.route('/auth-cache', methods=['GET'])
+@token_required
+@admin_required
+def auth_cache_stats():
+    return jsonify({"success": True, **auth_cache.stats()}), 200
+
+
+# Hit rate of the rendered fetch-consignments pages
+@system_management.route('/listing-cache', methods=['GET'])
+@token_required
+@admin_required
+def listing_cache_stats():
+    return jsonify({"success": True, **consignment_cache.stats()}), 200
+
+
+# Hot table size and the archive partitions with their row counts and date ranges
+@system_management.route('/archive', methods=['GET'])
+@token_required
+@admin_required
+def archive_stats():
+    return jsonify({"success": True, **archive.stats()}), 200
+
+
+# Report cache size and hit rate of this process
+@system_management.route('/reports', methods=['GET'])
+@token_required
+@admin_required
+def report_cache_stats():
+    return jsonify({"success": True, **reports.stats()}), 200
+
+
+# Audit write-behind buffer: pending entries, batch sizes and write failures
+@system_management.route('/audit', methods=['GET'])
+@token_required
+@admin_required
+def audit_stats():
+    return jsonify({"success": True, "audit": audit.stats()}), 200
+
+
+# Change feed position, buffer and connected subscribers of this process
+@system_management.route('/change-feed', methods=['GET'])
+@token_required
+@admin_required
+def change_feed_stats():
+    return jsonify({"success": True, "feed": changefeed.stats()}), 200
+
+
+# Per-rule evaluation counts and timings of the compliance engine
+@system_management.route('/compliance-rules', methods=['GET'])
+@token_required
+@admin_required
+def compliance_rules():
+    return jsonify({"success": True, **compliance.stats()}), 200
+
+
+# HS classifier cache hits, batching and model call time
+@system_management.route('/hs-classifier', methods=['GET'])
+@token_required
+@admin_required
+def hs_classifier_stats():
+    return jsonify({"success": True, **hs_classifier.get_classifier().stats()}), 200
+
+
+# Offline HS suggestion index size and query time
+@system_management.route('/hs-suggest', methods=['GET'])
+@token_required
+@admin_required
+def hs_suggest_stats():
+    return jsonify({"success": True, **hs_suggest.stats()}), 200
+
+
+# bcrypt pool load: queue wait, work time and rejections
+@system_management.route('/passwords', methods=['GET'])
+@token_required
+@admin_required
+def password_stats():
+    return jsonify({"success": True, **passwords.stats()}), 200
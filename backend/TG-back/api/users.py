@@ -1,8 +1,9 @@
 from flask import Blueprint, current_app, jsonify, request
 import jwt
-import bcrypt
 import datetime
-from utils import get_db_connection, token_required
+import auth_cache
+import passwords
+from utils import db_connection, token_required
 
 # Define the blueprint for users
 user_management = Blueprint('user_management', __name__)
@@ -14,15 +15,31 @@ def authenticate():
     email = request.json.get("email")
     password = request.json.get("password")
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        'SELECT user_id, password, firstName, lastName, email, phoneNumber, companyName, userRole, regNumber, primaryCountry, shippingVolume, created_at FROM users WHERE email = ?',
-        (email,))
-    result = cursor.fetchone()
-    conn.close()
+    if not email or not password:
+        return jsonify({"success": False, "message": "Email and password are required"}), 400
 
-    if result and bcrypt.checkpw(password.encode('utf-8'), result['password'].encode('utf-8')):
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT user_id, password, firstName, lastName, email, phoneNumber, companyName, userRole, regNumber, primaryCountry, shippingVolume, created_at FROM users WHERE email = ?',
+            (email,))
+        result = cursor.fetchone()
+
+    try:
+        if result is None:
+            authenticated = passwords.reject_unknown()
+        else:
+            authenticated = passwords.check_password(password, result['password'])
+            # Move the stored hash to the configured work factor while we have the password
+            if authenticated and passwords.needs_rehash(result['password']):
+                password_hash = passwords.hash_password(password)
+                with db_connection() as conn:
+                    conn.execute('UPDATE users SET password = ? WHERE user_id = ?', (password_hash, result['user_id']))
+                    conn.commit()
+    except passwords.PasswordHasherBusy as e:
+        return jsonify({"success": False, "message": str(e)}), 503
+
+    if authenticated:
         token = jwt.encode({
             'user_id': result['user_id'],
             'email': email,
@@ -84,42 +101,45 @@ def register():
     if shippingVolume and shippingVolume not in ['low', 'medium', 'high']:
         return jsonify({"success": False, "message": "Invalid shipping volume"}), 400
 
-    # Hash the password
-    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-    # Check if email already exists
-    cursor.execute('SELECT COUNT(*) FROM users WHERE email = ?', (email,))
-    if cursor.fetchone()[0] > 0:
-        conn.close()
-        return jsonify({"success": False, "message": "Email already exists"}), 409
+        # Check if email already exists
+        cursor.execute('SELECT COUNT(*) FROM users WHERE email = ?', (email,))
+        if cursor.fetchone()[0] > 0:
+            return jsonify({"success": False, "message": "Email already exists"}), 409
 
+    # Hash the password, without holding a database connection meanwhile
     try:
-        # Insert new user
-        cursor.execute(
-            '''INSERT INTO users (firstName, lastName, email, phoneNumber, companyName, userRole, 
-            companyType, regNumber, primaryCountry, shippingVolume, password) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-            (firstName, lastName, email, phoneNumber, companyName, userRole,
-             companyType, regNumber, primaryCountry, shippingVolume, password_hash)
-        )
-        conn.commit()
+        password_hash = passwords.hash_password(password)
+    except passwords.PasswordHasherBusy as e:
+        return jsonify({"success": False, "message": str(e)}), 503
 
-        # Get the user_id of the newly created user
-        user_id = cursor.lastrowid
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-        return jsonify({
-            "success": True,
-            "message": "User registered successfully",
-            "user_id": user_id
-        }), 201
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"success": False, "message": f"Registration failed: {str(e)}"}), 500
-    finally:
-        conn.close()
+        try:
+            # Insert new user
+            cursor.execute(
+                '''INSERT INTO users (firstName, lastName, email, phoneNumber, companyName, userRole, 
+                companyType, regNumber, primaryCountry, shippingVolume, password) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (firstName, lastName, email, phoneNumber, companyName, userRole,
+                 companyType, regNumber, primaryCountry, shippingVolume, password_hash)
+            )
+            conn.commit()
+
+            # Get the user_id of the newly created user
+            user_id = cursor.lastrowid
+
+            return jsonify({
+                "success": True,
+                "message": "User registered successfully",
+                "user_id": user_id
+            }), 201
+        except Exception as e:
+            conn.rollback()
+            return jsonify({"success": False, "message": f"Registration failed: {str(e)}"}), 500
 
 
 # Edit user profile
@@ -154,22 +174,29 @@ def edit_profile():
     new_password = request.json.get("new_password")
     current_password = request.json.get("current_password")
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        # If password change is requested, verify current password first
-        if new_password and current_password:
-            cursor.execute('SELECT password FROM users WHERE user_id = ?', (token_user_id,))
-            stored_password = cursor.fetchone()['password']
-
-            if not bcrypt.checkpw(current_password.encode('utf-8'), stored_password.encode('utf-8')):
+    # If password change is requested, verify current password first. bcrypt
+    # runs before a connection is checked out, as in register
+    password_hash = None
+    if new_password and current_password:
+        try:
+            with db_connection() as conn:
+                stored_password = conn.execute('SELECT password FROM users WHERE user_id = ?',
+                                               (token_user_id,)).fetchone()['password']
+            if not passwords.check_password(current_password, stored_password):
                 return jsonify({"success": False, "message": "Current password is incorrect"}), 401
 
             # Hash the new password
-            password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            password_hash = passwords.hash_password(new_password)
+        except passwords.PasswordHasherBusy as e:
+            return jsonify({"success": False, "message": str(e)}), 503
+        except Exception as e:
+            return jsonify({"success": False, "message": f"Update failed: {str(e)}"}), 500
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-            # Update with new password
+        try:
+            # Password is only replaced when a new hash was computed above
             cursor.execute(
                 '''UPDATE users SET 
                 firstName = COALESCE(?, firstName),
@@ -183,39 +210,19 @@ def edit_profile():
                 twoFA = COALESCE(?, twoFA),
                 notifs = COALESCE(?, notifs),
                 alerts = COALESCE(?, alerts),
-                password = ?
+                password = COALESCE(?, password)
                 WHERE user_id = ?''',
                 (firstName, lastName, phoneNumber, companyName, companyType, regNumber,
                  primaryCountry, shippingVolume, twoFA, notifs, alerts, password_hash, token_user_id)
             )
-        else:
-            # Update user without changing password
-            cursor.execute(
-                '''UPDATE users SET 
-                firstName = COALESCE(?, firstName),
-                lastName = COALESCE(?, lastName),
-                phoneNumber = COALESCE(?, phoneNumber),
-                companyName = COALESCE(?, companyName),
-                companyType = COALESCE(?, companyType),
-                regNumber = COALESCE(?, regNumber),
-                primaryCountry = COALESCE(?, primaryCountry),
-                shippingVolume = COALESCE(?, shippingVolume),
-                twoFA = COALESCE(?, twoFA),
-                notifs = COALESCE(?, notifs),
-                alerts = COALESCE(?, alerts)
-                WHERE user_id = ?''',
-                (firstName, lastName, phoneNumber, companyName, companyType, regNumber,
-                 primaryCountry, shippingVolume, twoFA, notifs, alerts, token_user_id)
-            )
 
-        conn.commit()
+            conn.commit()
+            auth_cache.invalidate_principal(token_user_id)
 
-        return jsonify({
-            "success": True,
-            "message": "Profile updated successfully"
-        }), 200
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"success": False, "message": f"Update failed: {str(e)}"}), 500
-    finally:
-        conn.close()
\ No newline at end of file
+            return jsonify({
+                "success": True,
+                "message": "Profile updated successfully"
+            }), 200
+        except Exception as e:
+            conn.rollback()
+            return jsonify({"success": False, "message": f"Update failed: {str(e)}"}), 500
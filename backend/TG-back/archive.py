@@ -0,0 +1,329 @@
+import datetime
+import heapq
+import os
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+
+import config
+from db import get_pool
+
+# Hot/cold split of Consignments. Shipments older than TG_ARCHIVE_AFTER_DAYS
+# move, a batch at a time, into one SQLite file per month of created_at under
+# ARCHIVE_DIR (consignments-YYYY-MM.db), so the hot table and its indexes
+# only hold recent shipments and stay in the page cache.
+#
+# A partition only ever receives rows; legacy inline invoices are stored
+# zlib-compressed (invoices already in invoice_store stay where they are) and
+# the file is VACUUMed after each run that added to it. In the hot database,
+# archived_consignments routes a uuid or shipment_id to its partition and
+# archive_manifest (migration 17) records each partition's created_at range,
+# which is what lets a date-ranged listing decide which files to open.
+#
+# Moves are online: each batch is committed to its partition first, then
+# removed from Consignments in one short write transaction, and only if the
+# row did not change in between (row_version). A crash between the two
+# commits leaves a copy in the partition that the next run overwrites.
+# Archived shipments are read-only and leave the full-text and restriction
+# indexes; the dashboard rollups keep counting them.
+
+# The Consignments columns partitions keep, in the order they store them
+# (compliance_basis is only needed for re-scoring, which skips archived rows)
+COLUMNS = (
+    'uuid', 'sender_name', 'sender_address', 'sender_country', 'sender_mail', 'sender_phone',
+    'receiver_name', 'receiver_address', 'receiver_country', 'shipment_id', 'shipment_date',
+    'PackageQuantity', 'HS_code', 'totalWeight', 'Item_desc', 'handling_inst', 'commercial_invoice',
+    'compliant', 'created_at', 'invoice_sha256', 'declared_value', 'compliance_reasons',
+    'compliance_override', 'row_version',
+)
+_INVOICE = COLUMNS.index('commercial_invoice')
+
+PARTITION_SQL = """
+    CREATE TABLE IF NOT EXISTS Consignments (
+        uuid INTEGER PRIMARY KEY,
+        sender_name TEXT,
+        sender_address TEXT,
+        sender_country TEXT,
+        sender_mail TEXT,
+        sender_phone TEXT,
+        receiver_name TEXT,
+        receiver_address TEXT,
+        receiver_country TEXT,
+        shipment_id TEXT,
+        shipment_date TEXT,
+        PackageQuantity INTEGER,
+        HS_code TEXT,
+        totalWeight REAL,
+        Item_desc TEXT,
+        handling_inst TEXT,
+        commercial_invoice BLOB,  -- compressed as named by invoice_codec
+        compliant TEXT,
+        created_at TIMESTAMP,
+        invoice_sha256 TEXT,
+        declared_value REAL,
+        compliance_reasons TEXT,
+        compliance_override INTEGER,
+        row_version INTEGER,
+        invoice_codec TEXT
+    );
+    -- The listing filters of fetch-consignments, as on the hot table
+    CREATE INDEX IF NOT EXISTS idx_consignments_created ON Consignments(created_at);
+    CREATE INDEX IF NOT EXISTS idx_consignments_compliant_created ON Consignments(compliant, created_at);
+    CREATE INDEX IF NOT EXISTS idx_consignments_receiver_created ON Consignments(receiver_country, created_at);
+    CREATE INDEX IF NOT EXISTS idx_consignments_sender_created ON Consignments(sender_country, created_at);
+    CREATE INDEX IF NOT EXISTS idx_consignments_hs_code ON Consignments(HS_code, created_at);
+"""
+
+_INSERT = (f"INSERT OR REPLACE INTO Consignments ({', '.join(COLUMNS)}, invoice_codec) "
+           f"VALUES ({', '.join('?' * (len(COLUMNS) + 1))})")
+
+
+def path_for(partition):
+    return os.path.join(config.ARCHIVE_DIR, f'consignments-{partition}.db')
+
+
+def partition_of(created_at):
+    """Partition name (YYYY-MM) for a created_at value."""
+    return str(created_at)[:7]
+
+
+def _open_for_write(partition):
+    os.makedirs(config.ARCHIVE_DIR, exist_ok=True)
+    conn = sqlite3.connect(path_for(partition), timeout=config.DB_BUSY_TIMEOUT_MS / 1000)
+    # Written once per run and read often: a rollback journal keeps each
+    # partition a single file, FULL makes the commit durable before the hot
+    # rows are deleted
+    conn.execute('PRAGMA journal_mode = DELETE')
+    conn.execute('PRAGMA synchronous = FULL')
+    conn.executescript(PARTITION_SQL)
+    return conn
+
+
+def open_partition(partition):
+    """Read-only connection to one partition."""
+    conn = sqlite3.connect(f'file:{path_for(partition)}?mode=ro', uri=True,
+                           timeout=config.DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def partitions(conn, created_from=None, created_to=None):
+    """(partition, newest created_at) of the partitions holding shipments
+    created in [created_from, created_to), newest first; either bound may be
+    None."""
+    return [tuple(row) for row in conn.execute(
+        '''SELECT partition, max_created FROM archive_manifest
+           WHERE rows > 0 AND (?1 IS NULL OR max_created >= ?1) AND (?2 IS NULL OR min_created < ?2)
+           ORDER BY partition DESC''', (created_from, created_to))]
+
+
+@contextmanager
+def opened(names):
+    """Read-only connections to the named partitions, closed afterwards."""
+    conns = []
+    try:
+        for name in names:
+            conns.append(open_partition(name))
+        yield conns
+    finally:
+        for part in conns:
+            part.close()
+
+
+def locate(conn, consignment_uuid):
+    """Partition an archived shipment lives in, or None."""
+    row = conn.execute('SELECT partition FROM archived_consignments WHERE uuid = ?', (consignment_uuid,)).fetchone()
+    return row[0] if row else None
+
+
+def fetch(conn, consignment_uuid, columns):
+    """One archived row (columns is SQL over the partition table), or None."""
+    partition = locate(conn, consignment_uuid)
+    if partition is None:
+        return None
+    with opened([partition]) as (part,):
+        return part.execute(f'SELECT {columns} FROM Consignments WHERE uuid = ?', (consignment_uuid,)).fetchone()
+
+
+def fetch_invoice(conn, consignment_uuid):
+    """(invoice_sha256, shipment_id, inline invoice bytes or None) of an
+    archived shipment, or None if it is not archived."""
+    row = fetch(conn, consignment_uuid, 'invoice_sha256, shipment_id, commercial_invoice, invoice_codec')
+    if row is None:
+        return None
+    blob = row[2]
+    if blob is not None and row[3] == 'zlib':
+        blob = zlib.decompress(blob)
+    return row[0], row[1], blob
+
+
+def _merge(rows, more, limit):
+    """The newest limit + 1 of two (created_at, uuid, ...) lists sorted newest
+    first. A uuid in both is taken from rows, which holds the hot table's."""
+    merged = []
+    seen = set()
+    # heapq.merge keeps ties in argument order
+    for row in heapq.merge(rows, more, key=lambda row: (row[0], row[1]), reverse=True):
+        if row[1] not in seen:
+            seen.add(row[1])
+            merged.append(row)
+            if len(merged) > limit:
+                break
+    return merged
+
+
+def listing(conn, ranges, columns, where_sql, params, limit):
+    """One fetch-consignments page from the hot table and the partitions in
+    ranges (as returned by partitions()), newest first: (rows, (created_at,
+    uuid) of the last row if there is a next page, else None).
+
+    Each source is asked for limit + 1 rows, newest first, and partitions
+    are visited newest first until the page is filled with rows newer than
+    anything the next one holds, so a page costs a few indexed range reads
+    however many months the date range spans.
+    """
+    query = f'''
+        SELECT created_at, uuid, {columns} FROM Consignments
+        {where_sql}
+        ORDER BY created_at DESC, uuid DESC
+        LIMIT ?'''
+    rows = conn.execute(query, (*params, limit + 1)).fetchall()
+    for partition, newest in ranges:
+        if len(rows) > limit and rows[limit][0] > newest:
+            break
+        with opened([partition]) as (part,):
+            rows = _merge(rows, part.execute(query, (*params, limit + 1)).fetchall(), limit)
+    last = (rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+    return [row[2:] for row in rows[:limit]], last
+
+
+def _cold(row):
+    values = list(row)
+    codec = None
+    if values[_INVOICE] is not None:
+        values[_INVOICE] = zlib.compress(values[_INVOICE], config.ARCHIVE_ZLIB_LEVEL)
+        codec = 'zlib'
+    return (*values, codec)
+
+
+def _move(conn, partition, rows):
+    """Copy rows to their partition, then drop the unchanged ones from the
+    hot table. Returns the number archived."""
+    part = _open_for_write(partition)
+    try:
+        part.executemany(_INSERT, [_cold(row) for row in rows])
+        part.commit()
+    finally:
+        part.close()
+
+    uuids = [row['uuid'] for row in rows]
+    placeholders = ','.join('?' * len(uuids))
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # The directory rows go first: the rollup delete trigger skips
+        # shipments that are in it
+        conn.executemany(
+            'INSERT OR REPLACE INTO archived_consignments (uuid, shipment_id, partition, created_at) VALUES (?, ?, ?, ?)',
+            [(row['uuid'], row['shipment_id'], partition, row['created_at']) for row in rows])
+        conn.executemany('DELETE FROM Consignments WHERE uuid = ? AND row_version = ?',
+                         [(row['uuid'], row['row_version']) for row in rows])
+        # Rows updated since they were read stay hot until the next run
+        changed = [r[0] for r in conn.execute(
+            f'SELECT uuid FROM Consignments WHERE uuid IN ({placeholders})', uuids)]
+        if changed:
+            conn.execute(f'DELETE FROM archived_consignments WHERE uuid IN ({",".join("?" * len(changed))})', changed)
+        kept = set(changed)
+        moved = [row for row in rows if row['uuid'] not in kept]
+        if moved:
+            conn.execute(
+                '''INSERT INTO archive_manifest (partition, rows, min_created, max_created, bytes, updated_at)
+                   VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                   ON CONFLICT (partition) DO UPDATE SET
+                       rows = rows + excluded.rows,
+                       min_created = min(min_created, excluded.min_created),
+                       max_created = max(max_created, excluded.max_created),
+                       bytes = excluded.bytes, updated_at = excluded.updated_at''',
+                (partition, len(moved), min(row['created_at'] for row in moved),
+                 max(row['created_at'] for row in moved), os.path.getsize(path_for(partition))))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if changed:
+        part = _open_for_write(partition)
+        try:
+            part.execute(f'DELETE FROM Consignments WHERE uuid IN ({",".join("?" * len(changed))})', changed)
+            part.commit()
+        finally:
+            part.close()
+    return len(moved)
+
+
+def run(older_than_days=None, batch_size=None, vacuum=True, progress=None):
+    """Archive every shipment created more than older_than_days ago.
+
+    Each batch holds the hot database's write lock only for its delete, and
+    runs pause TG_ARCHIVE_PAUSE_MS between batches, so requests keep being
+    served throughout. Safe to stop and re-run at any point.
+    """
+    days = config.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or config.ARCHIVE_BATCH_SIZE
+    cutoff = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    start = time.perf_counter()
+    summary = {"cutoff": cutoff, "archived": 0, "skipped": 0, "partitions": {}, "seconds": 0.0}
+    after = ('', 0)
+
+    with get_pool().connection() as conn:
+        while True:
+            rows = conn.execute(
+                f'''SELECT {', '.join(COLUMNS)} FROM Consignments
+                    WHERE created_at < ? AND (created_at, uuid) > (?, ?)
+                    ORDER BY created_at, uuid LIMIT ?''', (cutoff, *after, batch_size)).fetchall()
+            if not rows:
+                break
+            after = (rows[-1]['created_at'], rows[-1]['uuid'])
+
+            by_partition = {}
+            for row in rows:
+                by_partition.setdefault(partition_of(row['created_at']), []).append(row)
+            for partition, batch in by_partition.items():
+                moved = _move(conn, partition, batch)
+                summary["archived"] += moved
+                summary["skipped"] += len(batch) - moved
+                summary["partitions"][partition] = summary["partitions"].get(partition, 0) + moved
+
+            summary["seconds"] = round(time.perf_counter() - start, 3)
+            if progress:
+                progress(summary)
+            time.sleep(config.ARCHIVE_PAUSE_MS / 1000)
+
+        if vacuum:
+            for partition in summary["partitions"]:
+                part = _open_for_write(partition)
+                try:
+                    part.execute('VACUUM')
+                finally:
+                    part.close()
+                conn.execute('UPDATE archive_manifest SET bytes = ? WHERE partition = ?',
+                             (os.path.getsize(path_for(partition)), partition))
+            conn.commit()
+
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def stats():
+    with get_pool().connection() as conn:
+        rows = conn.execute(
+            'SELECT partition, rows, min_created, max_created, bytes, updated_at FROM archive_manifest ORDER BY partition'
+        ).fetchall()
+        hot = conn.execute('SELECT COUNT(*) FROM Consignments').fetchone()[0]
+    return {
+        "hot_rows": hot,
+        "archived_rows": sum(row['rows'] for row in rows),
+        "archive_bytes": sum(row['bytes'] or 0 for row in rows),
+        "after_days": config.ARCHIVE_AFTER_DAYS,
+        "partitions": [dict(row) for row in rows],
+    }
@@ -0,0 +1,265 @@
+import atexit
+import datetime
+import os
+import threading
+import time
+
+import config
+from db import get_pool
+
+# Audit trail of manual compliance status changes (compliance_audit,
+# migration 16). Entries are stamped when the change is made.
+#
+# TG_AUDIT_MODE picks the durability:
+#   async  - entries are buffered in the process once the change has
+#            committed, and one thread writes them in batched transactions,
+#            every TG_AUDIT_FLUSH_MS or at TG_AUDIT_BATCH_SIZE entries, so an
+#            override does not pay for a second commit of its own; a crash
+#            can lose the last interval
+#   commit - the entry is inserted in the transaction that makes the change,
+#            so both are committed or neither is
+#
+# A change takes a Reservation before its transaction: in async mode that is
+# where a full buffer makes it wait, while it holds no lock the writer needs.
+
+MODES = ('async', 'commit')
+
+_INSERT = '''INSERT INTO compliance_audit
+    (consignment_uuid, shipment_id, user_id, old_status, new_status, changed_at)
+    VALUES (?, ?, ?, ?, ?, ?)'''
+
+
+class AuditUnavailable(Exception):
+    """Raised in async mode when the buffer stayed full (the database has
+    been refusing writes) for TG_AUDIT_COMMIT_TIMEOUT. The change should not be made."""
+
+
+def timestamp(moment=None):
+    """UTC time as stored in changed_at: ISO 8601 with milliseconds, which
+    sorts correctly as text."""
+    moment = moment or datetime.datetime.now(datetime.timezone.utc)
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f'{moment.microsecond // 1000:03d}Z'
+
+
+class AuditLog:
+    """The async mode's buffer and writer thread."""
+
+    def __init__(self, batch_size, flush_interval, max_buffer):
+        self.pid = os.getpid()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._pending = []  # rows
+        self._reserved = 0  # room held for changes not committed yet
+        self._cond = threading.Condition()
+        self._flushing = False
+        self.recorded = 0
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_error = None
+        threading.Thread(target=self._run, name='audit-writer', daemon=True).start()
+
+    def reserve(self):
+        """Hold room in the buffer for one entry, waiting while it is full."""
+        with self._cond:
+            # A full buffer means the database has been refusing writes;
+            # wait for room rather than grow without bound
+            if not self._cond.wait_for(lambda: len(self._pending) + self._reserved < self.max_buffer,
+                                       config.AUDIT_COMMIT_TIMEOUT):
+                raise AuditUnavailable(f'Audit buffer still full after {config.AUDIT_COMMIT_TIMEOUT}s')
+            self._reserved += 1
+
+    def release(self):
+        """Give back room taken by reserve() for a change that did not commit."""
+        with self._cond:
+            self._reserved -= 1
+            self._cond.notify_all()
+
+    def append(self, row):
+        """Buffer the entry of a committed change into the room reserve() took."""
+        with self._cond:
+            self._reserved -= 1
+            self._pending.append(row)
+            self.recorded += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _due(self):
+        return len(self._pending) >= self.batch_size
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(self._due, self.flush_interval)
+                batch = self._pending[:self.batch_size]
+                del self._pending[:len(batch)]
+                self._flushing = bool(batch)
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            except Exception as e:
+                with self._cond:
+                    # Keep them, in order, for the next attempt
+                    self._pending[:0] = batch
+                    self._flushing = False
+                    self.failures += 1
+                    self.last_error = f'{type(e).__name__}: {e}'
+                time.sleep(self.flush_interval)
+                continue
+            with self._cond:
+                self._flushing = False
+                self.written += len(batch)
+                self.batches += 1
+                self._cond.notify_all()
+
+    def _write(self, batch):
+        with get_pool().connection() as conn:
+            conn.executemany(_INSERT, batch)
+            conn.commit()
+
+    def flush(self, timeout=None):
+        """Wait until everything recorded so far is written; False on timeout."""
+        with self._cond:
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._pending and not self._flushing,
+                                       timeout if timeout is not None else config.AUDIT_COMMIT_TIMEOUT)
+
+    def stats(self):
+        with self._cond:
+            buffered = len(self._pending)
+            reserved = self._reserved
+        return {
+            "mode": 'async',
+            "buffered": buffered,
+            "reserved": reserved,
+            "recorded": self.recorded,
+            "written": self.written,
+            "batches": self.batches,
+            "avg_batch": round(self.written / self.batches, 2) if self.batches else 0.0,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    global _log
+    log = _log
+    if log is None or log.pid != os.getpid():
+        with _log_lock:
+            if _log is None or _log.pid != os.getpid():
+                _log = AuditLog(config.AUDIT_BATCH_SIZE, config.AUDIT_FLUSH_MS / 1000, config.AUDIT_MAX_BUFFER)
+            log = _log
+    return log
+
+
+class Reservation:
+    """The audit entry of one status change, used as a context manager
+    around the change's transaction:
+
+        with audit.reserve() as entry:      # before BEGIN IMMEDIATE
+            ...                             # make the change
+            entry.record(conn, ...)
+            conn.commit()
+            entry.committed()
+
+    Leaving the block without committed() drops the entry.
+    """
+
+    def __init__(self, log):
+        self._log = log
+        self._row = None
+        self._open = log is not None
+        if log is not None:
+            log.reserve()
+
+    def record(self, conn, consignment_uuid, shipment_id, user_id, old_status, new_status):
+        """Audit a status change made in conn's open transaction; call before
+        committing it."""
+        self._row = (consignment_uuid, shipment_id, user_id, old_status, new_status, timestamp())
+        if self._log is None:
+            conn.execute(_INSERT, self._row)
+
+    def committed(self):
+        """Call once the change has committed; buffers an async entry."""
+        if self._open and self._row is not None:
+            self._open = False
+            self._log.append(self._row)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._open:
+            self._open = False
+            self._log.release()
+
+
+def reserve():
+    """A Reservation for one change. Call before the change's transaction
+    takes the write lock. Raises AuditUnavailable (async mode) when the
+    buffer stayed full for TG_AUDIT_COMMIT_TIMEOUT."""
+    if config.AUDIT_MODE == 'commit':
+        return Reservation(None)
+    if config.AUDIT_MODE != 'async':
+        raise ValueError(f"TG_AUDIT_MODE must be one of: {', '.join(MODES)}")
+    return Reservation(get_log())
+
+
+@atexit.register
+def _flush_at_exit():
+    log = _log
+    if log is not None and log.pid == os.getpid():
+        log.flush(timeout=config.AUDIT_COMMIT_TIMEOUT)
+
+
+def stats():
+    log = _log if _log is not None and _log.pid == os.getpid() else None
+    return log.stats() if log else {"mode": config.AUDIT_MODE}
+
+
+def query(conn, user_id=None, consignment_uuid=None, since=None, until=None, limit=100, after=None):
+    """One page of audit entries, newest first, as dicts with the acting
+    user's name. after is the (changed_at, id) of the last entry of the
+    previous page. Each filter combination is served by an index on
+    (user_id | consignment_uuid | nothing, changed_at, id).
+    """
+    where, params = [], []
+    if user_id is not None:
+        where.append('a.user_id = ?')
+        params.append(user_id)
+    if consignment_uuid is not None:
+        where.append('a.consignment_uuid = ?')
+        params.append(consignment_uuid)
+    if since:
+        where.append('a.changed_at >= ?')
+        params.append(since)
+    if until:
+        where.append('a.changed_at < ?')
+        params.append(until)
+    if after:
+        where.append('(a.changed_at, a.id) < (?, ?)')
+        params.extend(after)
+    rows = conn.execute(f'''
+        SELECT a.id, a.consignment_uuid, a.shipment_id, a.user_id, u.firstName, u.lastName, u.userRole,
+               a.old_status, a.new_status, a.changed_at
+        FROM compliance_audit a LEFT JOIN users u ON u.user_id = a.user_id
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY a.changed_at DESC, a.id DESC
+        LIMIT ?''', (*params, limit)).fetchall()
+    return [{
+        "id": row[0],
+        "uuid": row[1],
+        "shipment_id": row[2],
+        "user_id": row[3],
+        "user_name": ' '.join(part for part in (row[4], row[5]) if part) or None,
+        "user_role": row[6],
+        "old_status": row[7],
+        "new_status": row[8],
+        "changed_at": row[9],
+    } for row in rows]
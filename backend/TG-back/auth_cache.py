@@ -0,0 +1,72 @@
+import hashlib
+import threading
+import time
+
+import config
+from cache import LRUCache
+
+# user_id -> users row (as a dict) and sha256(token) -> decoded JWT payload
+principal_cache = LRUCache(config.AUTH_CACHE_SIZE, config.AUTH_CACHE_TTL)
+token_cache = LRUCache(config.AUTH_CACHE_SIZE, config.TOKEN_CACHE_TTL)
+
+_watch_lock = threading.Lock()
+_last_version = None
+_next_check = 0.0
+revalidations = 0
+
+
+def token_key(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def cache_token(token, payload):
+    ttl = config.TOKEN_CACHE_TTL
+    if 'exp' in payload:
+        # Never serve a token from cache past its expiry
+        ttl = min(ttl, payload['exp'] - time.time())
+    token_cache.set(token_key(token), payload, ttl)
+
+
+def invalidate_principal(user_id):
+    principal_cache.pop(int(user_id))
+
+
+def needs_revalidation():
+    return time.monotonic() >= _next_check
+
+
+def revalidate(conn):
+    """Evict principals changed by any process since the last check.
+
+    The users triggers bump user_versions on every update/delete, so one
+    indexed range query per interval is enough to stay coherent across
+    worker processes without re-reading users on every request.
+    """
+    global _last_version, _next_check, revalidations
+    now = time.monotonic()
+    if now < _next_check:
+        return
+    with _watch_lock:
+        if now < _next_check:
+            return
+        _next_check = now + config.AUTH_CACHE_REVALIDATE_SECONDS
+        revalidations += 1
+        if _last_version is None:
+            row = conn.execute('SELECT COALESCE(MAX(version), 0) FROM user_versions').fetchone()
+            _last_version = row[0]
+            principal_cache.clear()
+            return
+        rows = conn.execute(
+            'SELECT user_id, version FROM user_versions WHERE version > ? ORDER BY version',
+            (_last_version,)).fetchall()
+        for user_id, version in rows:
+            principal_cache.pop(user_id)
+            _last_version = version
+
+
+def stats():
+    return {
+        "principals": principal_cache.stats(),
+        "tokens": token_cache.stats(),
+        "revalidations": revalidations,
+    }
@@ -0,0 +1,72 @@
+"""Benchmarks and load tests. Run from backend/TG-back:
+
+    python -m benchmarks.generate --rows 1000000 --out /tmp/bench/database.db
+    python -m benchmarks.micro --db /tmp/bench/database.db
+    python -m benchmarks.load --db /tmp/bench/database.db            # Flask test client
+    python -m benchmarks.load --url http://127.0.0.1:5000 --db ...   # a running server
+
+Everything is seeded, and every command prints a JSON report (or writes it
+with --json) so runs can be compared across releases.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+
+def configure(db_path):
+    """Point the application modules at db_path. Call before importing them."""
+    db_path = os.path.abspath(db_path)
+    os.environ['TG_DATABASE_PATH'] = db_path
+    os.environ.setdefault('TG_INVOICE_STORE_DIR', os.path.join(os.path.dirname(db_path), 'invoices'))
+    os.environ.setdefault('TG_JOB_SPOOL_DIR', os.path.join(os.path.dirname(db_path), 'spool'))
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return db_path
+
+
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return None
+    return sorted_samples[min(len(sorted_samples) - 1, int(fraction * len(sorted_samples)))]
+
+
+def summarize(samples, elapsed=None, unit=1e6):
+    """Latency percentiles of samples (seconds) scaled by unit (default µs), and
+    throughput over elapsed wall-clock seconds (defaults to the samples' sum)."""
+    ordered = sorted(samples)
+    elapsed = elapsed if elapsed is not None else sum(ordered)
+    scale = lambda value: round(value * unit, 3) if value is not None else None
+    return {
+        "count": len(ordered),
+        "mean": scale(sum(ordered) / len(ordered)) if ordered else None,
+        "p50": scale(percentile(ordered, 0.50)),
+        "p95": scale(percentile(ordered, 0.95)),
+        "p99": scale(percentile(ordered, 0.99)),
+        "max": scale(ordered[-1]) if ordered else None,
+        "per_second": round(len(ordered) / elapsed, 1) if elapsed else None,
+    }
+
+
+def environment():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        revision = None
+    return {
+        "revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+
+def emit(report, path=None):
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if path:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+    print(text)
@@ -0,0 +1,171 @@
+"""Seeded synthetic database: users, restriction tables and any number of consignments.
+
+    python -m benchmarks.generate --rows 1000000 --out /tmp/bench/database.db --seed 1
+
+The restriction tables and base schema come from out.sql. Consignments ship
+to the four restricted jurisdictions (under their various spellings) and a
+few unrestricted countries; a configurable share carry a restricted HS code.
+Statuses are decided by the compliance engine, as add-consignment would.
+"""
+import argparse
+import datetime
+import os
+import random
+import time
+
+from . import configure, emit, environment
+
+BENCH_USERS = [
+    # (email, role); all share BENCH_PASSWORD
+    ('bench-admin@example.com', 'admin'),
+    ('bench-compliance@example.com', 'compliance'),
+    ('bench-exporter@example.com', 'exporter'),
+]
+BENCH_PASSWORD = 'benchmark'
+
+OTHER_COUNTRIES = ['CN', 'JP', 'CA', 'AU', 'BR', 'SG', 'AE', 'ZA']
+# Common HS chapters for parcel shipments (textiles, electronics, machinery, toys, ...)
+COMMON_CHAPTERS = ['61', '62', '64', '39', '42', '49', '71', '84', '85', '90', '94', '95', '33', '09']
+WORDS = ('cotton shirts', 'phone cases', 'laptop parts', 'ceramic mugs', 'tea', 'spices', 'books',
+         'leather wallets', 'toys', 'watch straps', 'cables', 'lamps', 'cosmetics', 'printed labels')
+
+
+def fake_pdf(rng, size):
+    """A small valid-looking PDF padded with seeded noise to about size bytes."""
+    pages = rng.randint(1, 4)
+    body = b''.join(b'%d 0 obj << /Type /Page >> endobj\n' % (i + 3) for i in range(pages))
+    head = b'%PDF-1.7\n1 0 obj << /Type /Catalog >> endobj\n' + body
+    tail = b'%%EOF\n'
+    padding = max(0, size - len(head) - len(tail))
+    return head + b'%' + rng.randbytes(padding) + b'\n' + tail
+
+
+def build(out, rows, seed, end_date, days, restricted_share, invoice_share, invoices, invoice_size, bcrypt_rounds, batch_size):
+    if os.path.exists(out):
+        raise SystemExit(f'{out} already exists')
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    configure(out)
+
+    import sqlite3
+
+    import bcrypt
+
+    import consignment_store
+    import invoice_store
+    import restrictions
+    from db import get_pool
+    from schema import init_db
+
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    base = sqlite3.connect(out)
+    with open(os.path.join(here, 'out.sql')) as f:
+        base.executescript(f.read())
+    base.close()
+    init_db()
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    with get_pool().connection() as conn:
+        password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode(), bcrypt.gensalt(bcrypt_rounds)).decode()
+        for email, role in BENCH_USERS:
+            conn.execute(
+                '''INSERT INTO users (firstName, lastName, email, phoneNumber, companyName, userRole,
+                                      primaryCountry, password) VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                ('Bench', role.title(), email, '000', 'Benchmark Ltd', role, 'UK', password_hash))
+        conn.commit()
+
+        index = restrictions.get_index()
+        aliases = [alias for names in restrictions.JURISDICTIONS.values() for alias in names]
+        restricted = {name: jurisdiction.trie.codes() for name, jurisdiction in index.jurisdictions.items()}
+
+        digests = []
+        for _ in range(invoices if invoice_share > 0 else 0):
+            digest, size = invoice_store.store_bytes(fake_pdf(rng, invoice_size))
+            invoice_store.register(conn, digest, size)
+            digests.append(digest)
+        conn.commit()
+
+        end = datetime.datetime.strptime(end_date, '%Y-%m-%d')
+        inserted = 0
+        while inserted < rows:
+            batch = []
+            created = []
+            for i in range(inserted, min(rows, inserted + batch_size)):
+                sender = rng.choice(aliases + OTHER_COUNTRIES)
+                receiver = rng.choice(aliases + OTHER_COUNTRIES)
+                jurisdiction = restrictions.jurisdiction_for(receiver)
+                if jurisdiction and restricted[jurisdiction] and rng.random() < restricted_share:
+                    hs_code = rng.choice(restricted[jurisdiction]) + ''.join(rng.choices('0123456789', k=2))
+                else:
+                    hs_code = rng.choice(COMMON_CHAPTERS) + ''.join(rng.choices('0123456789', k=4))
+                created_at = end - datetime.timedelta(seconds=rng.randint(0, days * 86400))
+                has_invoice = bool(digests) and rng.random() < invoice_share
+                validated = {
+                    "sender_name": f'Sender {rng.randint(1, 5000)}',
+                    "sender_address": f'{rng.randint(1, 999)} Export Street',
+                    "sender_country": sender,
+                    "sender_mail": f'sender{rng.randint(1, 5000)}@example.com',
+                    "sender_phone": str(rng.randint(10 ** 9, 10 ** 10 - 1)),
+                    "receiver_name": f'Receiver {rng.randint(1, 50000)}',
+                    "receiver_address": f'{rng.randint(1, 999)} Import Road',
+                    "receiver_country": receiver,
+                    "shipment_id": f'BENCH-{seed}-{i:09d}',
+                    "shipment_date": created_at.strftime('%Y-%m-%d'),
+                    "PackageQuantity": rng.randint(1, 20),
+                    "HS_code": hs_code,
+                    "totalWeight": round(rng.lognormvariate(2.5, 1.2), 2),
+                    "Item_desc": rng.choice(WORDS),
+                    "handling_inst": rng.choice(['', '', 'Fragile', 'Keep dry']),
+                    "declared_value": round(rng.lognormvariate(5.5, 1.5), 2),
+                }
+                decision = consignment_store.evaluate(validated, has_invoice)
+                batch.append(consignment_store.insert_params(
+                    validated, rng.choice(digests) if has_invoice else None, decision))
+                created.append(created_at.strftime('%Y-%m-%d %H:%M:%S'))
+            conn.executemany(consignment_store.INSERT_CONSIGNMENT_SQL, batch)
+            # created_at is spread over the past `days`; set it after insert so the
+            # stats triggers move each row into its real bucket
+            first = conn.execute('SELECT MAX(uuid) FROM Consignments').fetchone()[0] - len(batch) + 1
+            conn.executemany('UPDATE Consignments SET created_at = ? WHERE uuid = ?',
+                             [(stamp, first + offset) for offset, stamp in enumerate(created)])
+            conn.commit()
+            inserted += len(batch)
+            print(f'{inserted}/{rows} consignments', flush=True)
+
+        conn.execute('ANALYZE')
+        counts = dict(conn.execute('SELECT compliant, COUNT(*) FROM Consignments GROUP BY compliant').fetchall())
+    return {
+        "path": out,
+        "seed": seed,
+        "end_date": end_date,
+        "rows": rows,
+        "invoices": len(digests),
+        "by_status": counts,
+        "seconds": round(time.perf_counter() - started, 3),
+        "size_bytes": os.path.getsize(out),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', required=True, help='Database file to create.')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--end-date', default='2025-01-01', help='created_at values end on this YYYY-MM-DD date.')
+    parser.add_argument('--days', type=int, default=365, help='Spread created_at over this many days before --end-date.')
+    parser.add_argument('--restricted-share', type=float, default=0.05, help='Share of shipments with a restricted HS code.')
+    parser.add_argument('--invoice-share', type=float, default=0.8, help='Share of shipments with an invoice.')
+    parser.add_argument('--invoices', type=int, default=1000, help='Distinct invoice files to create.')
+    parser.add_argument('--invoice-size', type=int, default=64 * 1024, help='Bytes per invoice.')
+    parser.add_argument('--bcrypt-rounds', type=int, default=12, help='Cost of the benchmark users\' password hashes.')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--json', help='Also write the report to this file.')
+    args = parser.parse_args()
+
+    report = build(os.path.abspath(args.out), args.rows, args.seed, args.end_date, args.days, args.restricted_share,
+                   args.invoice_share, args.invoices, args.invoice_size, args.bcrypt_rounds, args.batch_size)
+    emit({"environment": environment(), "database": report}, args.json)
+
+
+if __name__ == '__main__':
+    main()
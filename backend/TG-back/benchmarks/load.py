@@ -0,0 +1,222 @@
+"""End-to-end load driver: every blueprint's routes, latency percentiles and throughput.
+
+    python -m benchmarks.load --db /tmp/bench/database.db                 # in-process Flask test client
+    python -m benchmarks.load --db /tmp/bench/database.db --url http://127.0.0.1:5000
+
+--db is always needed (to pick existing uuids and invoices); with --url the
+server must be serving that same database. Each scenario sends --requests
+requests from --concurrency threads; latencies are reported in ms.
+"""
+import argparse
+import fnmatch
+import http.client
+import json
+import random
+import threading
+import time
+import urllib.parse
+from collections import Counter
+
+from . import configure, emit, environment, summarize
+from .generate import BENCH_PASSWORD, BENCH_USERS
+
+
+class TestClientTransport:
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, headers=None, form=None, body=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        if form is not None:
+            response = client.open(path, method=method, headers=headers, data=form)
+        else:
+            response = client.open(path, method=method, headers=headers, json=body)
+        data = response.get_data()
+        return response.status_code, data
+
+
+class HTTPTransport:
+    """One keep-alive connection per thread."""
+
+    def __init__(self, url):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.local = threading.local()
+
+    def request(self, method, path, headers=None, form=None, body=None):
+        headers = dict(headers or {})
+        payload = None
+        if form is not None:
+            payload = urllib.parse.urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        for attempt in (1, 2):
+            conn = getattr(self.local, 'conn', None)
+            if conn is None:
+                conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed an idle keep-alive connection; reconnect once
+                conn.close()
+                self.local.conn = None
+                if attempt == 2:
+                    raise
+
+
+def scenarios(fixtures, seed):
+    """name -> (share of --requests, request builder taking a seeded Random)."""
+    auth = {'Authorization': fixtures['token']}
+    admin_email = BENCH_USERS[0][0]
+    counter = iter(range(10 ** 9))
+    counter_lock = threading.Lock()
+
+    def next_shipment_id():
+        with counter_lock:
+            return f'LOAD-{seed}-{time.time_ns()}-{next(counter)}'
+
+    def add_consignment(rng):
+        form = {
+            "sender_name": "Load Test", "sender_address": "1 Bench Street", "sender_country": "IN",
+            "sender_mail": "load@example.com", "sender_phone": "9876543210", "receiver_name": "Receiver",
+            "receiver_address": "2 Bench Road", "receiver_country": rng.choice(['UK', 'US', 'EU', 'India', 'JP']),
+            "shipment_id": next_shipment_id(), "shipment_date": "2024-06-01",
+            "PackageQuantity": str(rng.randint(1, 9)), "HS_code": rng.choice(['847130', '610910', '930200']),
+            "totalWeight": str(round(rng.uniform(0.5, 50), 2)), "Item_desc": "load test", "declared_value": "120.0",
+        }
+        return 'POST', '/consignment/add-consignment', {}, form, None
+
+    return {
+        "users.authenticate": (0.1, lambda rng: (
+            'POST', '/users/authenticate', {}, None, {"email": admin_email, "password": BENCH_PASSWORD})),
+        "consignment.fetch_consignments": (1, lambda rng: (
+            'GET', f"/consignment/fetch-consignments?limit=100{rng.choice(['', '&compliant=flagged', '&receiver_country=UK'])}",
+            auth, None, None)),
+        "consignment.fetch_consignment": (1, lambda rng: (
+            'GET', f"/consignment/fetch-consignment/{rng.choice(fixtures['uuids'])}", auth, None, None)),
+        "consignment.stats": (1, lambda rng: (
+            'GET', f"/consignment/stats?period={rng.choice(['day', 'month'])}", auth, None, None)),
+        "consignment.search_hs_code": (1, lambda rng: (
+            'POST', '/consignment/search-hs-code', auth, None,
+            {"destination_country": rng.choice(['UK', 'US', 'EU', 'India']), "hs_code": rng.choice(['93', '9301', '8471'])})),
+        "consignment.add_consignment": (1, add_consignment),
+        "consignment.download_invoice": (0.5, lambda rng: (
+            'GET', f"/consignment/download-invoice/{rng.choice(fixtures['invoice_uuids'])}", auth, None, None)),
+        "consignment.restriction_changes": (0.5, lambda rng: (
+            'GET', '/consignment/restriction-changes?limit=20', auth, None, None)),
+        "jobs.get_job": (0.5, lambda rng: ('GET', f"/jobs/{fixtures['job_id']}", auth, None, None)),
+        "system.db_pool": (0.5, lambda rng: ('GET', '/system/db-pool', auth, None, None)),
+    }
+
+
+def fixtures_for(transport, db_path, seed):
+    import sqlite3
+
+    conn = sqlite3.connect(db_path)
+    rng = random.Random(seed)
+    uuids = [row[0] for row in conn.execute('SELECT uuid FROM Consignments ORDER BY random() LIMIT 5000')]
+    invoice_uuids = [row[0] for row in conn.execute(
+        'SELECT uuid FROM Consignments WHERE invoice_sha256 IS NOT NULL LIMIT 5000')]
+    conn.close()
+    rng.shuffle(uuids)
+
+    status, body = transport.request('POST', '/users/authenticate',
+                                     body={"email": BENCH_USERS[0][0], "password": BENCH_PASSWORD})
+    if status != 200:
+        raise SystemExit(f'Could not log in as {BENCH_USERS[0][0]}: {status} {body[:200]!r}')
+    token = json.loads(body)['token']
+
+    status, body = transport.request('POST', '/consignment/evaluate', headers={'Authorization': token},
+                                     body={"uuids": uuids[:10]})
+    job_id = json.loads(body).get('job_id') if status == 202 else 'missing'
+    return {"token": token, "uuids": uuids or [0], "invoice_uuids": invoice_uuids or [0], "job_id": job_id}
+
+
+def run_scenario(transport, build, requests, concurrency, seed):
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        local_latencies = []
+        local_statuses = Counter()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            method, path, headers, form, body = build(rng)
+            start = time.perf_counter()
+            try:
+                status, _ = transport.request(method, path, headers=headers, form=form, body=body)
+            except Exception as e:
+                status = type(e).__name__
+            local_latencies.append(time.perf_counter() - start)
+            local_statuses[status] += 1
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    result = summarize(latencies, elapsed, unit=1e3)
+    result["statuses"] = {str(status): count for status, count in sorted(statuses.items(), key=str)}
+    result["errors"] = sum(count for status, count in statuses.items()
+                           if not isinstance(status, int) or status >= 500)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', required=True, help='Database made by benchmarks.generate.')
+    parser.add_argument('--url', help='Base URL of a running server; default is the in-process test client.')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per scenario (scaled by its share).')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--filter', default='*', help='Glob over scenario names.')
+    parser.add_argument('--json', help='Also write the report to this file.')
+    args = parser.parse_args()
+
+    db_path = configure(args.db)
+    if args.url:
+        transport = HTTPTransport(args.url)
+    else:
+        from api import create_app
+
+        transport = TestClientTransport(create_app())
+
+    fixtures = fixtures_for(transport, db_path, args.seed)
+    results = {}
+    for name, (share, build) in scenarios(fixtures, args.seed).items():
+        if fnmatch.fnmatch(name, args.filter):
+            results[name] = run_scenario(transport, build, max(1, int(args.requests * share)),
+                                         args.concurrency, args.seed)
+    emit({
+        "environment": environment(),
+        "target": args.url or "flask-test-client",
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "seed": args.seed,
+        "unit": "ms",
+        "scenarios": results,
+    }, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Micro-benchmarks for the per-request hot paths.
+
+    python -m benchmarks.micro --db /tmp/bench/database.db [--filter token] [--json out.json]
+
+Each benchmark runs `repeat` rounds of `number` calls; the report gives
+per-call latency percentiles (µs) across rounds and calls per second.
+"""
+import argparse
+import datetime
+import fnmatch
+import itertools
+import time
+
+from . import configure, emit, environment, summarize
+
+SAMPLE_CONSIGNMENT = {
+    "sender_name": "Acme Exports", "sender_address": "1 Export Street", "sender_country": "IN",
+    "sender_mail": "ops@acme.example", "sender_phone": "9876543210", "receiver_name": "Jane Doe",
+    "receiver_address": "2 Import Road", "receiver_country": "UK", "shipment_id": "BENCH-MICRO-1",
+    "shipment_date": "2024-06-01", "PackageQuantity": "3", "HS_code": "847130", "totalWeight": "12.5",
+    "Item_desc": "laptop parts", "handling_inst": "Fragile", "declared_value": "899.00",
+}
+
+
+class _Rows:
+    """Cursor stand-in serving an in-memory page to json_stream.stream."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchmany(self, size):
+        return list(itertools.islice(self.rows, size))
+
+
+def run(func, number, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return summarize(samples)
+
+
+def benchmarks(app, page_size):
+    """name -> (callable, calls per round)"""
+    import jwt
+
+    import auth_cache
+    import compliance
+    import json_stream
+    import restrictions
+    import validation
+    from api.consignment_management import CONSIGNMENT_FIELDS
+    from db import get_pool
+    from utils import token_required
+
+    with get_pool().connection() as conn:
+        user_id = conn.execute("SELECT user_id FROM users WHERE userRole = 'admin' LIMIT 1").fetchone()[0]
+        fields = list(CONSIGNMENT_FIELDS)
+        page = conn.execute(
+            f"SELECT created_at, uuid, {', '.join(CONSIGNMENT_FIELDS.values())} FROM Consignments "
+            "ORDER BY created_at DESC, uuid DESC LIMIT ?", (page_size,)).fetchall()
+
+    token = jwt.encode({'user_id': user_id, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)},
+                       app.config['SECRET_KEY'])
+    protected = token_required(lambda: 'ok')
+
+    def token_cached():
+        with app.test_request_context('/', headers={'Authorization': token}):
+            protected()
+
+    def token_cold():
+        auth_cache.token_cache.clear()
+        auth_cache.principal_cache.clear()
+        token_cached()
+
+    encoder = json_stream.RowEncoder(fields, raw=('compliance_reasons',), offset=2, sort_keys=True)
+
+    def serialize_page():
+        rows = iter(page)
+        ''.join(json_stream.stream(encoder, next(rows), _Rows(rows)))
+
+    shipment = {"receiver_country": "UK", "HS_code": "847130", "totalWeight": 12.5,
+                "declared_value": 899.0, "has_invoice": True}
+    index = restrictions.get_index()
+
+    return {
+        "validate_field_type.int": (lambda: validation.validate_field_type("3", "PackageQuantity", int), 10000),
+        "validate_field_type.float": (lambda: validation.validate_field_type("12.5", "totalWeight", float), 10000),
+        "validate_field_type.date": (lambda: validation.validate_field_type("2024-06-01", "shipment_date", "date"), 10000),
+        "validate_consignment": (lambda: validation.validate_consignment(SAMPLE_CONSIGNMENT), 2000),
+        "validate_consignments.batch_1000": (lambda: validation.validate_consignments([SAMPLE_CONSIGNMENT] * 1000), 5),
+        "token_required.cached": (token_cached, 500),
+        "token_required.cold": (token_cold, 200),
+        f"fetch_consignments.serialize_{len(page)}": (serialize_page, 5),
+        "restrictions.restricted": (lambda: index.restricted("UK", "847130"), 10000),
+        "compliance.evaluate": (lambda: compliance.evaluate(shipment), 5000),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', required=True, help='Database made by benchmarks.generate.')
+    parser.add_argument('--filter', default='*', help='Glob over benchmark names.')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--page-size', type=int, default=1000, help='Rows serialized per fetch_consignments page.')
+    parser.add_argument('--json', help='Also write the report to this file.')
+    args = parser.parse_args()
+
+    configure(args.db)
+    from api import create_app
+
+    app = create_app()
+    results = {}
+    for name, (func, number) in benchmarks(app, args.page_size).items():
+        if fnmatch.fnmatch(name, args.filter):
+            func()  # warm up caches and lazy imports
+            results[name] = run(func, number, args.repeat)
+    emit({"environment": environment(), "unit": "us", "benchmarks": results}, args.json)
+
+
+if __name__ == '__main__':
+    main()
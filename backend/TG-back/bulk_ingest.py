@@ -0,0 +1,148 @@
+import csv
+import json
+import sqlite3
+import time
+
+import config
+import consignment_store
+from db import get_pool
+from validation import validate_consignments
+
+# Streaming CSV / NDJSON shipment ingestion. Rows are read one at a time from
+# the uploaded stream, validated a batch at a time with the same rules as
+# add-consignment and inserted with executemany, one transaction per batch.
+
+FORMATS = ('csv', 'ndjson')
+
+# SQLite's default limit on host parameters is 32766; stay well below it
+_LOOKUP_CHUNK = 900
+
+
+def iter_rows(text_stream, fmt):
+    """Yield (row_number, values, error) for each record; row_number is 1-based
+    (the CSV header is not counted) and exactly one of values/error is set."""
+    if fmt == 'csv':
+        reader = csv.DictReader(text_stream)
+        for row_number, row in enumerate(reader, start=1):
+            if None in row:
+                yield row_number, None, "Row has more columns than the header"
+            else:
+                yield row_number, row, None
+    else:
+        row_number = 0
+        for line in text_stream:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                values = json.loads(line)
+            except ValueError as e:
+                yield row_number, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(values, dict):
+                yield row_number, None, "Each line must be a JSON object"
+                continue
+            yield row_number, values, None
+
+
+def _existing_shipment_ids(conn, shipment_ids):
+    existing = set()
+    for i in range(0, len(shipment_ids), _LOOKUP_CHUNK):
+        chunk = shipment_ids[i:i + _LOOKUP_CHUNK]
+        # Numbered, so both lookups share one parameter list
+        placeholders = ','.join(f'?{n}' for n in range(1, len(chunk) + 1))
+        existing.update(row[0] for row in conn.execute(
+            f'''SELECT shipment_id FROM Consignments WHERE shipment_id IN ({placeholders})
+                UNION ALL
+                SELECT shipment_id FROM archived_consignments WHERE shipment_id IN ({placeholders})''',
+            chunk))
+    return existing
+
+
+def ingest(text_stream, fmt, evaluate=True, batch_size=None):
+    """Validate and insert every row of text_stream; return a report dict."""
+    batch_size = batch_size or config.BULK_BATCH_SIZE
+    report = {"rows": 0, "inserted": 0, "failed": 0, "by_status": {}, "errors": [], "errors_truncated": False}
+    start = time.perf_counter()
+    seen = set()
+    batch = []
+
+    def fail(row_number, shipment_id, errors):
+        report["failed"] += 1
+        if len(report["errors"]) < config.BULK_MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": row_number, "shipment_id": shipment_id, "errors": errors})
+        else:
+            report["errors_truncated"] = True
+
+    def flush(conn):
+        rows = []
+        results = iter(validate_consignments(values for _, values, error in batch if error is None))
+        for row_number, _, error in batch:
+            if error:
+                fail(row_number, None, [error])
+                continue
+            validated_data, errors = next(results)
+            shipment_id = validated_data.get('shipment_id')
+            if errors:
+                fail(row_number, shipment_id, errors)
+                continue
+            if shipment_id in seen:
+                fail(row_number, shipment_id, ["Duplicate shipment ID in upload"])
+                continue
+            seen.add(shipment_id)
+            # Uploaded rows cannot carry an invoice; see InvoiceRequiredRule
+            decision = consignment_store.evaluate(validated_data, None) if evaluate else None
+            rows.append((row_number, validated_data, decision))
+        batch.clear()
+
+        # Checked under the write lock, so no other insert can take an id in between
+        conn.execute('BEGIN IMMEDIATE')
+        existing = _existing_shipment_ids(conn, [item[1]['shipment_id'] for item in rows])
+        accepted = []
+        for row_number, validated_data, decision in rows:
+            if validated_data['shipment_id'] in existing:
+                fail(row_number, validated_data['shipment_id'], ["Shipment ID already exists"])
+                continue
+            accepted.append((row_number, validated_data, decision,
+                             consignment_store.insert_params(validated_data, None, decision, invoice_pending=True)))
+
+        conn.execute('SAVEPOINT bulk_batch')
+        try:
+            conn.executemany(consignment_store.INSERT_CONSIGNMENT_SQL, [item[3] for item in accepted])
+            conn.execute('RELEASE bulk_batch')
+        except sqlite3.IntegrityError:
+            # A row the table's constraints reject; redo the batch a row at a
+            # time so only that row fails and is reported
+            conn.execute('ROLLBACK TO bulk_batch')
+            conn.execute('RELEASE bulk_batch')
+            inserted = []
+            for item in accepted:
+                try:
+                    conn.execute(consignment_store.INSERT_CONSIGNMENT_SQL, item[3])
+                except sqlite3.IntegrityError as e:
+                    fail(item[0], item[1]['shipment_id'], [f"Rejected by the database: {e}"])
+                else:
+                    inserted.append(item)
+            accepted = inserted
+        conn.commit()
+
+        for _, _, decision, _ in accepted:
+            status = decision.status if decision else 'pending'
+            report["by_status"][status] = report["by_status"].get(status, 0) + 1
+        report["inserted"] += len(accepted)
+
+    with get_pool().connection() as conn:
+        # Raw rows are validated a batch at a time (validate_consignments)
+        for row_number, values, error in iter_rows(text_stream, fmt):
+            report["rows"] += 1
+            batch.append((row_number, values, error))
+            if len(batch) >= batch_size:
+                flush(conn)
+
+        if batch:
+            flush(conn)
+
+    elapsed = time.perf_counter() - start
+    report["seconds"] = round(elapsed, 3)
+    report["rows_per_second"] = round(report["rows"] / elapsed, 1) if elapsed else None
+    return report
@@ -0,0 +1,209 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+from db import get_pool
+
+# Change feed of shipment creations and compliance status changes. Triggers
+# append every change to consignment_changes (migration 15), whose seq is
+# AUTOINCREMENT and so never goes backwards or gets reused, whichever
+# process wrote the row.
+#
+# Each process tails the table from one thread and keeps the latest
+# CHANGE_FEED_BUFFER events, already encoded, in a ring buffer. Subscribers
+# read from the buffer and sleep on one condition between events, so an idle
+# client costs a parked greenlet and no queries. A client resuming from
+# further back than the buffer reaches is served from the table; one asking
+# for changes that were pruned gets a reset and should reload its listing.
+
+_COLUMNS = 'seq, consignment_uuid, shipment_id, event, status, previous_status, receiver_country, changed_at'
+_PAGE = 1000
+
+
+def _encode(row):
+    seq = row[0]
+    data = json.dumps({
+        "seq": seq,
+        "uuid": row[1],
+        "shipment_id": row[2],
+        "event": row[3],
+        "status": row[4],
+        "previous_status": row[5],
+        "receiver_country": row[6],
+        "changed_at": row[7],
+    }, separators=(',', ':'))
+    return seq, data, f'id: {seq}\nevent: change\ndata: {data}\n\n'
+
+
+def last_seq(conn):
+    return conn.execute('SELECT COALESCE(MAX(seq), 0) FROM consignment_changes').fetchone()[0]
+
+
+def read_log(conn, since, limit):
+    """Encoded events after since, from the table; None if some were pruned."""
+    oldest = conn.execute('SELECT MIN(seq) FROM consignment_changes').fetchone()[0]
+    if oldest is not None and since < oldest - 1:
+        return None
+    return [_encode(row) for row in conn.execute(
+        f'SELECT {_COLUMNS} FROM consignment_changes WHERE seq > ? ORDER BY seq LIMIT ?', (since, limit))]
+
+
+class ChangeFeed:
+    """Ring buffer of the latest encoded events of this process.
+
+    Events are (seq, json, sse_frame). floor is the seq of the newest event
+    no longer buffered: the buffer answers any ``since >= floor``.
+    """
+
+    def __init__(self, capacity, start_seq):
+        self.pid = os.getpid()
+        self.capacity = capacity
+        self.floor = start_seq
+        self.last_seq = start_seq
+        self._events = []
+        self._seqs = []
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self.subscribers = 0
+        self.catch_up_reads = 0
+        self.resets = 0
+
+    def publish(self, events):
+        if not events:
+            return
+        with self._cond:
+            self._events.extend(events)
+            self._seqs.extend(event[0] for event in events)
+            self.last_seq = events[-1][0]
+            # Trimmed in bulk so publishing stays amortized O(1)
+            if len(self._events) >= 2 * self.capacity:
+                drop = len(self._events) - self.capacity
+                self.floor = self._seqs[drop - 1]
+                del self._events[:drop]
+                del self._seqs[:drop]
+            self._cond.notify_all()
+
+    def read(self, since, limit):
+        """(events after since, reset_to). reset_to is set, and events empty,
+        when since cannot be resumed from; the client should reload and
+        continue from reset_to."""
+        with self._cond:
+            if since > self.last_seq:
+                # Ahead of the log, e.g. a sequence from a restored database
+                self.resets += 1
+                return [], self.last_seq
+            if since >= self.floor:
+                start = bisect.bisect_right(self._seqs, since)
+                return self._events[start:start + limit], None
+        self.catch_up_reads += 1
+        with get_pool().connection() as conn:
+            events = read_log(conn, since, limit)
+            if events is None:
+                self.resets += 1
+                return [], last_seq(conn)
+        return events, None
+
+    def wait(self, since, timeout):
+        """Block until an event after since is buffered; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.last_seq > since, timeout)
+
+    @contextmanager
+    def subscribed(self):
+        """Counts a client as connected while the block runs."""
+        with self._cond:
+            self.subscribers += 1
+        try:
+            yield self
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+    def poke(self):
+        """Have the tailer look for new rows now rather than at its next poll."""
+        self._wake.set()
+
+    def tail(self):
+        while True:
+            self._wake.wait(config.CHANGE_FEED_POLL_SECONDS)
+            self._wake.clear()
+            try:
+                with get_pool().connection() as conn:
+                    while True:
+                        events = [_encode(row) for row in conn.execute(
+                            f'SELECT {_COLUMNS} FROM consignment_changes WHERE seq > ? ORDER BY seq LIMIT ?',
+                            (self.last_seq, _PAGE))]
+                        self.publish(events)
+                        if len(events) < _PAGE:
+                            break
+            except Exception:
+                # Try again next poll; subscribers just wait a little longer
+                pass
+            _maybe_prune()
+
+    def stats(self):
+        with self._cond:
+            buffered = len(self._events)
+        return {
+            "last_seq": self.last_seq,
+            "buffered": buffered,
+            "floor": self.floor,
+            "subscribers": self.subscribers,
+            "catch_up_reads": self.catch_up_reads,
+            "resets": self.resets,
+        }
+
+
+_last_prune = 0.0
+
+
+def _maybe_prune():
+    """Keep the newest CHANGE_FEED_RETENTION rows; any process may do it."""
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune < config.CHANGE_FEED_PRUNE_SECONDS:
+        return
+    _last_prune = now
+    try:
+        with get_pool().connection() as conn:
+            conn.execute('DELETE FROM consignment_changes WHERE seq <= ?',
+                         (last_seq(conn) - config.CHANGE_FEED_RETENTION,))
+            conn.commit()
+    except Exception:
+        pass
+
+
+_feed = None
+_feed_lock = threading.Lock()
+
+
+def get_feed():
+    """This process's feed, with its tailer started on first use."""
+    global _feed
+    feed = _feed
+    if feed is None or feed.pid != os.getpid():
+        with _feed_lock:
+            if _feed is None or _feed.pid != os.getpid():
+                with get_pool().connection() as conn:
+                    start = last_seq(conn)
+                _feed = ChangeFeed(config.CHANGE_FEED_BUFFER, start)
+                threading.Thread(target=_feed.tail, name='change-feed-tailer', daemon=True).start()
+            feed = _feed
+    return feed
+
+
+def notify():
+    """Called after committing a change so local subscribers see it at once;
+    other processes see it on their next poll."""
+    feed = _feed
+    if feed is not None and feed.pid == os.getpid():
+        feed.poke()
+
+
+def stats():
+    feed = _feed if _feed is not None and _feed.pid == os.getpid() else None
+    return feed.stats() if feed else None
@@ -0,0 +1,117 @@
+import click
+
+import archive
+import config
+import consignment_stats
+import hs_suggest
+import invoice_store
+import rescore
+import search
+from db import get_pool
+
+# Maintenance commands, run as `flask --app app <command>`
+
+
+def register_commands(app):
+    app.cli.add_command(migrate_invoices)
+    app.cli.add_command(rescore_consignments)
+    app.cli.add_command(apply_restriction_changes)
+    app.cli.add_command(rebuild_stats)
+    app.cli.add_command(rebuild_search_index)
+    app.cli.add_command(rebuild_hs_suggest)
+    app.cli.add_command(archive_consignments)
+
+
+@click.command('migrate-invoices')
+@click.option('--batch-size', default=50, show_default=True, help='Rows moved per transaction.')
+@click.option('--vacuum/--no-vacuum', default=False, help='VACUUM afterwards to return the freed pages to the OS.')
+def migrate_invoices(batch_size, vacuum):
+    """Move inline Consignments.commercial_invoice blobs into the invoice store."""
+    moved = 0
+    last_uuid = 0
+    with get_pool().connection() as conn:
+        while True:
+            rows = conn.execute(
+                '''SELECT uuid, commercial_invoice FROM Consignments
+                   WHERE commercial_invoice IS NOT NULL AND uuid > ?
+                   ORDER BY uuid LIMIT ?''', (last_uuid, batch_size)).fetchall()
+            if not rows:
+                break
+            for consignment_uuid, blob in rows:
+                digest, size = invoice_store.store_bytes(blob)
+                invoice_store.register(conn, digest, size)
+                conn.execute(
+                    'UPDATE Consignments SET invoice_sha256 = ?, commercial_invoice = NULL WHERE uuid = ?',
+                    (digest, consignment_uuid))
+            conn.commit()
+            moved += len(rows)
+            last_uuid = rows[-1][0]
+            click.echo(f'Moved {moved} invoices (up to uuid {last_uuid})')
+
+        if vacuum:
+            click.echo('Vacuuming...')
+            conn.execute('VACUUM')
+    click.echo(f'Done: {moved} invoices moved to {config.INVOICE_STORE_DIR}')
+
+
+@click.command('rescore-consignments')
+@click.option('--chunk-size', default=None, type=int, help='Rows read per chunk (default TG_RESCORE_CHUNK_SIZE).')
+def rescore_consignments(chunk_size):
+    """Recompute compliance status for all consignments after restriction lists change."""
+    def progress(summary):
+        rate = summary['scanned'] / summary['seconds'] if summary['seconds'] else 0
+        click.echo(f"Scanned {summary['scanned']} ({rate:,.0f} rows/s), changed {summary['changed']}")
+
+    summary = rescore.rescore_all(chunk_size, progress)
+    click.echo(f"Done in {summary['seconds']}s: {summary['changed']} of {summary['scanned']} changed {summary['by_status']}")
+
+
+@click.command('apply-restriction-changes')
+@click.option('--batch-size', default=500, show_default=True, help='Restriction changes applied per transaction.')
+def apply_restriction_changes(batch_size):
+    """Re-evaluate only the consignments affected by pending restriction-table edits."""
+    summary = rescore.apply_restriction_changes(batch_size)
+    click.echo(f"Done in {summary['seconds']}s: {summary['changes']} changes, "
+               f"{summary['changed']} of {summary['affected']} affected consignments changed {summary['by_status']}")
+
+
+@click.command('rebuild-stats')
+def rebuild_stats():
+    """Recompute the dashboard rollups (consignment_stats.ROLLUPS) from
+    Consignments and the archive partitions."""
+    with get_pool().connection() as conn:
+        with archive.opened(name for name, _ in archive.partitions(conn)) as partitions:
+            buckets = consignment_stats.rebuild(conn, partitions)
+    for table, count in buckets.items():
+        click.echo(f'{table}: {count} buckets')
+
+
+@click.command('rebuild-search-index')
+def rebuild_search_index():
+    """Rebuild the full-text search index (search.py) from Consignments."""
+    with get_pool().connection() as conn:
+        count = search.rebuild(conn)
+    click.echo(f'Indexed {count} shipments')
+
+
+@click.command('rebuild-hs-suggest')
+def rebuild_hs_suggest():
+    """Build and save a new HS suggestion index (hs_suggest.py), e.g. before
+    starting the workers so none of them builds it on its first request."""
+    with get_pool().connection() as conn:
+        index = hs_suggest.build_index(conn)
+    click.echo(f'Indexed {index.base.size} texts for {len(index.base.codes)} HS codes')
+
+
+@click.command('archive-consignments')
+@click.option('--older-than-days', default=None, type=int, help='Age to archive from (default TG_ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', default=None, type=int, help='Rows moved per transaction (default TG_ARCHIVE_BATCH_SIZE).')
+@click.option('--vacuum/--no-vacuum', default=True, help='Compact the partitions written to afterwards.')
+def archive_consignments(older_than_days, batch_size, vacuum):
+    """Move old shipments out of Consignments into the monthly archive partitions."""
+    def progress(summary):
+        click.echo(f"Archived {summary['archived']} (skipped {summary['skipped']} changed meanwhile)")
+
+    summary = archive.run(older_than_days, batch_size, vacuum=vacuum, progress=progress)
+    click.echo(f"Done in {summary['seconds']}s: {summary['archived']} shipments created before "
+               f"{summary['cutoff']} archived into {len(summary['partitions'])} partitions")
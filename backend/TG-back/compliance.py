@@ -0,0 +1,307 @@
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import config
+import restrictions
+
+# Severity of a finding: BLOCK flags the shipment, REVIEW leaves it pending
+BLOCK = 'block'
+REVIEW = 'review'
+
+# basis identifies what the violations depend on besides the shipment's own
+# fields (RuleEngine.basis); stored with them so batch re-evaluation can tell
+# when they may be out of date
+Decision = namedtuple('Decision', 'status violations basis')
+
+
+def violation(rule, code, message, severity=BLOCK, **details):
+    """Machine-readable finding, stored as JSON in Consignments.compliance_reasons."""
+    finding = {"rule": rule, "code": code, "severity": severity, "message": message}
+    if details:
+        finding["details"] = details
+    return finding
+
+
+class Rule:
+    """A compliance rule. compile() runs once per restriction-index version and
+    returns a check(shipment) callable for one destination (or None to skip it).
+
+    A shipment is a dict with receiver_country, HS_code, totalWeight,
+    declared_value and has_invoice.
+    """
+
+    name = None
+
+    def compile(self, jurisdiction):
+        raise NotImplementedError
+
+    def compile_batch(self, jurisdiction):
+        """Vectorized form used by batch re-evaluation (rescore.py).
+
+        Returns a callable taking a dict of NumPy columns (hs, weight, value,
+        has_invoice, invoice_pending) and returning (block_mask, review_mask), or None when the
+        rule never fires for this destination. Must agree with compile().
+        """
+        raise NotImplementedError
+
+
+class RestrictedHSCodeRule(Rule):
+    name = 'restricted_hs_code'
+
+    def compile(self, jurisdiction):
+        if jurisdiction is None:
+            def check(shipment):
+                return [violation(self.name, 'UNKNOWN_DESTINATION',
+                                  f"No restriction list for destination '{shipment['receiver_country']}'",
+                                  severity=REVIEW)]
+            return check
+
+        covering = jurisdiction.trie.covering
+        name = jurisdiction.name
+
+        def check(shipment):
+            hits = covering(shipment['HS_code'])
+            return [violation(self.name, 'RESTRICTED_HS_CODE',
+                              f"HS {hit.hs_code} ({hit.main_category}: {hit.sub_category}) is restricted for {name}",
+                              hs_code=hit.hs_code, jurisdiction=name) for hit in hits]
+        return check
+
+    def compile_batch(self, jurisdiction):
+        if jurisdiction is None:
+            def check(columns):
+                return None, np.ones(len(columns['hs']), dtype=bool)
+            return check
+
+        # Restricted codes grouped by length; casting the HS column to a
+        # narrower string dtype truncates every code to that prefix at once
+        by_length = {}
+        for code in jurisdiction.trie.codes():
+            by_length.setdefault(len(code), []).append(code)
+        by_length = {length: np.array(codes) for length, codes in by_length.items()}
+
+        def check(columns):
+            hs = columns['hs']
+            block = np.zeros(len(hs), dtype=bool)
+            for length, codes in by_length.items():
+                block |= np.isin(hs.astype(f'<U{length}'), codes)
+            return block, None
+        return check
+
+
+class WeightLimitRule(Rule):
+    name = 'weight_limit'
+
+    def __init__(self, max_kg, per_jurisdiction=None):
+        self.max_kg = max_kg
+        self.per_jurisdiction = per_jurisdiction or {}
+
+    def compile(self, jurisdiction):
+        limit = self.per_jurisdiction.get(jurisdiction.name if jurisdiction else None, self.max_kg)
+        if limit is None:
+            return None
+
+        def check(shipment):
+            weight = shipment.get('totalWeight')
+            if weight is not None and weight > limit:
+                return [violation(self.name, 'WEIGHT_LIMIT_EXCEEDED',
+                                  f"Total weight {weight} kg exceeds the {limit} kg limit",
+                                  limit=limit, value=weight)]
+            return None
+        return check
+
+    def compile_batch(self, jurisdiction):
+        limit = self.per_jurisdiction.get(jurisdiction.name if jurisdiction else None, self.max_kg)
+        if limit is None:
+            return None
+
+        def check(columns):
+            return columns['weight'] > limit, None
+        return check
+
+
+class InvoiceRequiredRule(Rule):
+    name = 'invoice_required'
+
+    def compile(self, jurisdiction):
+        def check(shipment):
+            has_invoice = shipment.get('has_invoice')
+            if has_invoice is None:
+                # Submitted without a way to attach one (bulk upload): not a
+                # missing invoice yet, but the shipment cannot be cleared
+                return [violation(self.name, 'INVOICE_PENDING', "A commercial invoice is still to be provided",
+                                  severity=REVIEW)]
+            if not has_invoice:
+                return [violation(self.name, 'MISSING_INVOICE', "A commercial invoice is required")]
+            return None
+        return check
+
+    def compile_batch(self, jurisdiction):
+        def check(columns):
+            missing = ~columns['has_invoice']
+            pending = columns['invoice_pending']
+            return missing & ~pending, missing & pending
+        return check
+
+
+class ValueThresholdRule(Rule):
+    name = 'value_threshold'
+
+    def __init__(self, max_value):
+        self.max_value = max_value
+
+    def compile(self, jurisdiction):
+        limit = self.max_value
+
+        def check(shipment):
+            value = shipment.get('declared_value')
+            if value is not None and value > limit:
+                return [violation(self.name, 'VALUE_THRESHOLD_EXCEEDED',
+                                  f"Declared value {value} exceeds the {limit} threshold and needs review",
+                                  severity=REVIEW, limit=limit, value=value)]
+            return None
+        return check
+
+    def compile_batch(self, jurisdiction):
+        limit = self.max_value
+
+        def check(columns):
+            return None, columns['value'] > limit
+        return check
+
+
+def default_rules():
+    rules = [RestrictedHSCodeRule(), WeightLimitRule(config.COMPLIANCE_MAX_WEIGHT_KG)]
+    if config.COMPLIANCE_REQUIRE_INVOICE:
+        rules.append(InvoiceRequiredRule())
+    rules.append(ValueThresholdRule(config.COMPLIANCE_MAX_DECLARED_VALUE))
+    return rules
+
+
+class RuleEngine:
+    """Rules compiled against one restriction index into a per-destination
+    tuple of checks, so evaluating a shipment is one dict lookup plus a few calls."""
+
+    def __init__(self, rules, index):
+        self.rules = rules
+        self.index = index
+        self._plans = {
+            name: self._compile(jurisdiction) for name, jurisdiction in index.jurisdictions.items()
+        }
+        self._unknown_plan = self._compile(None)
+        self._batch_plans = {
+            name: self._compile(jurisdiction, batch=True) for name, jurisdiction in index.jurisdictions.items()
+        }
+        self._unknown_batch_plan = self._compile(None, batch=True)
+        self._settings = repr([(type(rule).__name__, vars(rule)) for rule in rules])
+        self._bases = {}
+
+    def _compile(self, jurisdiction, batch=False):
+        plan = []
+        for rule in self.rules:
+            check = rule.compile_batch(jurisdiction) if batch else rule.compile(jurisdiction)
+            if check is not None:
+                plan.append((rule.name, check))
+        return tuple(plan)
+
+    def basis(self, jurisdiction_name, hs_digits):
+        """64-bit digest of the rule settings and of the restrictions covering
+        hs_digits for the destination. Two evaluations of the same shipment
+        with the same basis produce the same violations."""
+        key = (jurisdiction_name, hs_digits)
+        basis = self._bases.get(key)
+        if basis is None:
+            jurisdiction = self.index.jurisdictions.get(jurisdiction_name)
+            hits = jurisdiction.trie.covering(hs_digits) if jurisdiction else ()
+            digest = hashlib.blake2b(repr((self._settings, jurisdiction_name, hits)).encode('utf-8'), digest_size=8)
+            basis = self._bases[key] = int.from_bytes(digest.digest(), 'big', signed=True)
+        return basis
+
+    def evaluate_batch(self, jurisdiction_name, columns):
+        """Statuses for a column chunk of shipments that share one destination."""
+        plan = self._batch_plans.get(jurisdiction_name, self._unknown_batch_plan)
+        size = len(columns['hs'])
+        block = np.zeros(size, dtype=bool)
+        review = np.zeros(size, dtype=bool)
+        for _, check in plan:
+            rule_block, rule_review = check(columns)
+            if rule_block is not None:
+                block |= rule_block
+            if rule_review is not None:
+                review |= rule_review
+        return np.where(block, 'flagged', np.where(review, 'pending', 'compliant'))
+
+    def evaluate(self, shipment):
+        name = restrictions.jurisdiction_for(shipment.get('receiver_country'))
+        plan = self._plans.get(name, self._unknown_plan)
+        violations = []
+        timings = []
+        clock = time.perf_counter_ns
+        for rule_name, check in plan:
+            start = clock()
+            found = check(shipment)
+            timings.append((rule_name, clock() - start))
+            if found:
+                violations.extend(found)
+
+        with _timings_lock:
+            for rule_name, elapsed in timings:
+                counters = _timings.setdefault(rule_name, [0, 0])
+                counters[0] += 1
+                counters[1] += elapsed
+
+        if any(v['severity'] == BLOCK for v in violations):
+            status = 'flagged'
+        elif violations:
+            status = 'pending'
+        else:
+            status = 'compliant'
+        return Decision(status, violations, self.basis(name, restrictions.normalize_hs(shipment.get('HS_code'))))
+
+
+# Per-rule evaluation counts and time, kept across recompiles
+_timings = {}
+_timings_lock = threading.Lock()
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Engine compiled against the current restriction index, recompiled when it reloads."""
+    global _engine
+    index = restrictions.get_index()
+    engine = _engine
+    if engine is None or engine.index is not index:
+        with _engine_lock:
+            if _engine is None or _engine.index is not index:
+                _engine = RuleEngine(default_rules(), index)
+            engine = _engine
+    return engine
+
+
+def evaluate(shipment):
+    return get_engine().evaluate(shipment)
+
+
+def encode_reasons(violations):
+    return json.dumps(violations, separators=(',', ':')) if violations else None
+
+
+def stats():
+    with _timings_lock:
+        timings = {name: tuple(counters) for name, counters in _timings.items()}
+    return {
+        "restrictions_version": _engine.index.version if _engine else None,
+        "rules": {
+            name: {
+                "evaluations": calls,
+                "total_ms": round(nanos / 1e6, 3),
+                "avg_us": round(nanos / calls / 1e3, 3) if calls else 0.0,
+            } for name, (calls, nanos) in timings.items()
+        },
+    }
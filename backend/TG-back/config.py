@@ -0,0 +1,151 @@
+import os
+
+# Settings are read from the environment so the same code runs in development,
+# tests and production. Every value has a development-friendly default.
+
+
+def _int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _float(name, default):
+    return float(os.environ.get(name, default))
+
+
+# Database
+DATABASE_PATH = os.environ.get('TG_DATABASE_PATH', './database/database.db')
+DB_POOL_SIZE = _int('TG_DB_POOL_SIZE', 8)
+DB_POOL_TIMEOUT = _float('TG_DB_POOL_TIMEOUT', 10.0)  # seconds to wait for a free connection
+DB_BUSY_TIMEOUT_MS = _int('TG_DB_BUSY_TIMEOUT_MS', 5000)
+DB_SYNCHRONOUS = os.environ.get('TG_DB_SYNCHRONOUS', 'NORMAL')  # NORMAL is durable enough under WAL
+DB_CACHE_SIZE_KIB = _int('TG_DB_CACHE_SIZE_KIB', 65536)  # per connection
+DB_MMAP_SIZE = _int('TG_DB_MMAP_SIZE', 256 * 1024 * 1024)
+
+# Authenticated principal cache (utils.token_required)
+AUTH_CACHE_SIZE = _int('TG_AUTH_CACHE_SIZE', 10000)
+AUTH_CACHE_TTL = _float('TG_AUTH_CACHE_TTL', 300.0)
+TOKEN_CACHE_TTL = _float('TG_TOKEN_CACHE_TTL', 300.0)
+# How often each process checks user_versions for edits made by other processes
+AUTH_CACHE_REVALIDATE_SECONDS = _float('TG_AUTH_CACHE_REVALIDATE_SECONDS', 1.0)
+
+# Consignment read caching (consignment_cache.py): rendered fetch-consignments
+# pages, reused while the consignments table version is unchanged
+LISTING_CACHE_SIZE = _int('TG_LISTING_CACHE_SIZE', 256)
+LISTING_CACHE_TTL = _float('TG_LISTING_CACHE_TTL', 60.0)
+LISTING_CACHE_MAX_BODY = _int('TG_LISTING_CACHE_MAX_BODY', 512 * 1024)  # bytes; larger pages are not cached
+
+# Commercial invoice blob store
+INVOICE_STORE_DIR = os.environ.get('TG_INVOICE_STORE_DIR', './database/invoices')
+INVOICE_CHUNK_SIZE = _int('TG_INVOICE_CHUNK_SIZE', 64 * 1024)
+
+# Restricted-goods index (restrictions.py)
+RESTRICTIONS_RELOAD_SECONDS = _float('TG_RESTRICTIONS_RELOAD_SECONDS', 2.0)
+
+# Compliance rule engine (compliance.py)
+COMPLIANCE_MAX_WEIGHT_KG = _float('TG_COMPLIANCE_MAX_WEIGHT_KG', 500.0)
+COMPLIANCE_MAX_DECLARED_VALUE = _float('TG_COMPLIANCE_MAX_DECLARED_VALUE', 10000.0)
+COMPLIANCE_REQUIRE_INVOICE = os.environ.get('TG_COMPLIANCE_REQUIRE_INVOICE', '1') == '1'
+RESCORE_CHUNK_SIZE = _int('TG_RESCORE_CHUNK_SIZE', 50000)
+
+# Bulk shipment ingestion (bulk_ingest.py)
+BULK_BATCH_SIZE = _int('TG_BULK_BATCH_SIZE', 5000)  # rows per INSERT transaction
+BULK_MAX_REPORTED_ERRORS = _int('TG_BULK_MAX_REPORTED_ERRORS', 1000)
+
+# Background jobs (jobs.py)
+JOB_BACKEND = os.environ.get('TG_JOB_BACKEND', 'thread')  # 'thread' or 'celery'
+JOB_WORKERS = _int('TG_JOB_WORKERS', 2)  # concurrency of job kinds that do not set their own
+JOB_MAX_RETRIES = _int('TG_JOB_MAX_RETRIES', 2)
+JOB_RETRY_BACKOFF = _float('TG_JOB_RETRY_BACKOFF', 2.0)  # seconds, doubled per attempt
+JOB_PROGRESS_INTERVAL = _float('TG_JOB_PROGRESS_INTERVAL', 1.0)
+JOB_SPOOL_DIR = os.environ.get('TG_JOB_SPOOL_DIR', './database/spool')
+EVALUATE_MAX_UUIDS = _int('TG_EVALUATE_MAX_UUIDS', 10000)  # consignments per POST /consignment/evaluate
+CELERY_BROKER_URL = os.environ.get('TG_CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_EAGER = os.environ.get('TG_CELERY_EAGER', '0') == '1'
+
+# HS code suggestions from item descriptions (hs_classifier.py). The API key
+# is only ever read from the environment; without one the offline fake
+# backend is used
+GEMINI_API_KEY = os.environ.get('TG_GEMINI_API_KEY', '')
+HS_CLASSIFIER_BACKEND = os.environ.get('TG_HS_CLASSIFIER_BACKEND', 'gemini' if GEMINI_API_KEY else 'fake')
+HS_CLASSIFIER_MODEL = os.environ.get('TG_HS_CLASSIFIER_MODEL', 'gemini-2.0-flash')
+HS_CLASSIFIER_BATCH_SIZE = _int('TG_HS_CLASSIFIER_BATCH_SIZE', 50)  # descriptions per model call
+HS_CLASSIFIER_BATCH_WAIT_MS = _float('TG_HS_CLASSIFIER_BATCH_WAIT_MS', 20.0)  # time a batch waits to fill up
+HS_CLASSIFIER_CONCURRENCY = _int('TG_HS_CLASSIFIER_CONCURRENCY', 4)  # model calls in flight per process
+HS_CLASSIFIER_MAX_PENDING = _int('TG_HS_CLASSIFIER_MAX_PENDING', 5000)  # queued descriptions beyond this get 503
+HS_CLASSIFIER_TIMEOUT = _float('TG_HS_CLASSIFIER_TIMEOUT', 30.0)  # seconds, per model call and per request
+HS_CLASSIFIER_CACHE_TTL = _float('TG_HS_CLASSIFIER_CACHE_TTL', 30 * 86400.0)
+HS_CLASSIFIER_CACHE_SIZE = _int('TG_HS_CLASSIFIER_CACHE_SIZE', 200000)  # rows; least recently used go first
+
+# Offline HS code suggestions (hs_suggest.py). The index is saved under
+# HS_SUGGEST_DIR and mapped by every process; empty keeps it in memory only
+HS_SUGGEST_DIR = os.environ.get('TG_HS_SUGGEST_DIR', './database/hs_suggest')
+HS_SUGGEST_BITS = _int('TG_HS_SUGGEST_BITS', 18)  # 2**bits hashed n-gram features
+HS_SUGGEST_DELTA_MAX = _int('TG_HS_SUGGEST_DELTA_MAX', 5000)  # confirmations kept outside the base index
+HS_SUGGEST_REFRESH_SECONDS = _float('TG_HS_SUGGEST_REFRESH_SECONDS', 2.0)
+HS_SUGGEST_MAX_ROWS = _int('TG_HS_SUGGEST_MAX_ROWS', 100000)  # descriptions per request or CSV upload
+
+# Change feed of new shipments and status changes (changefeed.py)
+CHANGE_FEED_BUFFER = _int('TG_CHANGE_FEED_BUFFER', 10000)  # events kept in memory per process
+CHANGE_FEED_POLL_SECONDS = _float('TG_CHANGE_FEED_POLL_SECONDS', 0.25)  # how soon other processes' changes arrive
+CHANGE_FEED_RETENTION = _int('TG_CHANGE_FEED_RETENTION', 1000000)  # rows kept in consignment_changes
+CHANGE_FEED_PRUNE_SECONDS = _float('TG_CHANGE_FEED_PRUNE_SECONDS', 300.0)
+CHANGE_FEED_HEARTBEAT_SECONDS = _float('TG_CHANGE_FEED_HEARTBEAT_SECONDS', 15.0)  # below TG_SOCKET_TIMEOUT
+CHANGE_FEED_STREAM_SECONDS = _float('TG_CHANGE_FEED_STREAM_SECONDS', 300.0)  # SSE streams end after this; clients reconnect
+CHANGE_FEED_MAX_WAIT = _float('TG_CHANGE_FEED_MAX_WAIT', 30.0)  # longest long-poll wait
+
+# Audit trail of compliance overrides (audit.py)
+AUDIT_MODE = os.environ.get('TG_AUDIT_MODE', 'async')  # 'async' or 'commit' (written in the change's transaction)
+AUDIT_BATCH_SIZE = _int('TG_AUDIT_BATCH_SIZE', 500)  # entries per transaction
+AUDIT_FLUSH_MS = _float('TG_AUDIT_FLUSH_MS', 200.0)  # longest an async entry stays buffered
+AUDIT_MAX_BUFFER = _int('TG_AUDIT_MAX_BUFFER', 50000)  # record() blocks past this while writes fail, then refuses
+AUDIT_COMMIT_TIMEOUT = _float('TG_AUDIT_COMMIT_TIMEOUT', 5.0)  # seconds
+
+# Hot/cold archival (archive.py): shipments older than ARCHIVE_AFTER_DAYS
+# move to one SQLite file per month under ARCHIVE_DIR
+ARCHIVE_DIR = os.environ.get('TG_ARCHIVE_DIR', './database/archive')
+ARCHIVE_AFTER_DAYS = _int('TG_ARCHIVE_AFTER_DAYS', 365)
+ARCHIVE_BATCH_SIZE = _int('TG_ARCHIVE_BATCH_SIZE', 2000)  # rows moved per hot-table write transaction
+ARCHIVE_PAUSE_MS = _float('TG_ARCHIVE_PAUSE_MS', 50.0)  # pause between batches, leaving the write lock to requests
+ARCHIVE_ZLIB_LEVEL = _int('TG_ARCHIVE_ZLIB_LEVEL', 6)  # for inline invoices copied into partitions
+
+# Idempotency-Key retries of add-consignment (idempotency.py)
+IDEMPOTENCY_TTL_HOURS = _float('TG_IDEMPOTENCY_TTL_HOURS', 24.0)  # how long a key's response is replayed
+
+# Compliance reports and shipping forms (reports.py)
+REPORT_CACHE_DIR = os.environ.get('TG_REPORT_CACHE_DIR', './database/reports')
+REPORT_CACHE_MAX_BYTES = _int('TG_REPORT_CACHE_MAX_BYTES', 512 * 1024 * 1024)  # least recently used reports go first
+REPORT_CACHE_SCAN_SECONDS = _float('TG_REPORT_CACHE_SCAN_SECONDS', 300.0)  # recount the cache dir this often
+REPORT_SYNC_MAX_ROWS = _int('TG_REPORT_SYNC_MAX_ROWS', 2000)  # larger reports are rendered by a background job
+REPORT_MAX_UUIDS = _int('TG_REPORT_MAX_UUIDS', 100000)  # shipments that can be chosen by uuid for one report
+
+# Password hashing (passwords.py)
+BCRYPT_ROUNDS = _int('TG_BCRYPT_ROUNDS', 12)  # stored hashes with another cost are rehashed on login
+PASSWORD_WORKERS = _int('TG_PASSWORD_WORKERS', os.cpu_count() or 2)  # concurrent bcrypt calls per process
+PASSWORD_MAX_QUEUE = _int('TG_PASSWORD_MAX_QUEUE', 64)  # waiting calls beyond this are rejected with 503
+
+# Web application. Set TG_SECRET_KEY in every deployment: it signs the JWTs,
+# and all workers must share it. serve.py refuses to start without it.
+SECRET_KEY = os.environ.get('TG_SECRET_KEY', 'dev-only-secret-key')
+MAX_CONTENT_LENGTH = _int('TG_MAX_CONTENT_LENGTH', 256 * 1024 * 1024)  # bytes; larger bodies get 413
+
+# Production server (serve.py)
+SERVER_BIND = os.environ.get('TG_BIND', '0.0.0.0:5000')
+SERVER_WORKERS = _int('TG_WORKERS', os.cpu_count() or 1)  # processes; 0 serves from the current process
+SERVER_WORKER_CONNECTIONS = _int('TG_WORKER_CONNECTIONS', 1000)  # concurrent connections per process
+SERVER_BACKLOG = _int('TG_BACKLOG', 2048)
+SERVER_KEEPALIVE = _float('TG_KEEPALIVE_SECONDS', 5.0)  # idle time before a keep-alive connection is closed
+SERVER_TIMEOUT = _float('TG_SOCKET_TIMEOUT', 60.0)  # max stall while reading a request or sending a response
+SERVER_GRACEFUL_TIMEOUT = _float('TG_GRACEFUL_TIMEOUT', 30.0)  # time in-flight requests get on stop/reload
+SERVER_ACCESS_LOG = os.environ.get('TG_ACCESS_LOG', '1') == '1'
+
+# Instrumentation (metrics.py)
+METRICS_SQL = os.environ.get('TG_METRICS_SQL', '1') == '1'  # time every statement on pooled connections
+METRICS_TOKEN = os.environ.get('TG_METRICS_TOKEN', '')  # /metrics requires "Authorization: Bearer <token>"; unset, it is off
+# Shared by all serve.py workers so /metrics reports the whole server, not just
+# the process that answered the scrape; empty keeps metrics per process
+METRICS_DIR = os.environ.get('TG_METRICS_DIR', '')
+METRICS_FLUSH_SECONDS = _float('TG_METRICS_FLUSH_SECONDS', 5.0)
+# Sampling profiler, switched on per request with "X-Profile: 1"
+PROFILE_ENABLED = os.environ.get('TG_PROFILE_ENABLED', '0') == '1'
+PROFILE_INTERVAL_MS = _float('TG_PROFILE_INTERVAL_MS', 5.0)
+PROFILE_DIR = os.environ.get('TG_PROFILE_DIR', './profiles')
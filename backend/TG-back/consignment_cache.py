@@ -0,0 +1,51 @@
+import hashlib
+from collections import namedtuple
+
+import config
+from cache import LRUCache
+
+# Conditional GETs for consignment reads. Triggers keep two counters
+# (migration 11): Consignments.row_version per row and
+# table_versions['consignments'] for the whole table. A single row's ETag is
+# its uuid and row_version; a listing's ETag is the table version plus the
+# query, so an unchanged poll is answered with 304 after one indexed lookup.
+# Rendered pages are also kept in an LRU, keyed by (user, query, format), and
+# reused while the table version is the one they were rendered at.
+
+CachedPage = namedtuple('CachedPage', 'version etag mimetype body next_cursor')
+
+pages = LRUCache(config.LISTING_CACHE_SIZE, config.LISTING_CACHE_TTL)
+
+
+def table_version(conn):
+    row = conn.execute("SELECT version FROM table_versions WHERE name = 'consignments'").fetchone()
+    return row[0] if row else 0
+
+
+def row_etag(consignment_uuid, row_version):
+    return f'{consignment_uuid}.{row_version}'
+
+
+def listing_etag(version, query):
+    digest = hashlib.sha256(repr(query).encode('utf-8')).hexdigest()[:16]
+    return f'{version}.{digest}'
+
+
+def tee(key, version, etag, mimetype, next_cursor, chunks):
+    """Pass a streamed body through, caching it once complete if it is small enough."""
+    parts = []
+    size = 0
+    for chunk in chunks:
+        if parts is not None:
+            size += len(chunk)
+            if size <= config.LISTING_CACHE_MAX_BODY:
+                parts.append(chunk)
+            else:
+                parts = None
+        yield chunk
+    if parts is not None:
+        pages.set(key, CachedPage(version, etag, mimetype, ''.join(parts).encode('utf-8'), next_cursor))
+
+
+def stats():
+    return {"pages": pages.stats()}
@@ -0,0 +1,194 @@
+from collections import defaultdict
+
+# Dashboard aggregates. Each rollup table holds one row per bucket of its key
+# (plus status) with the shipment count and declared value; triggers on
+# Consignments (schema migration 10) keep them current, so a dashboard read
+# costs O(buckets) rather than O(shipments). A rollup per breakdown keeps the
+# bucket count at days x countries instead of days x countries^2. Shipments
+# moved to the archive (archive.py) stay counted.
+
+STATUSES = ('compliant', 'flagged', 'pending')
+
+# Bucket key columns as SQL over a Consignments row; {row} is 'NEW.', 'OLD.' or ''
+DIMENSIONS = {
+    "day": "IFNULL(date({row}created_at), '')",
+    "sender_country": "upper(trim({row}sender_country))",
+    "receiver_country": "upper(trim({row}receiver_country))",
+    "status": "IFNULL({row}compliant, 'pending')",
+}
+
+ROLLUPS = {
+    "consignment_stats_daily": ("day", "status"),
+    "consignment_stats_destination": ("day", "receiver_country", "status"),
+    "consignment_stats_origin": ("day", "sender_country", "status"),
+}
+
+
+def _key_sql(key, row=''):
+    return ', '.join(DIMENSIONS[column].format(row=row) for column in key)
+
+
+def _aggregate_sql(table):
+    key = ROLLUPS[table]
+    return (f"SELECT {_key_sql(key)}, COUNT(*), IFNULL(SUM(declared_value), 0) "
+            f"FROM Consignments GROUP BY {', '.join(str(i + 1) for i in range(len(key)))}")
+
+
+def _scan_sql(table):
+    return f"INSERT INTO {table} ({', '.join(ROLLUPS[table])}, shipments, declared_value) {_aggregate_sql(table)};"
+
+
+def _add_totals_sql(table):
+    columns = ', '.join(ROLLUPS[table])
+    return (f"INSERT INTO {table} ({columns}, shipments, declared_value) "
+            f"VALUES ({', '.join('?' * (len(ROLLUPS[table]) + 2))}) "
+            f"ON CONFLICT ({columns}) DO UPDATE SET shipments = shipments + excluded.shipments, "
+            f"declared_value = declared_value + excluded.declared_value")
+
+
+def _remove_sql(table):
+    key = ROLLUPS[table]
+    columns = ', '.join(key)
+    return f"""
+        UPDATE {table} SET shipments = shipments - 1, declared_value = declared_value - IFNULL(OLD.declared_value, 0)
+        WHERE ({columns}) = ({_key_sql(key, 'OLD.')});
+        DELETE FROM {table} WHERE ({columns}) = ({_key_sql(key, 'OLD.')}) AND shipments <= 0;"""
+
+
+def delete_trigger_sql(when=None):
+    """The trigger taking deleted shipments out of the rollups; ``when``
+    limits it to the deletes that should count."""
+    condition = f"\n    WHEN {when}" if when else ''
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS consignments_rollups_on_delete AFTER DELETE ON Consignments{condition}
+    BEGIN{''.join(_remove_sql(table) for table in ROLLUPS)}
+    END;
+    """
+
+
+def schema_sql():
+    """Rollup tables, their backfill and the triggers that maintain them."""
+    tables = []
+    on_insert = []
+    for table, key in ROLLUPS.items():
+        columns = ', '.join(key)
+        tables.append(f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        {' '.join(f'{column} TEXT NOT NULL,' for column in key)}
+        shipments INTEGER NOT NULL,
+        declared_value REAL NOT NULL,
+        PRIMARY KEY ({columns})
+    ) WITHOUT ROWID;
+    {_scan_sql(table)}""")
+        on_insert.append(f"""
+        INSERT INTO {table} ({columns}, shipments, declared_value)
+        VALUES ({_key_sql(key, 'NEW.')}, 1, IFNULL(NEW.declared_value, 0))
+        ON CONFLICT ({columns}) DO UPDATE SET
+            shipments = shipments + 1, declared_value = declared_value + excluded.declared_value;""")
+    on_remove = [_remove_sql(table) for table in ROLLUPS]
+
+    return ''.join(tables) + f"""
+
+    CREATE TRIGGER IF NOT EXISTS consignments_rollups_on_insert AFTER INSERT ON Consignments
+    BEGIN{''.join(on_insert)}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS consignments_rollups_on_update
+    AFTER UPDATE OF created_at, sender_country, receiver_country, compliant, declared_value ON Consignments
+    BEGIN{''.join(on_remove)}{''.join(on_insert)}
+    END;
+""" + delete_trigger_sql()
+
+
+def rebuild(conn, sources=()):
+    """Recompute every rollup from Consignments, plus the Consignments tables
+    of the connections in sources (archive partitions). Returns {table: buckets}."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        buckets = {}
+        for table in ROLLUPS:
+            conn.execute(f'DELETE FROM {table}')
+            conn.execute(_scan_sql(table))
+            for source in sources:
+                conn.executemany(_add_totals_sql(table), source.execute(_aggregate_sql(table)).fetchall())
+            buckets[table] = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return buckets
+
+
+def _counts():
+    return {"total": 0, "value": 0.0, **{status: 0 for status in STATUSES}, "compliance_rate": None}
+
+
+def _grouped(conn, table, key, where_sql, params):
+    """{key value: counts} for one breakdown, aggregated by SQLite over a rollup."""
+    grouped = defaultdict(_counts)
+    rows = conn.execute(f'''
+        SELECT {key}, status, SUM(shipments), SUM(declared_value)
+        FROM {table} {where_sql}
+        GROUP BY 1, 2
+    ''', params)
+    for group, status, shipments, value in rows:
+        counts = grouped[group]
+        counts["total"] += shipments
+        counts["value"] += value
+        counts[status] = counts.get(status, 0) + shipments
+    for counts in grouped.values():
+        counts["compliance_rate"] = round(counts["compliant"] / counts["total"], 4) if counts["total"] else None
+        counts["value"] = round(counts["value"], 2)
+    return grouped
+
+
+def summary(conn, day_from=None, day_to=None, sender_country=None, receiver_country=None, period='day'):
+    """Totals plus breakdowns by period (day or month), destination and origin.
+
+    day_from/day_to are inclusive YYYY-MM-DD strings. At most one of
+    sender_country/receiver_country may be given; the breakdown by the other
+    country is then None, since no rollup crosses origin with destination.
+    """
+    if sender_country and receiver_country:
+        raise ValueError('Filter by sender_country or receiver_country, not both')
+
+    where = []
+    params = []
+    if day_from:
+        where.append('day >= ?')
+        params.append(day_from)
+    if day_to:
+        where.append('day <= ?')
+        params.append(day_to)
+    days_only = (f"WHERE {' AND '.join(where)}" if where else '', list(params))
+
+    table = 'consignment_stats_daily'
+    for column, value, rollup in (('sender_country', sender_country, 'consignment_stats_origin'),
+                                  ('receiver_country', receiver_country, 'consignment_stats_destination')):
+        if value:
+            table = rollup
+            where.append(f'{column} = ?')
+            params.append(value.strip().upper())
+    filtered = (f"WHERE {' AND '.join(where)}" if where else '', params)
+
+    totals = _grouped(conn, table, "''", *filtered).get('') or _counts()
+    by_period = _grouped(conn, table, 'substr(day, 1, 7)' if period == 'month' else 'day', *filtered)
+    by_destination = by_origin = None
+    if not sender_country:
+        by_destination = _grouped(conn, 'consignment_stats_destination', 'receiver_country',
+                                  *(filtered if receiver_country else days_only))
+    if not receiver_country:
+        by_origin = _grouped(conn, 'consignment_stats_origin', 'sender_country',
+                             *(filtered if sender_country else days_only))
+
+    def ranked(grouped, name):
+        if grouped is None:
+            return None
+        return sorted(({name: key, **counts} for key, counts in grouped.items()), key=lambda item: -item["total"])
+
+    return {
+        "totals": totals,
+        "by_period": [{"period": key, **counts} for key, counts in sorted(by_period.items())],
+        "by_destination": ranked(by_destination, "receiver_country"),
+        "by_origin": ranked(by_origin, "sender_country"),
+    }
@@ -0,0 +1,59 @@
+import compliance
+
+# Write path for Consignments rows, shared by add-consignment and bulk upload
+
+INSERT_CONSIGNMENT_SQL = '''
+    INSERT INTO Consignments (
+        sender_name, sender_address, sender_country, sender_mail, sender_phone,
+        receiver_name, receiver_address, receiver_country, shipment_id, shipment_date,
+        PackageQuantity, HS_code, totalWeight, Item_desc, handling_inst,
+        declared_value, invoice_sha256, invoice_pending, compliant, compliance_reasons, compliance_basis
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# The same insert as one statement that also reports the outcome: the new
+# uuid, or no row if the shipment_id is taken (hot or archived)
+INSERT_NEW_CONSIGNMENT_SQL = INSERT_CONSIGNMENT_SQL + '''    ON CONFLICT (shipment_id) DO NOTHING
+    RETURNING uuid
+'''
+
+
+def evaluate(validated_data, has_invoice):
+    """Run the compliance rules for a validated consignment. has_invoice is
+    None when the submission had no way to carry one (bulk upload)."""
+    return compliance.evaluate({
+        "receiver_country": validated_data['receiver_country'],
+        "HS_code": validated_data['HS_code'],
+        "totalWeight": validated_data['totalWeight'],
+        "declared_value": validated_data.get('declared_value'),
+        "has_invoice": has_invoice,
+    })
+
+
+def insert_params(validated_data, invoice_sha256=None, decision=None, invoice_pending=False):
+    """Parameters for INSERT_CONSIGNMENT_SQL. Without a decision the row is left
+    pending. invoice_pending marks a row submitted without a way to attach an
+    invoice, so re-evaluation keeps treating it as has_invoice=None."""
+    return (
+        validated_data['sender_name'],
+        validated_data['sender_address'],
+        validated_data['sender_country'],
+        validated_data['sender_mail'],
+        validated_data['sender_phone'],
+        validated_data['receiver_name'],
+        validated_data['receiver_address'],
+        validated_data['receiver_country'],
+        validated_data['shipment_id'],
+        validated_data['shipment_date'],
+        validated_data['PackageQuantity'],
+        validated_data['HS_code'],
+        validated_data['totalWeight'],
+        validated_data['Item_desc'],
+        validated_data.get('handling_inst', ''),
+        validated_data.get('declared_value'),
+        invoice_sha256,
+        int(invoice_pending),
+        decision.status if decision else 'pending',
+        compliance.encode_reasons(decision.violations) if decision else None,
+        decision.basis if decision else None,
+    )
@@ -25,43 +25,11 @@ CREATE TABLE IF NOT EXISTS Consignments (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Create a trigger for detailed validation
-CREATE TRIGGER validate_consignment_insert 
-BEFORE INSERT ON Consignments 
-BEGIN
-    -- Validate email format
-    SELECT CASE 
-        WHEN NEW.sender_mail NOT LIKE '%@%.%'
-        THEN RAISE(ABORT, 'Invalid email format in sender_mail')
-    END;
-    
-    -- Validate shipment_date format
-    SELECT CASE
-        WHEN datetime(NEW.shipment_date) IS NULL
-        THEN RAISE(ABORT, 'Invalid date format in shipment_date')
-    END;
-    
-    -- Validate PackageQuantity is integer
-    SELECT CASE
-        WHEN typeof(NEW.PackageQuantity) != 'integer'
-        THEN RAISE(ABORT, 'PackageQuantity must be an integer')
-    END;
-    
-    -- Validate totalWeight is numeric
-    SELECT CASE
-        WHEN typeof(NEW.totalWeight) NOT IN ('real', 'integer')
-        THEN RAISE(ABORT, 'totalWeight must be a number')
-    END;
-    
-    -- Validate compliant status
-    SELECT CASE
-        WHEN NEW.compliant NOT IN ('pending', 'compliant', 'flagged')
-        THEN RAISE(ABORT, 'Invalid compliant status')
-    END;
-END;
+-- Values are validated by validation.py before they get here; the CHECK
+-- constraints above are the database's own guard
 
--- Index for faster lookups by shipment_id
-CREATE INDEX IF NOT EXISTS idx_consignments_shipment_id ON Consignments(shipment_id);
+-- One consignment per shipment_id; also serves lookups by shipment_id
+CREATE UNIQUE INDEX IF NOT EXISTS idx_consignments_shipment_id_unique ON Consignments(shipment_id);
 
 -- Index for filtering by compliance status
 CREATE INDEX IF NOT EXISTS idx_consignments_compliant ON Consignments(compliant);
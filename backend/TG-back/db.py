@@ -0,0 +1,254 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+import metrics
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became free within the pool timeout."""
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports execute and fetch times per statement to metrics.py.
+
+    Row-by-row iteration is accumulated and reported once the result set is
+    exhausted or the cursor is reused, not per row.
+    """
+
+    _label = None
+    _iter_seconds = 0.0
+    _iter_rows = 0
+
+    def _flush_iteration(self):
+        if self._iter_seconds:
+            metrics.sql_fetched(self._label, self._iter_seconds, self._iter_rows)
+            self._iter_seconds = 0.0
+            self._iter_rows = 0
+
+    def execute(self, sql, parameters=()):
+        self._flush_iteration()
+        self._label = metrics.sql_label(sql)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.sql_executed(self._label, time.perf_counter() - start, self.rowcount)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._flush_iteration()
+        self._label = metrics.sql_label(sql)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.sql_executed(self._label, time.perf_counter() - start, self.rowcount)
+
+    def _fetched(self, start, rows):
+        if self._label is not None:
+            metrics.sql_fetched(self._label, time.perf_counter() - start, rows)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._iter_seconds += time.perf_counter() - start
+            self._flush_iteration()
+            raise
+        self._iter_seconds += time.perf_counter() - start
+        self._iter_rows += 1
+        return row
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to the pool it came from."""
+
+    _pool = None
+    _checked_out = False
+
+    # sqlite3.Connection.execute() bypasses cursor(), so route it through
+    # the instrumented cursor explicitly
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = InstrumentedCursor if config.METRICS_SQL else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if self._pool is None:
+            super().close()
+        elif self._checked_out:
+            self._pool.release(self)
+        # Closing a connection that is already back in the pool is a no-op
+
+    def dispose(self):
+        super().close()
+
+
+class ConnectionPool:
+    """Bounded pool of WAL-mode SQLite connections.
+
+    Idle connections are kept on a LIFO stack, so a worker thread that
+    releases a connection and asks again gets the same one back with its
+    page cache still warm.
+    """
+
+    def __init__(self, path, size=None, timeout=None):
+        self.path = path
+        self.size = size or config.DB_POOL_SIZE
+        self.timeout = config.DB_POOL_TIMEOUT if timeout is None else timeout
+        self.pid = os.getpid()
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=config.DB_BUSY_TIMEOUT_MS / 1000,
+            factory=PooledConnection,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute(f'PRAGMA synchronous = {config.DB_SYNCHRONOUS}')
+        conn.execute(f'PRAGMA cache_size = -{config.DB_CACHE_SIZE_KIB}')
+        conn.execute(f'PRAGMA mmap_size = {config.DB_MMAP_SIZE}')
+        conn.execute(f'PRAGMA busy_timeout = {config.DB_BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn._pool = self
+        return conn
+
+    def acquire(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeout(f'No database connection available after {self.timeout}s')
+        waited = time.perf_counter() - start
+
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            self._checkouts += 1
+            self._in_use += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._in_use -= 1
+                self._slots.release()
+                raise
+            with self._lock:
+                self._created += 1
+
+        conn._checked_out = True
+        return conn
+
+    def release(self, conn):
+        conn._checked_out = False
+        try:
+            # Never hand out a connection with someone else's half-done transaction
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.dispose()
+            conn = None
+            with self._lock:
+                self._created -= 1
+
+        with self._lock:
+            if conn is not None:
+                self._idle.append(conn)
+            self._in_use -= 1
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def close_idle(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for conn in idle:
+            conn.dispose()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "size": self.size,
+                "created": self._created,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "wait_total_ms": round(self._wait_total * 1000, 3),
+                "wait_avg_ms": round(self._wait_total * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path=None):
+    """Return this process's pool for ``path`` (the configured database by default)."""
+    path = path or config.DATABASE_PATH
+    pool = _pools.get(path)
+    if pool is None or pool.pid != os.getpid():
+        with _pools_lock:
+            pool = _pools.get(path)
+            # Connections inherited across fork() must not be reused by the child
+            if pool is None or pool.pid != os.getpid():
+                pool = _pools[path] = ConnectionPool(path)
+    return pool
+
+
+def pool_stats():
+    return [pool.stats() for pool in list(_pools.values()) if pool.pid == os.getpid()]
@@ -0,0 +1,348 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import config
+from db import get_pool
+from restrictions import normalize_hs
+
+# HS code suggestions for free-text item descriptions. Descriptions are
+# normalized and looked up in a persistent cache (hs_classifications);
+# misses are queued, grouped into batches of up to HS_CLASSIFIER_BATCH_SIZE
+# and sent to the model backend, at most HS_CLASSIFIER_CONCURRENCY calls at a
+# time. A description already on its way to the model is not sent twice:
+# later callers wait for the same result.
+#
+# Backends (TG_HS_CLASSIFIER_BACKEND):
+#   gemini - Google Gemini through the google-genai package; needs TG_GEMINI_API_KEY
+#   fake   - deterministic keyword table, for tests and offline development
+
+MAX_DESCRIPTION_LENGTH = 500
+# used_at is refreshed at most this often per entry, so hits stay reads
+_TOUCH_INTERVAL = 3600.0
+_LOOKUP_CHUNK = 900
+
+Classification = namedtuple('Classification', 'description hs_code confidence source')
+
+_WORDS = re.compile(r'\w+')
+
+
+class ClassifierBusy(Exception):
+    """Raised when too many descriptions are already waiting for the model."""
+
+
+class ClassifierUnavailable(Exception):
+    """Raised when the model call failed or did not finish in time."""
+
+
+def normalize(description):
+    """Cache key for a description: casefolded words separated by single spaces."""
+    if not description:
+        return ''
+    return ' '.join(_WORDS.findall(str(description).casefold()))[:MAX_DESCRIPTION_LENGTH]
+
+
+class FakeBackend:
+    """Keyword lookup standing in for the model. Same input, same answer;
+    ``delay`` simulates model latency."""
+
+    name = 'fake'
+
+    # (words that must all appear, HS code), most specific first
+    KEYWORDS = (
+        ('ceramic mug', '691200'),
+        ('cotton shirt', '620520'),
+        ('laptop', '847130'),
+        ('smartphone', '851713'),
+        ('phone', '851713'),
+        ('cable', '854449'),
+        ('lamp', '940540'),
+        ('toy', '950300'),
+        ('cosmetic', '330499'),
+        ('tea', '090240'),
+        ('coffee', '090121'),
+        ('spice', '091099'),
+        ('rice', '100630'),
+        ('steel pipe', '730630'),
+        ('furniture', '940360'),
+        ('shoe', '640399'),
+    )
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self._rules = tuple((tuple(self._stem(w) for w in words.split()), code) for words, code in self.KEYWORDS)
+
+    @staticmethod
+    def _stem(word):
+        return word[:-1] if len(word) > 3 and word.endswith('s') and not word.endswith('ss') else word
+
+    def classify_batch(self, descriptions):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        results = []
+        for description in descriptions:
+            words = {self._stem(word) for word in description.split()}
+            for required, code in self._rules:
+                if all(word in words for word in required):
+                    results.append((code, 0.9))
+                    break
+            else:
+                results.append((None, 0.0))
+        return results
+
+
+_PROMPT = """You classify goods for customs. For each numbered item description below,
+give the most likely 6-digit Harmonized System (HS) subheading and your
+confidence between 0 and 1. Use null for hs_code when the description is too
+vague to classify. Answer with only a JSON array of objects with the keys
+"index", "hs_code" and "confidence", one per item.
+
+"""
+
+
+class GeminiBackend:
+    name = 'gemini'
+
+    def __init__(self, api_key, model, timeout):
+        if not api_key:
+            raise RuntimeError('TG_GEMINI_API_KEY is not set')
+        from google import genai
+        from google.genai import types
+
+        self.model = model
+        self.name = f'gemini:{model}'
+        self._types = types
+        self._client = genai.Client(api_key=api_key, http_options=types.HttpOptions(timeout=int(timeout * 1000)))
+
+    def classify_batch(self, descriptions):
+        prompt = _PROMPT + '\n'.join(f'{i}. {description}' for i, description in enumerate(descriptions))
+        response = self._client.models.generate_content(
+            model=self.model,
+            contents=[prompt],
+            config=self._types.GenerateContentConfig(temperature=0, response_mime_type='application/json'))
+        return parse_response(response.text, len(descriptions))
+
+
+def parse_response(text, count):
+    """[(hs_code, confidence)] from a model's JSON answer; items it skipped stay unclassified."""
+    results = [(None, 0.0)] * count
+    for item in json.loads(text):
+        index = int(item['index'])
+        if not 0 <= index < count:
+            continue
+        code = normalize_hs(item.get('hs_code')) if item.get('hs_code') else ''
+        if not 6 <= len(code) <= 10:
+            continue
+        confidence = min(max(float(item.get('confidence') or 0.0), 0.0), 1.0)
+        results[index] = (code, confidence)
+    return results
+
+
+def make_backend():
+    if config.HS_CLASSIFIER_BACKEND == 'gemini':
+        return GeminiBackend(config.GEMINI_API_KEY, config.HS_CLASSIFIER_MODEL, config.HS_CLASSIFIER_TIMEOUT)
+    if config.HS_CLASSIFIER_BACKEND == 'fake':
+        return FakeBackend()
+    raise ValueError(f"Unknown HS classifier backend '{config.HS_CLASSIFIER_BACKEND}'")
+
+
+class HSClassifier:
+    def __init__(self, backend, batch_size=None, batch_wait=None, concurrency=None, max_pending=None,
+                 timeout=None, cache_ttl=None, cache_size=None):
+        self.backend = backend
+        self.batch_size = batch_size or config.HS_CLASSIFIER_BATCH_SIZE
+        self.batch_wait = config.HS_CLASSIFIER_BATCH_WAIT_MS / 1000 if batch_wait is None else batch_wait
+        self.concurrency = concurrency or config.HS_CLASSIFIER_CONCURRENCY
+        self.max_pending = max_pending or config.HS_CLASSIFIER_MAX_PENDING
+        self.timeout = timeout or config.HS_CLASSIFIER_TIMEOUT
+        self.cache_ttl = cache_ttl or config.HS_CLASSIFIER_CACHE_TTL
+        self.cache_size = cache_size or config.HS_CLASSIFIER_CACHE_SIZE
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._pending = []   # keys waiting to be batched
+        self._inflight = {}  # key -> Future, from queueing until the result is cached
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='tg-hs-classify')
+        self._collector = None
+        self._stats = {"descriptions": 0, "cache_hits": 0, "coalesced": 0, "queued": 0, "rejected": 0,
+                       "batches": 0, "batch_items": 0, "model_seconds": 0.0, "errors": 0, "timeouts": 0}
+
+    def classify(self, descriptions, timeout=None):
+        """Classifications for descriptions, in order; None for blank ones.
+
+        Raises ClassifierBusy when the queue is full and ClassifierUnavailable
+        when the model fails or the answer takes longer than ``timeout``.
+        Anything classified before a failure is cached, so retries are cheap.
+        """
+        keys = [normalize(description) for description in descriptions]
+        unique = [key for key in dict.fromkeys(keys) if key]
+        results = self._cached(unique)
+        misses = [key for key in unique if key not in results]
+
+        futures = {}
+        if misses:
+            self._start_collector()
+            with self._lock:
+                new = [key for key in misses if key not in self._inflight]
+                if len(self._pending) + len(new) > self.max_pending:
+                    self._stats["rejected"] += len(misses)
+                    raise ClassifierBusy('Too many descriptions waiting for classification')
+                for key in new:
+                    self._inflight[key] = Future()
+                    self._pending.append(key)
+                futures = {key: self._inflight[key] for key in misses}
+                self._stats["coalesced"] += len(misses) - len(new)
+                self._stats["queued"] += len(new)
+                if new:
+                    self._ready.notify()
+
+        with self._lock:
+            self._stats["descriptions"] += len(unique)
+            self._stats["cache_hits"] += len(results)
+
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        for key, future in futures.items():
+            try:
+                results[key] = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except FutureTimeout:
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                raise ClassifierUnavailable('HS classification timed out')
+            except Exception as e:
+                raise ClassifierUnavailable(f'HS classification failed: {e}') from e
+        return [results[key] if key else None for key in keys]
+
+    # Cache
+
+    def _cached(self, keys):
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        stale = []
+        with get_pool().connection() as conn:
+            for i in range(0, len(keys), _LOOKUP_CHUNK):
+                chunk = keys[i:i + _LOOKUP_CHUNK]
+                rows = conn.execute(
+                    f'''SELECT description, hs_code, confidence, used_at FROM hs_classifications
+                        WHERE model = ? AND description IN ({','.join('?' * len(chunk))}) AND classified_at > ?''',
+                    (self.backend.name, *chunk, now - self.cache_ttl)).fetchall()
+                for description, hs_code, confidence, used_at in rows:
+                    found[description] = Classification(description, hs_code, confidence, 'cache')
+                    if used_at < now - _TOUCH_INTERVAL:
+                        stale.append(description)
+            if stale:
+                conn.executemany('UPDATE hs_classifications SET used_at = ? WHERE model = ? AND description = ?',
+                                 [(now, self.backend.name, description) for description in stale])
+                conn.commit()
+        return found
+
+    def _store(self, classifications):
+        now = time.time()
+        with get_pool().connection() as conn:
+            conn.executemany(
+                '''INSERT OR REPLACE INTO hs_classifications
+                   (model, description, hs_code, confidence, classified_at, used_at) VALUES (?, ?, ?, ?, ?, ?)''',
+                [(self.backend.name, c.description, c.hs_code, c.confidence, now, now) for c in classifications])
+            excess = conn.execute('SELECT COUNT(*) FROM hs_classifications').fetchone()[0] - self.cache_size
+            if excess > 0:
+                conn.execute(
+                    '''DELETE FROM hs_classifications WHERE (model, description) IN (
+                           SELECT model, description FROM hs_classifications ORDER BY used_at LIMIT ?)''',
+                    (excess,))
+            conn.commit()
+
+    # Batching
+
+    def _start_collector(self):
+        with self._lock:
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect, name='hs-classify-batcher', daemon=True)
+                self._collector.start()
+
+    def _collect(self):
+        while True:
+            # Wait for a free model slot first, so that under load batches
+            # keep filling while earlier calls are still running
+            self._slots.acquire()
+            with self._ready:
+                while not self._pending:
+                    self._ready.wait()
+                deadline = time.monotonic() + self.batch_wait
+                while len(self._pending) < self.batch_size and time.monotonic() < deadline:
+                    self._ready.wait(deadline - time.monotonic())
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        start = time.perf_counter()
+        try:
+            answers = self.backend.classify_batch(batch)
+            if len(answers) != len(batch):
+                raise ValueError(f'expected {len(batch)} answers, got {len(answers)}')
+            classifications = [Classification(key, code, confidence, 'model')
+                               for key, (code, confidence) in zip(batch, answers)]
+            # Cached before the waiters are released, so a request arriving
+            # in between finds the result in one place or the other
+            self._store(classifications)
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+                futures = [self._inflight.pop(key) for key in batch]
+            for future in futures:
+                future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["batch_items"] += len(batch)
+                self._stats["model_seconds"] += time.perf_counter() - start
+
+        with self._lock:
+            futures = [self._inflight.pop(key) for key in batch]
+        for future, classification in zip(futures, classifications):
+            future.set_result(classification)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+            stats["inflight"] = len(self._inflight)
+        batches = stats["batches"]
+        return {
+            "backend": self.backend.name,
+            **stats,
+            "model_seconds": round(stats["model_seconds"], 3),
+            "avg_batch_size": round(stats["batch_items"] / batches, 2) if batches else 0.0,
+            "cache_hit_rate": round(stats["cache_hits"] / stats["descriptions"], 4) if stats["descriptions"] else 0.0,
+        }
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier():
+    """This process's classifier, with the configured backend."""
+    global _classifier
+    classifier = _classifier
+    if classifier is None or classifier.pid != os.getpid():
+        with _classifier_lock:
+            if _classifier is None or _classifier.pid != os.getpid():
+                _classifier = HSClassifier(make_backend())
+            classifier = _classifier
+    return classifier
+
+
+def classify(descriptions, timeout=None):
+    return get_classifier().classify(descriptions, timeout=timeout)
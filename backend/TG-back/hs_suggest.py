@@ -0,0 +1,498 @@
+import json
+import os
+import shutil
+import threading
+import time
+from collections import Counter, namedtuple
+
+import numpy as np
+
+import config
+import metrics
+import restrictions
+from db import get_pool
+from hs_classifier import normalize
+from restrictions import normalize_hs
+
+# Offline HS code suggestions for item descriptions: TF-IDF over hashed
+# character n-grams of the restriction tables' category text and of the
+# descriptions compliance officers have confirmed (hs_confirmations,
+# migration 14). A query is a handful of NumPy calls over an inverted index;
+# nothing leaves the process and SQLite is not touched.
+#
+# A document is one distinct normalized text with the HS codes it is known
+# by and how often each was confirmed, so a description confirmed ten
+# thousand times is still one document. A code scores the similarity of the
+# best matching text times its count relative to that text's top code.
+#
+# The index has two segments. The base is built from everything at once and
+# saved under HS_SUGGEST_DIR as .npy files that every process maps read-only,
+# so serve.py workers share one copy. Confirmations recorded after that go
+# into a small delta segment, weighted with the base's IDF, which is rebuilt
+# as new ones arrive and folded into a new base past HS_SUGGEST_DELTA_MAX.
+# A delta document for a text the base already has carries the base's counts
+# too and hides the base document.
+
+NGRAMS = (3, 4)
+# n-grams found in more than this share of the documents get no weight, so
+# their (long) postings are never scanned; only applies to larger corpora
+MAX_DF = 0.5
+_MAX_DF_MIN_DOCS = 100
+# Best-scoring documents looked at per requested code
+_CANDIDATES_PER_CODE = 4
+MAX_K = 20
+
+CATEGORY = 0
+CONFIRMED = 1
+SOURCES = ('category', 'confirmed')
+
+_ARRAYS = ('idf', 'ptr', 'post_doc', 'post_w', 'label_ptr', 'label_code', 'label_count', 'label_source',
+           'codes', 'text_ptr', 'text')
+
+Suggestion = namedtuple('Suggestion', 'hs_code score source matched')
+
+_MULTIPLIER = np.uint64(1000003)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _ngrams(texts, bits):
+    """Hashed n-gram counts of normalized texts as (doc, feature, count) arrays.
+
+    All texts are hashed in one pass: they are joined with NUL separators and
+    every window of each n-gram size is hashed at once; windows spanning a
+    separator are dropped.
+    """
+    joined = '\x00'.join(f' {text} ' for text in texts)
+    chars = np.frombuffer(joined.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    breaks = chars == 0
+    doc_of = np.cumsum(breaks, dtype=np.uint64)
+    keys = []
+    for n in NGRAMS:
+        count = len(chars) - n + 1
+        if count <= 0:
+            continue
+        hashed = np.full(count, n, dtype=np.uint64)
+        valid = np.ones(count, dtype=bool)
+        for i in range(n):
+            hashed = hashed * _MULTIPLIER ^ chars[i:i + count]
+            valid &= ~breaks[i:i + count]
+        feature = (hashed[valid] * _MIX) >> np.uint64(64 - bits)
+        keys.append((doc_of[:count][valid] << np.uint64(bits)) | feature)
+    if not keys:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    keys, counts = np.unique(np.concatenate(keys), return_counts=True)
+    return (keys >> np.uint64(bits)).astype(np.int64), (keys & np.uint64((1 << bits) - 1)).astype(np.int64), counts
+
+
+def _weigh(doc, feature, counts, idf, n_docs):
+    """L2-normalized TF-IDF weights; zero-weight entries are dropped."""
+    weights = (1.0 + np.log(counts)) * idf[feature]
+    norms = np.sqrt(np.bincount(doc, weights=weights * weights, minlength=n_docs))
+    keep = weights > 0
+    doc, feature, weights = doc[keep], feature[keep], weights[keep]
+    return doc, feature, (weights / norms[doc]).astype(np.float32)
+
+
+def _idf(doc, feature, n_docs, bits):
+    df = np.bincount(feature, minlength=1 << bits)
+    # An n-gram no document has gets the highest weight, for delta segments
+    idf = (np.log((1.0 + n_docs) / (1.0 + df)) + 1.0).astype(np.float32)
+    if n_docs >= _MAX_DF_MIN_DOCS:
+        idf[df > MAX_DF * n_docs] = 0.0
+    return idf
+
+
+def _offsets(starts, lengths):
+    """Concatenated ranges start..start+length as one index array."""
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(int(lengths.sum()))
+
+
+class Segment:
+    """Immutable inverted index over one set of documents.
+
+    ptr[f]:ptr[f + 1] are the postings (post_doc, post_w) of feature f;
+    label_ptr[d]:label_ptr[d + 1] are document d's codes (indexes into codes),
+    most confirmed first, and text[text_ptr[d]:text_ptr[d + 1]] is its UTF-8
+    text.
+    """
+
+    def __init__(self, arrays):
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.size = len(self.text_ptr) - 1
+        self._text_ids = None
+
+    @classmethod
+    def build(cls, corpus, bits, idf=None):
+        """Segment over a corpus {text: {(hs_code, source): count}}. Without
+        idf, IDF weights come from the corpus itself (a base segment)."""
+        texts = list(corpus)
+        doc, feature, counts = _ngrams(texts, bits)
+        if idf is None:
+            idf = _idf(doc, feature, len(texts), bits)
+        doc, feature, weights = _weigh(doc, feature, counts, idf, len(texts))
+
+        order = np.argsort(feature, kind='stable')
+        ptr = np.zeros((1 << bits) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(feature, minlength=1 << bits), out=ptr[1:])
+
+        labels = [sorted(corpus[text].items(), key=lambda item: (-item[1], item[0])) for text in texts]
+        flat = [label for doc_labels in labels for label in doc_labels]
+        codes, label_code = np.unique(np.array([code for (code, _), _ in flat], dtype=str), return_inverse=True)
+        label_ptr = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(doc_labels) for doc_labels in labels], out=label_ptr[1:])
+
+        encoded = [text.encode('utf-8') for text in texts]
+        text_ptr = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=text_ptr[1:])
+        return cls({
+            'idf': idf,
+            'ptr': ptr,
+            'post_doc': doc[order].astype(np.int32),
+            'post_w': weights[order],
+            'label_ptr': label_ptr,
+            'label_code': label_code.astype(np.int32),
+            'label_count': np.array([count for _, count in flat], dtype=np.int32),
+            'label_source': np.array([source for (_, source), _ in flat], dtype=np.uint8),
+            'codes': codes,
+            'text_ptr': text_ptr,
+            'text': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        })
+
+    def scores(self, features, weights):
+        """Cosine similarity of every document with the query vector, or None
+        when no document shares an n-gram with it."""
+        starts = self.ptr[features]
+        lengths = self.ptr[features + 1] - starts
+        if not lengths.any():
+            return None
+        positions = _offsets(starts, lengths)
+        return np.bincount(self.post_doc[positions],
+                           weights=self.post_w[positions] * np.repeat(weights, lengths),
+                           minlength=self.size)
+
+    def text_of(self, doc):
+        return bytes(self.text[self.text_ptr[doc]:self.text_ptr[doc + 1]]).decode('utf-8')
+
+    def labels(self, doc, limit=None):
+        """[(hs_code, source, count)] of a document, most confirmed first."""
+        start, end = int(self.label_ptr[doc]), int(self.label_ptr[doc + 1])
+        if limit is not None:
+            end = min(end, start + limit)
+        return [(str(self.codes[self.label_code[i]]), int(self.label_source[i]), int(self.label_count[i]))
+                for i in range(start, end)]
+
+    def text_ids(self):
+        """text -> document, built on first use (only needed to build deltas)."""
+        if self._text_ids is None:
+            self._text_ids = {self.text_of(doc): doc for doc in range(self.size)}
+        return self._text_ids
+
+    def save(self, path, meta):
+        os.makedirs(path)
+        for name in _ARRAYS:
+            np.save(os.path.join(path, f'{name}.npy'), getattr(self, name), allow_pickle=False)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path):
+        """Map a saved segment; returns (segment, meta)."""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r', allow_pickle=False)
+                  for name in _ARRAYS}
+        return cls(arrays), meta
+
+
+def _merge(corpus, more):
+    for text, labels in more.items():
+        merged = corpus.setdefault(text, Counter())
+        merged.update(labels)
+    return corpus
+
+
+class SuggestIndex:
+    """Base segment plus the confirmations recorded since it was built.
+    Never mutated: new confirmations produce a new SuggestIndex."""
+
+    def __init__(self, base, restrictions_version, base_last_id, confirmed=None, last_id=None):
+        self.pid = os.getpid()
+        self.base = base
+        self.bits = int(np.log2(len(base.ptr) - 1))
+        self.restrictions_version = restrictions_version
+        self.base_last_id = base_last_id
+        self.last_id = base_last_id if last_id is None else last_id
+        # Confirmations since the base was built, as a corpus
+        self.confirmed = confirmed or {}
+        self.delta = None
+        self.hidden = None
+        if self.confirmed:
+            text_ids = base.text_ids()
+            corpus = {}
+            hidden = []
+            for text, labels in self.confirmed.items():
+                merged = Counter(labels)
+                doc = text_ids.get(text)
+                if doc is not None:
+                    merged.update({(code, source): count for code, source, count in base.labels(doc)})
+                    hidden.append(doc)
+                corpus[text] = merged
+            self.delta = Segment.build(corpus, self.bits, base.idf)
+            self.hidden = np.array(hidden, dtype=np.int64)
+
+    def with_confirmations(self, confirmed, last_id):
+        merged = _merge({text: Counter(labels) for text, labels in self.confirmed.items()}, confirmed)
+        return SuggestIndex(self.base, self.restrictions_version, self.base_last_id, merged, last_id)
+
+    def _vectors(self, texts):
+        doc, feature, counts = _ngrams(texts, self.bits)
+        doc, feature, weights = _weigh(doc, feature, counts, self.base.idf, len(texts))
+        bounds = np.searchsorted(doc, np.arange(len(texts) + 1))
+        return [(feature[bounds[i]:bounds[i + 1]], weights[bounds[i]:bounds[i + 1]]) for i in range(len(texts))]
+
+    def _top(self, features, weights, k):
+        base_scores = self.base.scores(features, weights)
+        if base_scores is None:
+            base_scores = np.zeros(self.base.size)
+        elif self.hidden is not None and len(self.hidden):
+            base_scores[self.hidden] = 0.0
+        candidates = [(self.base, base_scores)]
+        if self.delta is not None:
+            delta_scores = self.delta.scores(features, weights)
+            if delta_scores is not None:
+                candidates.append((self.delta, delta_scores))
+
+        ranked = []
+        for segment, scores in candidates:
+            count = min(k * _CANDIDATES_PER_CODE, len(scores))
+            if not count:
+                continue
+            top = np.argpartition(-scores, count - 1)[:count]
+            ranked.extend((float(scores[doc]), segment, int(doc)) for doc in top if scores[doc] > 0.0)
+        ranked.sort(key=lambda item: -item[0])
+
+        found = {}
+        for similarity, segment, doc in ranked:
+            if len(found) >= k and similarity <= min(s.score for s in found.values()):
+                # Relative counts are at most 1, so no later document can do better
+                break
+            labels = segment.labels(doc, k)
+            top_count = labels[0][2]
+            for code, source, count in labels:
+                score = round(similarity * count / top_count, 4)
+                if code not in found or score > found[code].score:
+                    found[code] = Suggestion(code, score, SOURCES[source], segment.text_of(doc))
+        return sorted(found.values(), key=lambda s: -s.score)[:k]
+
+    def suggest_many(self, descriptions, k=5):
+        """Top-k suggestions for each description, best first. Repeated
+        descriptions (common in uploads) are scored once."""
+        start = time.perf_counter()
+        normalized = [normalize(description) for description in descriptions]
+        unique = list(dict.fromkeys(normalized))
+        results = dict(zip(unique, (self._top(features, weights, k)
+                                    for features, weights in self._vectors(unique))))
+        elapsed = time.perf_counter() - start
+        metrics.observe('tg_hs_suggest_seconds', elapsed)
+        _count(len(descriptions), len(unique), elapsed)
+        return [results[text] for text in normalized]
+
+    def suggest(self, description, k=5):
+        return self.suggest_many([description], k)[0]
+
+    def stats(self):
+        return {
+            "restrictions_version": self.restrictions_version,
+            "last_confirmation_id": self.last_id,
+            "base_documents": self.base.size,
+            "delta_documents": len(self.confirmed),
+            "codes": len(self.base.codes),
+            "features": 1 << self.bits,
+            "postings": len(self.base.post_doc),
+            "bytes": sum(getattr(self.base, name).nbytes for name in _ARRAYS),
+        }
+
+
+def _category_corpus(conn):
+    corpus = {}
+    for name in restrictions.JURISDICTIONS:
+        for hs_code, main, sub in conn.execute(f'SELECT HS_code, main_category, sub_category FROM {name}'):
+            text = normalize(f'{main or ""} {sub or ""}')
+            if hs_code is not None and text:
+                # Listed by several jurisdictions still counts once
+                corpus.setdefault(text, Counter())[(normalize_hs(hs_code), CATEGORY)] = 1
+    return corpus
+
+
+def _confirmed_corpus(conn, after_id):
+    """Corpus of the confirmations with id > after_id, and the last id read."""
+    corpus = {}
+    last_id = after_id
+    for confirmation_id, description, hs_code in conn.execute(
+            'SELECT id, description, hs_code FROM hs_confirmations WHERE id > ? ORDER BY id', (after_id,)):
+        last_id = confirmation_id
+        text, code = normalize(description), normalize_hs(hs_code)
+        if text and code:
+            corpus.setdefault(text, Counter())[(code, CONFIRMED)] += 1
+    return corpus, last_id
+
+
+def _saved_base(restrictions_version, last_id):
+    """The base segment another process saved for these restrictions, if usable."""
+    if not config.HS_SUGGEST_DIR:
+        return None
+    try:
+        with open(os.path.join(config.HS_SUGGEST_DIR, 'current')) as f:
+            name = f.read().strip()
+        base, meta = Segment.load(os.path.join(config.HS_SUGGEST_DIR, name))
+    except (OSError, ValueError):
+        return None
+    if (meta['restrictions_version'] != restrictions_version or meta['bits'] != config.HS_SUGGEST_BITS
+            or meta['last_id'] > last_id):
+        # Built for other restrictions or settings, or for a database restored since
+        return None
+    return base, meta['last_id']
+
+
+def _save_base(base, restrictions_version, last_id):
+    """Publish a base segment for other processes; a failure only costs them a rebuild."""
+    if not config.HS_SUGGEST_DIR:
+        return
+    name = f'{restrictions_version}-{last_id}'
+    final = os.path.join(config.HS_SUGGEST_DIR, name)
+    staging = os.path.join(config.HS_SUGGEST_DIR, f'.tmp-{os.getpid()}-{threading.get_ident()}')
+    try:
+        shutil.rmtree(staging, ignore_errors=True)
+        base.save(staging, {"restrictions_version": restrictions_version, "last_id": last_id,
+                            "bits": config.HS_SUGGEST_BITS, "documents": base.size})
+        try:
+            os.rename(staging, final)
+        except OSError:
+            # Another process saved the same build first
+            shutil.rmtree(staging, ignore_errors=True)
+        pointer = os.path.join(config.HS_SUGGEST_DIR, f'.current-{os.getpid()}')
+        with open(pointer, 'w') as f:
+            f.write(name)
+        os.replace(pointer, os.path.join(config.HS_SUGGEST_DIR, 'current'))
+        # Processes still mapping older builds keep their (unlinked) files
+        for entry in os.listdir(config.HS_SUGGEST_DIR):
+            if entry != name and not entry.startswith('.') and entry != 'current':
+                shutil.rmtree(os.path.join(config.HS_SUGGEST_DIR, entry), ignore_errors=True)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def build_index(conn, restrictions_version=None):
+    """Build a new base segment from every category and confirmation and save it."""
+    if restrictions_version is None:
+        restrictions_version = restrictions.restrictions_version(conn)
+    confirmed, last_id = _confirmed_corpus(conn, 0)
+    base = Segment.build(_merge(_category_corpus(conn), confirmed), config.HS_SUGGEST_BITS)
+    _save_base(base, restrictions_version, last_id)
+    _count_build()
+    return SuggestIndex(base, restrictions_version, last_id)
+
+
+def _load_or_build(conn, restrictions_version, last_id):
+    saved = _saved_base(restrictions_version, last_id)
+    if saved is None:
+        return build_index(conn, restrictions_version)
+    base, base_last_id = saved
+    confirmed, confirmed_id = _confirmed_corpus(conn, base_last_id)
+    if len(confirmed) > config.HS_SUGGEST_DELTA_MAX:
+        return build_index(conn, restrictions_version)
+    return SuggestIndex(base, restrictions_version, base_last_id, confirmed, confirmed_id)
+
+
+_index = None
+_index_lock = threading.Lock()
+_watcher_pid = None
+
+_stats_lock = threading.Lock()
+_counters = {"queries": 0, "descriptions": 0, "scored": 0, "total_ms": 0.0, "builds": 0}
+
+
+def _count(descriptions, scored, seconds):
+    with _stats_lock:
+        _counters["queries"] += 1
+        _counters["descriptions"] += descriptions
+        _counters["scored"] += scored
+        _counters["total_ms"] += seconds * 1000
+
+
+def _count_build():
+    with _stats_lock:
+        _counters["builds"] += 1
+
+
+def get_index():
+    """Current suggestion index for this process, loaded or built on first use."""
+    index = _index
+    if index is None or index.pid != os.getpid():
+        index = refresh(force=True)
+        _start_watcher()
+    return index
+
+
+def refresh(force=False):
+    """Pick up new confirmations and restriction edits.
+
+    New confirmations extend the delta segment; a restriction edit or a delta
+    past HS_SUGGEST_DELTA_MAX means a new base. Without force, a process that
+    has not loaded the index yet is left alone.
+    """
+    global _index
+    with _index_lock:
+        current = _index if _index is not None and _index.pid == os.getpid() else None
+        if current is None and not force:
+            return None
+        with get_pool().connection() as conn:
+            version = restrictions.restrictions_version(conn)
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM hs_confirmations').fetchone()[0]
+            if current is not None and version == current.restrictions_version:
+                if last_id == current.last_id:
+                    return current
+                if last_id > current.last_id:
+                    confirmed, confirmed_id = _confirmed_corpus(conn, current.last_id)
+                    if len(current.confirmed.keys() | confirmed.keys()) <= config.HS_SUGGEST_DELTA_MAX:
+                        _index = current.with_confirmations(confirmed, confirmed_id)
+                        return _index
+                    _index = build_index(conn, version)
+                    return _index
+            _index = _load_or_build(conn, version, last_id)
+    return _index
+
+
+def _watch():
+    while True:
+        time.sleep(config.HS_SUGGEST_REFRESH_SECONDS)
+        try:
+            refresh()
+        except Exception:
+            # Keep serving the last good index; try again next interval
+            pass
+
+
+def _start_watcher():
+    global _watcher_pid
+    with _index_lock:
+        if _watcher_pid == os.getpid():
+            return
+        _watcher_pid = os.getpid()
+    threading.Thread(target=_watch, name='hs-suggest-refresher', daemon=True).start()
+
+
+def suggest_many(descriptions, k=5):
+    return get_index().suggest_many(descriptions, k)
+
+
+def stats():
+    index = _index if _index is not None and _index.pid == os.getpid() else None
+    with _stats_lock:
+        counters = dict(_counters)
+    counters["total_ms"] = round(counters["total_ms"], 3)
+    counters["avg_ms_per_description"] = (
+        round(counters["total_ms"] / counters["descriptions"], 4) if counters["descriptions"] else 0.0)
+    return {"index": index.stats() if index else None, **counters}
@@ -0,0 +1,60 @@
+import hashlib
+import json
+import time
+
+import config
+
+# Idempotency-Key support for add-consignment. The response to the first
+# request carrying a key is stored in idempotency_keys (migration 18) in the
+# same transaction as the insert it describes, so after a dropped connection
+# either both exist or neither does and the client can simply retry: a retry
+# gets the stored response back, a different request reusing the key is
+# refused. Keys belong to the user sending them, so one client can neither
+# replay nor block another's. They are forgotten after
+# TG_IDEMPOTENCY_TTL_HOURS.
+
+MAX_KEY_LENGTH = 255
+_PRUNE_SECONDS = 60.0
+
+
+class KeyReused(Exception):
+    """The key was first used with a different request."""
+
+
+def valid_key(key):
+    return 0 < len(key) <= MAX_KEY_LENGTH and key.isprintable()
+
+
+def fingerprint(form, invoice_sha256=None):
+    """Digest of a submitted form and its invoice, to tell a retry from a new request."""
+    return hashlib.sha256(json.dumps([sorted(form.items(multi=True)), invoice_sha256]).encode()).hexdigest()
+
+
+def lookup(conn, user_id, key, request_fingerprint):
+    """(status, response body) stored for user_id's key, or None if the key
+    is new. Raises KeyReused if it was used with another request."""
+    row = conn.execute(
+        'SELECT fingerprint, status, response FROM idempotency_keys WHERE user_id = ? AND key = ? AND created_at >= ?',
+        (user_id, key, time.time() - config.IDEMPOTENCY_TTL_HOURS * 3600)).fetchone()
+    if row is None:
+        return None
+    if row[0] != request_fingerprint:
+        raise KeyReused('Idempotency-Key was already used for a different request')
+    return row[1], row[2]
+
+
+_last_prune = 0.0
+
+
+def remember(conn, user_id, key, request_fingerprint, status, response):
+    """Store the response for user_id's key, in the caller's transaction."""
+    global _last_prune
+    now = time.time()
+    # Replaces an expired entry for the same key
+    conn.execute(
+        '''INSERT OR REPLACE INTO idempotency_keys (user_id, key, fingerprint, status, response, created_at)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        (user_id, key, request_fingerprint, status, response, now))
+    if now - _last_prune >= _PRUNE_SECONDS:
+        _last_prune = now
+        conn.execute('DELETE FROM idempotency_keys WHERE created_at < ?', (now - config.IDEMPOTENCY_TTL_HOURS * 3600,))
@@ -0,0 +1,79 @@
+import hashlib
+import os
+import tempfile
+
+import config
+
+# Commercial invoices live on disk, content-addressed by SHA-256, as
+# <INVOICE_STORE_DIR>/<first two hex digits>/<digest>. Identical uploads share
+# one file. The invoices table records which digests exist and their sizes.
+
+
+def path_for(digest):
+    return os.path.join(config.INVOICE_STORE_DIR, digest[:2], digest)
+
+
+def exists(digest):
+    return os.path.exists(path_for(digest))
+
+
+def spool_stream(stream):
+    """Copy a binary stream to a temporary file in the store chunk by chunk;
+    return (digest, size, temporary path). Nothing is visible under the
+    digest until publish(), so an upload that is not kept leaves no blob."""
+    os.makedirs(config.INVOICE_STORE_DIR, exist_ok=True)
+    sha = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=config.INVOICE_STORE_DIR, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(config.INVOICE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        return sha.hexdigest(), size, tmp_path
+    except BaseException:
+        discard(tmp_path)
+        raise
+
+
+def publish(digest, tmp_path):
+    """Move a spooled upload to its place in the store (or drop it if the
+    store already holds the same content)."""
+    final_path = path_for(digest)
+    if os.path.exists(final_path):
+        os.remove(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(tmp_path, final_path)
+
+
+def discard(tmp_path):
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+def store_bytes(data):
+    digest = hashlib.sha256(data).hexdigest()
+    final_path = path_for(digest)
+    if not os.path.exists(final_path):
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(final_path), suffix='.part')
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        os.replace(tmp_path, final_path)
+    return digest, len(data)
+
+
+def register(conn, digest, size):
+    """Record a stored invoice; returns True if the digest was new."""
+    cursor = conn.execute('INSERT INTO invoices (sha256, size) VALUES (?, ?) ON CONFLICT(sha256) DO NOTHING', (digest, size))
+    return cursor.rowcount == 1
+
+
+def unregister(conn, digest):
+    """Undo register() in the same transaction, when the row it was for was not inserted."""
+    conn.execute('DELETE FROM invoices WHERE sha256 = ?', (digest,))
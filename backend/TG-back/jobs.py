@@ -0,0 +1,208 @@
+import json
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from db import get_pool
+
+# Background jobs. Every job has a row in the jobs table (status, progress,
+# result) so any process can answer GET /jobs/<id>. Execution is delegated to
+# a backend chosen by TG_JOB_BACKEND:
+#   thread - in-process worker threads, up to each kind's concurrency; the
+#            default, and what tests use
+#   celery - Celery workers (worker.py) over TG_CELERY_BROKER_URL, e.g. Redis;
+#            TG_CELERY_EAGER=1 runs the tasks inline instead, for tests
+
+QUEUED = 'queued'
+RUNNING = 'running'
+RETRYING = 'retrying'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+_handlers = {}
+
+
+class JobSpec:
+    def __init__(self, kind, func, max_retries, concurrency):
+        self.kind = kind
+        self.func = func
+        self.max_retries = max_retries
+        self.concurrency = concurrency
+        self.slots = threading.BoundedSemaphore(concurrency)
+
+
+def job(kind, max_retries=config.JOB_MAX_RETRIES, concurrency=config.JOB_WORKERS):
+    """Register func(params, progress) as the handler for jobs of this kind.
+
+    progress(dict) may be called any number of times; the handler's return
+    value (JSON-serialisable) becomes the job result.
+    """
+    def decorator(func):
+        _handlers[kind] = JobSpec(kind, func, max_retries, concurrency)
+        return func
+    return decorator
+
+
+def _update(job_id, **fields):
+    for key in ('params', 'result', 'progress'):
+        if key in fields and fields[key] is not None:
+            fields[key] = json.dumps(fields[key])
+    assignments = ', '.join(f'{key} = ?' for key in fields)
+    with get_pool().connection() as conn:
+        conn.execute(
+            f'UPDATE jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+            (*fields.values(), job_id))
+        conn.commit()
+
+
+def get_job(job_id):
+    with get_pool().connection() as conn:
+        row = conn.execute(
+            '''SELECT id, kind, status, params, progress, result, error, attempts, created_by,
+                      created_at, updated_at FROM jobs WHERE id = ?''', (job_id,)).fetchone()
+    if row is None:
+        return None
+    job_info = dict(row)
+    for key in ('params', 'progress', 'result'):
+        job_info[key] = json.loads(job_info[key]) if job_info[key] else None
+    return job_info
+
+
+def queue_for(kind):
+    return f'tg.{kind}'
+
+
+def queues():
+    """Celery queue of every registered job kind."""
+    return [queue_for(kind) for kind in _handlers]
+
+
+def run(job_id):
+    """Execute one attempt of a job. Returns True when finished (succeeded, or
+    failed for good) and False when the caller should retry it."""
+    job_info = get_job(job_id)
+    spec = _handlers[job_info['kind']]
+
+    last_report = [0.0]
+
+    def progress(state):
+        # Progress writes are throttled; the final state is in the result
+        now = time.monotonic()
+        if now - last_report[0] >= config.JOB_PROGRESS_INTERVAL:
+            last_report[0] = now
+            _update(job_id, progress=state)
+
+    # A job waiting for a slot of its kind stays queued (or retrying)
+    with spec.slots:
+        attempts = job_info['attempts'] + 1
+        _update(job_id, status=RUNNING, attempts=attempts)
+        try:
+            result = spec.func(job_info['params'] or {}, progress)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}'
+            if attempts <= spec.max_retries:
+                _update(job_id, status=RETRYING, error=error)
+                return False
+            _update(job_id, status=FAILED, error=error)
+            return True
+
+    _update(job_id, status=SUCCEEDED, result=result, error=None)
+    return True
+
+
+def retry_delay(attempts):
+    return config.JOB_RETRY_BACKOFF * (2 ** max(attempts - 1, 0))
+
+
+class ThreadBackend:
+    """Runs jobs on in-process threads, one pool per job kind sized to the
+    kind's concurrency, so jobs of a kind at its limit wait in that pool's
+    queue without holding a thread another kind could use."""
+
+    def __init__(self):
+        self._executors = {}
+        self._lock = threading.Lock()
+
+    def _executor(self, kind):
+        with self._lock:
+            executor = self._executors.get(kind)
+            if executor is None:
+                executor = self._executors[kind] = ThreadPoolExecutor(
+                    max_workers=_handlers[kind].concurrency, thread_name_prefix=f'tg-job-{kind}')
+            return executor
+
+    def submit(self, job_id, kind, attempts=0):
+        self._executor(kind).submit(self._run, job_id, kind, attempts)
+
+    def _run(self, job_id, kind, attempts):
+        if not run(job_id):
+            # Resubmitted after the backoff; no thread is held meanwhile
+            timer = threading.Timer(retry_delay(attempts + 1), self.submit, (job_id, kind, attempts + 1))
+            timer.daemon = True
+            timer.start()
+
+
+class CeleryBackend:
+    """Sends jobs to Celery workers, one queue per job kind (tg.<kind>) so each
+    kind's worker concurrency can be set independently."""
+
+    def __init__(self):
+        self.app = make_celery()
+        self.task = self.app.tasks['tradeguard.run_job']
+
+    def submit(self, job_id, kind):
+        self.task.apply_async(args=(job_id,), task_id=job_id, queue=queue_for(kind))
+
+
+def make_celery():
+    from celery import Celery
+
+    app = Celery('tradeguard', broker=config.CELERY_BROKER_URL)
+    app.conf.update(
+        task_acks_late=True,
+        worker_prefetch_multiplier=1,
+        task_ignore_result=True,  # status lives in the jobs table
+        task_default_queue='tg.default',
+        # Runs tasks inline in the submitting process, for tests without a broker
+        task_always_eager=config.CELERY_EAGER,
+    )
+
+    @app.task(name='tradeguard.run_job', bind=True, max_retries=None)
+    def run_job(task, job_id):
+        if not run(job_id):
+            raise task.retry(countdown=retry_delay(task.request.retries + 1))
+
+    return app
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if config.JOB_BACKEND == 'celery':
+                    _backend = CeleryBackend()
+                else:
+                    _backend = ThreadBackend()
+    return _backend
+
+
+def submit(kind, params=None, created_by=None):
+    """Record a job and hand it to the backend; returns the job id immediately."""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind '{kind}'")
+    job_id = uuid.uuid4().hex
+    with get_pool().connection() as conn:
+        conn.execute(
+            'INSERT INTO jobs (id, kind, status, params, created_by) VALUES (?, ?, ?, ?, ?)',
+            (job_id, kind, QUEUED, json.dumps(params or {}), created_by))
+        conn.commit()
+    get_backend().submit(job_id, kind)
+    return job_id
@@ -0,0 +1,94 @@
+import itertools
+import json
+import math
+from json.encoder import encode_basestring_ascii
+
+# Streaming JSON for row listings. A RowEncoder is built once per column list
+# and turns a sqlite3 row straight into JSON text, without a dict per row;
+# stream() writes a cursor out as a JSON array or as NDJSON in chunks, so a
+# response's memory and time to first byte don't grow with the result size.
+
+CHUNK_ROWS = 256
+
+
+def _float(value):
+    return float.__repr__(value) if math.isfinite(value) else json.dumps(value)
+
+
+_ENCODERS = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    float: _float,
+}
+
+
+class RowEncoder:
+    """Encodes rows as JSON objects with fixed keys.
+
+    keys[i] is the output key of row[offset + i]. Columns named in ``raw``
+    already hold JSON text (e.g. compliance_reasons) and are copied verbatim.
+    sort_keys matches Flask's jsonify, which sorts object keys by default.
+    """
+
+    def __init__(self, keys, raw=(), offset=0, sort_keys=False):
+        order = sorted(range(len(keys)), key=keys.__getitem__) if sort_keys else range(len(keys))
+        self._plan = tuple(
+            (offset + i, ('{' if n == 0 else ',') + encode_basestring_ascii(keys[i]) + ':', keys[i] in raw)
+            for n, i in enumerate(order))
+        self._empty = '{}' if not keys else None
+
+    def encode(self, row):
+        if self._empty:
+            return self._empty
+        parts = []
+        append = parts.append
+        encoders = _ENCODERS
+        for index, prefix, raw in self._plan:
+            value = row[index]
+            append(prefix)
+            if value is None:
+                append('null')
+            elif raw:
+                append(value)
+            else:
+                append(encoders.get(type(value), json.dumps)(value))
+        append('}')
+        return ''.join(parts)
+
+
+class RowList:
+    """Rows already in memory, read through the cursor methods stream() uses."""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size):
+        return list(itertools.islice(self._rows, size))
+
+
+def stream(encoder, first, cursor, ndjson=False):
+    """Yield the rows as a JSON array (or NDJSON lines) in chunks of CHUNK_ROWS.
+
+    ``first`` is the already-fetched first row, or None. Fetching it up front
+    lets the caller answer an empty result with its own status code before
+    streaming. Errors after the first chunk can only cut the body short.
+    """
+    if ndjson:
+        opening, separator, closing = '', '\n', '\n'
+    else:
+        opening, separator, closing = '[', ',', ']\n'
+    if first is None:
+        if not ndjson:
+            yield '[]\n'
+        return
+    encode = encoder.encode
+    prefix = opening
+    rows = [first, *cursor.fetchmany(CHUNK_ROWS - 1)]
+    while rows:
+        text = prefix + separator.join(map(encode, rows))
+        rows = cursor.fetchmany(CHUNK_ROWS)
+        yield text + (separator if rows else closing)
+        prefix = ''
@@ -0,0 +1,373 @@
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+import config
+
+# In-process metrics in the Prometheus text format, without a client library.
+# Counters and histograms are kept per process; with TG_METRICS_DIR set each
+# process also flushes a snapshot there and /metrics adds up every live
+# process's snapshot (the same idea as prometheus_client's multiprocess mode).
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 0.5, 2.5)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'tg_http_request_duration_seconds': ('histogram', 'Request latency by route.', LATENCY_BUCKETS),
+    'tg_request_phase_seconds': ('histogram', 'Time per request spent in each phase (jwt_decode, principal_lookup, sql, bcrypt, json_encode).', LATENCY_BUCKETS),
+    'tg_sql_execute_seconds': ('histogram', 'Statement execute time by statement.', SQL_BUCKETS),
+    'tg_sql_fetch_seconds_total': ('counter', 'Time spent fetching result rows by statement.', None),
+    'tg_sql_rows_total': ('counter', 'Rows fetched or modified by statement.', None),
+    'tg_bcrypt_seconds': ('histogram', 'bcrypt work time per call.', LATENCY_BUCKETS),
+    'tg_bcrypt_queue_seconds': ('histogram', 'Time bcrypt calls waited for a pool thread.', LATENCY_BUCKETS),
+    'tg_hs_suggest_seconds': ('histogram', 'Offline HS suggestion time per call (one or many descriptions).', SQL_BUCKETS),
+    'tg_profiles_total': ('counter', 'Requests profiled with the X-Profile header.', None),
+}
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [count per bucket..., +Inf count, sum]
+_collectors = []
+
+
+def inc(name, value=1.0, labels=()):
+    key = (name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def observe(name, value, labels=()):
+    buckets = METRICS[name][2]
+    key = (name, labels)
+    with _lock:
+        series = _histograms.get(key)
+        if series is None:
+            series = _histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        else:
+            series[len(buckets)] += 1
+        series[-1] += value
+
+
+def register_collector(func):
+    """func() yields (name, type, help, labels, value) gauges/counters read at scrape time."""
+    _collectors.append(func)
+    return func
+
+
+# Request phases
+
+def add_phase(phase, seconds):
+    if has_request_context():
+        phases = g.setdefault('_tg_phases', {})
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - start)
+
+
+# SQL statements. Labels are the statement text with comments dropped,
+# whitespace collapsed and IN (?, ?, ...) lists folded, so chunked queries
+# share one series
+
+_COMMENT = re.compile(r'--[^\n]*')
+_WHITESPACE = re.compile(r'\s+')
+_PLACEHOLDER_LIST = re.compile(r'\?(\s*,\s*\?)+')
+_sql_labels = {}
+
+
+def sql_label(sql):
+    label = _sql_labels.get(sql)
+    if label is None:
+        label = _PLACEHOLDER_LIST.sub('?...', _WHITESPACE.sub(' ', _COMMENT.sub('', sql)).strip())[:160]
+        if len(_sql_labels) < 5000:
+            _sql_labels[sql] = label
+    return label
+
+
+def sql_executed(label, seconds, rows):
+    observe('tg_sql_execute_seconds', seconds, (('statement', label),))
+    if rows > 0:
+        inc('tg_sql_rows_total', rows, (('statement', label),))
+    add_phase('sql', seconds)
+
+
+def sql_fetched(label, seconds, rows):
+    labels = (('statement', label),)
+    inc('tg_sql_fetch_seconds_total', seconds, labels)
+    if rows:
+        inc('tg_sql_rows_total', rows, labels)
+    add_phase('sql', seconds)
+
+
+# Snapshots and exposition
+
+def snapshot():
+    with _lock:
+        counters = [[name, list(labels), value] for (name, labels), value in _counters.items()]
+        histograms = [[name, list(labels), list(series)] for (name, labels), series in _histograms.items()]
+    gauges = []
+    for collector in _collectors:
+        for name, kind, help_text, labels, value in collector():
+            gauges.append([name, kind, help_text, list(labels), value])
+    return {"pid": os.getpid(), "counters": counters, "histograms": histograms, "gauges": gauges}
+
+
+def _snapshots():
+    own = snapshot()
+    if not config.METRICS_DIR:
+        return [own]
+    snapshots = [own]
+    for entry in os.listdir(config.METRICS_DIR):
+        if not entry.endswith('.json') or entry == f'{own["pid"]}.json':
+            continue
+        pid = int(entry[:-5])
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            # Exited worker: its numbers go with it, which Prometheus reads as a counter reset
+            os.remove(os.path.join(config.METRICS_DIR, entry))
+            continue
+        except PermissionError:
+            pass
+        try:
+            with open(os.path.join(config.METRICS_DIR, entry)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _labels_text(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in pairs) + '}'
+
+
+def render():
+    counters = Counter()
+    histograms = {}
+    gauges = {}
+    meta = {name: (kind, help_text) for name, (kind, help_text, _) in METRICS.items()}
+    for snap in _snapshots():
+        for name, labels, value in snap["counters"]:
+            counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, series in snap["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            current = histograms.get(key)
+            histograms[key] = series if current is None else [a + b for a, b in zip(current, series)]
+        for name, kind, help_text, labels, value in snap["gauges"]:
+            meta.setdefault(name, (kind, help_text))
+            key = (name, tuple(map(tuple, labels)))
+            gauges[key] = gauges.get(key, 0) + value
+
+    lines = []
+    by_name = {}
+    for (name, labels), value in sorted({**counters, **gauges}.items()):
+        by_name.setdefault(name, []).append(f'{name}{_labels_text(labels)} {value:g}')
+    for (name, labels), series in sorted(histograms.items()):
+        buckets = METRICS[name][2]
+        cumulative = 0
+        out = by_name.setdefault(name, [])
+        for bound, count in zip((*buckets, '+Inf'), series[:-1]):
+            cumulative += count
+            out.append(f'{name}_bucket{_labels_text(labels, (("le", bound if bound == "+Inf" else f"{bound:g}"),))} {cumulative}')
+        out.append(f'{name}_sum{_labels_text(labels)} {series[-1]:g}')
+        out.append(f'{name}_count{_labels_text(labels)} {cumulative}')
+    for name in sorted(by_name):
+        kind, help_text = meta.get(name, ('untyped', ''))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(by_name[name])
+    return '\n'.join(lines) + '\n'
+
+
+def _flush_forever():
+    path = os.path.join(config.METRICS_DIR, f'{os.getpid()}.json')
+    while True:
+        time.sleep(config.METRICS_FLUSH_SECONDS)
+        try:
+            tmp = f'{path}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(snapshot(), f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+
+_flusher_pid = None
+
+
+def _start_flusher():
+    global _flusher_pid
+    if not config.METRICS_DIR or _flusher_pid == os.getpid():
+        return
+    _flusher_pid = os.getpid()
+    os.makedirs(config.METRICS_DIR, exist_ok=True)
+    threading.Thread(target=_flush_forever, name='metrics-flusher', daemon=True).start()
+
+
+# Sampling profiler
+
+def _native():
+    """(start_new_thread, get_ident, sleep) of the OS, even in a gevent-patched process."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        import _thread
+
+        return _thread.start_new_thread, _thread.get_ident, time.sleep
+    return (monkey.get_original('_thread', 'start_new_thread'),
+            monkey.get_original('_thread', 'get_ident'),
+            monkey.get_original('time', 'sleep'))
+
+
+class SamplingProfiler:
+    """Samples one OS thread's stack every interval and counts collapsed stacks
+    ("a;b;c count" lines, the input format of flamegraph.pl and speedscope).
+
+    The sampler is a native thread so it keeps running while the request
+    holds the GIL or, under gevent, the event loop. Greenlets share their OS
+    thread, so samples can include other requests that ran in between.
+    """
+
+    def __init__(self, interval):
+        self.start_thread, get_ident, self.sleep = _native()
+        self.thread_id = get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self._running = False
+
+    def _run(self):
+        while self._running:
+            self.sleep(self.interval)
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack and self._running:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._running = True
+        self.start_thread(self._run, ())
+
+    def stop(self):
+        # The sampler notices within one interval; samples after this are dropped
+        self._running = False
+        return Counter(self.stacks)
+
+
+# Flask integration
+
+class _TimedJSONProvider:
+    """Mixin for the app's JSON provider that records encoding time."""
+
+    def dumps(self, obj, **kwargs):
+        with phase('json_encode'):
+            return super().dumps(obj, **kwargs)
+
+
+def init_app(app):
+    provider = type(app.json)
+    app.json = type('TimedJSONProvider', (_TimedJSONProvider, provider), {})(app)
+
+    @app.before_request
+    def start_timer():
+        g._tg_start = time.perf_counter()
+        if config.PROFILE_ENABLED and request.headers.get('X-Profile') == '1':
+            g._tg_profiler = SamplingProfiler(config.PROFILE_INTERVAL_MS / 1000)
+            g._tg_profiler.start()
+
+    @app.after_request
+    def record(response):
+        start = g.pop('_tg_start', None)
+        if start is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        observe('tg_http_request_duration_seconds', time.perf_counter() - start,
+                (('route', route), ('method', request.method), ('status', str(response.status_code))))
+        for name, seconds in g.pop('_tg_phases', {}).items():
+            observe('tg_request_phase_seconds', seconds, (('route', route), ('phase', name)))
+
+        profiler = g.pop('_tg_profiler', None)
+        if profiler is not None:
+            stacks = profiler.stop()
+            os.makedirs(config.PROFILE_DIR, exist_ok=True)
+            name = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{profiler.thread_id}.folded'
+            with open(os.path.join(config.PROFILE_DIR, name), 'w') as f:
+                f.writelines(f'{stack} {count}\n' for stack, count in stacks.most_common())
+            response.headers['X-Profile-File'] = name
+            response.headers['X-Profile-Samples'] = str(sum(stacks.values()))
+            inc('tg_profiles_total')
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        # Closed unless a token is configured
+        if not config.METRICS_TOKEN or not hmac.compare_digest(
+                request.headers.get('Authorization', ''), f'Bearer {config.METRICS_TOKEN}'):
+            return 'Forbidden\n', 403, {'Content-Type': 'text/plain'}
+        return render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+    _register_collectors()
+    _start_flusher()
+
+
+def _register_collectors():
+    if _collectors:
+        return
+    import auth_cache
+    import consignment_cache
+    import passwords
+    from db import pool_stats
+
+    @register_collector
+    def database_pools():
+        for pool in pool_stats():
+            labels = (('path', pool['path']),)
+            yield 'tg_db_connections', 'gauge', 'Pooled SQLite connections by state.', (*labels, ('state', 'in_use')), pool['in_use']
+            yield 'tg_db_connections', 'gauge', 'Pooled SQLite connections by state.', (*labels, ('state', 'idle')), pool['idle']
+            yield 'tg_db_pool_size', 'gauge', 'Configured pool size.', labels, pool['size']
+            yield 'tg_db_checkouts_total', 'counter', 'Connections handed out by the pool.', labels, pool['checkouts']
+            yield 'tg_db_checkout_timeouts_total', 'counter', 'Checkouts that gave up waiting.', labels, pool['timeouts']
+            yield 'tg_db_checkout_wait_seconds_total', 'counter', 'Time spent waiting for a connection.', labels, pool['wait_total_ms'] / 1000
+
+    @register_collector
+    def caches():
+        for name, cache_stats in (('principals', auth_cache.principal_cache.stats()), ('tokens', auth_cache.token_cache.stats())):
+            for result in ('hits', 'misses'):
+                yield 'tg_auth_cache_requests_total', 'counter', 'Auth cache lookups.', (('cache', name), ('result', result)), cache_stats[result]
+
+    @register_collector
+    def listing_cache():
+        cache_stats = consignment_cache.pages.stats()
+        for result in ('hits', 'misses'):
+            yield 'tg_listing_cache_requests_total', 'counter', 'Rendered listing page cache lookups.', (('result', result),), cache_stats[result]
+
+    @register_collector
+    def password_pool():
+        yield 'tg_bcrypt_queued', 'gauge', 'bcrypt calls waiting or running.', (), passwords.stats()['queued']
+        yield 'tg_bcrypt_rejected_total', 'counter', 'bcrypt calls refused because the queue was full.', (), passwords.stats()['rejected']
@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+import config
+import metrics
+
+# bcrypt off the request thread. Each call costs ~250 ms of CPU at cost 12;
+# running it inline stalls a gevent worker's whole event loop. Calls go to a
+# bounded pool of native threads (bcrypt releases the GIL): gevent's hub
+# threadpool when the process is monkey-patched, a ThreadPoolExecutor
+# otherwise. At most PASSWORD_WORKERS run at once and PASSWORD_MAX_QUEUE wait.
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many password checks are already waiting."""
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+class _Pool:
+    def __init__(self, workers):
+        self.pid = os.getpid()
+        if _gevent_patched():
+            import gevent
+
+            threadpool = gevent.get_hub().threadpool
+            threadpool.maxsize = workers
+            self.apply = threadpool.apply
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tg-bcrypt')
+            self.apply = lambda func, args: executor.submit(func, *args).result()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    "calls": 0,
+    "rejected": 0,
+    "queued": 0,
+    "queue_wait_total": 0.0,
+    "queue_wait_max": 0.0,
+    "work_total": 0.0,
+}
+# Typical latency of a real check, used to pad failures for unknown emails;
+# starts from bcrypt's ~250 ms at cost 12 and follows observed checks
+_check_seconds = 0.25 * 2 ** (config.BCRYPT_ROUNDS - 12)
+
+
+def _get_pool():
+    global _pool
+    pool = _pool
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = _Pool(config.PASSWORD_WORKERS)
+            pool = _pool
+    return pool
+
+
+def _timed(func, submitted, args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, started - submitted, time.perf_counter() - started
+
+
+def _run(op, func, *args):
+    with _stats_lock:
+        if _stats["queued"] >= config.PASSWORD_MAX_QUEUE:
+            _stats["rejected"] += 1
+            raise PasswordHasherBusy('Too many password checks in progress')
+        _stats["queued"] += 1
+    try:
+        result, waited, worked = _get_pool().apply(_timed, (func, time.perf_counter(), args))
+    finally:
+        with _stats_lock:
+            _stats["queued"] -= 1
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats["queue_wait_total"] += waited
+        _stats["queue_wait_max"] = max(_stats["queue_wait_max"], waited)
+        _stats["work_total"] += worked
+    metrics.observe('tg_bcrypt_queue_seconds', waited, (('op', op),))
+    metrics.observe('tg_bcrypt_seconds', worked, (('op', op),))
+    metrics.add_phase('bcrypt', waited + worked)
+    return result, waited + worked
+
+
+def hash_password(password):
+    hashed, _ = _run('hash', bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(config.BCRYPT_ROUNDS))
+    return hashed.decode('utf-8')
+
+
+def check_password(password, stored_hash):
+    global _check_seconds
+    matched, elapsed = _run('check', bcrypt.checkpw, password.encode('utf-8'), stored_hash.encode('utf-8'))
+    _check_seconds += (elapsed - _check_seconds) * 0.1
+    return matched
+
+
+def reject_unknown():
+    """Stand-in for check_password when the email is unknown: no bcrypt work,
+    but just as slow, so response times don't reveal which emails exist."""
+    time.sleep(_check_seconds)
+    return False
+
+
+def needs_rehash(stored_hash):
+    """True when stored_hash was made with a cost other than BCRYPT_ROUNDS ($2b$<cost>$...)."""
+    try:
+        return int(stored_hash.split('$')[2]) != config.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+def stats():
+    with _stats_lock:
+        calls = _stats["calls"]
+        return {
+            "rounds": config.BCRYPT_ROUNDS,
+            "workers": config.PASSWORD_WORKERS,
+            "calls": calls,
+            "queued": _stats["queued"],
+            "rejected": _stats["rejected"],
+            "queue_wait_avg_ms": round(_stats["queue_wait_total"] * 1000 / calls, 3) if calls else 0.0,
+            "queue_wait_max_ms": round(_stats["queue_wait_max"] * 1000, 3),
+            "work_avg_ms": round(_stats["work_total"] * 1000 / calls, 3) if calls else 0.0,
+            "check_estimate_ms": round(_check_seconds * 1000, 3),
+        }
@@ -0,0 +1,490 @@
+import datetime
+import hashlib
+import html
+import json
+import os
+import tempfile
+import textwrap
+import threading
+import time
+import zlib
+
+import config
+
+# Compliance reports and shipping forms for a set of consignments, as HTML or
+# PDF. A report is rendered in one pass over a cursor and written out a chunk
+# at a time, so memory does not grow with the number of shipments.
+#
+# Finished reports are kept on disk under REPORT_CACHE_DIR, named by a digest
+# of what went into them: the layout, the format and title, and every
+# (uuid, row_version) of the selection. Regenerating a report whose
+# shipments have not changed is then a file send. The digest and the render
+# read the same snapshot, so a cached file always matches its key. When the
+# cache outgrows REPORT_CACHE_MAX_BYTES the least recently used reports go.
+# Each process keeps a running total of the cache size and only walks the
+# directory once that passes the limit, or every REPORT_CACHE_SCAN_SECONDS
+# to take in what other processes added and removed.
+#
+# Only shipments in the hot table are reported on; archived ones (archive.py)
+# are left out.
+
+KINDS = ('compliance', 'shipping-form')
+FORMATS = {'html': 'text/html; charset=utf-8', 'pdf': 'application/pdf'}
+# Part of every cache key: bump when a layout changes so old renders are not reused
+LAYOUT_VERSION = 1
+
+_COLUMNS = '''uuid, row_version, shipment_id, shipment_date, sender_name, sender_address, sender_country,
+    sender_mail, sender_phone, receiver_name, receiver_address, receiver_country, PackageQuantity,
+    HS_code, totalWeight, Item_desc, handling_inst, declared_value, invoice_sha256, compliant,
+    compliance_reasons, compliance_override, created_at'''
+
+# Filter -> SQL, for reports over a listing rather than chosen shipments
+_FILTERS = {
+    "compliant": "compliant = ?",
+    "sender_country": "sender_country = ?",
+    "receiver_country": "receiver_country = ?",
+    "created_from": "created_at >= ?",
+    "created_to": "created_at < ?",
+}
+
+_CHUNK_BYTES = 64 * 1024
+_FETCH_ROWS = 256
+
+
+def parse_spec(data):
+    """A validated report spec (JSON-serialisable, also the job params) from
+    a request body. Raises ValueError with a client-facing message."""
+    kind = data.get('kind', 'compliance')
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of: {', '.join(KINDS)}")
+    fmt = data.get('format', 'pdf')
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    title = data.get('title') or ('Compliance report' if kind == 'compliance' else 'Shipping forms')
+    if not isinstance(title, str) or len(title) > 200:
+        raise ValueError("title must be a string of at most 200 characters")
+
+    spec = {"kind": kind, "format": fmt, "title": title}
+    uuids = data.get('uuids')
+    filters = data.get('filters')
+    if (uuids is None) == (filters is None):
+        raise ValueError("Give either uuids or filters")
+    if uuids is not None:
+        if not isinstance(uuids, list) or not uuids or not all(isinstance(u, int) for u in uuids):
+            raise ValueError("uuids must be a non-empty list of integers")
+        if len(uuids) > config.REPORT_MAX_UUIDS:
+            raise ValueError(f"At most {config.REPORT_MAX_UUIDS} uuids per report")
+        spec["uuids"] = sorted(set(uuids))
+    else:
+        if not isinstance(filters, dict) or set(filters) - set(_FILTERS):
+            raise ValueError(f"filters may only contain: {', '.join(_FILTERS)}")
+        spec["filters"] = {}
+        for name, value in sorted(filters.items()):
+            if not isinstance(value, str) or not value:
+                raise ValueError(f"filter {name} must be a non-empty string")
+            if name in ('created_from', 'created_to'):
+                try:
+                    day = datetime.datetime.strptime(value, "%Y-%m-%d")
+                except ValueError:
+                    raise ValueError(f"{name} must be a YYYY-MM-DD date")
+                if name == 'created_to':
+                    day += datetime.timedelta(days=1)  # inclusive of the whole end day
+                value = day.strftime("%Y-%m-%d %H:%M:%S")
+            spec["filters"][name] = value
+    return spec
+
+
+def _where(spec):
+    if "uuids" in spec:
+        # json_each takes the whole list as one parameter, whatever its length
+        return 'WHERE uuid IN (SELECT value FROM json_each(?))', [json.dumps(spec["uuids"])]
+    clauses = [_FILTERS[name] for name in spec["filters"]]
+    return (f"WHERE {' AND '.join(clauses)}" if clauses else ''), list(spec["filters"].values())
+
+
+def report_key(conn, spec):
+    """(cache key, shipment count) of the report spec describes, at the
+    current snapshot of conn. Reads only (uuid, row_version) pairs."""
+    where_sql, params = _where(spec)
+    digest = hashlib.sha256(json.dumps(
+        [LAYOUT_VERSION, spec["kind"], spec["format"], spec["title"]]).encode('utf-8'))
+    count = 0
+    cursor = conn.execute(f'SELECT uuid, row_version FROM Consignments {where_sql} ORDER BY uuid', params)
+    while True:
+        rows = cursor.fetchmany(4096)
+        if not rows:
+            break
+        count += len(rows)
+        digest.update(','.join(f'{row[0]}.{row[1]}' for row in rows).encode('ascii'))
+        digest.update(b';')
+    return digest.hexdigest(), count
+
+
+def _findings(row):
+    return json.loads(row['compliance_reasons']) if row['compliance_reasons'] else []
+
+
+def _status(row):
+    status = row['compliant'] or 'pending'
+    return f'{status} (set by hand)' if row['compliance_override'] else status
+
+
+def _number(value, digits=2):
+    return '' if value is None else f'{value:,.{digits}f}'
+
+
+def _shipping_fields(row):
+    """(label, value) pairs of a shipping form, in print order."""
+    return [
+        ("Shipment ID", row['shipment_id']),
+        ("Shipment date", row['shipment_date']),
+        ("Sender", row['sender_name']),
+        ("Sender address", row['sender_address']),
+        ("Origin country", row['sender_country']),
+        ("Sender e-mail", row['sender_mail']),
+        ("Sender phone", row['sender_phone']),
+        ("Receiver", row['receiver_name']),
+        ("Receiver address", row['receiver_address']),
+        ("Destination country", row['receiver_country']),
+        ("Description of goods", row['Item_desc']),
+        ("HS code", row['HS_code']),
+        ("Packages", row['PackageQuantity']),
+        ("Total weight (kg)", _number(row['totalWeight'])),
+        ("Declared value", _number(row['declared_value'])),
+        ("Handling instructions", row['handling_inst'] or ''),
+        ("Commercial invoice", "attached" if row['invoice_sha256'] else "not provided"),
+        ("Compliance status", _status(row)),
+    ]
+
+
+class HtmlReport:
+    """Self-contained HTML, printable one shipping form per page."""
+
+    _STYLE = ('body{font-family:Helvetica,Arial,sans-serif;font-size:13px;margin:2em}'
+              'table{border-collapse:collapse;width:100%}th,td{border:1px solid #ccc;padding:4px 6px;'
+              'text-align:left;vertical-align:top}th{background:#f3f3f3}.flagged{color:#b00020}'
+              '.pending{color:#a66300}.compliant{color:#1b7f3b}section{page-break-after:always}'
+              'dl{display:grid;grid-template-columns:14em 1fr;gap:4px 12px}dt{font-weight:bold}')
+    _HEADER = ('<tr><th>Shipment ID</th><th>Date</th><th>Origin</th><th>Destination</th><th>HS code</th>'
+               '<th>Weight (kg)</th><th>Declared value</th><th>Status</th><th>Findings</th></tr>')
+
+    def __init__(self, kind, title):
+        self.kind = kind
+        self.title = title
+
+    def begin(self):
+        title = html.escape(self.title)
+        head = (f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{title}</title>'
+                f'<style>{self._STYLE}</style></head><body>\n<h1>{title}</h1>\n')
+        if self.kind == 'compliance':
+            head += f'<table><thead>{self._HEADER}</thead><tbody>\n'
+        return head.encode('utf-8')
+
+    def consignment(self, row):
+        e = html.escape
+        findings = _findings(row)
+        if self.kind == 'compliance':
+            notes = '<br>'.join(f"{e(f.get('severity', ''))}: {e(f.get('message', ''))}" for f in findings)
+            cells = (row['shipment_id'], row['shipment_date'], row['sender_country'], row['receiver_country'],
+                     row['HS_code'], _number(row['totalWeight']), _number(row['declared_value']))
+            return (f"<tr>{''.join(f'<td>{e(str(cell))}</td>' for cell in cells)}"
+                    f"<td class=\"{e(row['compliant'] or 'pending')}\">{e(_status(row))}</td>"
+                    f"<td>{notes}</td></tr>\n").encode('utf-8')
+        fields = ''.join(f'<dt>{e(label)}</dt><dd>{e(str(value))}</dd>' for label, value in _shipping_fields(row))
+        notes = ''.join(f"<li>{e(f.get('message', ''))}</li>" for f in findings)
+        return (f"<section><h2>Shipping form {e(row['shipment_id'])}</h2><dl>{fields}</dl>"
+                f"{f'<h3>Compliance findings</h3><ul>{notes}</ul>' if notes else ''}"
+                f"<p>Declared by: ______________________ &nbsp; Date: ____________</p></section>\n").encode('utf-8')
+
+    def end(self, summary):
+        counts = ', '.join(f'{status}: {count}' for status, count in sorted(summary["by_status"].items()))
+        tail = '</tbody></table>\n' if self.kind == 'compliance' else ''
+        return (f'{tail}<p>{summary["shipments"]} shipments. {html.escape(counts)}</p>\n'
+                '</body></html>\n').encode('utf-8')
+
+
+class PdfReport:
+    """Text-only PDF 1.4 in the standard Helvetica fonts, written as it goes.
+
+    Each page's content is buffered until the page is full, then written out
+    with its page object; only the byte offset of every object is kept for
+    the cross-reference table at the end. Characters outside Latin-1 print
+    as '?'.
+    """
+
+    WIDTH, HEIGHT, MARGIN = 595, 842, 40  # A4 in points
+    _CATALOG, _PAGES, _FONT, _BOLD, _INFO = 1, 2, 3, 4, 5
+
+    def __init__(self, kind, title):
+        self.kind = kind
+        self.title = title
+        self._offset = 0
+        self._offsets = {}
+        self._next_object = 6
+        self._pages = []
+        self._ops = []
+        self._y = None
+        self._forms = 0
+
+    def _object(self, number, body):
+        data = b'%d 0 obj\n' % number + body + b'\nendobj\n'
+        self._offsets[number] = self._offset
+        self._offset += len(data)
+        return data
+
+    @staticmethod
+    def _string(text):
+        text = ''.join(ch if ch >= ' ' else ' ' for ch in str(text))
+        raw = text.encode('latin-1', 'replace')
+        return b'(' + raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+    def begin(self):
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self._offset = len(header)
+        out = [header,
+               self._object(self._CATALOG, b'<< /Type /Catalog /Pages 2 0 R >>'),
+               self._object(self._FONT, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+                                        b'/Encoding /WinAnsiEncoding >>'),
+               self._object(self._BOLD, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold '
+                                        b'/Encoding /WinAnsiEncoding >>'),
+               self._object(self._INFO, b'<< /Title ' + self._string(self.title) + b' /Producer (TradeGuard) >>')]
+        self._ops = []
+        self._y = self.HEIGHT - self.MARGIN
+        out.append(self._line(self.title, size=16, bold=True, gap=10))
+        return b''.join(out)
+
+    def _page(self):
+        """Write out the current page and start the next; returns its bytes."""
+        content = zlib.compress(b''.join(self._ops))
+        stream_number, page_number = self._next_object, self._next_object + 1
+        self._next_object += 2
+        self._pages.append(page_number)
+        self._ops = []
+        self._y = self.HEIGHT - self.MARGIN
+        return (self._object(stream_number, b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(content)
+                             + content + b'\nendstream')
+                + self._object(page_number, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+                                            b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>'
+                               % (self.WIDTH, self.HEIGHT, stream_number)))
+
+    def _line(self, text, size=9, bold=False, indent=0, gap=0):
+        """Lay out one paragraph, wrapped to the page width; returns the bytes
+        of any pages it filled."""
+        out = []
+        # Helvetica averages about half an em per character; wrap a little early
+        width = int((self.WIDTH - 2 * self.MARGIN - indent) / (size * 0.55))
+        for part in textwrap.wrap(str(text), width) or ['']:
+            if self._y - size < self.MARGIN:
+                out.append(self._page())
+            self._y -= size + 3
+            self._ops.append(b'BT /F%d %d Tf %d %d Td ' % (2 if bold else 1, size, self.MARGIN + indent, self._y)
+                             + self._string(part) + b' Tj ET\n')
+        self._y -= gap
+        return b''.join(out)
+
+    def consignment(self, row):
+        out = []
+        findings = _findings(row)
+        if self.kind == 'compliance':
+            if self._y - 60 < self.MARGIN:
+                out.append(self._page())  # keep a shipment's first lines together
+            out.append(self._line(f"{row['shipment_id']}  -  {_status(row)}", size=10, bold=True))
+            out.append(self._line(
+                f"{row['shipment_date']}   {row['sender_name']} ({row['sender_country']})  ->  "
+                f"{row['receiver_name']} ({row['receiver_country']})", indent=10))
+            out.append(self._line(
+                f"HS {row['HS_code']}   {row['PackageQuantity']} packages   {_number(row['totalWeight'])} kg   "
+                f"declared value {_number(row['declared_value'])}   {row['Item_desc']}", indent=10))
+            for finding in findings:
+                out.append(self._line(f"{finding.get('severity', '')}: {finding.get('message', '')}", indent=20))
+            self._y -= 6
+        else:
+            if self._forms:
+                out.append(self._page())  # one form per page, the first below the title
+            self._forms += 1
+            out.append(self._line(f"Shipping form {row['shipment_id']}", size=14, bold=True, gap=8))
+            for label, value in _shipping_fields(row):
+                out.append(self._line(label, bold=True))
+                out.append(self._line(value, indent=12, gap=2))
+            if findings:
+                out.append(self._line('Compliance findings', bold=True))
+                for finding in findings:
+                    out.append(self._line(f"- {finding.get('message', '')}", indent=12))
+            out.append(self._line('', gap=20))
+            out.append(self._line('Declared by: ______________________    Date: ____________'))
+        return b''.join(out)
+
+    def end(self, summary):
+        out = [self._line('', gap=6),
+               self._line(f"{summary['shipments']} shipments", bold=True),
+               self._line(', '.join(f'{status}: {count}' for status, count in sorted(summary["by_status"].items())))]
+        out.append(self._page())
+        kids = b' '.join(b'%d 0 R' % number for number in self._pages)
+        out.append(self._object(self._PAGES, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self._pages))))
+        size = self._next_object
+        xref = [b'xref\n0 %d\n0000000000 65535 f \n' % size]
+        xref.extend(b'%010d 00000 n \n' % self._offsets[number] for number in range(1, size))
+        xref.append(b'trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%EOF\n' % (size, self._offset))
+        return b''.join(out) + b''.join(xref)
+
+
+_RENDERERS = {'html': HtmlReport, 'pdf': PdfReport}
+
+
+def render(conn, spec, progress=None):
+    """Yield the report as byte chunks of about 64 KiB, reading the
+    consignments from conn in one ordered pass."""
+    where_sql, params = _where(spec)
+    report = _RENDERERS[spec["format"]](spec["kind"], spec["title"])
+    summary = {"shipments": 0, "by_status": {}}
+    parts = [report.begin()]
+    size = len(parts[0])
+    cursor = conn.execute(f'SELECT {_COLUMNS} FROM Consignments {where_sql} ORDER BY uuid', params)
+    while True:
+        rows = cursor.fetchmany(_FETCH_ROWS)
+        if not rows:
+            break
+        for row in rows:
+            chunk = report.consignment(row)
+            parts.append(chunk)
+            size += len(chunk)
+            status = row['compliant'] or 'pending'
+            summary["by_status"][status] = summary["by_status"].get(status, 0) + 1
+        summary["shipments"] += len(rows)
+        if size >= _CHUNK_BYTES:
+            yield b''.join(parts)
+            parts, size = [], 0
+        if progress:
+            progress(dict(summary))
+    parts.append(report.end(summary))
+    yield b''.join(parts)
+
+
+def path_for(key, fmt):
+    return os.path.join(config.REPORT_CACHE_DIR, key[:2], f'{key}.{fmt}')
+
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evicted": 0, "scans": 0}
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def cached(key, fmt):
+    """Path of the cached report, or None. A hit counts as a use for eviction."""
+    path = path_for(key, fmt)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        _count("misses")
+        return None
+    _count("hits")
+    return path
+
+
+def generate(conn, spec, key, progress=None):
+    """Render the report, yielding its chunks while writing them to the
+    cache; the file appears under its key only once complete. Stopping
+    early (e.g. the client went away) leaves nothing behind."""
+    path = path_for(key, spec["format"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        size = 0
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in render(conn, spec, progress):
+                out.write(chunk)
+                size += len(chunk)
+                yield chunk
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _added(size, path)
+
+
+# Eviction goes this far below the limit, so a full cache is not walked
+# again on the very next report
+_EVICT_TO = 0.9
+
+_size_lock = threading.Lock()
+_evict_lock = threading.Lock()
+_cache_bytes = None  # this process's running total; None until the first scan
+_next_scan = 0.0
+
+
+def _added(size, path):
+    """Count a report just written to the cache, evicting if that takes the
+    running total past the limit or a recount is due."""
+    global _cache_bytes
+    with _size_lock:
+        due = _cache_bytes is None or time.monotonic() >= _next_scan
+        if not due:
+            _cache_bytes += size
+            due = _cache_bytes > config.REPORT_CACHE_MAX_BYTES
+    # A thread already evicting counts this report too
+    if due and _evict_lock.acquire(blocking=False):
+        try:
+            _evict(keep=path)
+        finally:
+            _evict_lock.release()
+
+
+def evict(keep=None):
+    """Recount the cache and, if it is over REPORT_CACHE_MAX_BYTES, delete
+    least recently used reports until it is back under. Returns the size left."""
+    with _evict_lock:
+        return _evict(keep)
+
+
+def _evict(keep):
+    global _cache_bytes, _next_scan
+    entries = []
+    total = 0
+    for root, _, files in os.walk(config.REPORT_CACHE_DIR):
+        for name in files:
+            if name.endswith('.part'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                info = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+            total += info.st_size
+    evicted = 0
+    if total > config.REPORT_CACHE_MAX_BYTES:
+        entries.sort()
+        for _, size, path in entries:
+            if total <= config.REPORT_CACHE_MAX_BYTES * _EVICT_TO:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+    _count("evicted", evicted)
+    _count("scans")
+    with _size_lock:
+        _cache_bytes = total
+        _next_scan = time.monotonic() + config.REPORT_CACHE_SCAN_SECONDS
+    return total
+
+
+def stats():
+    files = 0
+    total = 0
+    for root, _, names in os.walk(config.REPORT_CACHE_DIR):
+        for name in names:
+            if not name.endswith('.part'):
+                files += 1
+                total += os.path.getsize(os.path.join(root, name))
+    with _stats_lock:
+        counters = dict(_stats)
+    return {"files": files, "bytes": total, "max_bytes": config.REPORT_CACHE_MAX_BYTES, **counters}
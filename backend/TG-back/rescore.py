@@ -0,0 +1,229 @@
+import time
+
+import numpy as np
+
+import compliance
+import config
+import restrictions
+from db import get_pool
+
+# Batch re-evaluation of stored consignments after the restriction lists
+# change. Consignments are read in uuid-ordered chunks, turned into NumPy
+# columns, and scored per destination with the rules' vectorized form. The
+# scalar engine only re-runs (for the details) on rows whose status changed,
+# or whose stored reasons may be stale: not compliant, and scored under
+# another basis (compliance.RuleEngine.basis) than the current rules give.
+# Scoring reads the table without a transaction; only the writes take the
+# write lock, and each update applies only if the row's row_version is still
+# the one that was scored.
+
+# has_invoice as the rules take it: None for a row that could not carry one
+_HAS_INVOICE = '''CASE WHEN invoice_sha256 IS NOT NULL OR commercial_invoice IS NOT NULL THEN 1
+                     WHEN invoice_pending THEN NULL ELSE 0 END'''
+
+_CHUNK_QUERY = f'''
+    SELECT uuid, receiver_country, HS_code, totalWeight, declared_value, {_HAS_INVOICE}, compliant, compliance_reasons,
+           IFNULL(compliance_basis, 0), row_version
+    FROM Consignments
+    WHERE uuid > ? AND compliance_override = 0
+    ORDER BY uuid
+    LIMIT ?
+'''
+
+_UPDATE = '''
+    UPDATE Consignments SET compliant = ?, compliance_reasons = ?, compliance_basis = ?
+    WHERE uuid = ? AND row_version = ? AND compliance_override = 0
+'''
+
+
+def _columns(rows):
+    uuids, countries, hs_codes, weights, values, has_invoice, current, _, basis, _ = zip(*rows)
+
+    # Normalise each distinct HS code / country once, then broadcast back
+    unique_hs, hs_inverse = np.unique(np.array(hs_codes, dtype=str), return_inverse=True)
+    hs = np.array([restrictions.normalize_hs(code) for code in unique_hs] or [''])[hs_inverse]
+
+    unique_countries, country_inverse = np.unique(np.array(countries, dtype=str), return_inverse=True)
+    jurisdictions = np.array([restrictions.jurisdiction_for(c) or '' for c in unique_countries])[country_inverse]
+
+    columns = {
+        "hs": hs,
+        "weight": np.array(weights, dtype=float),  # NULL -> nan, which never exceeds a limit
+        "value": np.array(values, dtype=float),
+        "has_invoice": np.array(has_invoice, dtype=bool),  # NULL -> False
+        "invoice_pending": np.array([value is None for value in has_invoice], dtype=bool),
+    }
+    return jurisdictions, columns, np.array(current, dtype=str), np.array(basis, dtype=np.int64)
+
+
+def _shipment(row):
+    return {
+        "receiver_country": row[1],
+        "HS_code": row[2],
+        "totalWeight": row[3],
+        "declared_value": row[4],
+        "has_invoice": None if row[5] is None else bool(row[5]),
+    }
+
+
+def _score(engine, rows):
+    """(status, reasons, basis, uuid, row_version) for the rows of a chunk that need writing."""
+    jurisdictions, columns, current, stored_basis = _columns(rows)
+
+    new_status = np.empty(len(rows), dtype='<U9')
+    basis = np.empty(len(rows), dtype=np.int64)
+    for name in np.unique(jurisdictions):
+        group = jurisdictions == name
+        group_columns = {key: column[group] for key, column in columns.items()}
+        new_status[group] = engine.evaluate_batch(name or None, group_columns)
+        unique_hs, hs_inverse = np.unique(group_columns['hs'], return_inverse=True)
+        basis[group] = np.array([engine.basis(name or None, code) for code in unique_hs], dtype=np.int64)[hs_inverse]
+
+    updates = []
+    for i in np.nonzero((new_status != current) | ((current != 'compliant') & (basis != stored_basis)))[0]:
+        row = rows[i]
+        decision = engine.evaluate(_shipment(row))
+        reasons = compliance.encode_reasons(decision.violations)
+        if decision.status != row[6] or reasons != row[7] or decision.basis != row[8]:
+            updates.append((decision.status, reasons, decision.basis, row[0], row[9]))
+    return updates
+
+
+def rescore_all(chunk_size=None, progress=None):
+    """Recompute compliant for every consignment not manually overridden.
+
+    progress, if given, is called after each chunk with the running summary.
+    """
+    chunk_size = chunk_size or config.RESCORE_CHUNK_SIZE
+    summary = {"scanned": 0, "changed": 0, "by_status": {}, "seconds": 0.0}
+    start = time.perf_counter()
+    last_uuid = 0
+
+    with get_pool().connection() as conn:
+        while True:
+            restrictions.reload_index(force=False)
+            engine = compliance.get_engine()
+            rows = conn.execute(_CHUNK_QUERY, (last_uuid, chunk_size)).fetchall()
+            if not rows:
+                break
+            updates = _score(engine, rows)
+
+            conn.execute('BEGIN IMMEDIATE')
+            # The verdicts must come from the restriction tables as they are
+            # now; if they changed meanwhile, score the chunk again
+            if restrictions.restrictions_version(conn) != engine.index.version:
+                conn.rollback()
+                continue
+            for update in updates:
+                # A row written since it was read was re-scored by its writer
+                if conn.execute(_UPDATE, update).rowcount:
+                    summary["changed"] += 1
+                    summary["by_status"][update[0]] = summary["by_status"].get(update[0], 0) + 1
+            conn.commit()
+
+            last_uuid = rows[-1][0]
+            summary["scanned"] += len(rows)
+            summary["seconds"] = round(time.perf_counter() - start, 3)
+            summary["last_uuid"] = last_uuid
+            if progress:
+                progress(summary)
+
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+# Incremental re-evaluation. Edits to the restriction tables are logged in
+# restriction_changes (schema migration 9); each one only affects shipments to
+# that jurisdiction whose HS code starts with the edited code, which
+# consignment_hs_index returns as a range scan. hs_digits < code || ':' bounds
+# the prefix because ':' sorts right after '9'.
+
+_PENDING_CHANGES_QUERY = '''
+    SELECT id, jurisdiction, hs_code FROM restriction_changes
+    WHERE applied_at IS NULL ORDER BY id LIMIT ?
+'''
+
+_AFFECTED_QUERY = '''
+    SELECT uuid FROM consignment_hs_index
+    WHERE jurisdiction = ? AND hs_digits >= ? AND hs_digits < ? || ':'
+'''
+
+_ROWS_QUERY = f'''
+    SELECT uuid, receiver_country, HS_code, totalWeight, declared_value, {_HAS_INVOICE}, compliant, compliance_reasons,
+           IFNULL(compliance_basis, 0)
+    FROM Consignments
+    WHERE uuid IN ({{placeholders}}) AND compliance_override = 0
+'''
+
+
+def apply_restriction_changes(batch_size=500, progress=None):
+    """Re-evaluate only the consignments covered by unapplied restriction edits.
+
+    Changes are applied oldest first, batch_size at a time, each batch in one
+    write transaction that also marks the changes applied, so concurrent
+    callers never apply the same change twice. Cost scales with the number of
+    shipments the edited codes cover, not with the size of Consignments.
+    """
+    summary = {"changes": 0, "affected": 0, "changed": 0, "by_status": {}, "seconds": 0.0}
+    start = time.perf_counter()
+
+    with get_pool().connection() as conn:
+        while True:
+            restrictions.reload_index(force=False)
+            engine = compliance.get_engine()
+            conn.execute('BEGIN IMMEDIATE')
+            # The rules must see exactly the restriction tables this transaction sees
+            if restrictions.restrictions_version(conn) != engine.index.version:
+                conn.rollback()
+                continue
+
+            changes = conn.execute(_PENDING_CHANGES_QUERY, (batch_size,)).fetchall()
+            if not changes:
+                conn.rollback()
+                break
+
+            matched = {}
+            for change_id, jurisdiction, hs_code in changes:
+                matched[change_id] = [uuid for (uuid,) in conn.execute(_AFFECTED_QUERY, (jurisdiction, hs_code, hs_code))]
+
+            results = {}
+            uuids = list({uuid for found in matched.values() for uuid in found})
+            for i in range(0, len(uuids), 900):
+                chunk = uuids[i:i + 900]
+                rows = conn.execute(_ROWS_QUERY.format(placeholders=','.join('?' * len(chunk))), chunk).fetchall()
+                updates = []
+                for row in rows:
+                    decision = engine.evaluate(_shipment(row))
+                    reasons = compliance.encode_reasons(decision.violations)
+                    results[row[0]] = (row[6], decision.status)
+                    # Reasons are refreshed too, e.g. when only a category name changed
+                    if decision.status != row[6] or reasons != row[7] or decision.basis != row[8]:
+                        updates.append((decision.status, reasons, decision.basis, row[0]))
+                conn.executemany(
+                    'UPDATE Consignments SET compliant = ?, compliance_reasons = ?, compliance_basis = ? WHERE uuid = ?',
+                    updates)
+
+            for change_id, found in matched.items():
+                # Manually overridden consignments are skipped, so not in results
+                effects = [(change_id, uuid, *results[uuid]) for uuid in found if uuid in results]
+                conn.executemany(
+                    '''INSERT OR REPLACE INTO restriction_change_effects (change_id, uuid, previous_status, new_status)
+                       VALUES (?, ?, ?, ?)''', effects)
+                conn.execute(
+                    '''UPDATE restriction_changes SET applied_at = CURRENT_TIMESTAMP, affected = ?, changed = ?
+                       WHERE id = ?''',
+                    (len(effects), sum(1 for effect in effects if effect[2] != effect[3]), change_id))
+            conn.commit()
+
+            for previous, status in results.values():
+                if previous != status:
+                    summary["changed"] += 1
+                    summary["by_status"][status] = summary["by_status"].get(status, 0) + 1
+            summary["changes"] += len(changes)
+            summary["affected"] += len(results)
+            summary["seconds"] = round(time.perf_counter() - start, 3)
+            if progress:
+                progress(summary)
+
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    return summary
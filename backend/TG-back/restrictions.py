@@ -0,0 +1,193 @@
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+import config
+from db import get_pool
+
+# Restriction table per destination and the receiver_country spellings that map to it
+JURISDICTIONS = {
+    'united_states': ('US', 'USA', 'UNITED STATES', 'UNITED STATES OF AMERICA'),
+    'united_kingdom': ('UK', 'GB', 'GBR', 'UNITED KINGDOM', 'GREAT BRITAIN'),
+    'european_union': ('EU', 'EUROPEAN UNION'),
+    'india': ('IN', 'IND', 'INDIA'),
+}
+
+_COUNTRY_TO_JURISDICTION = {
+    alias: name for name, aliases in JURISDICTIONS.items() for alias in aliases
+}
+
+Restriction = namedtuple('Restriction', 'hs_code main_category sub_category jurisdiction')
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def jurisdiction_for(country):
+    """Map a receiver/destination country as entered to its restriction table, or None."""
+    if not country:
+        return None
+    return _COUNTRY_TO_JURISDICTION.get(country.strip().replace('_', ' ').upper())
+
+
+def normalize_hs(code):
+    """Digits-only HS code. HS levels come in pairs of digits, so an odd length
+    means a leading zero was lost (the tables store HS_code as INTEGER, 0507 -> 507)."""
+    digits = _NON_DIGITS.sub('', str(code)) if code is not None else ''
+    if len(digits) % 2:
+        digits = '0' + digits
+    return digits
+
+
+class HSTrie:
+    """Prefix index over HS codes at chapter (2), heading (4), subheading (6+) levels.
+
+    ``covering`` answers "is this shipment's code restricted?" by looking up each
+    2-digit level of the code; ``under`` lists every restriction inside a prefix.
+    """
+
+    __slots__ = ('_exact', '_under')
+
+    def __init__(self, restrictions):
+        exact = {}
+        under = {}
+        for restriction in restrictions:
+            code = restriction.hs_code
+            exact.setdefault(code, []).append(restriction)
+            for level in range(2, len(code) + 1, 2):
+                under.setdefault(code[:level], []).append(restriction)
+        self._exact = {code: tuple(items) for code, items in exact.items()}
+        self._under = {prefix: tuple(items) for prefix, items in under.items()}
+
+    def covering(self, hs_code):
+        digits = normalize_hs(hs_code)
+        found = ()
+        for level in range(2, len(digits) + 1, 2):
+            hit = self._exact.get(digits[:level])
+            if hit:
+                found += hit
+        return found
+
+    def under(self, prefix):
+        return self._under.get(normalize_hs(prefix), ())
+
+    def codes(self):
+        return tuple(self._exact)
+
+
+class JurisdictionIndex:
+    __slots__ = ('name', 'trie', 'by_category', 'by_subcategory')
+
+    def __init__(self, name, restrictions):
+        self.name = name
+        self.trie = HSTrie(restrictions)
+        by_category = {}
+        by_subcategory = {}
+        for restriction in restrictions:
+            main = (restriction.main_category or '').casefold()
+            sub = (restriction.sub_category or '').casefold()
+            by_category.setdefault(main, []).append(restriction)
+            by_subcategory.setdefault((main, sub), []).append(restriction)
+        self.by_category = {key: tuple(items) for key, items in by_category.items()}
+        self.by_subcategory = {key: tuple(items) for key, items in by_subcategory.items()}
+
+    def search(self, main_category=None, sub_category=None, hs_code=None):
+        main = (main_category or '').strip().casefold()
+        sub = (sub_category or '').strip().casefold()
+        if hs_code:
+            results = self.trie.covering(hs_code) + self.trie.under(hs_code)
+            results = tuple(dict.fromkeys(results))
+        elif main and sub:
+            results = self.by_subcategory.get((main, sub), ())
+        elif main:
+            results = self.by_category.get(main, ())
+        elif sub:
+            results = tuple(r for (_, s), items in self.by_subcategory.items() if s == sub for r in items)
+        else:
+            results = ()
+        if hs_code and (main or sub):
+            results = tuple(r for r in results
+                            if (not main or r.main_category.casefold() == main)
+                            and (not sub or r.sub_category.casefold() == sub))
+        return results
+
+
+class RestrictionIndex:
+    """Immutable snapshot of every restriction table, rebuilt (never mutated) on reload."""
+
+    def __init__(self, version, tables):
+        self.version = version
+        self.pid = os.getpid()
+        self.jurisdictions = {name: JurisdictionIndex(name, rows) for name, rows in tables.items()}
+
+    def for_country(self, country):
+        name = jurisdiction_for(country)
+        return self.jurisdictions.get(name) if name else None
+
+    def restricted(self, country, hs_code):
+        """Restrictions that cover ``hs_code`` for shipments to ``country``."""
+        jurisdiction = self.for_country(country)
+        return jurisdiction.trie.covering(hs_code) if jurisdiction else ()
+
+
+def restrictions_version(conn):
+    row = conn.execute("SELECT version FROM table_versions WHERE name = 'restrictions'").fetchone()
+    return row[0] if row else 0
+
+
+def load_index(conn):
+    version = restrictions_version(conn)
+    tables = {}
+    for name in JURISDICTIONS:
+        rows = conn.execute(f'SELECT HS_code, main_category, sub_category FROM {name}').fetchall()
+        tables[name] = [
+            Restriction(normalize_hs(hs_code), main or '', sub or '', name)
+            for hs_code, main, sub in rows if hs_code is not None
+        ]
+    return RestrictionIndex(version, tables)
+
+
+_index = None
+_index_lock = threading.Lock()
+_watcher_pid = None
+
+
+def get_index():
+    """Current restriction index for this process; lookups never touch SQLite."""
+    index = _index
+    if index is None or index.pid != os.getpid():
+        index = reload_index()
+        _start_watcher()
+    return index
+
+
+def reload_index(force=True):
+    """Rebuild the index if the restriction tables changed (or always, with force)."""
+    global _index
+    with _index_lock:
+        with get_pool().connection() as conn:
+            current = _index if _index is not None and _index.pid == os.getpid() else None
+            if current is not None and not force and restrictions_version(conn) == current.version:
+                return current
+            _index = load_index(conn)
+    return _index
+
+
+def _watch():
+    while True:
+        time.sleep(config.RESTRICTIONS_RELOAD_SECONDS)
+        try:
+            reload_index(force=False)
+        except Exception:
+            # Keep serving the last good index; try again next interval
+            pass
+
+
+def _start_watcher():
+    global _watcher_pid
+    with _index_lock:
+        if _watcher_pid == os.getpid():
+            return
+        _watcher_pid = os.getpid()
+    threading.Thread(target=_watch, name='restrictions-reloader', daemon=True).start()
@@ -0,0 +1,478 @@
+import sqlite3
+
+import consignment_stats
+import search
+from db import get_pool
+from restrictions import JURISDICTIONS
+
+
+def _bump_version_triggers(table, counter):
+    """Triggers that bump table_versions[counter] on any write to table."""
+    return ''.join(f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_version_on_{event.lower()} AFTER {event} ON {table}
+    BEGIN
+        UPDATE table_versions SET version = version + 1 WHERE name = '{counter}';
+    END;
+    """ for event in ('INSERT', 'UPDATE', 'DELETE'))
+
+
+def _hs_digits_sql(expr):
+    """SQL form of restrictions.normalize_hs for the separators HS codes are
+    written with (8471.30, 8471 30, 8471-30): digits only, odd lengths padded."""
+    digits = f"replace(replace(replace(replace(trim(CAST({expr} AS TEXT)), '.', ''), ' ', ''), '-', ''), '/', '')"
+    return f"(CASE WHEN length({digits}) % 2 = 1 THEN '0' || {digits} ELSE {digits} END)"
+
+
+def _country_key_sql(expr):
+    """SQL form of the receiver_country lookup in restrictions.jurisdiction_for."""
+    return f"upper(replace(trim({expr}), '_', ' '))"
+
+
+def _restriction_change_triggers(table):
+    """Triggers that log every edit to a restriction table in restriction_changes.
+    An UPDATE is logged as the old code removed and the new one added."""
+    def log(row, op):
+        return (f"INSERT INTO restriction_changes (jurisdiction, hs_code, op) "
+                f"SELECT '{table}', {_hs_digits_sql(f'{row}.HS_code')}, '{op}' WHERE {row}.HS_code IS NOT NULL;")
+
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_changes_on_insert AFTER INSERT ON {table}
+    BEGIN
+        {log('NEW', 'add')}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS {table}_changes_on_delete AFTER DELETE ON {table}
+    BEGIN
+        {log('OLD', 'remove')}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS {table}_changes_on_update AFTER UPDATE ON {table}
+    BEGIN
+        {log('OLD', 'remove')}
+        {log('NEW', 'add')}
+    END;
+    """
+
+
+def _hs_index_sql(row):
+    """Reverse-index entry for the Consignments row OLD or NEW (none if the
+    destination has no restriction list)."""
+    return (f"SELECT jurisdiction, {_hs_digits_sql(f'{row}.HS_code')}, {row}.uuid FROM jurisdiction_aliases "
+            f"WHERE alias = {_country_key_sql(f'{row}.receiver_country')}")
+
+
+# Schema changes layered on top of the base tables (out.sql and
+# create_consignments_table.sql). Each script runs exactly once per database,
+# in order, and the number applied so far is kept in PRAGMA user_version.
+MIGRATIONS = [
+    # 1: per-user version counter, bumped on every profile change, so each
+    # worker process can tell which cached principals went stale
+    """
+    CREATE TABLE IF NOT EXISTS user_versions (
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_user_versions_version ON user_versions(version);
+
+    CREATE TRIGGER IF NOT EXISTS users_version_on_update AFTER UPDATE ON users
+    BEGIN
+        INSERT INTO user_versions (user_id, version)
+        VALUES (OLD.user_id, (SELECT COALESCE(MAX(version), 0) + 1 FROM user_versions))
+        ON CONFLICT(user_id) DO UPDATE SET version = excluded.version;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS users_version_on_delete AFTER DELETE ON users
+    BEGIN
+        INSERT INTO user_versions (user_id, version)
+        VALUES (OLD.user_id, (SELECT COALESCE(MAX(version), 0) + 1 FROM user_versions))
+        ON CONFLICT(user_id) DO UPDATE SET version = excluded.version;
+    END;
+    """,
+
+    # 2: keyset pagination and filters for fetch-consignments. uuid is the
+    # rowid, so each index already ends in it and (created_at, uuid) order
+    # comes straight off the b-tree
+    """
+    CREATE INDEX IF NOT EXISTS idx_consignments_created ON Consignments(created_at);
+    CREATE INDEX IF NOT EXISTS idx_consignments_compliant_created ON Consignments(compliant, created_at);
+    CREATE INDEX IF NOT EXISTS idx_consignments_receiver_created ON Consignments(receiver_country, created_at);
+    CREATE INDEX IF NOT EXISTS idx_consignments_sender_created ON Consignments(sender_country, created_at);
+    CREATE INDEX IF NOT EXISTS idx_consignments_hs_code ON Consignments(HS_code, created_at);
+    -- Covered by the leading column of idx_consignments_compliant_created
+    DROP INDEX IF EXISTS idx_consignments_compliant;
+    """,
+
+    # 3: commercial invoices move out of the row into the content-addressed
+    # store (invoice_store.py); commercial_invoice stays only for rows that
+    # `flask migrate-invoices` has not reached yet
+    """
+    CREATE TABLE IF NOT EXISTS invoices (
+        sha256 TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    ALTER TABLE Consignments ADD COLUMN invoice_sha256 TEXT REFERENCES invoices(sha256);
+    CREATE INDEX IF NOT EXISTS idx_consignments_invoice ON Consignments(invoice_sha256);
+    """,
+
+    # 4: change counters, so in-memory copies of a table (the restriction
+    # index) can tell they are stale with one primary-key lookup
+    """
+    CREATE TABLE IF NOT EXISTS table_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    );
+    INSERT OR IGNORE INTO table_versions (name, version) VALUES ('restrictions', 0);
+    """ + ''.join(_bump_version_triggers(table, 'restrictions') for table in JURISDICTIONS),
+
+    # 5: rule engine inputs and output (compliance.py)
+    """
+    ALTER TABLE Consignments ADD COLUMN declared_value REAL;
+    ALTER TABLE Consignments ADD COLUMN compliance_reasons TEXT;  -- JSON list of violations
+    """,
+
+    # 6: statuses set by hand through update-compliance are left alone by
+    # batch re-evaluation (rescore.py)
+    """
+    ALTER TABLE Consignments ADD COLUMN compliance_override INTEGER NOT NULL DEFAULT 0;
+    """,
+
+    # 7: duplicate shipment_id checks (add-consignment, bulk upload). Declared
+    # in create_consignments_table.sql but missing from older databases
+    """
+    CREATE INDEX IF NOT EXISTS idx_consignments_shipment_id ON Consignments(shipment_id);
+    """,
+
+    # 8: background jobs (jobs.py) and the invoice metadata parse_invoice fills in
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL CHECK (status IN ('queued', 'running', 'retrying', 'succeeded', 'failed')),
+        params TEXT,
+        progress TEXT,
+        result TEXT,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_by INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at);
+
+    ALTER TABLE invoices ADD COLUMN page_count INTEGER;
+    ALTER TABLE invoices ADD COLUMN pdf_version TEXT;
+    ALTER TABLE invoices ADD COLUMN parsed_at TIMESTAMP;
+    """,
+
+    # 9: incremental re-evaluation after a restriction edit (rescore.py
+    # apply_restriction_changes). consignment_hs_index maps (jurisdiction,
+    # normalised HS code) to consignments so the shipments a restricted prefix
+    # covers are one range scan; restriction_changes logs every edit to the
+    # restriction tables and restriction_change_effects what applying it touched
+    """
+    CREATE TABLE IF NOT EXISTS jurisdiction_aliases (
+        alias TEXT PRIMARY KEY,
+        jurisdiction TEXT NOT NULL
+    ) WITHOUT ROWID;
+    """ + ''.join(
+        f"    INSERT OR IGNORE INTO jurisdiction_aliases (alias, jurisdiction) VALUES ('{alias}', '{name}');\n"
+        for name, aliases in JURISDICTIONS.items() for alias in aliases
+    ) + f"""
+    CREATE TABLE IF NOT EXISTS consignment_hs_index (
+        jurisdiction TEXT NOT NULL,
+        hs_digits TEXT NOT NULL,
+        uuid INTEGER NOT NULL,
+        PRIMARY KEY (jurisdiction, hs_digits, uuid)
+    ) WITHOUT ROWID;
+
+    INSERT OR IGNORE INTO consignment_hs_index (jurisdiction, hs_digits, uuid)
+    SELECT a.jurisdiction, {_hs_digits_sql('c.HS_code')}, c.uuid
+    FROM Consignments c JOIN jurisdiction_aliases a ON a.alias = {_country_key_sql('c.receiver_country')};
+
+    CREATE TRIGGER IF NOT EXISTS consignments_hs_index_on_insert AFTER INSERT ON Consignments
+    BEGIN
+        INSERT OR IGNORE INTO consignment_hs_index (jurisdiction, hs_digits, uuid) {_hs_index_sql('NEW')};
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS consignments_hs_index_on_update
+    AFTER UPDATE OF HS_code, receiver_country ON Consignments
+    BEGIN
+        DELETE FROM consignment_hs_index WHERE (jurisdiction, hs_digits, uuid) IN ({_hs_index_sql('OLD')});
+        INSERT OR IGNORE INTO consignment_hs_index (jurisdiction, hs_digits, uuid) {_hs_index_sql('NEW')};
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS consignments_hs_index_on_delete AFTER DELETE ON Consignments
+    BEGIN
+        DELETE FROM consignment_hs_index WHERE (jurisdiction, hs_digits, uuid) IN ({_hs_index_sql('OLD')});
+    END;
+
+    CREATE TABLE IF NOT EXISTS restriction_changes (
+        id INTEGER PRIMARY KEY,
+        jurisdiction TEXT NOT NULL,
+        hs_code TEXT NOT NULL,
+        op TEXT NOT NULL CHECK (op IN ('add', 'remove')),
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        applied_at TIMESTAMP,
+        affected INTEGER,  -- consignments re-evaluated
+        changed INTEGER    -- of those, how many changed status
+    );
+    CREATE INDEX IF NOT EXISTS idx_restriction_changes_pending ON restriction_changes(id) WHERE applied_at IS NULL;
+
+    CREATE TABLE IF NOT EXISTS restriction_change_effects (
+        change_id INTEGER NOT NULL REFERENCES restriction_changes(id),
+        uuid INTEGER NOT NULL,
+        previous_status TEXT,
+        new_status TEXT,
+        PRIMARY KEY (change_id, uuid)
+    ) WITHOUT ROWID;
+    """ + ''.join(_restriction_change_triggers(table) for table in JURISDICTIONS),
+
+    # 10: dashboard aggregates (consignment_stats.py): one rollup per
+    # breakdown (consignment_stats.ROLLUPS), each bounded by days x countries
+    # and kept current by triggers on every write path
+    consignment_stats.schema_sql(),
+
+    # 11: change versions for conditional GETs (consignment_cache.py).
+    # row_version counts updates to a row; table_versions['consignments']
+    # counts every write, so an unchanged listing is one primary-key lookup.
+    # The other UPDATE triggers are column-scoped, so bumping row_version
+    # does not re-fire them
+    """
+    ALTER TABLE Consignments ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0;
+    INSERT OR IGNORE INTO table_versions (name, version) VALUES ('consignments', 0);
+
+    CREATE TRIGGER IF NOT EXISTS consignments_version_on_insert AFTER INSERT ON Consignments
+    BEGIN
+        UPDATE table_versions SET version = version + 1 WHERE name = 'consignments';
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS consignments_version_on_update AFTER UPDATE ON Consignments
+    WHEN NEW.row_version = OLD.row_version
+    BEGIN
+        UPDATE Consignments SET row_version = OLD.row_version + 1 WHERE uuid = NEW.uuid;
+        UPDATE table_versions SET version = version + 1 WHERE name = 'consignments';
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS consignments_version_on_delete AFTER DELETE ON Consignments
+    BEGIN
+        UPDATE table_versions SET version = version + 1 WHERE name = 'consignments';
+    END;
+    """,
+
+    # 12: full-text search over shipments (search.py, /consignment/search)
+    search.schema_sql(),
+
+    # 13: persistent cache of HS code suggestions (hs_classifier.py), keyed on
+    # the normalized description; used_at drives LRU eviction
+    """
+    CREATE TABLE IF NOT EXISTS hs_classifications (
+        model TEXT NOT NULL,
+        description TEXT NOT NULL,
+        hs_code TEXT,
+        confidence REAL NOT NULL,
+        classified_at REAL NOT NULL,
+        used_at REAL NOT NULL,
+        PRIMARY KEY (model, description)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_hs_classifications_used ON hs_classifications(used_at);
+    """,
+
+    # 14: HS codes confirmed by compliance officers (hs_suggest.py). Marking a
+    # shipment compliant by hand confirms its HS code for its item
+    # description; shipments already marked so are taken over
+    """
+    CREATE TABLE IF NOT EXISTS hs_confirmations (
+        id INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        hs_code TEXT NOT NULL,
+        consignment_uuid INTEGER,
+        confirmed_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    INSERT INTO hs_confirmations (description, hs_code, consignment_uuid)
+    SELECT Item_desc, HS_code, uuid FROM Consignments
+    WHERE compliance_override = 1 AND compliant = 'compliant'
+      AND Item_desc IS NOT NULL AND HS_code IS NOT NULL
+    ORDER BY uuid;
+
+    CREATE TRIGGER IF NOT EXISTS consignments_hs_confirmed AFTER UPDATE OF compliant ON Consignments
+    WHEN NEW.compliance_override = 1 AND NEW.compliant = 'compliant'
+         AND NEW.Item_desc IS NOT NULL AND NEW.HS_code IS NOT NULL
+    BEGIN
+        INSERT INTO hs_confirmations (description, hs_code, consignment_uuid)
+        VALUES (NEW.Item_desc, NEW.HS_code, NEW.uuid);
+    END;
+    """,
+
+    # 15: change feed (changefeed.py): one row per new shipment and per
+    # compliance status change. AUTOINCREMENT keeps seq increasing even after
+    # old rows are pruned, so clients can resume from the last seq they saw
+    """
+    CREATE TABLE IF NOT EXISTS consignment_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        consignment_uuid INTEGER NOT NULL,
+        shipment_id TEXT,
+        event TEXT NOT NULL,
+        status TEXT,
+        previous_status TEXT,
+        receiver_country TEXT,
+        changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+
+    CREATE TRIGGER IF NOT EXISTS consignments_changes_on_insert AFTER INSERT ON Consignments
+    BEGIN
+        INSERT INTO consignment_changes (consignment_uuid, shipment_id, event, status, receiver_country)
+        VALUES (NEW.uuid, NEW.shipment_id, 'created', NEW.compliant, NEW.receiver_country);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS consignments_changes_on_status AFTER UPDATE OF compliant ON Consignments
+    WHEN NEW.compliant IS NOT OLD.compliant
+    BEGIN
+        INSERT INTO consignment_changes (consignment_uuid, shipment_id, event, status, previous_status, receiver_country)
+        VALUES (NEW.uuid, NEW.shipment_id, 'status', NEW.compliant, OLD.compliant, NEW.receiver_country);
+    END;
+    """,
+
+    # 16: audit trail of manual compliance status changes (audit.py), with
+    # one index per way the audit pages filter it
+    """
+    CREATE TABLE IF NOT EXISTS compliance_audit (
+        id INTEGER PRIMARY KEY,
+        consignment_uuid INTEGER NOT NULL,
+        shipment_id TEXT,
+        user_id INTEGER,
+        old_status TEXT,
+        new_status TEXT NOT NULL,
+        changed_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_compliance_audit_changed ON compliance_audit(changed_at);
+    CREATE INDEX IF NOT EXISTS idx_compliance_audit_user ON compliance_audit(user_id, changed_at);
+    CREATE INDEX IF NOT EXISTS idx_compliance_audit_consignment ON compliance_audit(consignment_uuid, changed_at);
+    """,
+
+    # 17: hot/cold archival (archive.py). archived_consignments routes an
+    # archived uuid or shipment_id to its monthly partition file and
+    # archive_manifest holds each partition's created_at range. Moving a
+    # shipment to the archive deletes it from Consignments without taking it
+    # out of the dashboard rollups
+    """
+    CREATE TABLE IF NOT EXISTS archive_manifest (
+        partition TEXT PRIMARY KEY,
+        rows INTEGER NOT NULL,
+        min_created TEXT,
+        max_created TEXT,
+        bytes INTEGER,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS archived_consignments (
+        uuid INTEGER PRIMARY KEY,
+        shipment_id TEXT NOT NULL,
+        partition TEXT NOT NULL,
+        created_at TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_archived_consignments_shipment_id ON archived_consignments(shipment_id);
+
+    DROP TRIGGER IF EXISTS consignments_rollups_on_delete;
+    """ + consignment_stats.delete_trigger_sql(
+        'NOT EXISTS (SELECT 1 FROM archived_consignments WHERE uuid = OLD.uuid)'),
+
+    # 18: single-statement, idempotent add-consignment. shipment_id becomes
+    # UNIQUE, so INSERT ... ON CONFLICT DO NOTHING settles duplicates even
+    # between concurrent requests, and inserting an archived shipment_id is
+    # skipped the same way. validate_consignment_insert (databases created
+    # from create_consignments_table.sql) repeated the table's CHECK
+    # constraints and validation.py. idempotency_keys holds the responses
+    # replayed for Idempotency-Key retries (idempotency.py), per user.
+    # Shipment IDs already duplicated by the old check-then-insert race would
+    # make the UNIQUE index fail: the oldest row keeps the ID, later ones are
+    # renamed to <id>~<uuid> and listed in duplicate_shipment_ids for review
+    """
+    DROP TRIGGER IF EXISTS validate_consignment_insert;
+
+    CREATE TABLE IF NOT EXISTS duplicate_shipment_ids (
+        uuid INTEGER PRIMARY KEY,
+        shipment_id TEXT NOT NULL,  -- as it was before the rename
+        renamed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    INSERT INTO duplicate_shipment_ids (uuid, shipment_id)
+    SELECT c.uuid, c.shipment_id
+    FROM Consignments c
+    JOIN (SELECT shipment_id, min(uuid) AS kept FROM Consignments GROUP BY shipment_id HAVING count(*) > 1) d
+        ON d.shipment_id = c.shipment_id AND c.uuid > d.kept;
+    UPDATE Consignments SET shipment_id = shipment_id || '~' || uuid
+    WHERE uuid IN (SELECT uuid FROM duplicate_shipment_ids);
+
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_consignments_shipment_id_unique ON Consignments(shipment_id);
+    DROP INDEX IF EXISTS idx_consignments_shipment_id;
+
+    CREATE TRIGGER IF NOT EXISTS consignments_archived_shipment_id BEFORE INSERT ON Consignments
+    WHEN EXISTS (SELECT 1 FROM archived_consignments WHERE shipment_id = NEW.shipment_id)
+    BEGIN
+        SELECT RAISE(IGNORE);
+    END;
+
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        user_id INTEGER NOT NULL,
+        key TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        status INTEGER NOT NULL,
+        response TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (user_id, key)
+    );
+    CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys(created_at);
+    """,
+
+    # 19: what each row's compliance_reasons were derived from besides its own
+    # fields (compliance.RuleEngine.basis). Batch re-evaluation only re-runs
+    # the scalar rules for a row whose status or basis changed; rows scored
+    # before this have none and are re-run once
+    """
+    ALTER TABLE Consignments ADD COLUMN compliance_basis INTEGER;
+    """,
+
+    # 20: rows submitted without a way to attach an invoice (bulk upload) are
+    # re-evaluated with has_invoice=None, as when they were inserted, instead
+    # of as missing their invoice. Rows uploaded before this are recognised
+    # by the finding they were stored with
+    """
+    ALTER TABLE Consignments ADD COLUMN invoice_pending INTEGER NOT NULL DEFAULT 0;
+    UPDATE Consignments SET invoice_pending = 1
+    WHERE invoice_sha256 IS NULL AND compliance_reasons LIKE '%"code":"INVOICE_PENDING"%';
+    """,
+]
+
+
+def _statements(script):
+    """Split a script into statements, keeping trigger bodies in one piece."""
+    buffer = ''
+    for piece in script.split(';'):
+        buffer += piece + ';'
+        if sqlite3.complete_statement(buffer):
+            if buffer.strip(' \n;'):
+                yield buffer
+            buffer = ''
+
+
+def migrate(conn):
+    """Apply pending migrations. Safe to call from several processes at once."""
+    for number, script in enumerate(MIGRATIONS, start=1):
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= number:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have applied it while we waited for the lock
+            if conn.execute('PRAGMA user_version').fetchone()[0] < number:
+                for statement in _statements(script):
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def init_db():
+    with get_pool().connection() as conn:
+        migrate(conn)
@@ -0,0 +1,175 @@
+import base64
+import binascii
+import html
+import re
+
+# Full-text search over shipments: an FTS5 index with external content
+# (Consignments itself), kept in sync by triggers (migration 12), so the text
+# is stored once and only the inverted index is extra. There are no prefix
+# indexes (prefix = '2 3'): they nearly doubled the per-row insert cost,
+# while prefix queries without them still take a few milliseconds.
+
+# Indexed column -> bm25 weight; a hit in the goods description counts most
+COLUMNS = {
+    "Item_desc": 10.0,
+    "sender_name": 4.0,
+    "receiver_name": 4.0,
+    "sender_address": 1.0,
+    "receiver_address": 1.0,
+    "handling_inst": 0.5,
+}
+
+MAX_TERMS = 16
+SNIPPET_TOKENS = 12
+
+# Marker characters snippet() puts around matches, swapped for <mark> tags
+# after the text itself has been HTML-escaped
+_OPEN, _CLOSE = '\x02', '\x03'
+
+_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def schema_sql():
+    columns = ', '.join(COLUMNS)
+    new = ', '.join(f'NEW.{column}' for column in COLUMNS)
+    old = ', '.join(f'OLD.{column}' for column in COLUMNS)
+    weights = ', '.join(str(weight) for weight in COLUMNS.values())
+    return f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS consignments_fts USING fts5(
+        {columns},
+        content = 'Consignments', content_rowid = 'uuid',
+        tokenize = 'unicode61 remove_diacritics 2'
+    );
+    INSERT INTO consignments_fts (consignments_fts) VALUES ('rebuild');
+    -- ORDER BY rank then means bm25 with the column weights above
+    INSERT INTO consignments_fts (consignments_fts, rank) VALUES ('rank', 'bm25({weights})');
+
+    CREATE TRIGGER IF NOT EXISTS consignments_fts_on_insert AFTER INSERT ON Consignments
+    BEGIN
+        INSERT INTO consignments_fts (rowid, {columns}) VALUES (NEW.uuid, {new});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS consignments_fts_on_update AFTER UPDATE OF {columns} ON Consignments
+    BEGIN
+        INSERT INTO consignments_fts (consignments_fts, rowid, {columns}) VALUES ('delete', OLD.uuid, {old});
+        INSERT INTO consignments_fts (rowid, {columns}) VALUES (NEW.uuid, {new});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS consignments_fts_on_delete AFTER DELETE ON Consignments
+    BEGIN
+        INSERT INTO consignments_fts (consignments_fts, rowid, {columns}) VALUES ('delete', OLD.uuid, {old});
+    END;
+    """
+
+
+def rebuild(conn):
+    """Rebuild the index from Consignments and merge it into one b-tree.
+    Returns the number of indexed shipments."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute("INSERT INTO consignments_fts (consignments_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO consignments_fts (consignments_fts) VALUES ('optimize')")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return conn.execute('SELECT COUNT(*) FROM Consignments').fetchone()[0]
+
+
+def match_expression(text):
+    """FTS5 query for what a user typed. Words must all match; "quoted words"
+    match as a phrase and a trailing * makes a prefix query (pip* -> pipe,
+    pipes, piping). Every term is quoted, so FTS5 operators and column
+    filters typed by the user are searched for as plain text.
+
+    Raises ValueError with a client-facing message on an empty query.
+    """
+    terms = []
+    for phrase, word in _TERM.findall(text or ''):
+        term = phrase if phrase else word
+        prefix = not phrase and term.endswith('*')
+        term = term.rstrip('*').strip()
+        if not term:
+            continue
+        quoted = '"' + term.replace('"', '""') + '"'
+        terms.append(quoted + '*' if prefix else quoted)
+    if not terms:
+        raise ValueError("q must contain at least one search term")
+    if len(terms) > MAX_TERMS:
+        raise ValueError(f"q may contain at most {MAX_TERMS} terms")
+    return ' '.join(terms)
+
+
+ORDERS = ('relevance', 'recent')
+
+
+def encode_cursor(rank, consignment_uuid):
+    # repr() round-trips the float exactly, so the next page starts right after this row
+    return base64.urlsafe_b64encode(f"{rank!r}|{consignment_uuid}".encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Return (rank, uuid) from a search page cursor, or raise ValueError."""
+    try:
+        rank, consignment_uuid = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return float(rank), int(consignment_uuid)
+    except (ValueError, UnicodeError, binascii.Error):
+        raise ValueError("Invalid cursor")
+
+
+def search(conn, text, columns, limit, cursor=None, order='relevance'):
+    """One page of matches as (rank, uuid, snippet, *columns) rows.
+
+    'relevance' pages are best first and keyed on (rank, uuid). bm25 is
+    computed for every match, so a term that matches most shipments costs
+    time in proportion to the matches. 'recent' pages are newest first,
+    keyed on uuid alone, and walk the index in rowid order, so they stop
+    after ``limit`` matches however common the terms are.
+
+    Ranks are recomputed per query, so a relevance page boundary can shift
+    if matching shipments change between pages. Returns (rows, next_cursor).
+    """
+    if order not in ORDERS:
+        raise ValueError(f"order must be one of: {', '.join(ORDERS)}")
+    params = [match_expression(text)]
+    after = ''
+    if cursor:
+        rank, last_uuid = decode_cursor(cursor)
+        if order == 'relevance':
+            after = 'AND (rank, rowid) > (?, ?)'
+            params.extend([rank, last_uuid])
+        else:
+            after = 'AND rowid < ?'
+            params.append(last_uuid)
+
+    # The page and its snippets come from the index alone; columns are then
+    # read for just those rows, as joining first would read every match
+    page = conn.execute(f'''
+        SELECT rank, rowid, snippet(consignments_fts, -1, char(2), char(3), '…', {SNIPPET_TOKENS})
+        FROM consignments_fts
+        WHERE consignments_fts MATCH ? {after}
+        ORDER BY {'rank, rowid' if order == 'relevance' else 'rowid DESC'}
+        LIMIT ?
+    ''', (*params, limit + 1)).fetchall()
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1][0], page[-1][1])
+    if not page:
+        return [], next_cursor
+
+    uuids = [row[1] for row in page]
+    details = {
+        row[0]: tuple(row[1:]) for row in conn.execute(
+            f'SELECT uuid, {", ".join(columns)} FROM Consignments WHERE uuid IN ({", ".join("?" * len(uuids))})',
+            uuids)
+    }
+    rows = [(rank, uuid, snippet, *details[uuid]) for rank, uuid, snippet in page if uuid in details]
+    return rows, next_cursor
+
+
+def highlight(snippet):
+    """HTML-safe snippet with matches wrapped in <mark>."""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
@@ -0,0 +1,206 @@
+"""Production server: pre-forked gevent WSGI workers sharing one listening socket.
+
+    TG_SECRET_KEY=... TG_WORKERS=8 python serve.py
+
+The master process only binds the socket, forks the workers and supervises
+them; it never imports the application, so each worker loads the code from
+disk. Signals to the master:
+
+    SIGTERM, SIGINT  stop: workers finish in-flight requests (TG_GRACEFUL_TIMEOUT)
+    SIGHUP           reload: start a fresh set of workers, then stop the old set
+    SIGTTIN, SIGTTOU one worker more / less
+
+TG_WORKERS=0 serves from the current process, without a master.
+"""
+import os
+import signal
+import socket
+import sys
+import time
+
+import config
+
+
+def _listen():
+    host, _, port = config.SERVER_BIND.rpartition(':')
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host.strip('[]') or '0.0.0.0', int(port)))
+    sock.listen(config.SERVER_BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _serve(listener):
+    """Run one gevent worker on listener until SIGTERM. Patches the process."""
+    from gevent import monkey
+
+    monkey.patch_all()
+
+    import gevent
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIHandler, WSGIServer
+
+    from api import create_app
+
+    class Handler(WSGIHandler):
+        def read_requestline(self):
+            # Idle keep-alive connections are dropped after TG_KEEPALIVE_SECONDS;
+            # a timeout here is a socket error, which closes the connection
+            self.socket.settimeout(config.SERVER_KEEPALIVE)
+            try:
+                return super().read_requestline()
+            finally:
+                self.socket.settimeout(config.SERVER_TIMEOUT)
+
+    app = create_app()
+    server = WSGIServer(
+        socket.socket(fileno=os.dup(listener.fileno())),
+        app,
+        spawn=Pool(config.SERVER_WORKER_CONNECTIONS),
+        handler_class=Handler,
+        log='default' if config.SERVER_ACCESS_LOG else None,
+    )
+    stop = lambda: gevent.spawn(server.stop, timeout=config.SERVER_GRACEFUL_TIMEOUT)
+    gevent.signal_handler(signal.SIGTERM, stop)
+    gevent.signal_handler(signal.SIGINT, stop)
+    server.serve_forever(stop_timeout=config.SERVER_GRACEFUL_TIMEOUT)
+
+
+def _log(message):
+    print(f'[serve {os.getpid()}] {message}', file=sys.stderr, flush=True)
+
+
+class Master:
+    def __init__(self, listener, workers):
+        self.listener = listener
+        self.target = workers
+        self.workers = {}  # pid -> generation
+        self.generation = 0
+        self.signals = []
+
+    def _on_signal(self, signum, frame):
+        self.signals.append(signum)
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            for signum in (signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+                signal.signal(signum, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                _serve(self.listener)
+            except BaseException:
+                import traceback
+
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = self.generation
+        return pid
+
+    def _migrate(self):
+        """Apply schema migrations once, in a throwaway child, before any worker starts."""
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                from schema import init_db
+
+                init_db()
+            except BaseException:
+                import traceback
+
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        return os.waitstatus_to_exitcode(status) == 0
+
+    def _stop(self, pids, signum=signal.SIGTERM):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if self.workers.pop(pid, None) == self.generation:
+                _log(f'worker {pid} exited with {os.waitstatus_to_exitcode(status)}')
+
+    def run(self):
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(signum, self._on_signal)
+        if not self._migrate():
+            _log('schema migration failed, not starting')
+            return 1
+        _log(f'listening on {config.SERVER_BIND} with {self.target} workers')
+
+        last_spawn = 0.0
+        while True:
+            while self.signals:
+                signum = self.signals.pop(0)
+                if signum in (signal.SIGTERM, signal.SIGINT):
+                    return self._shutdown()
+                if signum == signal.SIGHUP:
+                    if not self._migrate():
+                        _log('schema migration failed, keeping the current workers')
+                        continue
+                    old = list(self.workers)
+                    self.generation += 1
+                    for _ in range(self.target):
+                        self._spawn()
+                    self._stop(old)
+                    _log(f'reloaded: generation {self.generation}')
+                elif signum == signal.SIGTTIN:
+                    self.target += 1
+                elif signum == signal.SIGTTOU and self.target > 1:
+                    self.target -= 1
+                    current = [pid for pid, generation in self.workers.items() if generation == self.generation]
+                    self._stop(current[-1:])
+
+            self._reap()
+            current = sum(1 for generation in self.workers.values() if generation == self.generation)
+            # Replace crashed workers, at most one per second so a broken
+            # deployment doesn't fork in a tight loop
+            if current < self.target and time.monotonic() - last_spawn >= 1.0:
+                self._spawn()
+                last_spawn = time.monotonic()
+            time.sleep(0.2)
+
+    def _shutdown(self):
+        _log('stopping')
+        self._stop(list(self.workers))
+        deadline = time.monotonic() + config.SERVER_GRACEFUL_TIMEOUT + 5
+        while self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        # A worker may exit between the last reap and the kill
+        self._stop(list(self.workers), signal.SIGKILL)
+        return 0
+
+
+def main():
+    if 'TG_SECRET_KEY' not in os.environ:
+        _log('TG_SECRET_KEY must be set')
+        return 2
+    listener = _listen()
+    if config.SERVER_WORKERS <= 0:
+        _serve(listener)
+        return 0
+    return Master(listener, config.SERVER_WORKERS).run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+import os
+import re
+
+import archive
+import bulk_ingest
+import compliance
+import config
+import invoice_store
+import jobs
+import reports
+import rescore
+from db import get_pool
+
+# Job handlers. Imported by the web app (to submit) and by worker.py (to run).
+
+_PAGE = re.compile(rb'/Type\s*/Page\b')
+_VERSION = re.compile(rb'%PDF-(\d\.\d)')
+
+
+@jobs.job('rescore', concurrency=1)
+def rescore_job(params, progress):
+    return rescore.rescore_all(params.get('chunk_size'), progress)
+
+
+@jobs.job('apply_restriction_changes', concurrency=1)
+def apply_restriction_changes_job(params, progress):
+    return rescore.apply_restriction_changes(progress=progress)
+
+
+@jobs.job('archive', concurrency=1)
+def archive_job(params, progress):
+    """Move old shipments to the archive partitions; see archive.run."""
+    return archive.run(params.get('older_than_days'), params.get('batch_size'), progress=progress)
+
+
+@jobs.job('report', concurrency=2)
+def report_job(params, progress):
+    """Render a report into the report cache; see reports.generate."""
+    with get_pool().connection() as conn:
+        conn.execute('BEGIN')  # the key and the render read one snapshot
+        key, count = reports.report_key(conn, params)
+        if reports.cached(key, params['format']) is None:
+            for _ in reports.generate(conn, params, key, progress):
+                pass
+    path = reports.path_for(key, params['format'])
+    return {"key": key, "format": params['format'], "shipments": count, "bytes": os.path.getsize(path),
+            "url": f"/consignment/reports/{key}.{params['format']}"}
+
+
+@jobs.job('evaluate_compliance')
+def evaluate_compliance_job(params, progress):
+    """Re-run the rule engine for the given consignment uuids."""
+    uuids = params['uuids']
+    engine = compliance.get_engine()
+    summary = {"evaluated": 0, "changed": 0}
+    with get_pool().connection() as conn:
+        for i in range(0, len(uuids), 500):
+            chunk = uuids[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(
+                f'''SELECT uuid, receiver_country, HS_code, totalWeight, declared_value, {rescore._HAS_INVOICE},
+                           compliant, compliance_reasons, IFNULL(compliance_basis, 0)
+                    FROM Consignments WHERE uuid IN ({placeholders}) AND compliance_override = 0''',
+                chunk).fetchall()
+            updates = []
+            for row in rows:
+                decision = engine.evaluate(rescore._shipment(row))
+                reasons = compliance.encode_reasons(decision.violations)
+                if decision.status != row[6] or reasons != row[7] or decision.basis != row[8]:
+                    updates.append((decision.status, reasons, decision.basis, row[0]))
+            # The guard keeps an override set since the SELECT
+            conn.executemany(
+                '''UPDATE Consignments SET compliant = ?, compliance_reasons = ?, compliance_basis = ?
+                   WHERE uuid = ? AND compliance_override = 0''',
+                updates)
+            conn.commit()
+            summary["evaluated"] += len(rows)
+            summary["changed"] += len(updates)
+            progress(summary)
+    return summary
+
+
+@jobs.job('parse_invoice')
+def parse_invoice_job(params, progress):
+    """Record PDF version and page count of a stored invoice."""
+    digest = params['sha256']
+    pages = 0
+    version = None
+    tail = b''
+    with open(invoice_store.path_for(digest), 'rb') as f:
+        while True:
+            chunk = f.read(config.INVOICE_CHUNK_SIZE)
+            if not chunk:
+                break
+            window = tail + chunk
+            if version is None:
+                match = _VERSION.search(window)
+                version = match.group(1).decode() if match else None
+            # Count matches that end in the new chunk only, so none is counted twice
+            pages += sum(1 for m in _PAGE.finditer(window) if m.end() > len(tail))
+            tail = window[-32:]
+    with get_pool().connection() as conn:
+        conn.execute(
+            'UPDATE invoices SET page_count = ?, pdf_version = ?, parsed_at = CURRENT_TIMESTAMP WHERE sha256 = ?',
+            (pages, version, digest))
+        conn.commit()
+    return {"sha256": digest, "page_count": pages, "pdf_version": version}
+
+
+@jobs.job('bulk_upload', max_retries=0)
+def bulk_upload_job(params, progress):
+    """Ingest a spooled upload file; see bulk_ingest.ingest."""
+    try:
+        with open(params['path'], encoding='utf-8-sig', newline='') as text_stream:
+            return bulk_ingest.ingest(text_stream, params['format'], evaluate=params.get('evaluate', True))
+    finally:
+        os.remove(params['path'])
@@ -0,0 +1,79 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pytest
+
+# Settings are read when config is imported, so point everything at a scratch
+# directory first. Tests never touch database/database.db itself, only copies.
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED_DATABASE = os.path.join(APP_DIR, 'database', 'database.db')
+_scratch = tempfile.mkdtemp(prefix='tg-tests-')
+os.environ.setdefault('TG_DATABASE_PATH', os.path.join(_scratch, 'unused.db'))
+os.environ.setdefault('TG_SECRET_KEY', 'test-secret-key')
+os.environ.setdefault('TG_BCRYPT_ROUNDS', '4')
+sys.path.insert(0, APP_DIR)
+
+import config  # noqa: E402
+
+
+@pytest.fixture
+def seeded_db(tmp_path, monkeypatch):
+    """Path of a copy of the committed database (pre-migration schema and rows),
+    made the configured database; relative data dirs land in tmp_path."""
+    path = tmp_path / 'database' / 'database.db'
+    path.parent.mkdir()
+    shutil.copy(SEED_DATABASE, path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, 'DATABASE_PATH', str(path))
+    return str(path)
+
+
+@pytest.fixture
+def client(seeded_db):
+    import auth_cache
+    import restrictions
+    from api import create_app
+
+    # Caches are per process; entries for another test's database must not leak
+    auth_cache.principal_cache.clear()
+    auth_cache.token_cache.clear()
+    auth_cache._last_version = None
+    auth_cache._next_check = 0.0
+    app = create_app()
+    restrictions.reload_index()
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """login(role) registers a user with that role and returns its Authorization header."""
+    users = iter(range(1, 1000))
+
+    def login(role='exporter'):
+        email = f'{role}{next(users)}@example.com'
+        user = {"firstName": "Test", "lastName": role.title(), "email": email, "phoneNumber": "123",
+                "companyName": "Test Co", "userRole": role, "primaryCountry": "India", "password": "secret-pw"}
+        assert client.post('/users/register', json=user).status_code == 201
+        response = client.post('/users/authenticate', json={"email": email, "password": "secret-pw"})
+        return {"Authorization": response.get_json()['token']}
+    return login
+
+
+@pytest.fixture
+def wait_for_job():
+    """wait_for_job(job_id) polls the jobs table until the job reaches one of
+    statuses (finished by default) and returns it."""
+    import jobs
+
+    def wait(job_id, statuses=(jobs.SUCCEEDED, jobs.FAILED), timeout=10):
+        deadline = time.monotonic() + timeout
+        while True:
+            job_info = jobs.get_job(job_id)
+            if job_info['status'] in statuses:
+                return job_info
+            assert time.monotonic() < deadline, f"job stayed {job_info['status']}"
+            time.sleep(0.01)
+    return wait
@@ -0,0 +1,158 @@
+import io
+import os
+import threading
+
+import pytest
+
+import config
+from db import get_pool
+
+FORM = {
+    "sender_name": "Sender", "sender_address": "1 Road", "sender_country": "India",
+    "sender_mail": "sender@example.com", "sender_phone": "123",
+    "receiver_name": "Receiver", "receiver_address": "2 Street", "receiver_country": "United Kingdom",
+    "shipment_id": "IDEM-1", "shipment_date": "2025-01-02", "PackageQuantity": "2",
+    "HS_code": "8471.30", "totalWeight": "12.5", "Item_desc": "laptop computers", "declared_value": "100",
+}
+
+
+def _rows(shipment_id):
+    with get_pool().connection() as conn:
+        return conn.execute('SELECT count(*) FROM Consignments WHERE shipment_id = ?', (shipment_id,)).fetchone()[0]
+
+
+@pytest.fixture
+def user(login):
+    return login()
+
+
+def _add(client, key=None, invoice=None, headers=None, **fields):
+    data = {**FORM, **fields}
+    if invoice is not None:
+        data['commercial_invoice'] = (io.BytesIO(invoice), 'invoice.pdf')
+    headers = dict(headers or {})
+    if key:
+        headers['Idempotency-Key'] = key
+    return client.post('/consignment/add-consignment', data=data, content_type='multipart/form-data',
+                       headers=headers)
+
+
+def test_retry_with_the_same_key_replays_the_first_response(client, user):
+    first = _add(client, key='key-1', headers=user)
+    assert first.status_code == 201
+    retry = _add(client, key='key-1', headers=user)
+    assert retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    assert _rows('IDEM-1') == 1
+
+
+def test_a_stored_conflict_is_replayed_too(client, user):
+    assert _add(client).status_code == 201
+    assert _add(client, key='key-2', headers=user).status_code == 409
+    retry = _add(client, key='key-2', headers=user)
+    assert retry.status_code == 409 and retry.headers['Idempotent-Replayed'] == 'true'
+
+
+def test_key_reused_for_another_request_is_refused(client, user):
+    assert _add(client, key='key-3', headers=user).status_code == 201
+    assert _add(client, key='key-3', headers=user, shipment_id='IDEM-2').status_code == 422
+    assert _rows('IDEM-2') == 0
+
+
+def test_keys_belong_to_their_user(client, login, user):
+    first = _add(client, key='shared', headers=user)
+    assert first.status_code == 201
+    # Another user's request with the same key is neither replayed nor refused
+    other = _add(client, key='shared', headers=login(), shipment_id='IDEM-2')
+    assert other.status_code == 201 and 'Idempotent-Replayed' not in other.headers
+    assert other.get_json()['uuid'] != first.get_json()['uuid']
+
+    # A key needs someone to belong to
+    assert _add(client, key='anonymous', shipment_id='IDEM-3').status_code == 403
+    assert _add(client, key='anonymous', shipment_id='IDEM-3',
+                headers={'Authorization': 'not-a-token'}).status_code == 403
+    assert _rows('IDEM-3') == 0
+
+
+def test_browsers_may_send_the_key(client):
+    response = client.options('/consignment/add-consignment', headers={
+        'Origin': 'http://localhost:3000', 'Access-Control-Request-Method': 'POST',
+        'Access-Control-Request-Headers': 'Idempotency-Key, Authorization'})
+    # Every Allow-Headers value sent must list them, or browsers drop the retry
+    allowed = response.headers.getlist('Access-Control-Allow-Headers')
+    assert allowed
+    for value in allowed:
+        assert {'idempotency-key', 'authorization'} <= {h.strip().lower() for h in value.split(',')}
+
+
+def test_invalid_key_is_refused(client):
+    assert _add(client, key='x' * 256).status_code == 400
+    assert _rows('IDEM-1') == 0
+
+
+def test_duplicate_shipment_without_key_conflicts(client):
+    assert _add(client).status_code == 201
+    response = _add(client)
+    assert response.status_code == 409
+    assert _rows('IDEM-1') == 1
+
+
+def test_values_the_table_rejects_fail_validation(client):
+    for field, value in (('shipment_date', '2025-1-2'), ('sender_mail', 'no-at-sign.com'), ('totalWeight', 'nan')):
+        response = _add(client, **{field: value})
+        assert response.status_code == 400, field
+        assert field in response.get_json()['details'][0]
+    assert _rows('IDEM-1') == 0
+
+
+def test_concurrent_retries_insert_once(client, user):
+    statuses = []
+    lock = threading.Lock()
+
+    def attempt():
+        status = _add(client, key='key-race', headers=user).status_code
+        with lock:
+            statuses.append(status)
+
+    threads = [threading.Thread(target=attempt) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert statuses == [201] * 8
+    assert _rows('IDEM-1') == 1
+
+
+def test_concurrent_duplicates_insert_once(client):
+    statuses = []
+    lock = threading.Lock()
+
+    def attempt():
+        status = _add(client).status_code
+        with lock:
+            statuses.append(status)
+
+    threads = [threading.Thread(target=attempt) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(statuses) == [201] + [409] * 7
+    assert _rows('IDEM-1') == 1
+
+
+def _stored_invoices():
+    names = [name for _, _, files in os.walk(config.INVOICE_STORE_DIR) for name in files]
+    with get_pool().connection() as conn:
+        registered = conn.execute('SELECT count(*) FROM invoices').fetchone()[0]
+    return len(names), registered
+
+
+def test_rejected_requests_leave_no_invoice_behind(client, user):
+    assert _add(client, invoice=b'%PDF-1.4 first').status_code == 201
+    assert _stored_invoices() == (1, 1)
+    assert _add(client, invoice=b'%PDF-1.4 second').status_code == 409
+    assert _add(client, key='key-4', headers=user, invoice=b'%PDF-1.4 third').status_code == 409
+    assert _add(client, key='key-4', headers=user, invoice=b'%PDF-1.4 third').status_code == 409
+    assert _stored_invoices() == (1, 1)
@@ -0,0 +1,110 @@
+import os
+
+import archive
+from db import get_pool
+
+_INSERT = '''INSERT INTO Consignments (sender_name, sender_address, sender_country, sender_mail, sender_phone,
+    receiver_name, receiver_address, receiver_country, shipment_id, shipment_date, PackageQuantity, HS_code,
+    totalWeight, Item_desc, compliant, commercial_invoice, created_at)
+    VALUES ('s', 'a', 'India', 'a@b.co', '1', 'r', 'b', 'UK', ?, '2024-01-15', 1, '8471', 2.5, 'laptop', 'pending',
+            ?, ?)'''
+
+
+def _seed():
+    with get_pool().connection() as conn:
+        conn.executemany(_INSERT, [('OLD-1', b'%PDF-1.4 legacy invoice', '2024-01-15 10:00:00'),
+                                   ('OLD-2', None, '2024-02-20 10:00:00'),
+                                   ('NEW-1', None, '2999-01-01 10:00:00')])
+        conn.commit()
+        return dict(conn.execute("SELECT shipment_id, uuid FROM Consignments WHERE shipment_id LIKE '%-_'"))
+
+
+def _totals(conn):
+    return conn.execute('SELECT SUM(shipments) FROM consignment_stats_daily').fetchone()[0]
+
+
+def test_run_moves_old_shipments_to_monthly_partitions(client):
+    uuids = _seed()
+    with get_pool().connection() as conn:
+        totals = _totals(conn)
+
+    summary = archive.run(older_than_days=30)
+    # The two seed rows are from 2025-03
+    assert summary["archived"] == 4 and summary["skipped"] == 0
+    assert summary["partitions"] == {"2024-01": 1, "2024-02": 1, "2025-03": 2}
+    assert all(os.path.exists(archive.path_for(partition)) for partition in summary["partitions"])
+
+    with get_pool().connection() as conn:
+        assert [row[0] for row in conn.execute('SELECT shipment_id FROM Consignments')] == ['NEW-1']
+        assert archive.locate(conn, uuids['OLD-1']) == '2024-01'
+        assert archive.fetch_invoice(conn, uuids['OLD-1'])[2] == b'%PDF-1.4 legacy invoice'
+        # Archived shipments stay counted on the dashboard
+        assert _totals(conn) == totals
+    stats = archive.stats()
+    assert stats["hot_rows"] == 1 and stats["archived_rows"] == 4
+
+    # Nothing left to move
+    assert archive.run(older_than_days=30)["archived"] == 0
+
+
+def test_archived_shipments_stay_readable_and_read_only(client, login):
+    headers = login()
+    uuids = _seed()
+    archive.run(older_than_days=30)
+
+    row = client.get(f"/consignment/fetch-consignment/{uuids['OLD-2']}", headers=headers)
+    assert row.status_code == 200 and row.get_json()['shipment_id'] == 'OLD-2'
+    invoice = client.get(f"/consignment/download-invoice/{uuids['OLD-1']}", headers=headers)
+    assert invoice.status_code == 200 and invoice.data == b'%PDF-1.4 legacy invoice'
+    assert client.put(f"/consignment/update-compliance/{uuids['OLD-2']}", headers=headers,
+                      json={"compliant": "flagged"}).status_code == 409
+
+    # A date range reaching back into the archive merges it in, newest first
+    args = {'created_from': '2024-01-01', 'fields': 'shipment_id', 'limit': 2}
+    shipments = []
+    while True:
+        listed = client.get('/consignment/fetch-consignments', headers=headers, query_string=args)
+        assert listed.status_code == 200
+        shipments += [row['shipment_id'] for row in listed.get_json()]
+        if 'X-Next-Cursor' not in listed.headers:
+            break
+        args['cursor'] = listed.headers['X-Next-Cursor']
+    assert shipments[0] == 'NEW-1' and shipments[-2:] == ['OLD-2', 'OLD-1'] and len(shipments) == 5
+
+    hot_only = client.get('/consignment/fetch-consignments', headers=headers, query_string={'fields': 'shipment_id'})
+    assert hot_only.get_json() == [{"shipment_id": "NEW-1"}]
+
+
+def test_rows_changed_during_a_move_stay_hot(client):
+    uuids = _seed()
+    with get_pool().connection() as conn:
+        rows = conn.execute(f"SELECT {', '.join(archive.COLUMNS)} FROM Consignments WHERE shipment_id LIKE 'OLD-%' "
+                            "ORDER BY uuid").fetchall()
+        conn.execute("UPDATE Consignments SET compliant = 'flagged' WHERE shipment_id = 'OLD-2'")
+        conn.commit()
+
+        assert archive._move(conn, '2024-01', rows) == 1
+        assert archive.locate(conn, uuids['OLD-1']) == '2024-01'
+        assert archive.locate(conn, uuids['OLD-2']) is None
+        assert conn.execute("SELECT compliant FROM Consignments WHERE shipment_id = 'OLD-2'").fetchone()[0] == 'flagged'
+    with archive.opened(['2024-01']) as (part,):
+        assert [row[0] for row in part.execute('SELECT shipment_id FROM Consignments')] == ['OLD-1']
+
+
+def test_archive_endpoint_is_admin_only_and_runs_as_a_job(client, login, wait_for_job):
+    uuids = _seed()
+    assert client.post('/consignment/archive', headers=login('compliance')).status_code == 403
+    headers = login('admin')
+    assert client.post('/consignment/archive?older_than_days=-1', headers=headers).status_code == 400
+
+    response = client.post('/consignment/archive?older_than_days=30', headers=headers)
+    assert response.status_code == 202
+    job_info = wait_for_job(response.get_json()['job_id'])
+    assert job_info['status'] == 'succeeded', job_info
+    with get_pool().connection() as conn:
+        assert archive.locate(conn, uuids['OLD-2']) == '2024-02'
+
+    assert client.get('/system/archive', headers=login()).status_code == 403
+    stats = client.get('/system/archive', headers=headers).get_json()
+    assert stats['archived_rows'] == 4
+    assert [p['partition'] for p in stats['partitions']] == ['2024-01', '2024-02', '2025-03']
@@ -0,0 +1,105 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import audit
+import config
+import db
+from db import get_pool
+
+
+@pytest.fixture
+def log(client, monkeypatch):
+    """A fresh async audit log for the test database."""
+    monkeypatch.setattr(config, 'AUDIT_MODE', 'async')
+    monkeypatch.setattr(config, 'AUDIT_COMMIT_TIMEOUT', 2.0)
+    instance = audit.AuditLog(batch_size=100, flush_interval=0.02, max_buffer=10)
+    monkeypatch.setattr(audit, '_log', instance)
+    return instance
+
+
+def _override(client, headers, status, uuid=1):
+    return client.put(f'/consignment/update-compliance/{uuid}', headers=headers, json={"compliant": status})
+
+
+def _entries():
+    with get_pool().connection() as conn:
+        return [tuple(row) for row in conn.execute(
+            'SELECT consignment_uuid, old_status, new_status FROM compliance_audit ORDER BY id')]
+
+
+def _status(uuid=1):
+    with get_pool().connection() as conn:
+        return conn.execute('SELECT compliant FROM Consignments WHERE uuid = ?', (uuid,)).fetchone()[0]
+
+
+def _fail_next_commit(monkeypatch):
+    """Make the next pooled commit raise, as a full disk or I/O error would."""
+    commit = db.PooledConnection.commit
+    failed = []
+
+    def failing_commit(self):
+        if not failed:
+            failed.append(True)
+            raise sqlite3.OperationalError('disk I/O error')
+        return commit(self)
+    monkeypatch.setattr(db.PooledConnection, 'commit', failing_commit)
+
+
+def test_async_entries_are_written_after_the_change(client, login, log):
+    headers = login('compliance')
+    assert _override(client, headers, 'flagged').status_code == 200
+    assert _override(client, headers, 'compliant').status_code == 200
+    assert log.flush()
+    assert _entries() == [(1, 'pending', 'flagged'), (1, 'flagged', 'compliant')]
+    assert log.stats()['reserved'] == 0
+
+    page = client.get('/consignment/audit', headers=headers, query_string={'uuid': 1}).get_json()
+    assert [(entry['old_status'], entry['new_status'], entry['user_role']) for entry in page['entries']] == \
+        [('flagged', 'compliant', 'compliance'), ('pending', 'flagged', 'compliance')]
+
+
+@pytest.mark.parametrize('mode', ['async', 'commit'])
+def test_a_failed_commit_leaves_no_entry(client, login, log, monkeypatch, mode):
+    monkeypatch.setattr(config, 'AUDIT_MODE', mode)
+    headers = login('compliance')
+    with monkeypatch.context() as patch:
+        _fail_next_commit(patch)
+        assert _override(client, headers, 'flagged').status_code == 500
+    assert log.flush()
+    assert _status() == 'pending'
+    assert _entries() == []
+    assert log.stats()['recorded'] == 0 and log.stats()['reserved'] == 0
+
+    # Nor do requests that change nothing
+    assert _override(client, headers, 'flagged', uuid=999).status_code == 404
+    assert log.stats()['reserved'] == 0
+
+
+def test_a_full_buffer_waits_without_holding_the_write_lock(client, login, log, monkeypatch):
+    headers = login('compliance')
+    for _ in range(log.max_buffer):
+        log.reserve()
+    results = []
+    override = threading.Thread(target=lambda: results.append(_override(client, headers, 'flagged').status_code))
+    override.start()
+    time.sleep(0.2)
+
+    # While the override waits for room, other writers (the audit writer
+    # among them) still get the database
+    other = sqlite3.connect(config.DATABASE_PATH, timeout=0)
+    other.execute('BEGIN IMMEDIATE')
+    other.rollback()
+    other.close()
+
+    log.release()
+    override.join()
+    assert results == [200] and _status() == 'flagged'
+
+    assert log.flush()
+    log.reserve()
+    monkeypatch.setattr(config, 'AUDIT_COMMIT_TIMEOUT', 0.05)
+    assert _override(client, headers, 'compliant').status_code == 503
+    assert _status() == 'flagged'
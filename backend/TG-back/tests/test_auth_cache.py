@@ -0,0 +1,52 @@
+import time
+
+import jwt
+
+import auth_cache
+import config
+from db import get_pool
+
+
+def _user_id(headers):
+    return jwt.decode(headers['Authorization'], config.SECRET_KEY, algorithms=["HS256"])['user_id']
+
+
+def test_warm_requests_are_served_from_the_caches(client, login):
+    headers = login()
+    assert client.get('/consignment/fetch-consignments', headers=headers).status_code == 200
+    principals, tokens = auth_cache.principal_cache.hits, auth_cache.token_cache.hits
+    assert client.get('/consignment/fetch-consignments', headers=headers).status_code == 200
+    assert auth_cache.principal_cache.hits == principals + 1
+    assert auth_cache.token_cache.hits == tokens + 1
+
+
+def test_edit_profile_evicts_its_own_principal(client, login):
+    headers = login()
+    user_id = _user_id(headers)
+    client.get('/consignment/fetch-consignments', headers=headers)
+    assert auth_cache.principal_cache.get(user_id) is not None
+
+    response = client.put('/users/edit-profile', headers=headers, json={"user_id": user_id, "firstName": "Renamed"})
+    assert response.status_code == 200
+    assert auth_cache.principal_cache.get(user_id) is None
+
+
+def test_changes_made_by_another_process_are_picked_up(client, login, monkeypatch):
+    monkeypatch.setattr(config, 'AUTH_CACHE_REVALIDATE_SECONDS', 0.0)
+    headers = login()
+    user_id = _user_id(headers)
+    assert client.get('/consignment/fetch-consignments', headers=headers).status_code == 200
+
+    # As another worker would: straight to the table, bypassing this process's cache
+    with get_pool().connection() as conn:
+        conn.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
+        conn.commit()
+    assert client.get('/consignment/fetch-consignments', headers=headers).status_code == 404
+
+
+def test_tokens_are_not_cached_past_their_expiry():
+    auth_cache.cache_token('expired', {"user_id": 1, "exp": time.time() - 1})
+    assert auth_cache.token_cache.get(auth_cache.token_key('expired')) is None
+    payload = {"user_id": 1, "exp": time.time() + 60}
+    auth_cache.cache_token('valid', payload)
+    assert auth_cache.token_cache.get(auth_cache.token_key('valid')) == payload
@@ -0,0 +1,55 @@
+import random
+import sqlite3
+import sys
+
+import pytest
+
+import config
+from benchmarks import generate, summarize
+
+_COLUMNS = '''uuid, sender_country, receiver_country, shipment_id, created_at, HS_code, totalWeight,
+              declared_value, compliant, compliance_reasons, invoice_sha256'''
+
+
+@pytest.fixture
+def build(tmp_path, monkeypatch):
+    """build(name, seed) generates a small benchmark database and returns its rows."""
+    monkeypatch.chdir(tmp_path)
+    # configure() points the environment and sys.path at the new database
+    monkeypatch.setenv('TG_DATABASE_PATH', config.DATABASE_PATH)
+    monkeypatch.setattr(sys, 'path', list(sys.path))
+
+    def build(name, seed):
+        out = str(tmp_path / name / 'database.db')
+        monkeypatch.setattr(config, 'DATABASE_PATH', out)
+        report = generate.build(out, rows=60, seed=seed, end_date='2025-01-01', days=30, restricted_share=0.5,
+                                invoice_share=0.5, invoices=3, invoice_size=2048, bcrypt_rounds=4, batch_size=25)
+        with sqlite3.connect(out) as conn:
+            # out.sql brings a couple of rows of its own
+            rows = conn.execute(
+                f"SELECT {_COLUMNS} FROM Consignments WHERE shipment_id LIKE 'BENCH-%' ORDER BY uuid").fetchall()
+        assert report['rows'] == len(rows) == 60
+        return rows
+    return build
+
+
+def test_same_seed_same_database(build):
+    first = build('a', seed=7)
+    assert first == build('b', seed=7)
+    assert first != build('c', seed=8)
+
+    statuses = {row[8] for row in first}
+    assert 'flagged' in statuses and len(statuses) > 1
+    assert all('2024-12-02' <= row[4] <= '2025-01-01' for row in first)
+
+
+def test_fake_pdf_is_seeded_and_sized():
+    pdf = generate.fake_pdf(random.Random(1), 4096)
+    assert pdf == generate.fake_pdf(random.Random(1), 4096)
+    assert 4096 <= len(pdf) <= 4098 and pdf.startswith(b'%PDF-1.7') and pdf.endswith(b'%%EOF\n')
+
+
+def test_summarize():
+    result = summarize([0.004, 0.001, 0.002, 0.003], elapsed=2.0, unit=1e3)
+    assert result == {"count": 4, "mean": 2.5, "p50": 3.0, "p95": 4.0, "p99": 4.0, "max": 4.0, "per_second": 2.0}
+    assert summarize([])["p50"] is None
@@ -0,0 +1,97 @@
+import io
+import json
+
+import rescore
+import tasks
+from db import get_pool
+
+HEADER = ('sender_name,sender_address,sender_country,sender_mail,sender_phone,receiver_name,receiver_address,'
+          'receiver_country,shipment_id,shipment_date,PackageQuantity,HS_code,totalWeight,Item_desc,declared_value')
+
+
+def _row(shipment_id, hs_code='847130', weight='2.5', **overrides):
+    values = {"sender_name": "S", "sender_address": "1 Road", "sender_country": "India", "sender_mail": "s@x.com",
+              "sender_phone": "1", "receiver_name": "R", "receiver_address": "2 St", "receiver_country": "India",
+              "shipment_id": shipment_id, "shipment_date": "2025-01-02", "PackageQuantity": "1", "HS_code": hs_code,
+              "totalWeight": weight, "Item_desc": "laptops", "declared_value": "100"}
+    values.update(overrides)
+    return values
+
+
+def _csv(rows):
+    return '\n'.join([HEADER] + [','.join(row[column] for column in HEADER.split(',')) for row in rows]) + '\n'
+
+
+def _upload(client, headers, body, filename='rows.csv', **args):
+    return client.post('/consignment/bulk-upload', headers=headers, query_string=args, content_type='multipart/form-data',
+                       data={'file': (io.BytesIO(body.encode('utf-8')), filename)})
+
+
+def _statuses():
+    with get_pool().connection() as conn:
+        return dict(conn.execute("SELECT shipment_id, compliant FROM Consignments WHERE shipment_id LIKE 'B-%'"))
+
+
+def test_csv_rows_are_validated_evaluated_and_inserted(client, login):
+    headers = login()
+    rows = [_row('B-1'), _row('B-2', hs_code='930110'), _row('B-3', weight='heavy'), _row('B-1'),
+            _row('B-4', shipment_date='2025-13-01')]
+    report = _upload(client, headers, _csv(rows)).get_json()
+
+    assert (report['rows'], report['inserted'], report['failed']) == (5, 2, 3)
+    assert [error['row'] for error in report['errors']] == [3, 4, 5]
+    assert report['errors'][1]['errors'] == ["Duplicate shipment ID in upload"]
+    # No invoice can come with an upload: pending review, not flagged for it
+    assert report['by_status'] == {'pending': 1, 'flagged': 1}
+    assert _statuses() == {'B-1': 'pending', 'B-2': 'flagged'}
+
+
+def test_ndjson_upload_and_existing_shipment_ids(client, login):
+    headers = login()
+    assert _upload(client, headers, _csv([_row('B-1')])).get_json()['inserted'] == 1
+    body = '\n'.join(json.dumps(row) for row in [_row('B-1'), _row('B-2')]) + '\nnot json\n'
+    report = _upload(client, headers, body, filename='rows.ndjson').get_json()
+    assert (report['inserted'], report['failed']) == (1, 2)
+    errors = {error['row']: error['errors'][0] for error in report['errors']}
+    assert errors[1] == "Shipment ID already exists"
+    assert errors[3].startswith('Invalid JSON')
+
+
+def test_a_row_the_table_rejects_fails_alone(client, login):
+    headers = login()
+    with get_pool().connection() as conn:
+        # Stands in for a CHECK constraint validation does not know about
+        conn.execute('''CREATE TRIGGER reject_b2 BEFORE INSERT ON Consignments WHEN NEW.shipment_id = 'B-2'
+                        BEGIN SELECT RAISE(ABORT, 'CHECK constraint failed'); END''')
+        conn.commit()
+    response = _upload(client, headers, _csv([_row('B-1'), _row('B-2'), _row('B-3')]))
+    assert response.status_code == 200
+    report = response.get_json()
+    assert (report['inserted'], report['failed']) == (2, 1)
+    assert report['errors'][0]['errors'] == ["Rejected by the database: CHECK constraint failed"]
+    assert _statuses() == {'B-1': 'pending', 'B-3': 'pending'}
+
+
+def test_uploaded_rows_stay_pending_when_re_evaluated(client, login):
+    headers = login()
+    _upload(client, headers, _csv([_row('B-1'), _row('B-2', weight='900')]))
+    with get_pool().connection() as conn:
+        uuids = [uuid for (uuid,) in conn.execute("SELECT uuid FROM Consignments WHERE shipment_id LIKE 'B-%'")]
+        reasons = conn.execute("SELECT compliance_reasons FROM Consignments WHERE shipment_id = 'B-1'").fetchone()[0]
+    assert [r['code'] for r in json.loads(reasons)] == ['INVOICE_PENDING']
+
+    rescore.rescore_all()
+    assert _statuses() == {'B-1': 'pending', 'B-2': 'flagged'}
+
+    tasks.evaluate_compliance_job({"uuids": uuids}, lambda summary: None)
+    assert _statuses() == {'B-1': 'pending', 'B-2': 'flagged'}
+
+    with get_pool().connection() as conn:
+        conn.execute("INSERT INTO india (HS_code, main_category, sub_category) VALUES (8471, 'Electronics', 'Computers')")
+        conn.execute("DELETE FROM india WHERE HS_code = 8471")
+        conn.commit()
+    rescore.apply_restriction_changes()
+    assert _statuses() == {'B-1': 'pending', 'B-2': 'flagged'}
+    with get_pool().connection() as conn:
+        reasons = conn.execute("SELECT compliance_reasons FROM Consignments WHERE shipment_id = 'B-2'").fetchone()[0]
+    assert [r['code'] for r in json.loads(reasons)] == ['WEIGHT_LIMIT_EXCEEDED', 'INVOICE_PENDING']
@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+
+import pytest
+
+import changefeed
+import config
+from db import get_pool
+
+_INSERT = '''INSERT INTO Consignments (sender_name, sender_address, sender_country, sender_mail, sender_phone,
+    receiver_name, receiver_address, receiver_country, shipment_id, shipment_date, PackageQuantity, HS_code,
+    totalWeight, Item_desc, compliant)
+    VALUES ('s', 'a', 'India', 'a@b.co', '1', 'r', 'b', 'UK', ?, '2025-01-02', 1, '8471', 2.5, 'laptop', 'pending')'''
+
+
+@pytest.fixture
+def feed(client, monkeypatch):
+    """A fresh feed for the test database, tailing it every 10 ms."""
+    monkeypatch.setattr(config, 'CHANGE_FEED_POLL_SECONDS', 0.01)
+    monkeypatch.setattr(changefeed, '_feed', None)
+    return changefeed.get_feed()
+
+
+def _write(*statements):
+    with get_pool().connection() as conn:
+        for sql, params in statements:
+            conn.execute(sql, params)
+        conn.commit()
+    changefeed.notify()
+
+
+def _event(seq):
+    return seq, f'{{"seq":{seq}}}', f'id: {seq}\n\n'
+
+
+def test_ring_buffer_and_resets(client):
+    ring = changefeed.ChangeFeed(capacity=2, start_seq=0)
+    ring.publish([_event(1), _event(2), _event(3)])
+    assert [event[0] for event in ring.read(1, 10)[0]] == [2, 3]
+    ring.publish([_event(4)])
+    # Trimmed back to capacity; older positions are read from the table
+    assert ring.floor == 2 and [event[0] for event in ring.read(2, 1)[0]] == [3]
+    assert ring.read(9, 10) == ([], 4)
+
+    with get_pool().connection() as conn:
+        conn.executemany(_INSERT, [('FEED-0',), ('FEED-00',)])
+        first, last = conn.execute('SELECT MIN(seq), MAX(seq) FROM consignment_changes').fetchone()
+        conn.execute('DELETE FROM consignment_changes WHERE seq = ?', (first,))
+        conn.commit()
+    assert (first, last) == (1, 2)
+    # Positions before the buffer are read from the table, unless pruned
+    assert [event[0] for event in ring.read(1, 10)[0]] == [2]
+    assert ring.read(0, 10) == ([], 2)
+    assert ring.stats()['resets'] == 2 and ring.stats()['catch_up_reads'] == 2
+
+
+def test_long_poll_returns_creations_and_status_changes(feed, client, login):
+    headers = login()
+    start = client.get('/consignment/changes', headers=headers).get_json()
+    assert start['changes'] == [] and start['reset'] is False
+
+    _write((_INSERT, ('FEED-1',)), ("UPDATE Consignments SET compliant = 'flagged' WHERE shipment_id = 'FEED-1'", ()))
+    result = client.get('/consignment/changes', headers=headers,
+                        query_string={'since': start['last_seq'], 'wait': 5}).get_json()
+    assert [(c['event'], c['shipment_id'], c['status'], c['previous_status']) for c in result['changes']] == \
+        [('created', 'FEED-1', 'pending', None), ('status', 'FEED-1', 'flagged', 'pending')]
+    assert result['last_seq'] == result['changes'][-1]['seq']
+
+
+def test_long_poll_wakes_on_a_change(feed, client, login):
+    headers = login()
+    since = client.get('/consignment/changes', headers=headers).get_json()['last_seq']
+    writer = threading.Timer(0.2, _write, [(_INSERT, ('FEED-2',))])
+    writer.start()
+    started = time.monotonic()
+    result = client.get('/consignment/changes', headers=headers,
+                        query_string={'since': since, 'wait': 10}).get_json()
+    writer.join()
+    assert [c['shipment_id'] for c in result['changes']] == ['FEED-2']
+    assert time.monotonic() - started < 5
+
+
+def test_server_sent_events(feed, client, login, monkeypatch):
+    monkeypatch.setattr(config, 'CHANGE_FEED_STREAM_SECONDS', 0.3)
+    monkeypatch.setattr(config, 'CHANGE_FEED_HEARTBEAT_SECONDS', 0.1)
+    headers = login()
+    _write((_INSERT, ('FEED-3',)))
+
+    response = client.get('/consignment/changes/stream', headers={**headers, 'Last-Event-ID': '0'})
+    assert response.mimetype == 'text/event-stream'
+    frames = [frame for frame in response.get_data(as_text=True).split('\n\n') if frame]
+    assert frames[0].startswith('retry: ')
+    changes = [frame for frame in frames if 'event: change' in frame]
+    data = [json.loads(frame.split('data: ', 1)[1]) for frame in changes]
+    assert [(item['event'], item['shipment_id']) for item in data][-1] == ('created', 'FEED-3')
+    assert changes[-1].startswith(f"id: {data[-1]['seq']}\n")
+    assert ': keep-alive' in frames
+
+
+def test_rejects_bad_arguments(feed, client, login):
+    headers = login()
+    for args in ({'since': 'x'}, {'since': -1}, {'limit': 0}, {'wait': 'soon'}):
+        assert client.get('/consignment/changes', headers=headers, query_string=args).status_code == 400
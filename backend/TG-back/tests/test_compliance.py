@@ -0,0 +1,58 @@
+import io
+import json
+
+import pytest
+
+import compliance
+import restrictions
+from db import get_pool
+
+FORM = {
+    "sender_name": "Sender", "sender_address": "1 Road", "sender_country": "India",
+    "sender_mail": "sender@example.com", "sender_phone": "123",
+    "receiver_name": "Receiver", "receiver_address": "2 Street", "receiver_country": "India",
+    "shipment_id": "RULES-1", "shipment_date": "2025-01-02", "PackageQuantity": "2",
+    "HS_code": "8471.30", "totalWeight": "12.5", "Item_desc": "laptop computers", "declared_value": "100",
+}
+
+
+def _add(client, invoice=True, **fields):
+    data = {**FORM, **fields}
+    if invoice:
+        data['commercial_invoice'] = (io.BytesIO(b'%PDF-1.4 invoice'), 'invoice.pdf')
+    return client.post('/consignment/add-consignment', data=data, content_type='multipart/form-data')
+
+
+@pytest.mark.parametrize('fields, invoice, status, codes', [
+    ({}, True, 'compliant', []),
+    ({'HS_code': '9301.10'}, True, 'flagged', ['RESTRICTED_HS_CODE']),
+    ({'totalWeight': '750'}, True, 'flagged', ['WEIGHT_LIMIT_EXCEEDED']),
+    ({}, False, 'flagged', ['MISSING_INVOICE']),
+    ({'declared_value': '25000'}, True, 'pending', ['VALUE_THRESHOLD_EXCEEDED']),
+    ({'receiver_country': 'Atlantis'}, True, 'pending', ['UNKNOWN_DESTINATION']),
+    ({'HS_code': '9301', 'declared_value': '25000'}, True, 'flagged', ['RESTRICTED_HS_CODE', 'VALUE_THRESHOLD_EXCEEDED']),
+])
+def test_rules_decide_the_status_at_insert(client, fields, invoice, status, codes):
+    response = _add(client, invoice, **fields)
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['compliant'] == status
+    assert [v['code'] for v in body['violations']] == codes
+
+    with get_pool().connection() as conn:
+        stored, reasons = conn.execute(
+            'SELECT compliant, compliance_reasons FROM Consignments WHERE uuid = ?', (body['uuid'],)).fetchone()
+    assert stored == status
+    assert (json.loads(reasons) if reasons else []) == body['violations']
+
+
+def test_engine_is_recompiled_when_the_index_reloads(client):
+    engine = compliance.get_engine()
+    assert compliance.get_engine() is engine
+    with get_pool().connection() as conn:
+        conn.execute("INSERT INTO india (HS_code, main_category, sub_category) VALUES (8471, 'Electronics', 'Computers')")
+        conn.commit()
+    restrictions.reload_index(force=False)
+    assert compliance.get_engine() is not engine
+    assert compliance.evaluate({"receiver_country": "India", "HS_code": "847130", "totalWeight": 1,
+                                "declared_value": 1, "has_invoice": True}).status == 'flagged'
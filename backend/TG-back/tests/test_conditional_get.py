@@ -0,0 +1,59 @@
+import consignment_cache
+from db import get_pool
+
+
+def _write(sql, params=()):
+    with get_pool().connection() as conn:
+        conn.execute(sql, params)
+        conn.commit()
+
+
+def test_listing_revalidates_until_the_table_changes(client, login):
+    headers = login()
+    first = client.get('/consignment/fetch-consignments', headers=headers)
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and first.headers['Cache-Control'] == 'private, no-cache'
+
+    unchanged = client.get('/consignment/fetch-consignments', headers={**headers, 'If-None-Match': etag})
+    assert unchanged.status_code == 304 and unchanged.data == b''
+    # Another query is another ETag
+    other = client.get('/consignment/fetch-consignments', headers={**headers, 'If-None-Match': etag},
+                       query_string={'fields': 'uuid'})
+    assert other.status_code == 200 and other.headers['ETag'] != etag
+
+    _write("UPDATE Consignments SET compliant = 'flagged' WHERE uuid = 1")
+    changed = client.get('/consignment/fetch-consignments', headers={**headers, 'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert {row['uuid']: row['compliant'] for row in changed.get_json()}[1] == 'flagged'
+
+
+def test_rendered_pages_are_reused_per_user_until_the_table_changes(client, login):
+    headers = login()
+    body = client.get('/consignment/fetch-consignments', headers=headers).data
+    hits = consignment_cache.pages.stats()['hits']
+
+    assert client.get('/consignment/fetch-consignments', headers=headers).data == body
+    assert consignment_cache.pages.stats()['hits'] == hits + 1
+    # Pages are not shared between users
+    assert client.get('/consignment/fetch-consignments', headers=login()).data == body
+    assert consignment_cache.pages.stats()['hits'] == hits + 1
+
+    _write("UPDATE Consignments SET declared_value = 99 WHERE uuid = 2")
+    page = client.get('/consignment/fetch-consignments', headers=headers).get_json()
+    assert {row['uuid']: row['declared_value'] for row in page}[2] == 99
+
+
+def test_single_row_etag_follows_its_row_version(client, login):
+    headers = login()
+    first = client.get('/consignment/fetch-consignment/1', headers=headers)
+    etag = first.headers['ETag']
+    assert first.status_code == 200
+
+    assert client.get('/consignment/fetch-consignment/1', headers={**headers, 'If-None-Match': etag}).status_code == 304
+    # Writes to other rows leave it valid
+    _write("UPDATE Consignments SET compliant = 'flagged' WHERE uuid = 2")
+    assert client.get('/consignment/fetch-consignment/1', headers={**headers, 'If-None-Match': etag}).status_code == 304
+
+    _write("UPDATE Consignments SET compliant = 'flagged' WHERE uuid = 1")
+    changed = client.get('/consignment/fetch-consignment/1', headers={**headers, 'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
@@ -0,0 +1,64 @@
+from db import get_pool
+
+_INSERT = '''INSERT INTO Consignments (sender_name, sender_address, sender_country, sender_mail, sender_phone,
+    receiver_name, receiver_address, receiver_country, shipment_id, shipment_date, PackageQuantity, HS_code,
+    totalWeight, Item_desc, compliant, declared_value, created_at)
+    VALUES ('s', 'a', ?, 'a@b.co', '1', 'r', 'b', ?, ?, '2024-05-01', 1, '8471', 2.5, 'laptop', ?, ?, ?)'''
+
+
+def _seed(conn):
+    conn.executemany(_INSERT, [
+        ('India', 'UK', 'S-1', 'compliant', 100.0, '2024-05-01 09:00:00'),
+        ('India', 'UK', 'S-2', 'flagged', 50.0, '2024-05-01 10:00:00'),
+        (' india', 'uk ', 'S-3', 'compliant', 25.5, '2024-05-02 09:00:00'),
+        ('China', 'EU', 'S-4', None, None, '2024-06-01 09:00:00'),
+    ])
+    conn.commit()
+
+
+def _stats(client, headers, **args):
+    response = client.get('/consignment/stats', headers=headers, query_string=args)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_totals_and_breakdowns(client, login):
+    headers = login()
+    with get_pool().connection() as conn:
+        _seed(conn)
+
+    result = _stats(client, headers, **{'from': '2024-05-01', 'to': '2024-05-31'})
+    assert result['totals'] == {"total": 3, "value": 175.5, "compliant": 2, "flagged": 1, "pending": 0,
+                                "compliance_rate": 0.6667}
+    assert [(row['period'], row['total']) for row in result['by_period']] == [('2024-05-01', 2), ('2024-05-02', 1)]
+    # Countries are bucketed trimmed and upper-cased
+    assert [(row['receiver_country'], row['total']) for row in result['by_destination']] == [('UK', 3)]
+    assert [(row['sender_country'], row['total']) for row in result['by_origin']] == [('INDIA', 3)]
+
+    result = _stats(client, headers, period='month', receiver_country='eu',
+                    **{'from': '2024-01-01', 'to': '2024-12-31'})
+    assert result['totals']['total'] == 1 and result['totals']['pending'] == 1
+    assert [row['period'] for row in result['by_period']] == ['2024-06']
+    assert result['by_destination'] == [{"receiver_country": "EU", **result['totals']}]
+    assert result['by_origin'] is None
+
+
+def test_status_changes_and_deletes_move_the_counts(client, login):
+    headers = login()
+    with get_pool().connection() as conn:
+        _seed(conn)
+        conn.execute("UPDATE Consignments SET compliant = 'compliant' WHERE shipment_id = 'S-2'")
+        conn.execute("DELETE FROM Consignments WHERE shipment_id = 'S-3'")
+        conn.commit()
+
+    totals = _stats(client, headers, **{'from': '2024-05-01', 'to': '2024-05-31'})['totals']
+    assert totals == {"total": 2, "value": 150.0, "compliant": 2, "flagged": 0, "pending": 0, "compliance_rate": 1.0}
+
+
+def test_rejects_bad_arguments(client, login):
+    headers = login()
+    assert client.get('/consignment/stats', headers=headers, query_string={'from': '01/03/2025'}).status_code == 400
+    assert client.get('/consignment/stats', headers=headers, query_string={'period': 'week'}).status_code == 400
+    assert client.get('/consignment/stats', headers=headers,
+                      query_string={'sender_country': 'India', 'receiver_country': 'UK'}).status_code == 400
+    assert client.get('/consignment/stats').status_code == 403
@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from db import ConnectionPool, PoolTimeout
+from utils import closing_once
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), size=2, timeout=0.1)
+    with pool.connection() as conn:
+        conn.execute('CREATE TABLE t (x INTEGER)')
+        conn.commit()
+    yield pool
+    pool.close_idle()
+
+
+def test_close_returns_connection_for_reuse(pool):
+    conn = pool.acquire()
+    assert conn._checked_out
+    conn.close()
+    assert not conn._checked_out
+    # Idle connections are reused most recently returned first
+    assert pool.acquire() is conn
+    stats = pool.stats()
+    assert stats["created"] == 1 and stats["in_use"] == 1 and stats["checkouts"] == 3
+
+
+def test_closing_a_returned_connection_is_a_no_op(pool):
+    conn = pool.acquire()
+    conn.close()
+    conn.close()
+    assert pool.stats()["in_use"] == 0
+    assert pool.stats()["idle"] == 1
+
+
+def test_release_rolls_back_an_open_transaction(pool):
+    conn = pool.acquire()
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute('INSERT INTO t VALUES (1)')
+    conn.close()
+    with pool.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute('SELECT count(*) FROM t').fetchone()[0] == 0
+
+
+def test_connection_context_returns_connection_on_error(pool):
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.execute('INSERT INTO t VALUES (1)')
+            raise RuntimeError
+    assert pool.stats()["in_use"] == 0
+    with pool.connection() as conn:
+        assert conn.execute('SELECT count(*) FROM t').fetchone()[0] == 0
+
+
+def test_pool_is_bounded(pool):
+    held = [pool.acquire(), pool.acquire()]
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+
+    # A waiter gets the first connection released
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    pool.timeout = 5
+    waiter.start()
+    held[0].close()
+    waiter.join(5)
+    assert got == [held[0]]
+    for conn in (got[0], held[1]):
+        conn.close()
+    assert pool.stats()["in_use"] == 0
+
+
+def test_closing_once_never_releases_another_checkout(pool):
+    conn = pool.acquire()
+    release = closing_once(conn)
+    release()
+    # The same connection is handed to the next caller...
+    other = pool.acquire()
+    assert other is conn
+    other.execute('BEGIN IMMEDIATE')
+    # ...and a repeated close from the first owner leaves it alone
+    release()
+    assert other._checked_out and other.in_transaction
+    other.rollback()
+    other.close()
@@ -0,0 +1,67 @@
+import json
+
+from db import get_pool
+
+_INSERT = '''INSERT INTO Consignments (sender_name, sender_address, sender_country, sender_mail, sender_phone,
+    receiver_name, receiver_address, receiver_country, shipment_id, shipment_date, PackageQuantity, HS_code,
+    totalWeight, Item_desc, compliant, created_at)
+    VALUES ('s', 'a', 'India', 'a@b.co', '1', 'r', 'b', ?, ?, '2025-01-02', 1, ?, 2.5, 'laptop', ?, ?)'''
+
+
+def _seed(rows):
+    with get_pool().connection() as conn:
+        conn.executemany(_INSERT, rows)
+        conn.commit()
+
+
+def _pages(client, headers, **args):
+    pages = []
+    while True:
+        response = client.get('/consignment/fetch-consignments', headers=headers, query_string=args)
+        assert response.status_code == 200
+        pages.append(response.get_json())
+        if 'X-Next-Cursor' not in response.headers:
+            return pages
+        args['cursor'] = response.headers['X-Next-Cursor']
+
+
+def test_cursor_walks_every_row_once_newest_first(client, login):
+    headers = login()
+    # Ties on created_at are broken by uuid
+    _seed([('UK', f'PAGE-{i}', '8471', 'pending', f'2025-02-0{i % 3 + 1} 10:00:00') for i in range(10)])
+
+    pages = _pages(client, headers, limit=3, fields='uuid,created_at')
+    assert [len(page) for page in pages] == [3, 3, 3, 3]
+    rows = [(row['created_at'], row['uuid']) for page in pages for row in page]
+    assert rows == sorted(rows, reverse=True)
+    assert len(set(rows)) == 12
+
+
+def test_filters_and_projection(client, login):
+    headers = login()
+    _seed([('India', 'F-1', '930100', 'flagged', '2025-02-01 10:00:00'),
+           ('India', 'F-2', '847130', 'flagged', '2025-02-02 10:00:00'),
+           ('UK', 'F-3', '930100', 'flagged', '2025-02-03 10:00:00')])
+
+    page = client.get('/consignment/fetch-consignments', headers=headers, query_string={
+        'compliant': 'flagged', 'receiver_country': 'India', 'hs_code': '93', 'fields': 'shipment_id,hs_code'}).get_json()
+    assert page == [{"shipment_id": "F-1", "hs_code": "930100"}]
+
+    page = client.get('/consignment/fetch-consignments', headers=headers, query_string={
+        'created_from': '2025-02-02', 'created_to': '2025-02-02', 'fields': 'shipment_id'}).get_json()
+    assert page == [{"shipment_id": "F-2"}]
+
+
+def test_ndjson_listing(client, login):
+    headers = {**login(), 'Accept': 'application/x-ndjson'}
+    response = client.get('/consignment/fetch-consignments', headers=headers, query_string={'fields': 'uuid'})
+    assert response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line) for line in response.get_data(as_text=True).splitlines()] == [{"uuid": 2}, {"uuid": 1}]
+
+
+def test_bad_arguments_are_refused(client, login):
+    headers = login()
+    for args in ({'fields': 'password'}, {'limit': 'ten'}, {'cursor': '!!'}, {'compliant': 'maybe'},
+                 {'created_from': '02/01/2025'}):
+        assert client.get('/consignment/fetch-consignments', headers=headers, query_string=args).status_code == 400, args
+    assert client.get('/consignment/fetch-consignments').status_code == 403
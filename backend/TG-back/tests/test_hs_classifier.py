@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+
+import hs_classifier
+
+
+class FailingBackend(hs_classifier.FakeBackend):
+    def classify_batch(self, descriptions):
+        self.calls += 1
+        raise RuntimeError('model down')
+
+
+@pytest.fixture
+def classifier(client):
+    """classifier(backend, **options) builds an HSClassifier over the test database."""
+    def make(backend=None, **options):
+        return hs_classifier.HSClassifier(backend or hs_classifier.FakeBackend(), **options)
+    return make
+
+
+def test_normalize_and_parse_response():
+    assert hs_classifier.normalize('  Blue  CERAMIC-mugs, x2 ') == 'blue ceramic mugs x2'
+    assert hs_classifier.normalize(None) == ''
+    answer = '[{"index": 1, "hs_code": "6912.00", "confidence": 1.5}, {"index": 7, "hs_code": "847130"}, ' \
+             '{"index": 0, "hs_code": "69", "confidence": 0.5}]'
+    assert hs_classifier.parse_response(answer, 3) == [(None, 0.0), ('691200', 1.0), (None, 0.0)]
+
+
+def test_results_are_cached_and_keyed_on_the_normalized_text(classifier):
+    backend = hs_classifier.FakeBackend()
+    first = classifier(backend, batch_wait=0)
+    results = first.classify(['Ceramic mugs', '', 'unknown thing', 'ceramic  MUGS'])
+    assert [c and (c.hs_code, c.source) for c in results] == \
+        [('691200', 'model'), None, (None, 'model'), ('691200', 'model')]
+    assert backend.calls == 1
+
+    # A fresh classifier (another process) reads the persistent cache
+    again = classifier(backend, batch_wait=0).classify(['CERAMIC MUGS', 'unknown thing'])
+    assert [(c.hs_code, c.source) for c in again] == [('691200', 'cache'), (None, 'cache')]
+    assert backend.calls == 1
+    assert first.stats()['descriptions'] == 2
+
+
+def test_misses_are_batched_and_concurrent_requests_coalesce(classifier):
+    backend = hs_classifier.FakeBackend(delay=0.05)
+    instance = classifier(backend, batch_size=4, batch_wait=0.05, concurrency=1)
+    descriptions = [f'tea blend {i}' for i in range(10)]
+    results = {}
+
+    def classify(name):
+        results[name] = instance.classify(descriptions)
+
+    threads = [threading.Thread(target=classify, args=(n,)) for n in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all([c.hs_code for c in found] == ['090240'] * 10 for found in results.values())
+    assert backend.calls == 3
+    assert instance.stats()['batch_items'] == 10
+
+
+def test_busy_failed_and_slow_classifications(classifier):
+    with pytest.raises(hs_classifier.ClassifierBusy):
+        classifier(max_pending=2).classify(['lamp 1', 'lamp 2', 'lamp 3'])
+
+    backend = FailingBackend()
+    failing = classifier(backend, batch_wait=0)
+    with pytest.raises(hs_classifier.ClassifierUnavailable):
+        failing.classify(['lamp'])
+    # Failures are not cached
+    with pytest.raises(hs_classifier.ClassifierUnavailable):
+        failing.classify(['lamp'])
+    assert backend.calls == 2
+
+    with pytest.raises(hs_classifier.ClassifierUnavailable, match='timed out'):
+        classifier(hs_classifier.FakeBackend(delay=0.5), batch_wait=0).classify(['rice'], timeout=0.05)
+
+
+def test_classify_endpoint(client, login, classifier, monkeypatch):
+    monkeypatch.setattr(hs_classifier, '_classifier', classifier(batch_wait=0))
+    headers = login()
+    response = client.post('/consignment/classify-hs', headers=headers,
+                           json={"descriptions": ["Laptop computer", " "]})
+    assert response.status_code == 200
+    assert response.get_json()['classifications'] == [
+        {"description": "Laptop computer", "hs_code": "847130", "confidence": 0.9, "source": "model"},
+        {"description": " ", "hs_code": None, "confidence": 0.0, "source": None}]
+
+    assert client.post('/consignment/classify-hs', headers=headers, json={"descriptions": "tea"}).status_code == 400
+    monkeypatch.setattr(hs_classifier._classifier, 'max_pending', 0)
+    assert client.post('/consignment/classify-hs', headers=headers, json={"description": "tea"}).status_code == 503
@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+import config
+import hs_suggest
+from db import get_pool
+
+
+@pytest.fixture
+def index_dir(client, tmp_path, monkeypatch):
+    """A fresh per-process index saved under tmp_path, without the refresh thread."""
+    path = tmp_path / 'hs_suggest'
+    path.mkdir()
+    monkeypatch.setattr(config, 'HS_SUGGEST_DIR', str(path))
+    monkeypatch.setattr(hs_suggest, '_index', None)
+    monkeypatch.setattr(hs_suggest, '_watcher_pid', os.getpid())
+    return path
+
+
+def _confirm(rows):
+    with get_pool().connection() as conn:
+        conn.executemany('INSERT INTO hs_confirmations (description, hs_code) VALUES (?, ?)', rows)
+        conn.commit()
+
+
+def test_suggests_from_the_restriction_categories(index_dir):
+    suggestions = hs_suggest.suggest_many(['revolvers and pistols', 'REVOLVERS and  pistols!', ''])
+    assert suggestions[0][0].hs_code == '9302' and suggestions[0][0].source == 'category'
+    assert suggestions[0][0].matched == 'military weapons revolvers and pistols'
+    assert suggestions[1] == suggestions[0]
+    assert suggestions[2] == []
+    assert (index_dir / 'current').exists()
+
+
+def test_confirmations_go_to_the_delta_then_the_base(index_dir, monkeypatch):
+    base = hs_suggest.get_index()
+    _confirm([('Widget gizmo', '847130')] * 3 + [('widget gizmo', '851713')])
+
+    index = hs_suggest.refresh()
+    assert index.base is base.base and index.stats()['delta_documents'] == 1
+    suggestions = index.suggest('widget gizmos', k=2)
+    assert [(s.hs_code, s.source) for s in suggestions] == [('847130', 'confirmed'), ('851713', 'confirmed')]
+    assert suggestions[0].score > suggestions[1].score
+
+    # Past HS_SUGGEST_DELTA_MAX the confirmations are folded into a new base
+    monkeypatch.setattr(config, 'HS_SUGGEST_DELTA_MAX', 1)
+    _confirm([('sprocket', '731815')])
+    index = hs_suggest.refresh()
+    assert index.base is not base.base and index.stats()['delta_documents'] == 0
+    assert index.suggest('sprocket')[0].hs_code == '731815'
+    assert index.suggest('widget gizmo')[0].hs_code == '847130'
+
+
+def test_other_processes_map_the_saved_base(index_dir):
+    built = hs_suggest.get_index()
+    with get_pool().connection() as conn:
+        loaded = hs_suggest._load_or_build(conn, built.restrictions_version, built.last_id)
+    assert loaded.base is not built.base and hs_suggest.stats()['builds'] >= 1
+    assert loaded.suggest('ammunition') == built.suggest('ammunition')
+
+    # A restriction edit means a new base
+    with get_pool().connection() as conn:
+        conn.execute("UPDATE india SET sub_category = 'Kitchen Knives' WHERE HS_code = 9307")
+        conn.commit()
+    index = hs_suggest.refresh()
+    assert index.restrictions_version != built.restrictions_version
+    assert index.suggest('kitchen knives')[0].hs_code == '9307'
+
+
+def test_suggest_endpoint(index_dir, client, login):
+    headers = login()
+    response = client.post('/consignment/suggest-hs', headers=headers,
+                           json={"descriptions": ["automatic firearms"], "k": 1, "destination_country": "India"})
+    assert response.status_code == 200
+    [row] = response.get_json()['results']
+    assert [(s['hs_code'], s['restricted']) for s in row['suggestions']] == [('9301', True)]
+
+    response = client.post('/consignment/suggest-hs?k=1', headers={**headers, 'Content-Type': 'text/csv'},
+                           data='shipment_id,Item_desc\nS-1,swords and bayonets\n')
+    assert response.status_code == 200
+    [row] = response.get_json()['rows']
+    assert row['shipment_id'] == 'S-1' and row['suggestions'][0]['hs_code'] == '9307'
+
+    for body in ({"description": "x", "k": 0}, {"description": "x", "destination_country": "Atlantis"}):
+        assert client.post('/consignment/suggest-hs', headers=headers, json=body).status_code == 400
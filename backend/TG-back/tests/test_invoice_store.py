@@ -0,0 +1,74 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+import config
+import db
+from db import get_pool
+
+FORM = {
+    "sender_name": "Sender", "sender_address": "1 Road", "sender_country": "India",
+    "sender_mail": "sender@example.com", "sender_phone": "123",
+    "receiver_name": "Receiver", "receiver_address": "2 Street", "receiver_country": "United Kingdom",
+    "shipment_id": "INV-1", "shipment_date": "2025-01-02", "PackageQuantity": "2",
+    "HS_code": "8471.30", "totalWeight": "12.5", "Item_desc": "laptop computers", "declared_value": "100",
+}
+
+
+def _add(client, invoice, headers=None, **fields):
+    data = {**FORM, **fields, 'commercial_invoice': (io.BytesIO(invoice), 'invoice.pdf')}
+    return client.post('/consignment/add-consignment', data=data, content_type='multipart/form-data',
+                       headers=headers or {})
+
+
+def _stored_invoices():
+    names = [name for _, _, files in os.walk(config.INVOICE_STORE_DIR) for name in files]
+    with get_pool().connection() as conn:
+        registered = conn.execute('SELECT count(*) FROM invoices').fetchone()[0]
+    return len(names), registered
+
+
+def test_invoice_is_stored_once_by_digest_and_downloadable(client, login):
+    headers = login()
+    pdf = b'%PDF-1.4 shared'
+    first = _add(client, pdf)
+    assert first.status_code == 201
+    assert _add(client, pdf, shipment_id='INV-2').status_code == 201
+    assert _stored_invoices() == (1, 1)
+
+    response = client.get(f"/consignment/download-invoice/{first.get_json()['uuid']}", headers=headers)
+    assert response.status_code == 200
+    assert response.data == pdf
+    assert response.headers['ETag'] == f'"{hashlib.sha256(pdf).hexdigest()}"'
+
+
+def test_rejected_requests_leave_no_invoice_behind(client):
+    assert _add(client, b'%PDF-1.4 first').status_code == 201
+    assert _stored_invoices() == (1, 1)
+    assert _add(client, b'%PDF-1.4 second').status_code == 409
+    assert _stored_invoices() == (1, 1)
+
+
+def test_failed_commit_leaves_no_invoice_behind(client, monkeypatch):
+    def commit(self):
+        raise db.sqlite3.OperationalError('disk I/O error')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(db.PooledConnection, 'commit', commit)
+        assert _add(client, b'%PDF-1.4 lost').status_code == 500
+
+    assert _stored_invoices() == (0, 0)
+    with get_pool().connection() as conn:
+        assert conn.execute("SELECT count(*) FROM Consignments WHERE shipment_id = 'INV-1'").fetchone()[0] == 0
+
+
+@pytest.mark.parametrize('payload', [b'', b'%PDF-1.4 ' + b'x' * 200000])
+def test_invoices_of_any_size_are_streamed_through(client, payload):
+    assert _add(client, payload).status_code == 201
+    with get_pool().connection() as conn:
+        digest, = conn.execute("SELECT invoice_sha256 FROM Consignments WHERE shipment_id = 'INV-1'").fetchone()
+    assert digest == hashlib.sha256(payload).hexdigest()
+    with open(os.path.join(config.INVOICE_STORE_DIR, digest[:2], digest), 'rb') as f:
+        assert f.read() == payload
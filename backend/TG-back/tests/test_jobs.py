@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+import config
+import jobs
+
+
+@pytest.fixture
+def kind(client, monkeypatch):
+    """Registers test job kinds for the duration of a test."""
+    monkeypatch.setattr(config, 'JOB_RETRY_BACKOFF', 0.01)
+    registered = []
+
+    def register(name, func, **options):
+        jobs.job(name, **options)(func)
+        registered.append(name)
+        return name
+    yield register
+    for name in registered:
+        jobs._handlers.pop(name)
+
+
+def test_job_result_and_retries(kind, wait_for_job):
+    attempts = []
+
+    def flaky(params, progress):
+        attempts.append(params)
+        if len(attempts) < 3:
+            raise RuntimeError('try again')
+        return {"doubled": params['n'] * 2}
+
+    job_info = wait_for_job(jobs.submit(kind('test_flaky', flaky, max_retries=2), {"n": 21}))
+    assert job_info['status'] == jobs.SUCCEEDED
+    assert job_info['result'] == {"doubled": 42}
+    assert job_info['attempts'] == 3 and job_info['error'] is None
+
+    job_info = wait_for_job(jobs.submit(kind('test_broken', lambda params, progress: 1 / 0, max_retries=1)))
+    assert job_info['status'] == jobs.FAILED and job_info['attempts'] == 2
+    assert job_info['error'].startswith('ZeroDivisionError')
+
+
+def test_jobs_waiting_for_their_kind_stay_queued(kind, wait_for_job):
+    release = threading.Event()
+    serial = kind('test_serial', lambda params, progress: release.wait(10), concurrency=1)
+    other = kind('test_other', lambda params, progress: 'done')
+
+    first, second = jobs.submit(serial), jobs.submit(serial)
+    wait_for_job(first, (jobs.RUNNING,))
+    # The second job neither shows as running nor holds up another kind
+    assert wait_for_job(jobs.submit(other))['result'] == 'done'
+    assert jobs.get_job(second)['status'] == jobs.QUEUED
+
+    release.set()
+    assert wait_for_job(first)['status'] == wait_for_job(second)['status'] == jobs.SUCCEEDED
+    assert jobs.get_job(second)['attempts'] == 1
+
+
+def test_job_status_is_only_shown_to_its_creator_and_officers(client, login, wait_for_job):
+    owner, stranger, officer = login(), login(), login('compliance')
+    response = client.post('/consignment/bulk-upload?async=1', headers=owner, data=b'', content_type='text/csv')
+    job_id = response.get_json()['job_id']
+    wait_for_job(job_id)
+    assert client.get(f'/jobs/{job_id}', headers=owner).status_code == 200
+    assert client.get(f'/jobs/{job_id}', headers=officer).status_code == 200
+    assert client.get(f'/jobs/{job_id}', headers=stranger).status_code == 403
+    assert client.get('/jobs/missing', headers=owner).status_code == 404
+
+
+def test_evaluate_is_for_officers_and_bounded(client, login, monkeypatch, wait_for_job):
+    monkeypatch.setattr(config, 'EVALUATE_MAX_UUIDS', 3)
+    exporter, officer = login(), login('compliance')
+    assert client.post('/consignment/evaluate', headers=exporter, json={"uuids": [1]}).status_code == 403
+    assert client.post('/consignment/evaluate', headers=officer, json={"uuids": [1, 2, 3, 4]}).status_code == 400
+    assert client.post('/consignment/evaluate', headers=officer, json={"uuids": {"1": 1}}).status_code == 400
+
+    response = client.post('/consignment/evaluate', headers=officer, json={"uuids": [1, 2]})
+    assert response.status_code == 202
+    assert wait_for_job(response.get_json()['job_id'])['result'] == {"evaluated": 2, "changed": 2}
+
+
+def test_every_job_kind_has_a_celery_queue(client):
+    import tasks  # noqa: F401
+    import worker
+    assert {queue.name for queue in worker.celery.conf.task_queues} == {f'tg.{kind}' for kind in jobs._handlers}
+    assert {'tg.archive', 'tg.report', 'tg.apply_restriction_changes'} <= set(jobs.queues())
@@ -0,0 +1,82 @@
+import json
+
+import json_stream
+from db import get_pool
+from utils import closing_once
+
+_KEYS = ['uuid', 'name', 'weight', 'reasons', 'note']
+
+
+def _rows(count):
+    return [(i, f'Ré "{i}"\n', i / 3, json.dumps([{"n": i, "rule": "r"}], separators=(',', ':')), None)
+            for i in range(count)]
+
+
+def _expected(row, sort_keys=False):
+    values = dict(zip(_KEYS, row))
+    values['reasons'] = json.loads(values['reasons'])
+    return json.dumps(values, sort_keys=sort_keys, separators=(',', ':'))
+
+
+def test_encoder_matches_json_dumps():
+    for sort_keys in (False, True):
+        encoder = json_stream.RowEncoder(_KEYS, raw=('reasons',), sort_keys=sort_keys)
+        for row in _rows(3) + [(2 ** 70, '', float('nan'), 'null', True), (-1, '\x00', 1e300, '{}', 'x')]:
+            assert encoder.encode(row) == _expected(row, sort_keys)
+
+    # Leading columns that are not output
+    assert json_stream.RowEncoder(['b'], offset=2).encode((1, 2, 'x')) == '{"b":"x"}'
+    assert json_stream.RowEncoder([]).encode(()) == '{}'
+
+
+def test_stream_array_and_ndjson_in_chunks():
+    rows = _rows(json_stream.CHUNK_ROWS * 2 + 5)
+    encoder = json_stream.RowEncoder(_KEYS, raw=('reasons',))
+
+    chunks = list(json_stream.stream(encoder, rows[0], json_stream.RowList(rows[1:])))
+    assert len(chunks) == 3
+    assert json.loads(''.join(chunks)) == [json.loads(_expected(row)) for row in rows]
+
+    lines = ''.join(json_stream.stream(encoder, rows[0], json_stream.RowList(rows[1:]), ndjson=True))
+    assert lines.endswith('\n')
+    assert [json.loads(line) for line in lines.splitlines()] == [json.loads(_expected(row)) for row in rows]
+
+
+def test_stream_empty_result():
+    encoder = json_stream.RowEncoder(_KEYS)
+    assert ''.join(json_stream.stream(encoder, None, json_stream.RowList([]))) == '[]\n'
+    assert ''.join(json_stream.stream(encoder, None, json_stream.RowList([]), ndjson=True)) == ''
+
+
+def test_closing_once():
+    class Connection:
+        closed = 0
+
+        def close(self):
+            self.closed += 1
+
+    conn = Connection()
+    close = closing_once(conn)
+    close()
+    close()
+    assert conn.closed == 1
+
+
+def test_streamed_listing_returns_its_connection(client, login):
+    headers = login()
+    pool = get_pool()
+
+    response = client.get('/consignment/fetch-consignments', headers=headers)
+    assert [row['uuid'] for row in response.get_json()] == [2, 1]
+    response.close()
+    assert pool.stats()['in_use'] == 0
+
+    # A client that goes away before reading the body
+    checkouts = pool.stats()['checkouts']
+    response = client.get('/consignment/fetch-consignments', headers=headers, buffered=False,
+                          query_string={'fields': 'uuid'})
+    assert pool.stats()['in_use'] == 1
+    response.close()
+    assert pool.stats()['in_use'] == 0
+    # Only the listing's own checkout
+    assert pool.stats()['checkouts'] == checkouts + 1
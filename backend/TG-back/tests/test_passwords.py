@@ -0,0 +1,85 @@
+import bcrypt
+
+import config
+import passwords
+from db import get_pool
+
+_USER = {"firstName": "Pat", "lastName": "Doe", "email": "pat@example.com", "phoneNumber": "123",
+         "companyName": "Doe Co", "userRole": "exporter", "primaryCountry": "India", "password": "first-pw"}
+
+
+def _register(client):
+    assert client.post('/users/register', json=_USER).status_code == 201
+
+
+def _authenticate(client, password):
+    return client.post('/users/authenticate', json={"email": _USER['email'], "password": password})
+
+
+def _stored_hash():
+    with get_pool().connection() as conn:
+        return conn.execute('SELECT password FROM users WHERE email = ?', (_USER['email'],)).fetchone()[0]
+
+
+def test_hash_and_check():
+    stored = passwords.hash_password('pw')
+    assert stored.startswith(f'$2b$0{config.BCRYPT_ROUNDS}$')
+    assert passwords.check_password('pw', stored)
+    assert not passwords.check_password('other', stored)
+    assert not passwords.needs_rehash(stored)
+    assert passwords.needs_rehash(bcrypt.hashpw(b'pw', bcrypt.gensalt(config.BCRYPT_ROUNDS + 1)).decode())
+
+
+def test_login_moves_the_hash_to_the_configured_cost(client):
+    _register(client)
+    old_hash = bcrypt.hashpw(b'first-pw', bcrypt.gensalt(config.BCRYPT_ROUNDS + 1)).decode()
+    with get_pool().connection() as conn:
+        conn.execute('UPDATE users SET password = ? WHERE email = ?', (old_hash, _USER['email']))
+        conn.commit()
+
+    assert _authenticate(client, 'wrong-pw').status_code == 401
+    assert _stored_hash() == old_hash
+    assert _authenticate(client, 'first-pw').status_code == 200
+    assert _stored_hash() != old_hash and not passwords.needs_rehash(_stored_hash())
+    assert _authenticate(client, 'first-pw').status_code == 200
+
+
+def test_edit_profile_changes_the_password(client):
+    _register(client)
+    login = _authenticate(client, 'first-pw').get_json()
+    headers = {"Authorization": login['token']}
+    change = {"user_id": login['user_id'], "current_password": "wrong-pw", "new_password": "second-pw"}
+
+    assert client.put('/users/edit-profile', headers=headers, json=change).status_code == 401
+    change['current_password'] = 'first-pw'
+    assert client.put('/users/edit-profile', headers=headers, json=change).status_code == 200
+    assert _authenticate(client, 'first-pw').status_code == 401
+    assert _authenticate(client, 'second-pw').status_code == 200
+
+
+def test_busy_hasher_answers_503(client, monkeypatch):
+    _register(client)
+    monkeypatch.setattr(config, 'PASSWORD_MAX_QUEUE', 0)
+    rejected = passwords.stats()['rejected']
+
+    assert _authenticate(client, 'first-pw').status_code == 503
+    assert client.post('/users/register', json={**_USER, "email": "other@example.com"}).status_code == 503
+    assert passwords.stats()['rejected'] == rejected + 2
+
+
+def test_no_connection_is_held_while_hashing(client, monkeypatch):
+    in_use = []
+    timed = passwords._timed
+
+    def spy(func, submitted, args):
+        in_use.append(get_pool().stats()['in_use'])
+        return timed(func, submitted, args)
+
+    monkeypatch.setattr(passwords, '_timed', spy)
+    _register(client)
+    login = _authenticate(client, 'first-pw').get_json()
+    change = {"user_id": login['user_id'], "current_password": "first-pw", "new_password": "second-pw"}
+    assert client.put('/users/edit-profile', headers={"Authorization": login['token']}, json=change).status_code == 200
+
+    # register hashes, login checks, edit-profile checks and hashes
+    assert in_use == [0, 0, 0, 0]
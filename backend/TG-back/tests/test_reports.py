@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+import config
+import reports
+from db import get_pool
+
+
+@pytest.fixture
+def cache(client, monkeypatch):
+    """A report cache with no running total yet and no periodic recount."""
+    monkeypatch.setattr(config, 'REPORT_CACHE_SCAN_SECONDS', 3600.0)
+    monkeypatch.setattr(reports, '_cache_bytes', None)
+    monkeypatch.setattr(reports, '_next_scan', 0.0)
+    return config.REPORT_CACHE_DIR
+
+
+def _generate(title):
+    spec = reports.parse_spec({"uuids": [1, 2], "format": "html", "title": title})
+    with get_pool().connection() as conn:
+        key, _ = reports.report_key(conn, spec)
+        b''.join(reports.generate(conn, spec, key))
+    return reports.path_for(key, 'html')
+
+
+def _counters():
+    stats = reports.stats()
+    return stats['scans'], stats['evicted']
+
+
+def test_reports_are_served_from_the_cache(client, login, cache):
+    headers = login()
+    body = {"uuids": [1, 2], "format": "html", "kind": "shipping-form"}
+    first = client.post('/consignment/reports', headers=headers, json=body)
+    assert first.status_code == 200 and first.headers['X-Report-Cache'] == 'miss'
+    html = first.get_data()
+    assert b'<html' in html
+
+    again = client.post('/consignment/reports', headers=headers, json=body)
+    assert again.headers['X-Report-Cache'] == 'hit' and again.get_data() == html
+    key = first.headers['X-Report-Key']
+    assert client.get(f'/consignment/reports/{key}.html', headers=headers).get_data() == html
+    assert client.get(f'/consignment/reports/{"0" * 64}.html', headers=headers).status_code == 404
+
+    # A changed shipment is a new report
+    assert client.put('/consignment/update-compliance/1', headers=login('compliance'),
+                      json={"compliant": "flagged"}).status_code == 200
+    changed = client.post('/consignment/reports', headers=headers, json=body)
+    assert changed.headers['X-Report-Cache'] == 'miss' and changed.headers['X-Report-Key'] != key
+
+
+def test_the_cache_is_only_walked_past_the_limit(cache, monkeypatch):
+    scans, evicted = _counters()
+    paths = [_generate('Report A')]
+    assert _counters() == (scans + 1, evicted)
+    size = os.path.getsize(paths[0])
+    monkeypatch.setattr(config, 'REPORT_CACHE_MAX_BYTES', int(size * 3.5))
+
+    # Under the limit each new report is only added to the running total
+    paths += [_generate('Report B'), _generate('Report C')]
+    assert _counters() == (scans + 1, evicted)
+
+    # B is the least recently used
+    for age, path in zip((20, 30, 10), paths):
+        os.utime(path, (1000000000 - age, 1000000000 - age))
+    paths.append(_generate('Report D'))
+    assert _counters() == (scans + 2, evicted + 1)
+    assert [os.path.exists(path) for path in paths] == [True, False, True, True]
+
+
+def test_the_cache_is_recounted_periodically(cache, monkeypatch):
+    first = _generate('Report A')
+    scans, evicted = _counters()
+    monkeypatch.setattr(config, 'REPORT_CACHE_MAX_BYTES', os.path.getsize(first) * 4)
+
+    # Another process filled the cache; this one notices at the next recount
+    other = os.path.join(cache, 'ff', 'f' * 64 + '.pdf')
+    os.makedirs(os.path.dirname(other))
+    with open(other, 'wb') as out:
+        out.write(b'x' * os.path.getsize(first) * 4)
+    os.utime(other, (1000000000, 1000000000))
+    second = _generate('Report B')
+    assert _counters() == (scans, evicted) and os.path.exists(other)
+
+    monkeypatch.setattr(reports, '_next_scan', 0.0)
+    _generate('Report C')
+    assert _counters() == (scans + 1, evicted + 1)
+    assert not os.path.exists(other) and os.path.exists(first) and os.path.exists(second)
+    assert reports.evict() == reports.stats()['bytes']
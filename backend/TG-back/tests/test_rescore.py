@@ -0,0 +1,122 @@
+import json
+import random
+
+import numpy as np
+import compliance
+import rescore
+from db import get_pool
+
+_INSERT = '''INSERT INTO Consignments (sender_name, sender_address, sender_country, sender_mail, sender_phone,
+    receiver_name, receiver_address, receiver_country, shipment_id, shipment_date, PackageQuantity, HS_code,
+    totalWeight, Item_desc, declared_value, invoice_sha256, compliant)
+    VALUES ('s', 'a', 'India', 'a@b.co', '1', 'r', 'b', ?, ?, '2025-01-02', 1, ?, ?, 'goods', ?, ?, 'pending')'''
+
+
+def _seed(rows):
+    """rows of (receiver_country, shipment_id, HS_code, totalWeight, declared_value, has_invoice)."""
+    with get_pool().connection() as conn:
+        conn.executemany(_INSERT, [(*row[:5], 'ab' * 32 if row[5] else None) for row in rows])
+        conn.commit()
+
+
+def _stored(shipment_id):
+    with get_pool().connection() as conn:
+        status, reasons = conn.execute('SELECT compliant, compliance_reasons FROM Consignments WHERE shipment_id = ?',
+                                       (shipment_id,)).fetchone()
+    return status, json.loads(reasons) if reasons else []
+
+
+def _scalar_calls(monkeypatch):
+    calls = []
+    evaluate = compliance.RuleEngine.evaluate
+
+    def counting(self, shipment):
+        calls.append(shipment)
+        return evaluate(self, shipment)
+    monkeypatch.setattr(compliance.RuleEngine, 'evaluate', counting)
+    return calls
+
+
+def test_vectorized_rules_agree_with_the_scalar_engine(client):
+    engine = compliance.get_engine()
+    rng = random.Random(7)
+    restricted = [code for jurisdiction in engine.index.jurisdictions.values() for code in jurisdiction.trie.codes()]
+    countries = ['India', 'UK', 'United States', 'EU', 'Atlantis', '']
+    shipments = []
+    for _ in range(3000):
+        code = rng.choice(restricted) + str(rng.randint(0, 99)) if rng.random() < 0.3 else str(rng.randint(100, 999999))
+        shipments.append({
+            "receiver_country": rng.choice(countries),
+            "HS_code": code,
+            "totalWeight": rng.choice([None, 0.5, 499.99, 500.0, 500.01, rng.uniform(0, 2000)]),
+            "declared_value": rng.choice([None, 10000.0, 10000.5, rng.uniform(0, 50000)]),
+            "has_invoice": rng.choice([True, True, False, None]),
+        })
+
+    rows = [(i, s['receiver_country'], s['HS_code'], s['totalWeight'], s['declared_value'], s['has_invoice'],
+             'pending', None, 0, 0) for i, s in enumerate(shipments)]
+    jurisdictions, columns, _, _ = rescore._columns(rows)
+    for name in np.unique(jurisdictions):
+        group = np.nonzero(jurisdictions == name)[0]
+        statuses = engine.evaluate_batch(name or None, {key: column[group] for key, column in columns.items()})
+        assert list(statuses) == [engine.evaluate(shipments[i]).status for i in group], name
+
+
+def test_rescore_uses_restrictions_changed_since_the_last_reload(client):
+    _seed([('India', 'R-1', '847130', 2.0, 10.0, True)])
+    rescore.rescore_all()
+    assert _stored('R-1')[0] == 'compliant'
+
+    # Edited by another process; this one's index has not reloaded yet
+    with get_pool().connection() as conn:
+        conn.execute("INSERT INTO india (HS_code, main_category, sub_category) VALUES (8471, 'Electronics', 'Computers')")
+        conn.commit()
+    assert rescore.rescore_all()["changed"] == 1
+    status, reasons = _stored('R-1')
+    assert status == 'flagged' and reasons[0]['details']['hs_code'] == '8471'
+
+
+def test_reasons_are_refreshed_when_only_the_details_change(client):
+    _seed([('India', 'R-2', '930110', 2.0, 10.0, True)])
+    rescore.rescore_all()
+    assert 'Automatic Firearms' in _stored('R-2')[1][0]['message']
+
+    with get_pool().connection() as conn:
+        conn.execute("UPDATE india SET sub_category = 'Machine Guns' WHERE HS_code = 9301")
+        conn.commit()
+    rescore.rescore_all()
+    status, reasons = _stored('R-2')
+    assert status == 'flagged' and 'Machine Guns' in reasons[0]['message']
+
+
+def test_unchanged_rows_skip_the_scalar_engine(client, monkeypatch):
+    _seed([('India', f'R-{i}', '930110' if i % 2 else '847130', 2.0, 10.0, i % 3 == 0) for i in range(50)])
+    first = rescore.rescore_all(chunk_size=7)
+    assert first["scanned"] == 52 and first["changed"] == 52
+
+    calls = _scalar_calls(monkeypatch)
+    again = rescore.rescore_all(chunk_size=7)
+    assert again["changed"] == 0
+    assert calls == []
+
+
+def test_overrides_and_rows_written_meanwhile_are_left_alone(client, monkeypatch):
+    _seed([('India', 'R-3', '930110', 2.0, 10.0, True), ('India', 'R-4', '930110', 2.0, 10.0, True)])
+    with get_pool().connection() as conn:
+        conn.execute("UPDATE Consignments SET compliant = 'compliant', compliance_override = 1 WHERE shipment_id = 'R-3'")
+        conn.commit()
+
+    score = rescore._score
+
+    def racing(engine, rows):
+        updates = score(engine, rows)
+        # Another writer gets to R-4 between the read and the write lock
+        with get_pool().connection() as conn:
+            conn.execute("UPDATE Consignments SET compliant = 'pending' WHERE shipment_id = 'R-4'")
+            conn.commit()
+        return updates
+    monkeypatch.setattr(rescore, '_score', racing)
+    rescore.rescore_all()
+
+    assert _stored('R-3') == ('compliant', [])
+    assert _stored('R-4') == ('pending', [])
@@ -0,0 +1,94 @@
+import threading
+
+import compliance
+import rescore
+from db import get_pool
+
+_INSERT = '''INSERT INTO Consignments (sender_name, sender_address, sender_country, sender_mail, sender_phone,
+    receiver_name, receiver_address, receiver_country, shipment_id, shipment_date, PackageQuantity, HS_code,
+    totalWeight, Item_desc, declared_value, invoice_sha256, compliant)
+    VALUES ('s', 'a', 'India', 'a@b.co', '1', 'r', 'b', ?, ?, '2025-01-02', 1, ?, 2.0, 'goods', 10.0, ?, 'compliant')'''
+
+
+def _seed():
+    rows = [('India', 'C-1', '8471.30'), ('IN', 'C-2', '847150'), ('India', 'C-3', '8517'),
+            ('UK', 'C-4', '990130'), ('Atlantis', 'C-5', '847130')]
+    with get_pool().connection() as conn:
+        conn.executemany(_INSERT, [(*row, 'ab' * 32) for row in rows])
+        conn.commit()
+
+
+def _statuses():
+    with get_pool().connection() as conn:
+        return dict(conn.execute("SELECT shipment_id, compliant FROM Consignments WHERE shipment_id LIKE 'C-%'"))
+
+
+def test_only_the_shipments_an_edit_covers_are_re_evaluated(client, monkeypatch):
+    _seed()
+    with get_pool().connection() as conn:
+        conn.execute("INSERT INTO india (HS_code, main_category, sub_category) VALUES (8471, 'Electronics', 'Computers')")
+        conn.commit()
+
+    evaluated = []
+    evaluate = compliance.RuleEngine.evaluate
+    monkeypatch.setattr(compliance.RuleEngine, 'evaluate',
+                        lambda self, shipment: evaluated.append(shipment['HS_code']) or evaluate(self, shipment))
+    summary = rescore.apply_restriction_changes()
+
+    assert sorted(evaluated) == ['8471.30', '847150']
+    assert (summary["changes"], summary["affected"], summary["changed"]) == (1, 2, 2)
+    assert _statuses() == {'C-1': 'flagged', 'C-2': 'flagged', 'C-3': 'compliant', 'C-4': 'compliant',
+                           'C-5': 'compliant'}
+
+    with get_pool().connection() as conn:
+        change = conn.execute('SELECT jurisdiction, hs_code, op, affected, changed FROM restriction_changes').fetchone()
+        assert tuple(change) == ('india', '8471', 'add', 2, 2)
+        effects = conn.execute('SELECT previous_status, new_status FROM restriction_change_effects').fetchall()
+        assert [tuple(effect) for effect in effects] == [('compliant', 'flagged')] * 2
+
+    # Nothing left to apply
+    assert rescore.apply_restriction_changes()["changes"] == 0
+
+
+def test_edits_through_the_api_are_applied_in_the_background(client, login, wait_for_job):
+    _seed()
+    officer = login('compliance')
+    assert client.post('/consignment/restrictions', headers=login(), json={}).status_code == 403
+
+    response = client.post('/consignment/restrictions', headers=officer, json={
+        "destination_country": "UK", "hs_code": "9901", "main_category": "Test"})
+    assert response.status_code == 202
+    wait_for_job(response.get_json()['job_id'])
+    assert _statuses()['C-4'] == 'flagged'
+
+    response = client.delete('/consignment/restrictions', headers=officer, json={
+        "destination_country": "UK", "hs_code": "9901"})
+    wait_for_job(response.get_json()['job_id'])
+    assert _statuses()['C-4'] == 'compliant'
+
+    changes = client.get('/consignment/restriction-changes', headers=officer).get_json()['changes']
+    assert [(change['op'], change['affected'], change['changed']) for change in changes] == [
+        ('remove', 1, 1), ('add', 1, 1)]
+    effects = client.get(f"/consignment/restriction-changes/{changes[0]['id']}", headers=officer).get_json()
+    assert [(e['previous_status'], e['new_status']) for e in effects['consignments']] == [('flagged', 'compliant')]
+    assert len(client.get('/consignment/restriction-changes?limit=-1', headers=officer).get_json()['changes']) == 1
+
+
+def test_concurrent_callers_apply_each_change_once(client):
+    _seed()
+    with get_pool().connection() as conn:
+        for code in (8471, 8517, 9999):
+            conn.execute("INSERT INTO india (HS_code, main_category, sub_category) VALUES (?, 'Test', 'Test')", (code,))
+        conn.commit()
+
+    summaries = []
+    threads = [threading.Thread(target=lambda: summaries.append(rescore.apply_restriction_changes(batch_size=1)))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(summary["changes"] for summary in summaries) == 3
+    with get_pool().connection() as conn:
+        assert conn.execute('SELECT count(*) FROM restriction_change_effects').fetchone()[0] == 3
+    assert _statuses()['C-3'] == 'flagged'
@@ -0,0 +1,58 @@
+import restrictions
+from db import get_pool
+
+
+def _search(client, headers, **body):
+    return client.post('/consignment/search-hs-code', headers=headers, json=body)
+
+
+def test_hs_codes_are_normalized():
+    assert restrictions.normalize_hs(507) == '0507'
+    assert restrictions.normalize_hs('8471.30') == '847130'
+    assert restrictions.normalize_hs(None) == ''
+    assert restrictions.jurisdiction_for(' united_kingdom ') == 'united_kingdom'
+    assert restrictions.jurisdiction_for('Atlantis') is None
+
+
+def test_a_code_is_restricted_by_every_level_that_covers_it(client):
+    index = restrictions.get_index()
+    assert [r.hs_code for r in index.restricted('India', '9301.10.00')] == ['9301']
+    assert [r.hs_code for r in index.restricted('IN', '0507.90')] == ['0507']
+    assert index.restricted('India', '8471') == ()
+    assert index.restricted('Atlantis', '9301') == ()
+
+
+def test_search_by_code_prefix_and_category(client, login):
+    headers = login()
+    found = _search(client, headers, destination_country='India', hs_code='93').get_json()
+    assert found['destination'] == 'india'
+    assert [r['hs_code'] for r in found['results']] == ['9301', '9302', '9305', '9306', '9307']
+
+    # A longer code finds the heading that covers it
+    found = _search(client, headers, destination_country='India', hs_code='930110').get_json()
+    assert [r['hs_code'] for r in found['results']] == ['9301']
+
+    found = _search(client, headers, destination_country='India', main_category='military items').get_json()
+    assert [r['sub_category'] for r in found['results']] == ['Ammunition and Munitions', 'Swords and Bayonets']
+
+
+def test_search_errors(client, login):
+    headers = login()
+    assert _search(client, headers, hs_code='93').status_code == 400
+    assert _search(client, headers, destination_country='India').status_code == 400
+    assert _search(client, headers, destination_country='Atlantis', hs_code='93').status_code == 400
+    assert _search(client, headers, destination_country='India', hs_code='8471').status_code == 404
+
+
+def test_index_is_rebuilt_when_the_tables_change(client):
+    before = restrictions.get_index()
+    assert restrictions.reload_index(force=False) is before
+
+    with get_pool().connection() as conn:
+        conn.execute("INSERT INTO india (HS_code, main_category, sub_category) VALUES (8471, 'Electronics', 'Computers')")
+        conn.commit()
+    after = restrictions.reload_index(force=False)
+    assert after is not before and after.version > before.version
+    assert [r.hs_code for r in after.restricted('India', '847130')] == ['8471']
+    # Snapshots are never mutated in place
+    assert before.restricted('India', '847130') == ()
@@ -0,0 +1,82 @@
+import sqlite3
+
+import consignment_stats
+import schema
+from db import get_pool
+
+_INSERT = '''INSERT INTO Consignments (sender_name, sender_address, sender_country, sender_mail, sender_phone,
+    receiver_name, receiver_address, receiver_country, shipment_id, shipment_date, PackageQuantity, HS_code,
+    totalWeight, Item_desc, compliant, created_at)
+    VALUES ('s', 'a', 'India', 'a@b.co', '1', 'r', 'b', 'United Kingdom', ?, '2025-01-02', 1, '8471', 2.5,
+            'laptop', ?, '2025-01-02 10:00:00')'''
+
+
+def _migrate(path):
+    with get_pool(path).connection() as conn:
+        schema.migrate(conn)
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def test_migrations_keep_existing_rows(seeded_db):
+    before = sqlite3.connect(seeded_db)
+    assert before.execute('PRAGMA user_version').fetchone()[0] == 0
+    rows = before.execute('SELECT uuid, shipment_id, compliant FROM Consignments ORDER BY uuid').fetchall()
+    users = before.execute('SELECT count(*) FROM users').fetchone()[0]
+    before.close()
+    assert rows
+
+    assert _migrate(seeded_db) == len(schema.MIGRATIONS)
+
+    with get_pool(seeded_db).connection() as conn:
+        assert [tuple(row) for row in conn.execute(
+            'SELECT uuid, shipment_id, compliant FROM Consignments ORDER BY uuid')] == rows
+        assert conn.execute('SELECT count(*) FROM users').fetchone()[0] == users
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        # Backfilled: the rollups cover the rows that were there
+        for table in consignment_stats.ROLLUPS:
+            assert conn.execute(f'SELECT sum(shipments) FROM {table}').fetchone()[0] == len(rows)
+        assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'consignment_stats'").fetchone()
+
+
+def test_migrations_are_idempotent(seeded_db):
+    assert _migrate(seeded_db) == len(schema.MIGRATIONS)
+    with get_pool(seeded_db).connection() as conn:
+        conn.execute(_INSERT, ('AGAIN-1', 'flagged'))
+        conn.commit()
+    assert _migrate(seeded_db) == len(schema.MIGRATIONS)
+    with get_pool(seeded_db).connection() as conn:
+        assert conn.execute("SELECT count(*) FROM Consignments WHERE shipment_id = 'AGAIN-1'").fetchone()[0] == 1
+
+
+def test_rollups_match_a_rebuild_after_writes(seeded_db):
+    _migrate(seeded_db)
+    with get_pool(seeded_db).connection() as conn:
+        conn.executemany(_INSERT, [(f'ROLL-{i}', status) for i, status in enumerate(['pending', 'flagged', 'compliant'])])
+        conn.execute("UPDATE Consignments SET compliant = 'compliant' WHERE shipment_id = 'ROLL-1'")
+        conn.execute("DELETE FROM Consignments WHERE shipment_id = 'ROLL-0'")
+        conn.commit()
+        maintained = {table: conn.execute(f'SELECT * FROM {table} ORDER BY 1, 2, 3').fetchall()
+                      for table in consignment_stats.ROLLUPS}
+        consignment_stats.rebuild(conn)
+        for table in consignment_stats.ROLLUPS:
+            assert conn.execute(f'SELECT * FROM {table} ORDER BY 1, 2, 3').fetchall() == maintained[table]
+
+
+def test_duplicate_shipment_ids_do_not_block_the_unique_index(seeded_db):
+    # Duplicates left behind by the old check-then-insert race
+    conn = sqlite3.connect(seeded_db)
+    conn.executemany(_INSERT, [('DUP-1', 'pending'), ('DUP-1', 'flagged'), ('DUP-1', 'pending')])
+    conn.commit()
+    conn.close()
+
+    assert _migrate(seeded_db) == len(schema.MIGRATIONS)
+
+    with get_pool(seeded_db).connection() as conn:
+        rows = conn.execute(
+            "SELECT uuid, shipment_id FROM Consignments WHERE shipment_id LIKE 'DUP-1%' ORDER BY uuid").fetchall()
+        assert [row[1] for row in rows] == ['DUP-1', f'DUP-1~{rows[1][0]}', f'DUP-1~{rows[2][0]}']
+        duplicates = conn.execute('SELECT uuid, shipment_id FROM duplicate_shipment_ids ORDER BY uuid')
+        assert [tuple(row) for row in duplicates] == [(rows[1][0], 'DUP-1'), (rows[2][0], 'DUP-1')]
+        # From now on the index refuses them
+        assert conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'idx_consignments_shipment_id_unique'").fetchone()
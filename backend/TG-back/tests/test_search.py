@@ -0,0 +1,87 @@
+import pytest
+
+import search
+from db import get_pool
+
+_INSERT = '''INSERT INTO Consignments (sender_name, sender_address, sender_country, sender_mail, sender_phone,
+    receiver_name, receiver_address, receiver_country, shipment_id, shipment_date, PackageQuantity, HS_code,
+    totalWeight, Item_desc, compliant)
+    VALUES (?, 'a', 'India', 'a@b.co', '1', 'Receiver', 'b', 'UK', ?, '2025-01-02', 1, '6912', 2.5, ?, 'pending')'''
+
+
+def _seed(rows):
+    with get_pool().connection() as conn:
+        conn.executemany(_INSERT, rows)
+        conn.commit()
+
+
+def _search(client, headers, **args):
+    response = client.get('/consignment/search', headers=headers, query_string=args)
+    assert response.status_code == 200, response.get_json()
+    return response
+
+
+def test_match_expression():
+    assert search.match_expression('ceramic mugs') == '"ceramic" "mugs"'
+    assert search.match_expression('"blue ceramic" mug*') == '"blue ceramic" "mug"*'
+    # Operators and column filters are plain text
+    assert search.match_expression('NOT sender_name:x OR "a""b"') == '"NOT" "sender_name:x" "OR" "a" "b"'
+    for text in (None, '', '  * "" '):
+        with pytest.raises(ValueError):
+            search.match_expression(text)
+    with pytest.raises(ValueError):
+        search.match_expression(' '.join(['w'] * (search.MAX_TERMS + 1)))
+
+
+def test_existing_rows_are_indexed(client, login):
+    with get_pool().connection() as conn:
+        name = conn.execute('SELECT sender_name FROM Consignments WHERE uuid = 1').fetchone()[0]
+    assert 1 in [row['uuid'] for row in _search(client, login(), q=name).get_json()]
+
+
+def test_ranking_snippets_and_sync(client, login):
+    headers = login()
+    _seed([('Ceramic Works', 'S-1', 'cotton shirts'),
+           ('Pottery Ltd', 'S-2', 'blue ceramic mugs <b>'),
+           ('Pottery Ltd', 'S-3', 'ceramics and glass')])
+
+    results = _search(client, headers, q='ceramic').get_json()
+    # A match in the goods description outranks one in the sender name
+    assert [row['shipment_id'] for row in results] == ['S-2', 'S-1']
+    assert results[0]['score'] > results[1]['score']
+    assert results[0]['snippet'] == 'blue <mark>ceramic</mark> mugs &lt;b&gt;'
+    assert {row['shipment_id'] for row in _search(client, headers, q='ceram*').get_json()} == {'S-1', 'S-2', 'S-3'}
+    assert [row['shipment_id'] for row in _search(client, headers, q='"mugs blue"').get_json()] == []
+
+    with get_pool().connection() as conn:
+        conn.execute("UPDATE Consignments SET Item_desc = 'steel pans' WHERE shipment_id = 'S-2'")
+        conn.execute("DELETE FROM Consignments WHERE shipment_id = 'S-1'")
+        conn.commit()
+    assert _search(client, headers, q='ceramic').get_json() == []
+    assert [row['shipment_id'] for row in _search(client, headers, q='pans', fields='shipment_id').get_json()] == \
+        ['S-2']
+
+
+def test_pages_cover_every_match_once(client, login):
+    headers = login()
+    _seed([(f'Sender {i}', f'P-{i}', 'tea ' * (i % 4 + 1)) for i in range(12)])
+
+    for order in ('relevance', 'recent'):
+        seen = []
+        args = {'q': 'tea', 'limit': 5, 'order': order, 'fields': 'uuid'}
+        while True:
+            response = _search(client, headers, **args)
+            seen.extend(row['uuid'] for row in response.get_json())
+            if 'X-Next-Cursor' not in response.headers:
+                break
+            args['cursor'] = response.headers['X-Next-Cursor']
+        assert len(seen) == len(set(seen)) == 12
+        if order == 'recent':
+            assert seen == sorted(seen, reverse=True)
+
+
+def test_rejects_bad_arguments(client, login):
+    headers = login()
+    for args in ({}, {'q': 'tea', 'order': 'oldest'}, {'q': 'tea', 'cursor': '!!'}, {'q': 'tea', 'fields': 'nope'},
+                 {'q': 'tea', 'limit': 'x'}):
+        assert client.get('/consignment/search', headers=headers, query_string=args).status_code == 400
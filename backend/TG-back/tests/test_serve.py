@@ -0,0 +1,58 @@
+import os
+import signal
+import time
+
+import config
+import serve
+
+
+def _child(ignore_term=False):
+    ready, started = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        if ignore_term:
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        os.write(started, b'.')
+        time.sleep(30)
+        os._exit(0)
+    os.read(ready, 1)
+    os.close(ready)
+    os.close(started)
+    return pid
+
+
+def test_shutdown_stops_and_reaps_the_workers():
+    master = serve.Master(None, 1)
+    pids = [_child(), _child()]
+    master.workers = {pid: master.generation for pid in pids}
+
+    assert master._shutdown() == 0
+    assert master.workers == {}
+
+
+def test_shutdown_kills_workers_that_outlive_the_grace_period(monkeypatch):
+    monkeypatch.setattr(config, 'SERVER_GRACEFUL_TIMEOUT', -4.5)
+    master = serve.Master(None, 1)
+    pid = _child(ignore_term=True)
+    master.workers = {pid: master.generation}
+
+    assert master._shutdown() == 0
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGKILL
+
+
+def test_shutdown_ignores_workers_that_exit_before_the_kill(monkeypatch):
+    monkeypatch.setattr(config, 'SERVER_GRACEFUL_TIMEOUT', -5)
+    signalled = []
+
+    def kill(pid, signum):
+        signalled.append(signum)
+        raise ProcessLookupError(pid)
+
+    monkeypatch.setattr(serve.os, 'kill', kill)
+    master = serve.Master(None, 1)
+    # Already gone, but not reaped by this master
+    master.workers = {2 ** 22 + 1: master.generation}
+
+    assert master._shutdown() == 0
+    assert signalled == [signal.SIGTERM, signal.SIGKILL]
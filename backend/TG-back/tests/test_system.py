@@ -0,0 +1,33 @@
+import config
+
+
+def _system_routes(client):
+    return sorted(rule.rule for rule in client.application.url_map.iter_rules()
+                  if rule.endpoint.startswith('system_management.'))
+
+
+def test_system_endpoints_are_admin_only(client, login):
+    routes = _system_routes(client)
+    assert '/system/db-pool' in routes and '/system/archive' in routes
+
+    for role in ('exporter', 'compliance'):
+        headers = login(role)
+        assert {route: client.get(route, headers=headers).status_code for route in routes} == \
+            {route: 403 for route in routes}
+
+    headers = login('admin')
+    assert {route: client.get(route, headers=headers).status_code for route in routes} == \
+        {route: 200 for route in routes}
+    assert client.get('/system/db-pool').status_code == 403
+
+
+def test_metrics_is_closed_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(config, 'METRICS_TOKEN', '')
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer '}).status_code == 403
+
+    monkeypatch.setattr(config, 'METRICS_TOKEN', 'scrape-me')
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'})
+    assert response.status_code == 200
+    assert b'tg_http_request_duration_seconds' in response.data
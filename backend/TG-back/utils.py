@@ -1,13 +1,89 @@
+import threading
 from functools import wraps
 from flask import request, jsonify, current_app
 import jwt
-import sqlite3
+
+import auth_cache
+import metrics
+from db import get_pool
 
 
 def get_db_connection():
-    conn = sqlite3.connect('./database/database.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Check a connection out of the pool; close() returns it."""
+    return get_pool().acquire()
+
+
+def closing_once(conn):
+    """conn.close as a callable that does nothing after its first call.
+
+    A streamed response has two places that return its connection: the end
+    of the body and the server closing the response. Only the first may
+    close it; by the second the pool may have handed it to another request.
+    """
+    once = threading.Lock()
+
+    def close():
+        if once.acquire(blocking=False):
+            conn.close()
+    return close
+
+
+def db_connection():
+    """Context manager that checks out a pooled connection and always returns it,
+    rolling back whatever the block left uncommitted."""
+    return get_pool().connection()
+
+
+def get_principal(user_id):
+    """Return the users row for user_id as a dict, served from the principal cache when fresh."""
+    pool = get_pool()
+    if auth_cache.needs_revalidation():
+        with pool.connection() as conn:
+            auth_cache.revalidate(conn)
+
+    user_info = auth_cache.principal_cache.get(user_id)
+    if user_info is None:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""SELECT user_id, firstName, lastName, email, phoneNumber, companyName, 
+                           userRole, regNumber, primaryCountry, shippingVolume, created_at 
+                           FROM users WHERE user_id = ?""", (user_id,))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        user_info = dict(row)
+        auth_cache.principal_cache.set(user_id, user_info)
+    return user_info
+
+
+def authenticate(token):
+    """Decode an Authorization header value and refresh it with the user's
+    current role. Returns (token data, None), or (None, error response)."""
+    if not token:
+        return None, (jsonify({'message': 'Token is missing'}), 403)
+    try:
+        data = auth_cache.token_cache.get(auth_cache.token_key(token))
+        if data is None:
+            with metrics.phase('jwt_decode'):
+                data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+            auth_cache.cache_token(token, data)
+        data = dict(data)
+
+        with metrics.phase('principal_lookup'):
+            user_info = get_principal(data['user_id'])
+        if not user_info:
+            return None, (jsonify({'message': 'User not found'}), 404)
+
+        # Update token data with latest user info
+        data['user_id'] = user_info['user_id']
+        data['userRole'] = user_info['userRole']
+        data['regNumber'] = user_info['regNumber']
+        data['primaryCountry'] = user_info['primaryCountry']
+        return data, None
+    except jwt.ExpiredSignatureError:
+        return None, (jsonify({'message': 'Token has expired'}), 403)
+    except jwt.InvalidTokenError:
+        return None, (jsonify({'message': 'Token is invalid'}), 403)
 
 
 def token_required(f):
@@ -15,35 +91,12 @@ def token_required(f):
     def decorated_function(*args, **kwargs):
         if request.method == 'OPTIONS':
             return jsonify({}), 200
-        token = request.headers.get('Authorization')
-        if not token:
-            return jsonify({'message': 'Token is missing'}), 403
-        try:
-            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("""SELECT user_id, firstName, lastName, email, phoneNumber, companyName, 
-                           userRole, regNumber, primaryCountry, shippingVolume, created_at 
-                           FROM users WHERE user_id = ?""", (data['user_id'],))
-            user_info = cursor.fetchone()
-            if not user_info:
-                return jsonify({'message': 'User not found'}), 404
-
-            # Update token data with latest user info
-            data['user_id'] = user_info['user_id']
-            data['userRole'] = user_info['userRole']
-            data['regNumber'] = user_info['regNumber']
-            data['primaryCountry'] = user_info['primaryCountry']
-
-            # Add the decoded token data to the request context
-            request.token_data = data
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token has expired'}), 403
-        except jwt.InvalidTokenError:
-            return jsonify({'message': 'Token is invalid'}), 403
-        finally:
-            if 'conn' in locals():
-                conn.close()
+        data, error = authenticate(request.headers.get('Authorization'))
+        if error:
+            return error
+
+        # Add the decoded token data to the request context
+        request.token_data = data
         return f(*args, **kwargs)
 
-    return decorated_function
\ No newline at end of file
+    return decorated_function
@@ -0,0 +1,150 @@
+import datetime
+import math
+import re
+
+# Both as the Consignments table's CHECK constraints would have them:
+# datetime(shipment_date) needs two-digit months and days, and sender_mail
+# must match LIKE '%@%.%'
+_DATE = re.compile(r'([0-9]{4})-([0-9]{2})-([0-9]{2})')
+_EMAIL = re.compile(r'@.*\.', re.S)
+
+
+def _parse_date(value):
+    """YYYY-MM-DD naming a real calendar day; kept as the text given."""
+    match = _DATE.fullmatch(value)
+    if match is None:
+        raise ValueError(value)
+    datetime.date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    return value
+
+
+def _parse_float(value):
+    """float() without nan (stored as NULL) and infinities (not valid JSON)."""
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(value)
+    return number
+
+
+def _parse_email(value):
+    """An '@' followed somewhere by a '.'; kept as the text given."""
+    if _EMAIL.search(value) is None:
+        raise ValueError(value)
+    return value
+
+
+# Expected type -> (parser returning the stored value, name used in errors);
+# str values are stored as given
+_TYPES = {
+    str: (None, 'str'),
+    int: (int, 'int'),
+    float: (_parse_float, 'float'),
+    "date": (_parse_date, 'date'),
+    "email": (_parse_email, 'email'),
+}
+
+
+def validate_field_type(value, field_name, expected_type, required=True):
+    """Validate field type and return tuple of (is_valid, error_message)"""
+    if value is None or value == "":
+        if required:
+            return False, f"Field '{field_name}' is required"
+        return True, None
+
+    parse, type_name = _TYPES[expected_type]
+    try:
+        if parse is not None:
+            parse(value)
+        return True, None
+    except (ValueError, TypeError):
+        return False, f"Invalid data type for field '{field_name}'. Expected {type_name}"
+
+
+class Validator:
+    """Validator for mappings of raw values, compiled once from a field list.
+
+    fields are (field, expected type, required) as in CONSIGNMENT_INPUT_FIELDS;
+    defaults maps a field to a function giving its value when the field is
+    absent altogether. Each value is parsed once and the parsed value is what
+    validate() returns, with the error messages built up front.
+    """
+
+    def __init__(self, fields, defaults=None):
+        defaults = defaults or {}
+        self.fields = tuple(fields)
+        self._plan = tuple(
+            (name, _TYPES[expected_type][0], required, defaults.get(name),
+             f"Field '{name}' is required",
+             f"Invalid data type for field '{name}'. Expected {_TYPES[expected_type][1]}")
+            for name, expected_type, required in self.fields)
+
+    def validate(self, values):
+        """Return (validated_data, errors) for one mapping of raw values (form
+        fields, a CSV row or a decoded NDJSON object)."""
+        validated_data = {}
+        errors = []
+        for name, parse, required, default, missing, invalid in self._plan:
+            value = values.get(name)
+            if value is None and default is not None and name not in values:
+                value = default()
+            elif value is not None and not isinstance(value, str):
+                # NDJSON rows may carry numbers; validate them as their text form
+                value = str(value)
+            if value is None or value == "":
+                if required:
+                    errors.append(missing)
+                continue
+            if parse is None:
+                validated_data[name] = value
+                continue
+            try:
+                validated_data[name] = parse(value)
+            except (ValueError, TypeError):
+                errors.append(invalid)
+        return validated_data, errors
+
+    def validate_many(self, rows):
+        """[(validated_data, errors)] for an iterable of mappings."""
+        validate = self.validate
+        return [validate(values) for values in rows]
+
+
+# (field, expected type, required) for a consignment as submitted by the
+# add-consignment form or one row of a bulk upload
+CONSIGNMENT_INPUT_FIELDS = [
+    ("sender_name", str, True),
+    ("sender_address", str, True),
+    ("sender_country", str, True),
+    ("sender_mail", "email", True),
+    ("sender_phone", str, True),
+    ("receiver_name", str, True),
+    ("receiver_address", str, True),
+    ("receiver_country", str, True),
+    ("shipment_id", str, True),
+    ("shipment_date", "date", True),
+    ("PackageQuantity", int, True),
+    ("HS_code", str, True),
+    ("totalWeight", float, True),
+    ("Item_desc", str, True),
+    ("handling_inst", str, False),
+    ("declared_value", float, False),
+]
+
+CONSIGNMENT_VALIDATOR = Validator(
+    CONSIGNMENT_INPUT_FIELDS,
+    # A consignment submitted without a shipment date ships today
+    defaults={"shipment_date": lambda: datetime.datetime.utcnow().strftime("%Y-%m-%d")})
+
+
+def validate_consignment(values):
+    """Validate and convert one submitted consignment.
+
+    values is a mapping of raw values (form fields, a CSV row or a decoded
+    NDJSON object). Returns (validated_data, errors).
+    """
+    return CONSIGNMENT_VALIDATOR.validate(values)
+
+
+def validate_consignments(rows):
+    """validate_consignment for many rows at once; [(validated_data, errors)]."""
+    return CONSIGNMENT_VALIDATOR.validate_many(rows)
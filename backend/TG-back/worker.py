@@ -0,0 +1,19 @@
+# Celery worker entry point, for TG_JOB_BACKEND=celery. Each job kind has its
+# own queue (tg.<kind>), so concurrency is capped per kind by the workers
+# consuming it; together they must cover every kind in tasks.py, or its jobs
+# stay queued. For example:
+#
+#   celery -A worker worker -Q tg.rescore,tg.apply_restriction_changes,tg.archive --concurrency 1
+#   celery -A worker worker -Q tg.report --concurrency 2
+#   celery -A worker worker -Q tg.evaluate_compliance,tg.parse_invoice,tg.bulk_upload --concurrency 4
+#
+# A worker started without -Q consumes every kind's queue (jobs.queues()).
+from kombu import Queue
+
+import jobs
+import tasks  # noqa: F401  (registers the job handlers)
+from schema import init_db
+
+init_db()
+celery = jobs.make_celery()
+celery.conf.task_queues = [Queue(name) for name in jobs.queues()]